@@ -1,22 +1,29 @@
 import os as _os
-import imp as _imp
+import sys as _sys
 
 _HOME = _os.environ.get('HOME')
 
-# Load custom defaults    
-if _os.path.exists('{!s}/.ares/defaults.py'.format(_HOME)):
-    (_f, _filename, _data) =\
-        _imp.find_module('defaults', ['{!s}/.ares/'.format(_HOME)])
-    rcParams = _imp.load_module('defaults.py', _f, _filename, _data).pf
+# Load custom defaults
+_defaults = '{!s}/.ares/defaults.py'.format(_HOME)
+if _os.path.exists(_defaults):
+    if _sys.version_info[0] < 3:
+        import imp as _imp
+        rcParams = _imp.load_source('_ares_defaults', _defaults).pf
+    else:
+        # importlib itself is always loaded at startup, so this is free.
+        import importlib.util as _ilu
+        _spec = _ilu.spec_from_file_location('_ares_defaults', _defaults)
+        _mod = _ilu.module_from_spec(_spec)
+        _spec.loader.exec_module(_mod)
+        rcParams = _mod.pf
 else:
     rcParams = {}
 
-import ares.physics
-import ares.util
-import ares.analysis
-import ares.sources
-import ares.populations
-import ares.static
-import ares.solvers
-import ares.simulations
-import ares.inference
+# Sub-packages are only imported when first accessed, e.g., ares.analysis
+# (and thus matplotlib) isn't loaded until someone actually makes a plot.
+from ares.util.Lazy import lazy_import as _lazy_import
+
+__getattr__, __dir__ = _lazy_import(__name__,
+    {name: (name, None) for name in ['physics', 'util', 'analysis',
+    'sources', 'populations', 'static', 'solvers', 'simulations',
+    'inference', 'phenom']})
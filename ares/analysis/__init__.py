@@ -1,11 +1,17 @@
-from ares.analysis.ModelSet import ModelSet
-from ares.analysis.MultiPlot import MultiPanel
-from ares.analysis.RaySegment import RaySegment
-from ares.analysis.Global21cm import Global21cm
-from ares.analysis.PowerSpectrum import PowerSpectrum
-from ares.analysis.ModelSelection import ModelSelection
-from ares.analysis.GalaxyPopulation import GalaxyPopulation
-from ares.analysis.Animation import Animation, AnimationSet
-from ares.analysis.MultiPhaseMedium import MultiPhaseMedium
-from ares.analysis.MetaGalacticBackground import MetaGalacticBackground
-from ares.analysis.ModelSetGalaxyPopulation import ModelSetGalaxyPopulation
+from ares.util.Lazy import lazy_import
+
+__getattr__, __dir__ = lazy_import(__name__,
+{
+ 'ModelSet': ('ModelSet', 'ModelSet'),
+ 'MultiPanel': ('MultiPlot', 'MultiPanel'),
+ 'RaySegment': ('RaySegment', 'RaySegment'),
+ 'Global21cm': ('Global21cm', 'Global21cm'),
+ 'PowerSpectrum': ('PowerSpectrum', 'PowerSpectrum'),
+ 'ModelSelection': ('ModelSelection', 'ModelSelection'),
+ 'GalaxyPopulation': ('GalaxyPopulation', 'GalaxyPopulation'),
+ 'Animation': ('Animation', 'Animation'),
+ 'AnimationSet': ('Animation', 'AnimationSet'),
+ 'MultiPhaseMedium': ('MultiPhaseMedium', 'MultiPhaseMedium'),
+ 'MetaGalacticBackground': ('MetaGalacticBackground', 'MetaGalacticBackground'),
+ 'ModelSetGalaxyPopulation': ('ModelSetGalaxyPopulation', 'ModelSetGalaxyPopulation'),
+})
@@ -0,0 +1,431 @@
+"""
+
+AsyncEnsembleSampler.py
+
+Description: Affine-invariant ensemble sampler (stretch move) that can
+update walkers asynchronously and/or run a ladder of tempered ensembles.
+Meant to be a drop-in replacement for emcee.EnsembleSampler within ModelFit,
+i.e., `sample` yields (pos, prob, state, blobs) for the untempered walkers
+only, so all the usual output files look the same.
+
+"""
+
+import numpy as np
+from collections import deque
+
+class SerialPool(object):
+    """
+    Trivial pool with the same interface as LocalPool and MPIPool.
+
+    Tasks are evaluated as soon as they are submitted.
+    """
+    def __init__(self):
+        self._done = deque()
+
+    def is_master(self):
+        return True
+
+    def map(self, function, iterable):
+        return list(map(function, iterable))
+
+    def submit(self, function, arg, tag):
+        self._done.append((tag, function(arg)))
+
+    def wait(self):
+        return self._done.popleft()
+
+    def stop(self):
+        pass
+
+class _function_wrapper(object):
+    """
+    Make the log-posterior picklable and callable with a single argument.
+    """
+    def __init__(self, f, args):
+        self.f = f
+        self.args = args
+
+    def __call__(self, x):
+        return self.f(x, *self.args)
+
+class AsyncEnsembleSampler(object):
+    def __init__(self, nwalkers, dim, lnpostfn, pool=None, args=[], a=2.,
+        ntemps=1, betas=None, Tmax=None, asynchronous=True, logprior=None,
+        logprior_args=[]):
+        """
+        Initialize a sampler.
+
+        Parameters
+        ----------
+        nwalkers : int
+            Number of walkers per temperature.
+        dim : int
+            Number of parameters.
+        lnpostfn : function
+            Returns (log-posterior, blobs) given a position vector (and
+            `args`).
+        pool : object
+            Anything with `submit(function, arg, tag)` and `wait()` methods,
+            e.g., ares.util.MPIPool.MPIPool or ares.util.MPIPool.LocalPool.
+            If None, will evaluate models in serial.
+        a : int, float
+            Scale parameter for stretch move.
+        ntemps : int
+            Number of temperatures. If > 1, will run parallel-tempered
+            ensembles, and attempt to swap walkers between neighbouring
+            temperatures after each update.
+        betas : np.ndarray
+            Inverse temperatures. Must have betas[0] == 1. If None, will
+            use a geometric ladder with spacing 1 + sqrt(2 / dim), which is
+            appropriate for (roughly) Gaussian posteriors.
+        Tmax : int, float
+            Alternatively, set the maximum temperature of a geometric ladder.
+        asynchronous : bool
+            If True, each walker is updated as soon as its last model
+            finishes, using the current positions of the rest of the ensemble,
+            i.e., the slowest model no longer holds up all of the others.
+            If False, will use the usual two-halves update so that results
+            are identical to a synchronous stretch move.
+        logprior : function
+            Returns the log-prior for a position vector (and `logprior_args`).
+            Only used if ntemps > 1, in which case only the likelihood, i.e.,
+            `lnpostfn - logprior`, is tempered. If None, the full posterior
+            is tempered.
+
+        """
+
+        self.nwalkers = int(nwalkers)
+        self.dim = int(dim)
+        self.a = a
+        self.ntemps = int(ntemps)
+        self.asynchronous = asynchronous
+
+        assert self.nwalkers % 2 == 0, "nwalkers must be even!"
+        assert self.nwalkers >= 2 * self.dim, "Need nwalkers >= 2 * dim!"
+
+        self.lnpostfn = _function_wrapper(lnpostfn, args)
+
+        if logprior is None:
+            self.logprior = None
+        else:
+            self.logprior = _function_wrapper(logprior, logprior_args)
+
+        self.pool = SerialPool() if pool is None else pool
+
+        if betas is not None:
+            self.betas = np.array(betas, dtype=float)
+            assert self.betas.size == self.ntemps
+            assert self.betas[0] == 1
+        elif self.ntemps == 1:
+            self.betas = np.ones(1)
+        else:
+            if Tmax is None:
+                step = 1. + np.sqrt(2. / self.dim)
+            else:
+                step = Tmax**(1. / (self.ntemps - 1.))
+
+            self.betas = step**(-np.arange(self.ntemps, dtype=float))
+
+        self._random = np.random.mtrand.RandomState()
+
+        self._p = None
+        self.reset()
+
+    @property
+    def random_state(self):
+        return self._random.get_state()
+
+    @random_state.setter
+    def random_state(self, state):
+        if state is None:
+            return
+        self._random.set_state(state)
+
+    @property
+    def acceptance_fraction(self):
+        """
+        Fraction of proposals accepted for each untempered walker.
+        """
+        return self.naccepted[0] / np.maximum(self.iterations[0], 1.)
+
+    @property
+    def tswap_acceptance_fraction(self):
+        """
+        Fraction of swaps accepted between temperatures t and t+1.
+        """
+        return self.nswap_accepted / np.maximum(self.nswap, 1.)
+
+    def reset(self):
+        """
+        Clear acceptance statistics. The current state of all walkers
+        is retained so that subsequent calls to `sample` can pick up where
+        we left off.
+        """
+        self.naccepted = np.zeros((self.ntemps, self.nwalkers))
+        self.iterations = np.zeros((self.ntemps, self.nwalkers))
+        self.nswap = np.zeros(self.ntemps - 1)
+        self.nswap_accepted = np.zeros(self.ntemps - 1)
+
+    def _tempered(self, lnpost, lnprior, t):
+        if self.betas[t] == 1:
+            return lnpost
+        if not np.isfinite(lnpost):
+            return -np.inf
+        return lnprior + self.betas[t] * (lnpost - lnprior)
+
+    def _initialize(self, p0, lnprob0=None, blobs0=None):
+        """
+        Setup positions, posteriors, and blobs for all temperatures.
+        """
+
+        p0 = np.array(p0, dtype=float)
+
+        # Re-use last state if we're just continuing.
+        if (self._p is not None) and (lnprob0 is None):
+            if p0.shape == self._p.shape and np.all(p0 == self._p):
+                return
+            if p0.shape == self._p[0].shape and np.all(p0 == self._p[0]):
+                return
+
+        if p0.ndim == 2:
+            p0 = np.array([p0] * self.ntemps)
+
+        assert p0.shape == (self.ntemps, self.nwalkers, self.dim)
+
+        self._p = p0.copy()
+        self._lnpost = np.zeros((self.ntemps, self.nwalkers))
+        self._lnprior = np.zeros((self.ntemps, self.nwalkers))
+        self._blobs = [[None for k in range(self.nwalkers)] \
+            for t in range(self.ntemps)]
+
+        if lnprob0 is not None:
+            assert self.ntemps == 1
+            self._lnpost[0] = lnprob0
+            if blobs0 is not None:
+                self._blobs[0] = list(blobs0)
+            return
+
+        for s in range(self.ntemps * self.nwalkers):
+            t, k = divmod(s, self.nwalkers)
+            self.pool.submit(self.lnpostfn, self._p[t,k], s)
+
+        for i in range(self.ntemps * self.nwalkers):
+            s, (lnpost, blobs) = self.pool.wait()
+            t, k = divmod(s, self.nwalkers)
+            self._lnpost[t,k] = lnpost
+            self._blobs[t][k] = blobs
+
+        if self.ntemps > 1 and self.logprior is not None:
+            for t in range(self.ntemps):
+                for k in range(self.nwalkers):
+                    self._lnprior[t,k] = self.logprior(self._p[t,k])
+
+    def _propose(self, t, k, complement):
+        """
+        Stretch move for walker k at temperature t.
+
+        Returns
+        -------
+        Tuple: (proposed position, stretch factor).
+
+        """
+        j = complement[self._random.randint(len(complement))]
+        z = ((self.a - 1.) * self._random.rand() + 1)**2 / self.a
+        q = self._p[t,j] + z * (self._p[t,k] - self._p[t,j])
+        return q, z
+
+    def _accept(self, t, k, q, z, lnpost, blobs):
+        """
+        Metropolis-Hastings step for a stretch move.
+        """
+
+        if self.ntemps > 1 and self.logprior is not None:
+            lnprior = self.logprior(q)
+        else:
+            lnprior = 0.
+
+        new = self._tempered(lnpost, lnprior, t)
+        old = self._tempered(self._lnpost[t,k], self._lnprior[t,k], t)
+
+        lnpdiff = (self.dim - 1.) * np.log(z) + new - old
+
+        self.iterations[t,k] += 1
+
+        if lnpdiff > np.log(self._random.rand()):
+            self._p[t,k] = q
+            self._lnpost[t,k] = lnpost
+            self._lnprior[t,k] = lnprior
+            self._blobs[t][k] = blobs
+            self.naccepted[t,k] += 1
+
+    def _swap(self, t, k):
+        """
+        Propose swapping walker k between temperatures t and t+1.
+
+        Returns
+        -------
+        True if swap was accepted.
+
+        """
+
+        b1, b2 = self.betas[t], self.betas[t+1]
+        lnL1 = self._lnpost[t,k] - self._lnprior[t,k]
+        lnL2 = self._lnpost[t+1,k] - self._lnprior[t+1,k]
+
+        self.nswap[t] += 1
+
+        if not (np.isfinite(lnL1) and np.isfinite(lnL2)):
+            return False
+
+        if (b1 - b2) * (lnL2 - lnL1) <= np.log(self._random.rand()):
+            return False
+
+        self.nswap_accepted[t] += 1
+
+        for arr in [self._p, self._lnpost, self._lnprior]:
+            arr[[t,t+1],k] = arr[[t+1,t],k]
+
+        self._blobs[t][k], self._blobs[t+1][k] = \
+            self._blobs[t+1][k], self._blobs[t][k]
+
+        return True
+
+    def _snapshot(self):
+        return self._p[0].copy(), self._lnpost[0].copy(), list(self._blobs[0])
+
+    def sample(self, p0, lnprob0=None, rstate0=None, blobs0=None,
+        iterations=1, **kwargs):
+        """
+        Advance the ensemble `iterations` steps.
+
+        Parameters
+        ----------
+        p0 : np.ndarray
+            Initial positions, shape (nwalkers, dim) or
+            (ntemps, nwalkers, dim).
+        lnprob0 : np.ndarray
+            Log-posterior at p0 (untempered walkers only). If None, will
+            be computed, unless p0 corresponds to the last state of this
+            sampler.
+        rstate0 : tuple
+            State of random number generator.
+
+        Returns
+        -------
+        Generator yielding, after each step, a tuple containing positions,
+        log-posteriors, random state, and blobs for the untempered walkers.
+
+        """
+
+        self.random_state = rstate0
+
+        self._initialize(p0, lnprob0, blobs0)
+
+        if self.asynchronous:
+            generator = self._sample_async(int(iterations))
+        else:
+            generator = self._sample_sync(int(iterations))
+
+        for pos, prob, blobs in generator:
+            yield pos, prob, self.random_state, blobs
+
+    def _sample_sync(self, iterations):
+        half = self.nwalkers // 2
+        halves = [np.arange(half), np.arange(half, self.nwalkers)]
+
+        for i in range(iterations):
+            for h in range(2):
+                update, complement = halves[h], halves[1-h]
+
+                proposals = {}
+                for t in range(self.ntemps):
+                    for k in update:
+                        s = t * self.nwalkers + k
+                        proposals[s] = self._propose(t, k, complement)
+
+                for s in sorted(proposals.keys()):
+                    self.pool.submit(self.lnpostfn, proposals[s][0], s)
+
+                results = {}
+                for j in range(len(proposals)):
+                    s, result = self.pool.wait()
+                    results[s] = result
+
+                # Accept/reject in a fixed order so results don't depend
+                # on the order in which models finish.
+                for s in sorted(results.keys()):
+                    t, k = divmod(s, self.nwalkers)
+                    q, z = proposals[s]
+                    lnpost, blobs = results[s]
+                    self._accept(t, k, q, z, lnpost, blobs)
+
+            for t in range(self.ntemps - 1):
+                for k in range(self.nwalkers):
+                    self._swap(t, k)
+
+            yield self._snapshot()
+
+    def _sample_async(self, iterations):
+        nslots = self.ntemps * self.nwalkers
+        ndone = np.zeros(nslots, dtype=int)
+        busy = np.zeros(nslots, dtype=bool)
+        everyone = np.arange(self.nwalkers)
+
+        # Tags identify models in flight. They normally map one-to-one onto
+        # slots (temperature, walker), but when walkers are swapped between
+        # temperatures, their pending proposals follow them.
+        tag_of = np.arange(nslots)
+        slot_of = np.arange(nslots)
+        proposals = [None] * nslots
+
+        # Untempered walker state after each of its updates. Yield a step
+        # once every walker has gotten that far.
+        rows = [deque() for k in range(self.nwalkers)]
+        nyield = 0
+
+        def submit(s):
+            t, k = divmod(s, self.nwalkers)
+            tag = tag_of[s]
+            proposals[tag] = self._propose(t, k, everyone[everyone != k])
+            self.pool.submit(self.lnpostfn, proposals[tag][0], tag)
+            busy[s] = True
+
+        for s in range(nslots):
+            submit(s)
+
+        while np.any(busy):
+            tag, (lnpost, blobs) = self.pool.wait()
+            s = slot_of[tag]
+            t, k = divmod(s, self.nwalkers)
+            busy[s] = False
+
+            q, z = proposals[tag]
+            self._accept(t, k, q, z, lnpost, blobs)
+            ndone[s] += 1
+
+            # The stretch move is valid for any fixed complementary walker,
+            # so a pending proposal stays valid if its walker is swapped
+            # to a neighbouring temperature. Hand it over rather than
+            # throwing it away.
+            if t < self.ntemps - 1:
+                s2 = s + self.nwalkers
+                if self._swap(t, k) and busy[s2]:
+                    tag_of[s], tag_of[s2] = tag_of[s2], tag_of[s]
+                    slot_of[tag_of[s]], slot_of[tag_of[s2]] = s, s2
+                    busy[s], busy[s2] = True, False
+
+                    if ndone[s2] < iterations:
+                        submit(s2)
+
+            if t == 0 and nyield < iterations:
+                rows[k].append((self._p[0,k].copy(), self._lnpost[0,k],
+                    self._blobs[0][k]))
+
+                while all([len(row) > 0 for row in rows]):
+                    pos, prob, blobs = zip(*[row.popleft() for row in rows])
+                    nyield += 1
+                    yield np.array(pos), np.array(prob), list(blobs)
+
+            if (not busy[s]) and (ndone[s] < iterations):
+                submit(s)
+
@@ -99,6 +99,64 @@ class loglikelihood(LogLikelihood):
                 
         return self._include
     
+    @property
+    def xdata_arr(self):
+        """
+        Independent variables as a plain array (for fancy indexing).
+        """
+        if not hasattr(self, '_xdata_arr'):
+            self._xdata_arr = np.array(np.ma.getdata(self.xdata), dtype=float)
+        return self._xdata_arr
+    
+    @property
+    def metadata_arr(self):
+        if not hasattr(self, '_metadata_arr'):
+            self._metadata_arr = np.array(self.metadata)
+        return self._metadata_arr
+    
+    @property
+    def zmod_flat(self):
+        """
+        Model redshift for each data point, i.e., after applying `zmap`.
+        """
+        if not hasattr(self, '_zmod_flat'):
+            self._zmod_flat = []
+            for i, quantity in enumerate(self.metadata):
+                z = self.redshifts[i]
+                if quantity in self.zmap:
+                    self._zmod_flat.append(self.zmap[quantity][z])
+                else:
+                    self._zmod_flat.append(z)
+                    
+            self._zmod_flat = np.array(self._zmod_flat)
+            
+        return self._zmod_flat
+    
+    @property
+    def groups(self):
+        """
+        Map of (quantity, model redshift) -> indices of unmasked data points.
+        
+        Built once so that each likelihood evaluation needs only one 
+        (vectorized) call per quantity and redshift.
+        """
+        if not hasattr(self, '_groups'):
+            self._groups = {}
+            for i, quantity in enumerate(self.metadata):
+                if self.mask[i]:
+                    continue
+                
+                key = (quantity, self.zmod_flat[i])
+                if key not in self._groups:
+                    self._groups[key] = []
+                    
+                self._groups[key].append(i)
+                
+            for key in self._groups:
+                self._groups[key] = np.array(self._groups[key], dtype=int)
+                
+        return self._groups
+    
     @property
     def monotonic_beta(self):
         if not hasattr(self, '_monotonic_beta'):
@@ -138,68 +196,74 @@ class loglikelihood(LogLikelihood):
                                 
         if len(pops) > 1:
             raise NotImplemented('careful! need to think about this.')
-                                                                                                     
-        # Loop over all data points individually.
-        #try:
-        phi = np.zeros_like(self.ydata)
-        for i, quantity in enumerate(self.metadata):
-                                                
-            if self.mask[i]:
-                #print('masked:', rank, self.redshifts[i], self.xdata[i])
+
+        # If streaming halos from disk, get the SMF and LF at all redshifts
+        # we need in a single pass through the catalog.
+        for pop in pops:
+            if not hasattr(pop, 'RunSAMChunked'):
+                continue
+            if pop.pf['pop_hist_chunk'] is None:
                 continue
 
-            xdat = self.xdata[i]
-            z = self.redshifts[i]
-                        
-            if quantity in self.zmap:
-                zmod = self.zmap[quantity][z]
-            else:
-                zmod = z
-                        
+            zsmf = []; zlf = []
+            for (quantity, zmod) in self.groups:
+                if quantity == 'smf' and pop._cache_smf(zmod, None) is None:
+                    zsmf.append(zmod)
+                elif quantity == 'lf' and \
+                    pop._cache_lf(zmod, wave=1600.) is None:
+                    zlf.append(zmod)
+
+            if zsmf or zlf:
+                pop.RunSAMChunked(zsmf=zsmf, zlf=zlf)
+
+        # Evaluate each (quantity, redshift) group with a single call.
+        phi = np.zeros_like(self.ydata)
+        for (quantity, zmod), idx in self.groups.items():
+            
+            xdat = self.xdata_arr[idx]
+            
             for j, pop in enumerate(pops):
-                                                        
+                
                 # Generate model LF
                 if quantity == 'lf':
-                                    
+                    
                     # New convention: LuminosityFunction always in terms of
-                    # observed magnitudes.                
-                                    
+                    # observed magnitudes.
+                    
                     # Compute LF
                     p = pop.LuminosityFunction(z=zmod, x=xdat, mags=True)
-                                                                                
-                    if not np.isfinite(p):
+                    
+                    if not np.all(np.isfinite(p)):
                         print('LF is inf or nan!', zmod, xdat)
                         raise ValueError('LF is inf or nan!', zmod, xdat)
-                                                                
+                        
                 elif quantity == 'smf':
                     M = np.log10(xdat)
+                    
+                    # Make sure the SMF is tabulated on its default grid
+                    # first so that we interpolate rather than bin on `M`.
+                    if hasattr(pop, '_cache_smf'):
+                        pop.StellarMassFunction(zmod)
+                        
                     p = pop.StellarMassFunction(zmod, M)
-                                        
+                    
                 elif quantity == 'beta':
                     
-                    zstr = int(round(zmod))
-
-                    if zstr >= 7:
-                        filt_hst = hst_deep
-                    else:
-                        filt_hst = hst_shallow
-
-                    M = xdat
-                    p = pop.Beta(zmod, MUV=M, presets='hst', dlam=20., 
+                    # All magnitudes at this redshift at once.
+                    p = pop.Beta(zmod, MUV=xdat, presets='hst', dlam=20., 
                         return_binned=True, rest_wave=None)
-
-                    if not np.isfinite(p):
-                        print('beta is inf or nan!', z, M)
+                    
+                    if not np.all(np.isfinite(p)):
+                        print('beta is inf or nan!', zmod, xdat)
                         return -np.inf
-                        #raise ValueError('beta is inf or nan!', z, M)
-                                            
+                        
                 else:
                     raise ValueError('Unrecognized quantity: {!s}'.format(\
                         quantity))
-                        
+                
                 # If UVLF or SMF, could do multi-pop in which case we'd 
-                # increment here.        
-                phi[i] = p   
+                # increment here.
+                phi[idx] = p
 
         ## 
         # Apply restrictions to beta    
@@ -213,24 +277,10 @@ class loglikelihood(LogLikelihood):
                 # overlap with UVLF constraints, or 2 extra mags if no UVLF
                 # fitting happening (rare). 
                 
-                xmod = []
-                ymod = []
-                zmod = []
-                xlf = []
-                for i, quantity in enumerate(self.metadata):
-                    if quantity == 'lf':
-                        xlf.append(self.xdata[i])
-
-                    z = self.redshifts[i]
-
-                    if quantity in self.zmap:
-                        _zmod = self.zmap[quantity][z]
-                    else:
-                        _zmod = z    
-
-                    xmod.append(self.xdata[i])
-                    ymod.append(phi[i])
-                    zmod.append(_zmod)
+                xmod = self.xdata
+                ymod = phi
+                zmod = self.zmod_flat
+                xlf = self.xdata[self.metadata_arr == 'lf']
 
                 i_lo = np.argmin(xmod)
                 M_lo = xmod[i_lo]
@@ -285,6 +335,9 @@ class FitGalaxyPopulation(FitBase):
             self._loglikelihood.metadata = self.metadata_flat
             self._loglikelihood.zmap = self.zmap
             self._loglikelihood.monotonic_beta = self.monotonic_beta
+            
+            # Setup index maps for batched evaluation
+            self._loglikelihood.groups
 
             self.info
 
@@ -15,18 +15,21 @@ from __future__ import print_function
 import glob
 import numpy as np
 from ..util import get_rev
-from ..util.MPIPool import MPIPool
+from ..util.MPIPool import MPIPool, LocalPool
 from ..util.PrintInfo import print_fit
 from ..physics.Constants import nu_0_mhz
 from ..util.Warnings import not_a_restart
 from ..util.ParameterFile import par_info
 import gc, os, sys, copy, types, time, re, glob
+import atexit, signal, threading
+from collections import deque
 from ..analysis import Global21cm as anlG21
 from types import FunctionType#, InstanceType # InstanceType not in Python3
 from ..analysis import ModelSet
 from ..analysis.BlobFactory import BlobFactory
 from ..sources import BlackHole, SynthesisModel
 from ..analysis.TurningPoints import TurningPoints
+from .AsyncEnsembleSampler import AsyncEnsembleSampler
 from ..util.Stats import Gauss1D, GaussND, get_nu, bin_e2c
 from ..util.Pickling import read_pickle_file, write_pickle_file
 from ..util.SetDefaultParameterValues import _blob_names, _blob_redshifts
@@ -114,6 +117,128 @@ def checkpoint_on_completion(prefix, is_blobs=False, checkpoint_by_proc=True,
                 print("Simulation finished: {!s}".format(time.ctime()), file=f)
 
     
+class CheckpointBuffer(object):
+    def __init__(self, prefix, freq=30., maxlen=100):
+        """
+        Keep track of in-flight models in memory, write to disk periodically.
+        
+        This replaces the (up to four) small file writes per model evaluation
+        done by `checkpoint` and `checkpoint_on_completion` with one
+        write every `freq` seconds, carried out by a background thread. The
+        buffer is also flushed when the process exits or receives SIGTERM,
+        SIGINT, or SIGUSR1 (e.g., when MPI aborts or the job hits its 
+        wall-clock limit). Note that `atexit` hooks are not run in
+        multiprocessing pool workers, so runs using `LocalPool` rely on the
+        writer thread (and the signal handlers) alone.
+        
+        File names are the same as before: `prefix.<rank>.checkpt.pkl`
+        holds the parameters of the most recent model. However,
+        `prefix.<rank>.checkpt.txt` now holds a log of the last `maxlen`
+        events, rather than being rewritten for every model. Both files are
+        written to a temporary file first and then moved into place, so an
+        interrupted flush never leaves a truncated checkpoint behind.
+        
+        Parameters
+        ----------
+        prefix : str
+            Prefix for output files.
+        freq : int, float
+            Time between flushes [seconds].
+        maxlen : int
+            Number of events to keep in ring buffer.
+            
+        """
+        procid = str(rank).zfill(3)
+        self.fn_pkl = '{0!s}.{1!s}.checkpt.pkl'.format(prefix, procid)
+        self.fn_txt = '{0!s}.{1!s}.checkpt.txt'.format(prefix, procid)
+        
+        self.freq = freq
+        self.events = deque(maxlen=maxlen)
+        self.kwargs = None
+        self._dirty = False
+        self._new_kwargs = False
+        # Re-entrant, since a signal may arrive while the main thread is
+        # inside push or flush, at which point _on_signal calls flush.
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+        
+        atexit.register(self.close)
+        
+        self._handlers = {}
+        for signame in ['SIGTERM', 'SIGINT', 'SIGUSR1']:
+            if not hasattr(signal, signame):
+                continue
+            signum = getattr(signal, signame)
+            try:
+                self._handlers[signum] = signal.signal(signum, self._on_signal)
+            except ValueError:
+                # Can only install handlers from main thread.
+                pass
+        
+    def push(self, msg, kwargs=None):
+        """
+        Record an event (and, optionally, the parameters of a new model).
+        """
+        with self._lock:
+            self.events.append("{0!s}: {1!s}".format(msg, time.ctime()))
+            if kwargs is not None:
+                self.kwargs = kwargs
+                self._new_kwargs = True
+            self._dirty = True
+        
+    def flush(self):
+        # Hold the lock while writing so that concurrent flushes (writer
+        # thread vs. signal handler) can't interleave. A nested call from a
+        # signal handler in the same thread finds _dirty=False and returns.
+        with self._lock:
+            if not self._dirty:
+                return
+            events = list(self.events)
+            kwargs = self.kwargs if self._new_kwargs else None
+            self._dirty = self._new_kwargs = False
+        
+            if kwargs is not None:
+                write_pickle_file(kwargs, self.fn_pkl + '.tmp', ndumps=1, 
+                    open_mode='w', safe_mode=False, verbose=False)
+                os.replace(self.fn_pkl + '.tmp', self.fn_pkl)
+            
+            with open(self.fn_txt + '.tmp', 'w') as f:
+                for event in events:
+                    print(event, file=f)
+            os.replace(self.fn_txt + '.tmp', self.fn_txt)
+    
+    def _loop(self):
+        while not self._stop.wait(self.freq):
+            self.flush()
+            
+    def _on_signal(self, signum, frame):
+        self.flush()
+        
+        # Fall back on whatever would have happened otherwise.
+        handler = self._handlers.get(signum, signal.SIG_DFL)
+        if callable(handler):
+            handler(signum, frame)
+        elif handler == signal.SIG_DFL:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+    
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+_checkpoint_buffers = {}
+def get_checkpoint_buffer(prefix, freq):
+    """
+    Retrieve the CheckpointBuffer for this process (create if need be).
+    """
+    if prefix not in _checkpoint_buffers:
+        _checkpoint_buffers[prefix] = CheckpointBuffer(prefix, freq)
+    return _checkpoint_buffers[prefix]
+    
 def _compute_blob_prior(sim, priors_B):
     
     like = 0.0
@@ -150,7 +275,8 @@ def _compute_blob_prior(sim, priors_B):
     return np.log(like)
     
 def loglikelihood(pars, prefix, parameters, is_log, prior_set_P, prior_set_B,
-    blank_blob, base_kwargs, checkpoint_by_proc, simulator, fitters, debug):
+    blank_blob, base_kwargs, checkpoint_by_proc, simulator, fitters, debug,
+    checkpoint_freq=0, force_gc=True):
 
     #write_memory('1')
     
@@ -178,9 +304,18 @@ def loglikelihood(pars, prefix, parameters, is_log, prior_set_P, prior_set_B,
     # Update kwargs
     kw = base_kwargs.copy()
     kw.update(kwargs)
+    
+    # Either write checkpoints straight away or buffer them in memory.
+    if checkpoint_by_proc and (checkpoint_freq > 0):
+        buff = get_checkpoint_buffer(prefix, checkpoint_freq)
+    else:
+        buff = None
 
     # Don't save base_kwargs for each proc! Needlessly expensive I/O-wise.
-    checkpoint(prefix, False, checkpoint_by_proc, **kwargs)
+    if buff is None:
+        checkpoint(prefix, False, checkpoint_by_proc, **kwargs)
+    else:
+        buff.push("Simulation began", kwargs)
 
     #for i, par in enumerate(self.parameters):
     #    print(rank, par, pars[i], kwargs[par])
@@ -197,19 +332,24 @@ def loglikelihood(pars, prefix, parameters, is_log, prior_set_P, prior_set_B,
         
     try:
         if not debug:
-            sim.run()            
-            blobs = copy.deepcopy(sim.blobs)
+            sim.run()
+            # No need to copy: `sim` is thrown away when we're done.
+            blobs = sim.blobs
     except ValueError:
         print('FAILURE: ', kwargs)
         del sim, kw, kwargs
-        gc.collect()
+        if force_gc:
+            gc.collect()
         return -np.inf, blank_blob
 
     t2 = time.time()
     
     #write_memory('2')
     
-    checkpoint_on_completion(prefix, False, checkpoint_by_proc, **kwargs)
+    if buff is None:
+        checkpoint_on_completion(prefix, False, checkpoint_by_proc, **kwargs)
+    else:
+        buff.push("Simulation finished")
 
     lnL = 0.0
     for fitter in fitters:
@@ -220,7 +360,10 @@ def loglikelihood(pars, prefix, parameters, is_log, prior_set_P, prior_set_B,
         
         ##    
         # Blobs    
-        checkpoint(prefix, True, checkpoint_by_proc, **kwargs)
+        if buff is None:
+            checkpoint(prefix, True, checkpoint_by_proc, **kwargs)
+        else:
+            buff.push("Generating blobs")
 
         try:
             blobs = sim.blobs
@@ -228,7 +371,11 @@ def loglikelihood(pars, prefix, parameters, is_log, prior_set_P, prior_set_B,
             print("WARNING: Failure to generate blobs.")
             blobs = blank_blob
 
-        checkpoint_on_completion(prefix, True, checkpoint_by_proc, **kwargs)
+        if buff is None:
+            checkpoint_on_completion(prefix, True, checkpoint_by_proc, 
+                **kwargs)
+        else:
+            buff.push("Blobs generated")
         ##
         #
         
@@ -244,7 +391,8 @@ def loglikelihood(pars, prefix, parameters, is_log, prior_set_P, prior_set_B,
     # emcee doesn't like nans, but -inf is OK (see below)
     if np.isnan(PofD) or isinstance(PofD, np.ma.core.MaskedConstant):
         del sim, kw, kwargs
-        gc.collect()
+        if force_gc:
+            gc.collect()
         return -np.inf, blank_blob
 
     # Remember, -np.inf is OK (means proposal was bad, probably).
@@ -255,12 +403,23 @@ def loglikelihood(pars, prefix, parameters, is_log, prior_set_P, prior_set_B,
     #write_memory('3')
     
     del sim, kw, kwargs
-    gc.collect()
+    if force_gc:
+        gc.collect()
     
     #write_memory('4')
                     
     return PofD, blobs    
 
+def logprior(pars, parameters, prior_set_P):
+    """
+    Log-prior on model parameters only (used for parallel tempering).
+    """
+    point = {}
+    for i, par in enumerate(parameters):
+        point[par] = pars[i]
+        
+    return prior_set_P.log_value(point)
+
 def _str_to_val(p, par, pvals, pars):
     """
     Convert string to parameter value.
@@ -688,6 +847,83 @@ class ModelFit(FitBase):
     def nwalkers(self, value):
         self._nw = int(value)
         
+    @property
+    def sampler_backend(self):
+        """
+        Which sampler to use: 'emcee' or 'ares'.
+        
+        The latter is ares.inference.AsyncEnsembleSampler, which supports
+        asynchronous walker updates (see `asynchronous`) and parallel
+        tempering (see `ntemps`).
+        """
+        if not hasattr(self, '_sampler_backend'):
+            if (self.ntemps > 1) or self.asynchronous:
+                self._sampler_backend = 'ares'
+            else:
+                self._sampler_backend = 'emcee'
+        return self._sampler_backend
+        
+    @sampler_backend.setter
+    def sampler_backend(self, value):
+        assert value in ['emcee', 'ares'], \
+            "sampler_backend must be 'emcee' or 'ares'."
+        self._sampler_backend = value
+        
+    @property
+    def asynchronous(self):
+        """
+        If True, walkers are updated as soon as their last model finishes.
+        """
+        if not hasattr(self, '_asynchronous'):
+            self._asynchronous = False
+        return self._asynchronous
+        
+    @asynchronous.setter
+    def asynchronous(self, value):
+        self._asynchronous = bool(value)
+        
+    @property
+    def ntemps(self):
+        """
+        Number of temperatures for parallel-tempered sampling.
+        
+        Only the untempered (beta=1) walkers are written to disk.
+        """
+        if not hasattr(self, '_ntemps'):
+            self._ntemps = 1
+        return self._ntemps
+        
+    @ntemps.setter
+    def ntemps(self, value):
+        self._ntemps = int(value)
+        
+    @property
+    def Tmax(self):
+        """
+        Maximum temperature (if ntemps > 1). If None, will be chosen 
+        automatically based on the number of parameters.
+        """
+        if not hasattr(self, '_Tmax'):
+            self._Tmax = None
+        return self._Tmax
+        
+    @Tmax.setter
+    def Tmax(self, value):
+        self._Tmax = value
+        
+    @property
+    def nprocs(self):
+        """
+        Number of local worker processes to use if not running with MPI.
+        """
+        if not hasattr(self, '_nprocs'):
+            self._nprocs = 1
+        return self._nprocs
+        
+    @nprocs.setter
+    def nprocs(self, value):
+        self._nprocs = int(value)
+        
     def _handler(self, signum, frame):
         raise RuntimeError('timeout!')
             
@@ -937,6 +1173,34 @@ class ModelFit(FitBase):
     def checkpoint_by_proc(self, value):
         self._checkpoint_by_proc = value
     
+    @property
+    def checkpoint_freq(self):
+        """
+        Time [seconds] between writes of per-processor checkpoint files.
+        
+        If 0, will write before and after every model (old behavior).
+        """
+        if not hasattr(self, '_checkpoint_freq'):
+            self._checkpoint_freq = 30.
+        return self._checkpoint_freq
+        
+    @checkpoint_freq.setter
+    def checkpoint_freq(self, value):
+        self._checkpoint_freq = value
+        
+    @property
+    def force_gc(self):
+        """
+        Call gc.collect() after every model evaluation?
+        """
+        if not hasattr(self, '_force_gc'):
+            self._force_gc = True
+        return self._force_gc
+        
+    @force_gc.setter
+    def force_gc(self, value):
+        self._force_gc = bool(value)
+    
     @property
     def checkpoint_append(self):
         if not hasattr(self, '_checkpoint_append'):
@@ -1342,6 +1606,8 @@ class ModelFit(FitBase):
                     restart=True, save_freq=save_freq, 
                     reboot=self.counter < reboot, burn_method=burn_method)
 
+        elif self.nprocs > 1:
+            self.pool = LocalPool(self.nprocs)
         else:
             self.pool = None
             
@@ -1427,10 +1693,21 @@ class ModelFit(FitBase):
         args = [self.prefix, self.parameters, self.is_log, self.prior_set_P, 
             self.prior_set_B, self.blank_blob, 
             self.base_kwargs, self.checkpoint_by_proc, 
-            self.simulator, self.fitters, self.debug]
+            self.simulator, self.fitters, self.debug, self.checkpoint_freq,
+            self.force_gc]
         
-        self.sampler = emcee.EnsembleSampler(self.nwalkers,
-            self.Nd, loglikelihood, pool=self.pool, args=args)
+        if self.sampler_backend == 'emcee':
+            assert self.ntemps == 1, \
+                "Must set sampler_backend='ares' for parallel tempering."
+            
+            self.sampler = emcee.EnsembleSampler(self.nwalkers,
+                self.Nd, loglikelihood, pool=self.pool, args=args)
+        else:
+            self.sampler = AsyncEnsembleSampler(self.nwalkers,
+                self.Nd, loglikelihood, pool=self.pool, args=args, 
+                ntemps=self.ntemps, Tmax=self.Tmax, 
+                asynchronous=self.asynchronous, logprior=logprior,
+                logprior_args=[self.parameters, self.prior_set_P])
                             
         # If restart, will use last point from previous chain, or, if one
         # isn't found, will look for burn-in data.
@@ -1564,7 +1841,7 @@ class ModelFit(FitBase):
         else:
             ct = 0
             
-        if emcee_v >= 3:
+        if (self.sampler_backend != 'emcee') or (emcee_v >= 3):
             kw = {}
         else:
             kw = {'storechain': False}   
@@ -1,9 +1,12 @@
-from ares.inference.ModelFit import ModelFit
-from ares.inference.ModelGrid import ModelGrid
-from ares.inference.ModelSample import ModelSample
-from ares.inference.FitGlobal21cm import FitGlobal21cm
-#from ares.inference.ModelEmulator import ModelEmulator
-from ares.inference.CalibrateModel import CalibrateModel
-#from ares.inference.OptimizeSpectrum import SpectrumOptimization
-from ares.inference.FitGalaxyPopulation import FitGalaxyPopulation
+from ares.util.Lazy import lazy_import
 
+__getattr__, __dir__ = lazy_import(__name__,
+{
+ 'ModelFit': ('ModelFit', 'ModelFit'),
+ 'ModelGrid': ('ModelGrid', 'ModelGrid'),
+ 'ModelSample': ('ModelSample', 'ModelSample'),
+ 'FitGlobal21cm': ('FitGlobal21cm', 'FitGlobal21cm'),
+ 'ModelEmulator': ('ModelEmulator', 'ModelEmulator'),
+ 'CalibrateModel': ('CalibrateModel', 'CalibrateModel'),
+ 'FitGalaxyPopulation': ('FitGalaxyPopulation', 'FitGalaxyPopulation'),
+})
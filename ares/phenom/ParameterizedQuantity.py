@@ -49,6 +49,9 @@ func_options = \
 
 Np_max = 15
 
+# Number of recent results to hang on to
+memo_max = 8
+
 optional_kwargs = 'pq_val_ceil', 'pq_val_floor', 'pq_var_ceil', 'pq_var_floor'
 numeric_types = [int, float, np.int, np.int64, np.float64]    
     
@@ -87,6 +90,18 @@ class BasePQ(object):
                     self.tlim = kwargs['pq_func_var2_lim']
                     self.tfill = kwargs['pq_func_var2_fill']            
         
+    def _fill(self, x, y):
+        """
+        Replace values outside of pq_func_var_lim with pq_func_var_fill.
+        """
+        if self.xlim == (-np.inf, np.inf):
+            return y
+            
+        fill = np.nan if self.xfill is None else self.xfill
+        ok = np.logical_and(x >= self.xlim[0], x <= self.xlim[1])
+        
+        return np.where(ok, y, fill)
+        
 class PowerLaw(BasePQ):
     def __call__(self, **kwargs):
         if self.x == '1+z':
@@ -94,10 +109,9 @@ class PowerLaw(BasePQ):
         else:
             x = kwargs[self.x]
             
-        if not (self.xlim[0] <= x <= self.xlim[1]):
-            return self.xfill
-
-        return self.args[0] * (x / self.args[1])**self.args[2]
+        y = self.args[0] * (x / self.args[1])**self.args[2]
+        
+        return self._fill(x, y)
 
 class PowerLaw10(BasePQ):
     def __call__(self, **kwargs):
@@ -106,10 +120,9 @@ class PowerLaw10(BasePQ):
         else:
             x = kwargs[self.x]
             
-        if not (self.xlim[0] <= x <= self.xlim[1]):
-            return self.xfill
-
-        return 10**(self.args[0] * (x / self.args[1])**self.args[2])
+        y = 10**(self.args[0] * (x / self.args[1])**self.args[2])
+        
+        return self._fill(x, y)
 
 class PowerLawEvolvingNorm(BasePQ):
     def __call__(self, **kwargs):
@@ -567,8 +580,36 @@ class LogLinear(BasePQ):
         y = 10**logy
         return y
 
+def _clamp(lo, hi):
+    """
+    Return a function that clips its input to [lo, hi], or None if neither
+    bound is set, so we needn't check at call time.
+    """
+    if (lo is None) and (hi is None):
+        return None
+    elif lo is None:
+        return lambda y: np.minimum(y, hi)
+    elif hi is None:
+        return lambda y: np.maximum(y, lo)
+    else:
+        return lambda y: np.clip(y, lo, hi)
+
 class ParameterizedQuantity(object):
-    def __init__(self, **kwargs):
+    def __init__(self, raw_pf=None, **kwargs):
+        """
+        Initialize a parameterized quantity.
+        
+        Parameters
+        ----------
+        raw_pf : dict
+            Full parameter file. Only needed if any parameters of this
+            quantity are themselves parameterized quantities, e.g., 
+            'pq_func_par2[0]'='pq[1]'.
+            
+        """
+        
+        self._raw_pf = raw_pf
+        
         if kwargs['pq_func'] == 'pl':
             self.func = PowerLaw(**kwargs)
         elif kwargs['pq_func'] == 'pl_10':
@@ -630,37 +671,134 @@ class ParameterizedQuantity(object):
         else:
             raise NotImplemented('help')
             
-    def __call__(self, **kwargs):
+        self._compile()
+            
+    def _nest(self, val):
+        """
+        Create a nested ParameterizedQuantity if `val` is, e.g., 'pq[1]'.
+        """
+        if isinstance(val, basestring) and val.startswith('pq') and \
+           (self._raw_pf is not None):
+            pars = get_pq_pars(val, self._raw_pf)
+            return ParameterizedQuantity(raw_pf=self._raw_pf, **pars)
+            
+        return val
         
-        # Patch up kwargs. Make sure inputs are arrays and that they lie
-        # within the specified range (if there is one).
-        kw = {}
-        for key in kwargs:
-            var = np.atleast_1d(kwargs[key])
+    def _bound(self, val):
+        if type(val) in numeric_types:
+            return val
+        return None
             
-            if key != self.func.x:
-                kw[key] = var
-                continue
+    def _compile(self):
+        """
+        Build a single function that evaluates this quantity.
+        
+        All the decisions about ceilings, floors, and nested quantities are
+        made here, once, rather than every time we're called.
+        """
+        
+        func = self.func
+        
+        func.args = [self._nest(arg) for arg in func.args]
+        nested = [(i, arg) for i, arg in enumerate(func.args) \
+            if isinstance(arg, ParameterizedQuantity)]
+        args = list(func.args)
+        
+        # Should have these options for var2 also
+        clamp_var = _clamp(self._bound(func.var_floor), 
+            self._bound(func.var_ceil))
+        clamp_val = _clamp(self._bound(func.val_floor), 
+            self._bound(func.val_ceil))
+        
+        # Ceilings and floors that are themselves parameterized
+        val_ceil = self._nest(func.val_ceil)
+        val_floor = self._nest(func.val_floor)
+        if not isinstance(val_ceil, ParameterizedQuantity):
+            val_ceil = None
+        if not isinstance(val_floor, ParameterizedQuantity):
+            val_floor = None
+        
+        x = func.x
+        
+        def evaluate(**kwargs):
+            
+            # Make sure inputs are arrays and that they lie within the 
+            # specified range (if there is one).
+            kw = {key: np.atleast_1d(kwargs[key]) for key in kwargs}
+            
+            if (clamp_var is not None) and (x in kw):
+                kw[x] = clamp_var(kw[x])
             
-            # Should have these options for var2 also    
-            if self.func.var_ceil is not None:
-                if type(self.func.var_ceil) in numeric_types:
-                    var = np.minimum(var, self.func.var_ceil)
-            if self.func.var_floor is not None:
-                if type(self.func.var_floor) in numeric_types:
-                    var = np.maximum(var, self.func.var_floor)
+            if nested:
+                for i, pq in nested:
+                    args[i] = pq(**kwargs)
+                func.args = args
+            
+            y = func.__call__(**kw)
+            
+            if clamp_val is not None:
+                y = clamp_val(y)
+            if val_ceil is not None:
+                y = np.minimum(y, val_ceil(**kwargs))
+            if val_floor is not None:
+                y = np.maximum(y, val_floor(**kwargs))
                 
-            kw[key] = var
+            return y
+            
+        self._evaluate = evaluate
+        self._memo = {}
 
-        y = self.func.__call__(**kw)
+    def _memo_key(self, kwargs):
+        """
+        Cheap summary of inputs used to look for previous results.
         
-        if self.func.val_ceil is not None:
-            if type(self.func.val_ceil) in numeric_types:
-                y = np.minimum(y, self.func.val_ceil)
-        if self.func.val_floor is not None:
-            if type(self.func.val_floor) in numeric_types:
-                y = np.maximum(y, self.func.val_floor)
+        Returns None if the inputs aren't worth (or able to be) cached.
+        """
+        
+        key = []
+        for name in sorted(kwargs.keys()):
+            var = np.asarray(kwargs[name])
             
-        return y
+            if var.dtype.kind not in 'biuf':
+                return None
+            
+            if var.ndim == 0:
+                key.append((name, var.item()))
+            elif var.size == 0:
+                return None
+            else:
+                key.append((name, var.shape, var.flat[0], var.flat[-1]))
+                
+        return tuple(key)
+            
+    def __call__(self, **kwargs):
+        
+        # Repeated calls with identical inputs (e.g., the redshift and halo
+        # mass grids) are common, so hang on to recent results.
+        key = self._memo_key(kwargs)
         
+        if key in self._memo:
+            inputs, y = self._memo[key]
+            
+            same = True
+            for name in inputs:
+                if not np.array_equal(inputs[name], kwargs[name]):
+                    same = False
+                    break
+            
+            if same:
+                return y.copy()
+                
+        y = self._evaluate(**kwargs)
         
+        if key is None:
+            return y
+        
+        if len(self._memo) >= memo_max:
+            del self._memo[next(iter(self._memo))]
+        
+        inputs = {name: np.array(kwargs[name]) for name in kwargs \
+            if np.ndim(kwargs[name]) > 0}
+        self._memo[key] = inputs, np.array(y)
+            
+        return y
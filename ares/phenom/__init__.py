@@ -1,6 +1,11 @@
-from ares.phenom.Tanh21cm import Tanh21cm
-from ares.phenom.OpticalDepth import Madau1995
-from ares.phenom.Gaussian21cm import Gaussian21cm
-from ares.phenom.DustCorrection import DustCorrection
-from ares.phenom.Parametric21cm import Parametric21cm
-from ares.phenom.ParameterizedQuantity import ParameterizedQuantity
+from ares.util.Lazy import lazy_import
+
+__getattr__, __dir__ = lazy_import(__name__,
+{
+ 'Tanh21cm': ('Tanh21cm', 'Tanh21cm'),
+ 'Madau1995': ('OpticalDepth', 'Madau1995'),
+ 'Gaussian21cm': ('Gaussian21cm', 'Gaussian21cm'),
+ 'DustCorrection': ('DustCorrection', 'DustCorrection'),
+ 'Parametric21cm': ('Parametric21cm', 'Parametric21cm'),
+ 'ParameterizedQuantity': ('ParameterizedQuantity', 'ParameterizedQuantity'),
+})
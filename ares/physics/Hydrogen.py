@@ -13,7 +13,7 @@ Description: Container for hydrogen physics stuff.
 import scipy
 import numpy as np
 from types import FunctionType
-from scipy.optimize import fsolve, minimize
+from scipy.optimize import fsolve, minimize, brentq
 from ..util.ParameterFile import ParameterFile
 from ..util.Math import central_difference, interp1d
 from .Constants import A10, T_star, m_p, m_e, erg_per_ev, h, c, E_LyA, E_LL, \
@@ -72,6 +72,55 @@ tabulated_coeff = \
 
 l_LyA = h * c / E_LyA / erg_per_ev
 
+# Equation 38 in Hirata (2006), modulo 1 / T_CMB. Width is 50 MHz.
+_xalpha_tilde_coeff = 8. * np.pi * l_LyA**2 * 5e7 * T_star / 9. / A10
+
+def _Salpha_FP06(alpha):
+    """
+    Equation 18 in Furlanetto & Pritchard (2006), before clipping at zero.
+    """
+    Ai, Aip, Bi, Bip = airy(-2. * alpha / 3.**(1./3.))
+    F2 = hyp2f1(1., 4./3., 5./3., -8 * alpha**3 / 27.)
+    return 1. - 4. * alpha \
+        * (3.**(2./3.) * np.pi * Bi + 3 * alpha**2 * F2) / 9.
+        
+# Tables of S_alpha vs. log10(alpha), keyed by error tolerance. Equation 18 
+# depends on Tk, z, etc. only through alpha, so tables don't depend on 
+# cosmology and can be shared by everybody.
+_Salpha_tabs = {}
+
+def _Salpha_table(tol):
+    """
+    Tabulate Equation 18 in Furlanetto & Pritchard (2006) on a grid in 
+    log10(alpha) fine enough that linear interpolation is accurate to `tol`.
+    
+    Table ends where S_alpha first hits zero: beyond that, the solution 
+    oscillates (and is clipped at zero anyways).
+    """
+    
+    if tol in _Salpha_tabs:
+        return _Salpha_tabs[tol]
+    
+    logalpha_max = np.log10(brentq(_Salpha_FP06, 1., 3.))
+    
+    N = 64
+    while True:
+        logalpha = np.linspace(-6., logalpha_max, N)
+        S = _Salpha_FP06(10**logalpha)
+        
+        # Check errors half-way between grid points
+        mid = 0.5 * (logalpha[1:] + logalpha[:-1])
+        err = np.abs(0.5 * (S[1:] + S[:-1]) - _Salpha_FP06(10**mid))
+        
+        if np.all(err < tol):
+            break
+            
+        N *= 2
+        
+    _Salpha_tabs[tol] = logalpha, S
+        
+    return _Salpha_tabs[tol]
+
 class Hydrogen(object):
     def __init__(self, pf=None, cosm=None, **kwargs):
         
@@ -286,7 +335,8 @@ class Hydrogen(object):
         return self.RadiativeCouplingCoefficient(z, Ja, Tk, xHII)
         
     def _xtot(self, z, Tk, xHII=0.0, ne=0.0, Ja=0.0):
-        return self._xc(z, Tk, xHII, ne) + self._xa(z, Tk, xHII, ne, Ja)
+        kern = self.SpinTemperatureKernel(z, Tk, Ja, xHII, ne)
+        return kern['xc'] + kern['xa']
     
     def _xc_HH(self, z, Tk, xHII=0.0, ne=0.0):
         return self.cosm.nH(z) * (1. - xHII) * self.kappa_H(Tk) \
@@ -339,53 +389,17 @@ class Hydrogen(object):
         """
         Return radiative coupling coefficient (i.e., Wouthuysen-Field effect).
         
-        .. note :: If approx_Sa > 3, will return x_a, S_a, and T_S, which are
-            determined iteratively.
+        .. note :: If approx_Sa > 3, will return x_a, S_a, and T_S, which
+            depend on each other (see `SpinTemperatureKernel`).
         
         """
 
         if self.approx_S < 4:
             return self.xalpha_tilde(z) * self.Sa(z=z, Tk=Tk, xHII=xHII) * Ja
 
-        ##
-        # Must solve iteratively.
-        ##
-        
-        # Hirata (2006)
         if self.approx_S == 4:
-            
-            # This will correctly cause a crash if Tk is an array
-            Tk = float(Tk)
-                        
-            xi = (1e-7 * self.tauGP(z, xHII=xHII))**(1./3.) * Tk**(-2./3.)
-            a = lambda Ts: 1. - 0.0631789 / Tk + 0.115995 / Tk**2 \
-                - 0.401403 / Ts / Tk + 0.336463 / Ts / Tk**2
-            b = 1. + 2.98394 * xi + 1.53583 * xi**2 + 3.85289 * xi**3
-        
-            Sa = lambda Ts: a(Ts) / b
-                        
-            xc = self.CollisionalCouplingCoefficient(z, Tk, xHII, ne, Tr)
-            xa = lambda Ts: self.xalpha_tilde(z) * Sa(Ts) * float(Ja) * 1.
-            Tcmb = self.cosm.TCMB(z)
-            Trad = Tcmb + Tr
-            
-            Tr_inv = 1. / Trad
-            Tk_inv = 1. / Tk
-            Tc_inv = lambda Ts: Tk**-1. + 0.405535 * (Ts**-1. - Tk**-1.) / Tk
-            
-            Ts_inv = lambda Ts: (Tr_inv + xa(Ts) * Tc_inv(Ts) + xc * Tk_inv) \
-                   / (1. + xa(Ts) + xc)
-            
-            to_solve = lambda Ts: np.abs(1. / Ts / Ts_inv(Ts) - 1.)
-            
-            assert type(z) is not np.ndarray
-
-            to_solve = lambda Ts: np.abs(Ts * Ts_inv(Ts) - 1.)
-            
-            x = fsolve(to_solve, Tcmb, full_output=True, epsfcn=1e-3)  
-            Ts = abs(float(x[0]))
-            
-            return xa(Ts), Sa(Ts), Ts
+            kern = self.SpinTemperatureKernel(z, Tk, Ja, xHII, ne, Tr)
+            return kern['xa'], kern['Sa'], kern['Ts']
         else:
             raise NotImplemented('approx_Salpha>4 not currently supported!')  
             
@@ -404,15 +418,30 @@ class Hydrogen(object):
         """
         Equation 38 in Hirata (2006).
         """
-        gamma = 5e7 # 50 MHz
-        return 8. * np.pi * l_LyA**2 * gamma * T_star \
-            / 9. / A10 / self.cosm.TCMB(z)
+        return _xalpha_tilde_coeff / self.cosm.TCMB(z)
 
     def Sa(self, z=None, Tk=None, xHII=0.0, Ts=None, Ja=0.0):
         """
         Account for line profile effects.
         """
 
+        if self.approx_S == 4:
+            xa, S, Ts = self.RadiativeCouplingCoefficient(z, Ja, Tk, xHII)
+            return np.maximum(S, 0.0)
+        
+        if int(self.approx_S) == 3:
+            tau = self.tauGP(z, xHII=xHII)
+        else:
+            tau = None
+            
+        return self._Salpha(z, Tk, tau)
+        
+    def _Salpha(self, z, Tk, tau=None):
+        """
+        Line profile correction for approx_Sa < 4, given the Gunn-Peterson 
+        optical depth `tau` (only needed if approx_Sa == 3).
+        """
+        
         if self.approx_S == 0:
             raise NotImplementedError('Must use analytical formulae.')
         elif self.approx_S == 1:
@@ -421,28 +450,51 @@ class Hydrogen(object):
             S = np.exp(-0.37 * np.sqrt(1. + z) * Tk**(-2./3.)) \
                 / (1. + 0.4 / Tk)
         elif int(self.approx_S) == 3:
-            gamma = 1. / self.tauGP(z, xHII=xHII) / (1. + 0.4 / Tk)  # Eq. 4
-            alpha = 0.717 * Tk**(-2./3.) * (1e-6 / gamma)**(1. / 3.) # Eq. 20
+            gamma = 1. / tau / (1. + 0.4 / Tk)                      # Eq. 4
+            alpha = 0.717 * np.cbrt(1e-6 / gamma / Tk**2)           # Eq. 20
             
             # Gamma function approximation: Eq. 19
             if self.approx_S % 1 != 0:
                 # c1 = 4. * np.pi / 3. / np.sqrt(3.) / Gamma(2/3)
                 # c2 = 8. * np.pi / 3. / np.sqrt(3.) / Gamma(1/3)
                 S = 1. - c1 * alpha + c2 * alpha**2 - 4. * alpha**3 / 3.
-            # Actual solution: Eq. 18
+            # Actual solution: Eq. 18, possibly from lookup table
+            elif self.pf['approx_Salpha_tab']:
+                S = self._Salpha_interp(alpha)
             else:
-                Ai, Aip, Bi, Bip = airy(-2. * alpha / 3.**(1./3.))
-                F2 = hyp2f1(1., 4./3., 5./3., -8 * alpha**3 / 27.)
-                S = 1. - 4. * alpha \
-                    * (3.**(2./3.) * np.pi * Bi + 3 * alpha**2 * F2) / 9.
-            
-        elif self.approx_S == 4:
-            xa, S, Ts = self.RadiativeCouplingCoefficient(z, Ja, Tk, xHII)
+                S = _Salpha_FP06(alpha)
         else:
             raise NotImplementedError('approx_Sa must be in [1,2,3,4].')
                 
         return np.maximum(S, 0.0)
 
+    def _Salpha_interp(self, alpha):
+        """
+        Interpolate Equation 18 in Furlanetto & Pritchard (2006) from table.
+        
+        Values of alpha outside the table are computed exactly.
+        """
+        
+        logalpha, S = _Salpha_table(self.pf['approx_Salpha_tol'])
+        
+        alpha = np.asarray(alpha, dtype=float)
+        logx = np.log10(alpha)
+        
+        # Grid is regular, so no need to search for neighbors
+        u = (logx - logalpha[0]) / (logalpha[1] - logalpha[0])
+        u = np.clip(u, 0, logalpha.size - 1)
+        i = np.minimum(u.astype(int), logalpha.size - 2)
+        result = S[i] + (u - i) * (S[i+1] - S[i])
+        
+        out = np.logical_or(logx < logalpha[0], logx > logalpha[-1])
+        if np.any(out):
+            result = np.atleast_1d(result)
+            result[np.atleast_1d(out)] = \
+                _Salpha_FP06(np.atleast_1d(alpha)[np.atleast_1d(out)])
+            result = result.reshape(alpha.shape)
+            
+        return result
+        
     def ELyn(self, n):
         """ Return energy of Lyman-n photon in eV. """
         return self.BohrModel(nfrom=n, ninto=1)
@@ -510,39 +562,78 @@ class Hydrogen(object):
          
         """
         
-        x_c = self.CollisionalCouplingCoefficient(z, Tk, xHII, ne)
-        x_a = self.RadiativeCouplingCoefficient(z, Ja, Tk, xHII)
-        Tc = Tk
+        Ts = self.SpinTemperatureKernel(z, Tk, Ja, xHII, ne, Tr)['Ts']
+                            
+        return np.maximum(Ts, self.Ts_floor(z=z))
+    
+    def SpinTemperatureKernel(self, z, Tk, Ja, xHII=0.0, ne=0.0, Tr=0.0):
+        """
+        Compute coupling coefficients and the spin temperature in one pass.
+        
+        Parameters are the same as for `SpinTemperature`, and may be arrays 
+        of any shape as long as they broadcast against each other.
+        
+        Returns
+        -------
+        Dictionary containing the collisional and radiative coupling 
+        coefficients ('xc' and 'xa'), the line profile correction ('Sa'), the
+        color temperature ('Tc'), and spin temperature ('Ts', no floor). 
+        
+        """
+        
+        Tcmb = self.cosm.TCMB(z)
+        Tref = Tcmb + Tr
+        xa_tilde = _xalpha_tilde_coeff / Tcmb
+        
+        # Sum of collision rate coefficients, i.e., x_c * A10 * Tref / T_star
+        coll = self.cosm.nH(z) * (1. - xHII) * self.kappa_H(Tk) \
+            + ne * self.kappa_e(Tk)
         
-        Tref = self.cosm.TCMB(z) + Tr
- 
         if self.approx_S < 4:
-            x_a = self.RadiativeCouplingCoefficient(z, Ja, Tk, xHII, Tr, ne)
+            if int(self.approx_S) == 3:
+                tau = self.tauGP(z, xHII=xHII)
+            else:
+                tau = None
+                
+            Sa = self._Salpha(z, Tk, tau)
+            xc = coll * T_star / A10 / Tcmb
+            xa = xa_tilde * Sa * Ja
             Tc = Tk
-
-            Tref = self.cosm.TCMB(z) + Tr
-
-            Ts = (1.0 + x_c + x_a) / \
-                (Tref**-1. + x_c * Tk**-1. + x_a * Tc**-1.)
+            Ts = (1.0 + xc + xa) / (1. / Tref + xc / Tk + xa / Tc)
+            
+        elif self.approx_S == 4:
+            # Hirata (2006): S_alpha and 1 / T_c are linear in u = 1 / T_s, 
+            # i.e., S_alpha = (A0 - A1 * u) / B and 1 / T_c = C0 + C1 * u,
+            # so u is the root of a quadratic.
+            xi = (1e-7 * self.tauGP(z, xHII=xHII))**(1./3.) * Tk**(-2./3.)
+            A0 = 1. - 0.0631789 / Tk + 0.115995 / Tk**2
+            A1 = 0.401403 / Tk - 0.336463 / Tk**2
+            B = 1. + 2.98394 * xi + 1.53583 * xi**2 + 3.85289 * xi**3
+            C1 = 0.405535 / Tk
+            C0 = (1. - C1) / Tk
+            
+            xc = coll * T_star / A10 / Tref
+            
+            # x_a = P - Q * u
+            P = xa_tilde * Ja * A0 / B
+            Q = xa_tilde * Ja * A1 / B
+            
+            # alpha * u**2 - beta * u + gamma = 0. Take the root that 
+            # reduces to gamma / beta as alpha -> 0.
+            alpha = Q * (1. - C1)
+            beta = 1. + xc + P * (1. - C1) + Q * C0
+            gamma = 1. / Tref + P * C0 + xc / Tk
+            disc = np.sqrt(np.maximum(beta**2 - 4. * alpha * gamma, 0.))
+            u = 2. * gamma / (beta + disc)
+            
+            Sa = (A0 - A1 * u) / B
+            xa = xa_tilde * Sa * Ja
+            Tc = 1. / (C0 + C1 * u)
+            Ts = 1. / u
         else:
-            if type(z) == np.ndarray:
-                x_a = []; S = []; Ts = []
-                for i, red in enumerate(z):
-                    _xa, _S, _Ts = self.RadiativeCouplingCoefficient(z[i], 
-                        Ja[i], Tk[i], xHII[i], Tr[i], ne[i])
-                        
-                    x_a.append(_xa)
-                    S.append(_S)
-                    Ts.append(_Ts)
-                    
-                x_a = np.array(x_a)
-                S = np.array(S)
-                Ts = np.array(Ts)
-            else:    
-                x_a, S, Ts = self.RadiativeCouplingCoefficient(z, 
-                    Ja, Tk, xHII, Tr, ne)
-                            
-        return np.maximum(Ts, self.Ts_floor(z=z))
+            raise NotImplemented('approx_Salpha>4 not currently supported!')
+            
+        return {'xc': xc, 'xa': xa, 'Sa': Sa, 'Tc': Tc, 'Ts': Ts}
     
     def dTb(self, z, xavg, Ts, Tr=0.0):
         """
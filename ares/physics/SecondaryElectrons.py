@@ -39,6 +39,17 @@ prefix = os.path.join('input','secondary_electrons')
 # our spline will get screwed up since log(0) = inf
 tiny_number = 1e-20
 
+# Channels in Furlanetto & Stoever tables, in the order they're stacked 
+channels = ['heat', 'h_1', 'he_1', 'he_2', 'lya', 'exc']
+
+# Resolution of regular (log E, log x) grid used for fast lookups 
+NE_lookup = 512
+Nx_lookup = 128
+
+# Furlanetto & Stoever tables (and lookup grids), keyed by filename, so we 
+# only read and resample them once per session.
+_fs10_cache = {}
+
 class SecondaryElectrons(object):
     def __init__(self, method=0):
         self.method = method
@@ -57,6 +68,10 @@ class SecondaryElectrons(object):
         else:
             self.fn = os.path.join(ARES,prefix,'secondary_electron_data.pkl')
             have_hdf5_file = False
+            
+        if self.fn in _fs10_cache:
+            self.__dict__.update(_fs10_cache[self.fn])
+            return
 
         if have_h5py and have_hdf5_file:
             f = h5py.File(self.fn, 'r')
@@ -79,8 +94,17 @@ class SecondaryElectrons(object):
             
         self._logx = np.log10(self.x)    
          
-        # Now, setup splines
-        from scipy.interpolate import RectBivariateSpline, interp2d
+        self._setup_splines()
+        self._setup_lookup()
+        
+        _fs10_cache[self.fn] = {key: self.__dict__[key] for key in \
+            ['E', '_x', '_logx', 'fh_tab', 'fionHI_tab', 'fionHeI_tab', 
+             'fionHeII_tab', 'fexc_tab', 'flya_tab', 'fion_tab', 'fh', 'fHI', 
+             'fHeI', 'fHeII', 'fexc', 'flya', '_lookup', '_lookup_logE', 
+             '_lookup_logx']}
+             
+    def _setup_splines(self):
+        from scipy.interpolate import RectBivariateSpline
         
         self.fh = RectBivariateSpline(self.E, self.x, self.fh_tab)
         self.fHI = RectBivariateSpline(self.E, self.x, self.fionHI_tab)
@@ -88,6 +112,27 @@ class SecondaryElectrons(object):
         self.fHeII = RectBivariateSpline(self.E, self.x, self.fionHeII_tab)
         self.fexc = RectBivariateSpline(self.E, self.x, self.fexc_tab)
         self.flya = RectBivariateSpline(self.E, self.x, self.flya_tab) 
+        
+    def _setup_lookup(self):
+        """
+        Resample splines onto a regular grid in (log E, log x).
+        
+        Sets `_lookup`, an array with shape (channels, NE_lookup, Nx_lookup),
+        which we can interpolate bilinearly without any searching.
+        """
+        
+        self._lookup_logE = np.linspace(np.log10(self.E.min()), 
+            np.log10(self.E.max()), NE_lookup)
+        self._lookup_logx = np.linspace(self.logx.min(), self.logx.max(), 
+            Nx_lookup)
+        
+        E = 10**self._lookup_logE
+        x = 10**self._lookup_logx
+        
+        splines = [self.fh, self.fHI, self.fHeI, self.fHeII, self.flya, 
+            self.fexc]
+        
+        self._lookup = np.array([spl(E, x) for spl in splines])
             
     @property
     def logx(self):
@@ -154,56 +199,93 @@ class SecondaryElectrons(object):
             
         # Ricotti, Gnedin, & Shull (2002)
         if method == 2:
+            
+            # Energies may be an array too, so branch with np.where. Pin 
+            # inputs to the range where each fit applies to avoid warnings.
+            E = np.asarray(E, dtype=float)
+            
             if channel == 'heat': 
-                tmp = tiny_number * np.zeros_like(xHII)
-                tmp[xHII <= 1e-4] = 0.15 * np.ones_like(tmp[xHII <= 1e-4]) 
-                if E >= 11:
-                    tmp[xHII > 1e-4] = 3.9811 * (11. / E)**0.7 \
-                        * pow(xHII[xHII > 1e-4], 0.4) * \
-                        (1. - pow(xHII[xHII > 1e-4] , 0.34))**2 + \
-                        (1. - (1. - pow(xHII[xHII > 1e-4] , 0.2663))**1.3163)
-                else:
-                    tmp[xHII > 1e-4] = (1. - tiny_number) \
-                        * np.ones_like(tmp[xHII > 1e-4]) 
-                    
-                return tmp
+                x = np.maximum(xHII, 1e-4)
+                fit = 3.9811 * (11. / np.maximum(E, 11.))**0.7 \
+                    * pow(x, 0.4) * (1. - pow(x, 0.34))**2 + \
+                    (1. - (1. - pow(x, 0.2663))**1.3163)
+                
+                return np.where(xHII <= 1e-4, 0.15, 
+                    np.where(E >= 11, fit, 1. - tiny_number))
                     
             if channel == 'h_1': 
-                if E >= 28:
-                    return np.maximum(-0.6941 * (28. / E)**0.4 * pow(xHII, 0.2) * \
-                        (1. - pow(xHII, 0.38))**2 + \
-                        0.3908 * (1. - pow(xHII, 0.4092))**1.7592, tiny_number)
-                else:
-                    return tiny_number * np.zeros_like(xHII)
+                fit = -0.6941 * (28. / np.maximum(E, 28.))**0.4 \
+                    * pow(xHII, 0.2) * (1. - pow(xHII, 0.38))**2 + \
+                    0.3908 * (1. - pow(xHII, 0.4092))**1.7592
+                return np.where(E >= 28, np.maximum(fit, tiny_number), 0.0)
             if channel == 'he_1': 
-                if E >= 28:
-                    return np.maximum(-0.0984 * (28. / E)**0.4 * pow(xHII, 0.2) * \
-                        (1. - pow(xHII, 0.38))**2 + \
-                        0.0554 * (1. - pow(xHII, 0.4614))**1.6660, tiny_number)
-                else:
-                    return tiny_number * np.zeros_like(xHII)
+                fit = -0.0984 * (28. / np.maximum(E, 28.))**0.4 \
+                    * pow(xHII, 0.2) * (1. - pow(xHII, 0.38))**2 + \
+                    0.0554 * (1. - pow(xHII, 0.4614))**1.6660
+                return np.where(E >= 28, np.maximum(fit, tiny_number), 0.0)
             if channel == 'he_2': 
-                return tiny_number * np.zeros_like(xHII)
+                return tiny_number * np.zeros_like(xHII * E)
         
         # Furlanetto & Stoever (2010)
         if method == 3:
+            return self.AllDepositionFractions(xHII, E)[channel]
             
-            f = tiny_number * np.zeros_like(xHII)
-            
-            for i, x in enumerate(xHII):
+    def AllDepositionFractions(self, xHII, E=None):
+        """
+        Return Furlanetto & Stoever (2010) deposition fractions in all
+        channels at once.
+        
+        Uses bilinear interpolation in (log E, log x) on tables resampled 
+        from the original splines. Values outside the tabulated range are 
+        pinned to the boundary.
+        
+        Parameters
+        ----------
+        xHII : int, float, np.ndarray
+            Ionized fraction(s).
+        E : int, float, np.ndarray
+            Electron energy(ies) in eV. Must be broadcastable against `xHII`.
             
-                if channel == 'heat':
-                    f[i] = self.fh(E, x)
-                if channel == 'h_1': 
-                    f[i] = self.fHI(E, x)
-                if channel == 'he_1': 
-                    f[i] = self.fHeI(E, x)
-                if channel == 'he_2': 
-                    f[i] = self.fHeII(E, x)
-                if channel == 'lya':
-                    f[i] = self.flya(E, x)
-                if channel == 'exc':
-                    f[i] = self.fexc(E, x)
+        Returns
+        -------
+        Dictionary of arrays, one per channel, each with shape equal to that 
+        of the broadcast `xHII` and `E` arrays. Channels are 'heat', 'h_1', 
+        'he_1', 'he_2', 'lya', and 'exc'.
+        
+        """
+        
+        if not hasattr(self, '_lookup'):
+            self._load_data()
+        
+        if not isinstance(xHII, Iterable):
+            xHII = np.array([xHII])
             
-            return f
+        if E is None: 
+            E = tiny_number
+        
+        logx, logE = np.broadcast_arrays(
+            np.log10(np.maximum(xHII, tiny_number)), 
+            np.log10(np.maximum(E, tiny_number)))
+        
+        # Fractional indices into regular grid
+        ui = self._fractional_index(logE, self._lookup_logE)
+        uj = self._fractional_index(logx, self._lookup_logx)
+        i = np.minimum(ui.astype(int), NE_lookup - 2)
+        j = np.minimum(uj.astype(int), Nx_lookup - 2)
+        di = ui - i
+        dj = uj - j
+        
+        tab = self._lookup
+        f = tab[:,i,j] * (1. - di) * (1. - dj) \
+          + tab[:,i+1,j] * di * (1. - dj) \
+          + tab[:,i,j+1] * (1. - di) * dj \
+          + tab[:,i+1,j+1] * di * dj
             
+        return {channel: f[k] for k, channel in enumerate(channels)}
+        
+    def _fractional_index(self, val, grid):
+        """
+        Position of `val` on regular `grid` in units of grid spacing.
+        """
+        u = (val - grid[0]) / (grid[1] - grid[0])
+        return np.clip(u, 0, grid.size - 1)
@@ -1,10 +1,15 @@
-import ares.physics.Constants
-from ares.physics.Hydrogen import Hydrogen
-from ares.physics.Cosmology import Cosmology
-from ares.physics.HaloModel import HaloModel
-from ares.physics.ExcursionSet import ExcursionSet
-from ares.physics.NebularEmission import NebularEmission
-from ares.physics.HaloMassFunction import HaloMassFunction
-from ares.physics.RateCoefficients import RateCoefficients
-from ares.physics.SecondaryElectrons import SecondaryElectrons
-from ares.physics.CrossSections import PhotoIonizationCrossSection
+from ares.util.Lazy import lazy_import
+
+__getattr__, __dir__ = lazy_import(__name__,
+{
+ 'Constants': ('Constants', None),
+ 'Hydrogen': ('Hydrogen', 'Hydrogen'),
+ 'Cosmology': ('Cosmology', 'Cosmology'),
+ 'HaloModel': ('HaloModel', 'HaloModel'),
+ 'ExcursionSet': ('ExcursionSet', 'ExcursionSet'),
+ 'NebularEmission': ('NebularEmission', 'NebularEmission'),
+ 'HaloMassFunction': ('HaloMassFunction', 'HaloMassFunction'),
+ 'RateCoefficients': ('RateCoefficients', 'RateCoefficients'),
+ 'SecondaryElectrons': ('SecondaryElectrons', 'SecondaryElectrons'),
+ 'PhotoIonizationCrossSection': ('CrossSections', 'PhotoIonizationCrossSection'),
+})
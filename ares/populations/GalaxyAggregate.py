@@ -90,7 +90,7 @@ class GalaxyAggregate(HaloPopulation):
                 self._sfrd_ = self.pf['pop_sfrd']
             elif self.pf['pop_sfrd'][0:2] == 'pq':
                 pars = get_pq_pars(self.pf['pop_sfrd'], self.pf)
-                self._sfrd_ = ParameterizedQuantity(**pars)
+                self._sfrd_ = ParameterizedQuantity(raw_pf=self.pf, **pars)
             else:
                 tmp = read_lit(self.pf['pop_sfrd'], verbose=self.pf['verbose'])
                 self._sfrd_ = lambda z: tmp.SFRD(z, **self.pf['pop_kwargs'])
@@ -133,7 +133,7 @@ class GalaxyCohort(GalaxyAggregate,BlobFactory):
                 pars = tmp            
             Mmin = lambda z: self.Mmin
             #result = ParameterizedQuantity({'pop_Mmin': Mmin}, self.pf, **pars)
-            result = ParameterizedQuantity(**pars)
+            result = ParameterizedQuantity(raw_pf=self.pf, **pars)
 
             self._update_pq_registry(name, result)
             
@@ -2082,7 +2082,7 @@ class GalaxyCohort(GalaxyAggregate,BlobFactory):
                 elif self.pf['pop_mlf'][0:2] == 'pq':
                     pars = get_pq_pars(self.pf['pop_mlf'], self.pf)
                     Mmin = lambda z: np.interp(z, self.halos.tab_z, self._tab_Mmin)
-                    self._mlf_inst = ParameterizedQuantity(**pars)
+                    self._mlf_inst = ParameterizedQuantity(raw_pf=self.pf, **pars)
                     self._update_pq_registry('mlf', self._mlf_inst)
                     
                     self._fstar = \
@@ -2101,7 +2101,7 @@ class GalaxyCohort(GalaxyAggregate,BlobFactory):
                     #
                     #self._update_pq_registry('fstar', self._fstar_inst)    
 
-                    self._fstar_inst = ParameterizedQuantity(**pars)
+                    self._fstar_inst = ParameterizedQuantity(raw_pf=self.pf, **pars)
 
                     self._fstar = \
                         lambda **kwargs: self._fstar_inst.__call__(**kwargs) \
@@ -18,6 +18,7 @@ import numpy as np
 from ..util import read_lit
 from ..util.Math import smooth
 from ..util import ProgressBar
+from ..util.MPIPool import LocalPool
 from ..util.Survey import Survey
 from .Halo import HaloPopulation
 from scipy.optimize import curve_fit
@@ -46,9 +47,428 @@ def _linfunc(x, x0, p0, p1):
 def _quadfunc2(x, x0, p0, p1):  
     return p0 * (x - x0)**2 + p1
  
-def _quadfunc3(x, x0, p0, p1, p2):  
+def _quadfunc3(x, x0, p0, p1, p2):
     return p0 * (x - x0)**2 + p1 * (x - x0) + p2
-       
+
+def _burst_mask(rng, fduty, i_on, Nt, active=None):
+    """
+    Generate on/off star formation histories for all halos at once.
+
+    Parameters
+    ----------
+    rng : np.random.Generator
+        Random number generator.
+    fduty : np.ndarray
+        Target duty cycle for each halo, i.e., fraction of time steps with
+        star formation.
+    i_on : int
+        Length of each burst in time steps.
+    Nt : int
+        Number of time steps.
+    active : np.ndarray
+        Boolean mask of halos to consider. Others are never switched on.
+
+    Bursts start at random (uniformly distributed) time steps, and are
+    added to a halo until the fraction of time steps that are 'on' reaches
+    `fduty`. If a halo is short of its target by d time steps, the next
+    ceil(d / i_on) bursts can't possibly overshoot it, so we draw that many
+    at once, for all halos at once, and repeat until everybody is done.
+    This yields the same distribution of histories as adding one burst at
+    a time.
+
+    Returns
+    -------
+    Boolean array with dimensions (number of halos, number of times).
+
+    """
+
+    Nh = fduty.size
+    i_on = max(int(i_on), 1)
+
+    if active is None:
+        active = np.ones(Nh, dtype=bool)
+
+    on = np.zeros((Nh, Nt), dtype=bool)
+    on[np.logical_and(active, fduty >= 1)] = True
+
+    target = fduty * Nt
+    todo = np.argwhere(np.logical_and(active, fduty < 1)).squeeze(axis=1)
+    while todo.size > 0:
+        deficit = target[todo] - on[todo].sum(axis=1)
+        todo = todo[deficit > 0]
+        if todo.size == 0:
+            break
+
+        N = np.ceil(deficit[deficit > 0] / i_on).astype(int)
+        K = N.max()
+
+        # Burst start indices. Ignore draws beyond each halo's quota.
+        j1 = rng.integers(0, Nt, size=(todo.size, K))
+        j2 = np.minimum(j1 + i_on, Nt)
+        ok = np.arange(K)[None,:] < N[:,None]
+        row = np.repeat(np.arange(todo.size)[:,None], K, axis=1)
+
+        # Paint bursts via cumulative sum of +1 (start) and -1 (end) flags.
+        size = todo.size * (Nt + 1)
+        flags = np.bincount(row[ok] * (Nt + 1) + j1[ok], minlength=size) \
+              - np.bincount(row[ok] * (Nt + 1) + j2[ok], minlength=size)
+        flags = flags.reshape(todo.size, Nt + 1)
+        on[todo] |= np.cumsum(flags[:,0:-1], axis=1) > 0
+
+    return on
+
+def _draw_massive_stars(rng, kern, Mc):
+    """
+    Draw the number of massive stars (M >= 8 Msun), i.e., eventual SNe, in
+    clusters of mass `Mc`.
+
+    .. note :: If pop_sample_imf, this is an *approximation* to drawing
+        stars one at a time from the IMF until we reach `Mc` (what the old
+        cluster-by-cluster loop did, at a cost of ~Mc / <m> draws per
+        cluster). Instead, the number of stars is Poisson with mean
+        Mc / <m>, each of which is massive with probability `p_massive`.
+        This gets the mean number of SNe per cluster right, but, since
+        the total mass isn't fixed, overestimates the scatter somewhat
+        (by ~30% in the variance for a Salpeter IMF).
+
+    """
+
+    if kern['sample_imf']:
+        Nstars = rng.poisson(Mc / kern['m_avg'])
+        return rng.binomial(Nstars, kern['p_massive'])
+
+    return rng.poisson(Mc * kern['nsn_per_m'])
+
+def _form_clusters(rng, kern, Mg, N_SN_p, vesc, dt_myr, p_now, max_draws=2**22):
+    """
+    Draw star clusters in all halos at once until each one runs out of gas
+    or blows it away.
+
+    Parameters
+    ----------
+    rng : np.random.Generator
+        Random number generator.
+    kern : dict
+        Tables and parameters, see `GalaxyEnsemble._stochastic_kernel`.
+    Mg : np.ndarray
+        Gas mass available for star formation in each halo [Msun].
+    N_SN_p : np.ndarray
+        Number of SNe from stars formed in previous steps that go off now.
+    vesc : np.ndarray
+        Escape velocity of each halo [cm/s].
+    dt_myr : float
+        Length of this time step [Myr].
+    p_now : float
+        Probability that a SN from stars formed now also goes off now.
+
+    Clusters are drawn in rounds of K per halo. Within a round, the state
+    (stellar mass, wind mass, etc.) after each would-be cluster is just a
+    cumulative sum, so we can find the first cluster that violates the
+    stopping criteria without looping over clusters. Feedback often shuts
+    things down long before the gas runs out, so K starts small and
+    doubles each round.
+
+    Returns
+    -------
+    Tuple: (stellar mass formed, wind mass, # SNe now, # SNe later), each
+    an array with one element per halo.
+
+    """
+
+    N = Mg.size
+    Ms = np.zeros(N)
+    N_now = np.zeros(N)
+    N_fut = np.zeros(N)
+    E_UV = np.zeros(N)
+
+    target = Mg * kern['fstar']
+
+    # Wind mass per SN [Msun] and per erg of UV
+    k_sne = 2 * 1e51 * kern['coupling_sne'] / vesc**2 / g_per_msun
+    k_rad = 2 * kern['coupling_rad'] / vesc**2 / g_per_msun
+
+    # UV energy injected per massive star
+    if kern['feedback_rad']:
+        corr = min(kern['tavg'] / dt_myr, 1.)
+        e_UV = kern['Lavg'] * dt_myr * corr * 1e6 * s_per_yr
+    else:
+        e_UV = 0.0
+
+    # Halos with no sensible gas supply or escape velocity (e.g., Mh=0) can
+    # never meet the stopping criteria, so don't form any stars in them.
+    ok = np.isfinite(target) & np.isfinite(Mg) & np.isfinite(k_sne) \
+        & np.isfinite(k_rad) & np.isfinite(N_SN_p)
+
+    K = 16
+    done = ~ok
+    while not np.all(done):
+        act = np.argwhere(~done).squeeze(axis=1)
+
+        # Number of clusters to draw this round: no more than needed to
+        # finish off the neediest halo, or than fit in memory.
+        Mw = k_sne[act] * (N_SN_p[act] + N_now[act]) + k_rad[act] * E_UV[act]
+        need = np.max(target[act] - Ms[act] - Mw) / kern['Mcl_avg']
+        K = int(max(min(K, 1.2 * need, max_draws // act.size), 16))
+
+        Mc = np.interp(rng.random((act.size, K)), kern['cl_cdf'],
+            kern['cl_M'])
+
+        # Number of massive stars, i.e., eventual SNe, in each cluster.
+        N_MS = _draw_massive_stars(rng, kern, Mc)
+
+        if p_now == 1:
+            now = N_MS
+        elif p_now == 0:
+            now = np.zeros_like(N_MS)
+        else:
+            now = rng.binomial(N_MS, p_now)
+
+        # State before each cluster is added.
+        Ms_c = Ms[act,None] + np.cumsum(Mc, axis=1) - Mc
+        N_c = N_now[act,None] + np.cumsum(now, axis=1) - now
+        E_c = E_UV[act,None] + e_UV * (np.cumsum(N_MS, axis=1) - N_MS)
+        Mw_c = k_sne[act,None] * (N_SN_p[act,None] + N_c)
+        Mw_rad_c = k_rad[act,None] * E_c
+
+        # Stop when we've used up the gas, or if a proposed cluster would
+        # take up all the rest of our gas (and then some).
+        stop = np.logical_or((Mw_c + Mw_rad_c + Ms_c) >= target[act,None],
+            (Ms_c + Mc + Mw_c) >= Mg[act,None])
+
+        # Clusters before the first `stop` are accepted.
+        acc = np.cumsum(stop, axis=1) == 0
+
+        Ms[act] += np.sum(Mc * acc, axis=1)
+        N_now[act] += np.sum(now * acc, axis=1)
+        N_fut[act] += np.sum((N_MS - now) * acc, axis=1)
+        E_UV[act] += e_UV * np.sum(N_MS * acc, axis=1)
+        done[act] = np.any(stop, axis=1)
+
+        K *= 2
+
+    Mw = np.zeros(N)
+    Mw[ok] = k_sne[ok] * (N_SN_p[ok] + N_now[ok]) + k_rad[ok] * E_UV[ok]
+
+    return Ms, Mw, N_now, N_fut
+
+def _evolve_stochastic(args):
+    """
+    Evolve a chunk of galaxies in time, forming stars one cluster at a time.
+
+    This is a module-level function (rather than a GalaxyEnsemble method)
+    so that chunks can be farmed out to worker processes.
+
+    Parameters
+    ----------
+    args : tuple
+        (Mh, MAR, vesc, Eh, seed, kern), where the first four are 2-D
+        arrays with shape (number of halos, number of times) in order of
+        *ascending time*, `seed` is a np.random.SeedSequence, and `kern` is
+        a dictionary (see `GalaxyEnsemble._stochastic_kernel`).
+
+    Returns
+    -------
+    Dictionary of 2-D arrays, with the same shape as `Mh`.
+
+    """
+
+    Mh, MAR, vesc, Eh, seed, kern = args
+
+    rng = np.random.default_rng(seed)
+
+    t = kern['t']
+    z = kern['z']
+    fb = kern['fb']
+    Nh, Nt = Mh.shape
+
+    SFR = np.zeros_like(Mh)
+    Msc = np.zeros_like(Mh)
+    Mg_t = np.zeros_like(Mh)
+    Mg_c = np.zeros_like(Mh)
+    Nsn = np.zeros_like(Mh)
+    bursty = np.zeros_like(Mh)
+
+    # SNe scheduled for the future.
+    SN = np.zeros_like(Mh)
+
+    # Time step at which each halo forms
+    exists = Mh > 0
+    iform = np.argmax(exists, axis=1)
+
+    for i in range(Nt - 1):
+
+        Msc[:,i+1] = Msc[:,i]
+
+        if z[i] < kern['zstop']:
+            continue
+
+        alive = exists[:,i]
+        if not np.any(alive):
+            continue
+
+        # In years
+        dt_myr = t[i+1] - t[i]
+        dt = dt_myr * 1e6
+
+        born = np.logical_and(alive, iform == i)
+        Mg_t[born,i] = fb * Mh[born,i]
+
+        # Determine gas supply
+        if kern['multiphase']:
+            j = kern['ifut'][i]
+        else:
+            j = i
+
+        Mg_c[alive,j] = Mg_t[alive,i]
+
+        # Gas we will accrete on this timestep
+        Macc = fb * 0.5 * (MAR[:,i+1] + MAR[:,i]) * dt
+
+        ##
+        # Override switch to smooth inflow-driven star formation model.
+        ##
+        eq = np.logical_and(alive, Eh[:,i] > (1e51 * kern['force_eq']))
+        if np.any(eq):
+            # Assume 1e51 * SNR * dt = 1e51 * SFR * SN/Mstell * dt = E_h
+            eta = 2. * kern['coupling_sne'] * 1e51 * kern['nsn_per_m'] \
+                / g_per_msun / vesc[eq,i]**2
+
+            SFR[eq,i] = fb * MAR[eq,i] / (1. + eta)
+            Msc[eq,i+1] += SFR[eq,i] * dt
+            Mg_t[eq,i+1] = np.maximum(Mg_t[eq,i] + Macc[eq] \
+                - SFR[eq,i] * dt, 0.)
+            Nsn[eq,i] = SFR[eq,i] * dt * kern['nsn_per_m']
+
+        ##
+        # FORM STARS!
+        ##
+        burst = np.logical_and(alive, ~eq)
+        if not np.any(burst):
+            continue
+
+        Mg_c[burst,j] += Macc[burst]
+
+        p_now, p_fut = kern['p_delay'][i]
+
+        Mnew, Mw, N_now, N_fut = _form_clusters(rng, kern, Mg_c[burst,i],
+            SN[burst,i], vesc[burst,i], dt_myr, p_now)
+
+        # Schedule SNe from stars formed now that go off later.
+        if np.any(N_fut > 0):
+            if kern['delay_sne'] == 1:
+                SN[burst,i+p_fut] += N_fut
+            else:
+                SN[burst,i+1:] += rng.multinomial(N_fut.astype(int), p_fut)
+
+        Mg_t[burst,i+1] = np.maximum(Mg_t[burst,i] + Macc[burst] - Mnew - Mw,
+            0.)
+
+        if kern['multiphase']:
+            Mg_c[:,i+1] = np.maximum(Mg_c[:,i+1], 0.)
+
+        # Flag this step as bursty.
+        bursty[burst,i] = 1
+
+        SFR[burst,i] = Mnew / dt
+        Msc[burst,i+1] += Mnew
+        Nsn[burst,i] = SN[burst,i] + N_now
+
+    data = \
+    {
+     'SFR': SFR,
+     'Mg': Mg_t,
+     'Mg_c': Mg_c,
+     'Ms': Msc, # *cumulative* stellar mass!
+     'Nsn': Nsn,
+     'bursty': bursty,
+    }
+
+    return data
+
+# Set by `GalaxyEnsemble.SaveCatalog` so that worker processes inherit the
+# population (and its histories) rather than having it pickled for each task.
+_catalog_pop = None
+
+def _catalog_block(args):
+    """
+    Compute properties, spectra, and photometry for a block of galaxies.
+
+    Parameters
+    ----------
+    args : tuple
+        Redshift, index of that redshift in `histories`, first and last
+        (exclusive) galaxy in block, and dictionary of options (see
+        `GalaxyEnsemble.SaveCatalog`).
+
+    Returns
+    -------
+    Tuple: (redshift, first galaxy, last galaxy, results), where results is
+    a dictionary of arrays, each with one row per galaxy in block.
+
+    """
+
+    z, iz, i0, i1, kw = args
+
+    pop = _catalog_pop
+
+    assert pop is not None, "Worker processes must be forked!"
+
+    hist = pop.histories
+    Ngal = hist['SFR'].shape[0]
+
+    blk = {}
+    for key, val in hist.items():
+        if isinstance(val, np.ndarray) and (val.ndim > 1) and \
+           (val.shape[0] == Ngal):
+            blk[key] = val[i0:i1]
+        else:
+            blk[key] = val
+
+    data = {}
+    for field in kw['fields']:
+        val = blk[field]
+        if isinstance(val, np.ndarray) and val.ndim > 1:
+            data[field] = val[:,iz]
+        else:
+            data[field] = val * np.ones(i1 - i0)
+
+    if not (kw['save_spec'] or (kw['filters'] is not None)):
+        return z, i0, i1, data
+
+    waves = kw['waves']
+    spec = pop.synth.Spectrum(waves, sfh=blk['SFR'], zarr=hist['z'],
+        window=1, zobs=z, units='Hz', hist=blk, extras=pop.extras,
+        load=False)
+
+    if kw['save_spec']:
+        data['spec'] = spec
+
+    if kw['filters'] is None:
+        return z, i0, i1, data
+
+    filters = kw['filters']
+    if type(filters) is dict:
+        filters = filters[round(z)]
+
+    owaves, oflux = pop.synth.ObserveSpectrum(z, spec=spec, waves=waves,
+        extras=pop.extras)
+
+    names, cent, mags = [], [], []
+    for cam in kw['cam']:
+        _names, xphot, wphot, ycorr = pop.synth.Photometry(zobs=z,
+            ospec=oflux.copy(), owaves=owaves, waves=waves, cam=cam,
+            filters=filters, dlam=kw['dlam'])
+
+        names.extend([str(name) for name in _names])
+        cent.extend(xphot)
+        mags.extend(list(ycorr))
+
+    data['filters'] = names
+    data['filt_cent'] = np.array(cent)
+    data['mags'] = np.reshape(np.array(mags).T, (i1 - i0, len(names)))
+
+    return z, i0, i1, data
+
 pars_affect_mars = ["pop_MAR", "pop_MAR_interp", "pop_MAR_corr"]
 pars_affect_sfhs = ["pop_scatter_sfr", "pop_scatter_sfe", "pop_scatter_mar"]
 pars_affect_sfhs.extend(["pop_update_dt", "pop_thin_hist"])
@@ -152,6 +572,18 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
         """
         Will convert to internal cgs units.
         """
+        
+        # Streaming halos from disk: just use accumulated SFRD.
+        if (self.pf['pop_hist_chunk'] is not None) and (Mmin is None):
+            if not hasattr(self, '_tab_sfrd_chunked'):
+                self.RunSAMChunked()
+                
+            zarr, sfrd = self._tab_sfrd_chunked
+            iz = np.argmin(np.abs(np.atleast_1d(z)[:,None] - zarr), axis=1)
+            
+            if type(z) in [int, float, np.float64]:
+                return sfrd[iz[0]]
+            return sfrd[iz]
                 
         if type(z) in [int, float, np.float64]:
         
@@ -266,16 +698,23 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
     def _cache_halos(self, value):
         self._cache_halos_ = value
             
-    def _gen_halo_histories(self):
+    def _gen_halo_histories(self, rows=None):
         """
         From a set of smooth halo assembly histories, build a bigger set
         of histories by thinning, and (optionally) adding scatter to the MAR. 
+        
+        Parameters
+        ----------
+        rows : slice
+            If supplied, only generate histories for this block of halos,
+            i.e., rows of the halo catalog. Results are not cached.
+            
         """            
         
-        if hasattr(self, '_cache_halos_'):
+        if hasattr(self, '_cache_halos_') and (rows is None):
             return self._cache_halos
 
-        raw = self.load()
+        raw = self.load(rows=rows)
         
         thin = self.pf['pop_thin_hist']
         
@@ -350,8 +789,12 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
             any_viable = np.sum(is_viable, axis=1)
             
             # Cut out halos that never exist in our mass range of interest.
-            ilo = np.min(np.argwhere(any_viable > 0))
-            ihi = np.max(np.argwhere(any_viable > 0)) + 1
+            # (A block of halos may not have any).
+            if np.any(any_viable > 0):
+                ilo = np.min(np.argwhere(any_viable > 0))
+                ihi = np.max(np.argwhere(any_viable > 0)) + 1
+            else:
+                ilo = ihi = 0
 
             # Also cut out some redshift range.        
             zok = np.logical_and(zall >= self.pf['pop_synth_zmin'],
@@ -388,7 +831,10 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
             mar *= (1. + self.noise_normal(mar, sigma_env))
 
         if sigma_mar > 0:
-            np.random.seed(self.pf['pop_scatter_mar_seed'])
+            # When streaming blocks of halos, only seed once, otherwise 
+            # every block would get the same noise.
+            if (rows is None) or (rows.start in [0, None]):
+                np.random.seed(self.pf['pop_scatter_mar_seed'])
             noise = self.noise_lognormal(mar, sigma_mar)
             mar += noise
             # Normalize by mean of log-normal to preserve mean MAR?
@@ -484,6 +930,149 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
         """
                 
         return self._gen_galaxy_histories()
+        
+    def RunSAMChunked(self, redshifts=None, chunk=None, Msbins=None, 
+        wave=1600., window=1, band=None, zsmf=None, zlf=None):
+        """
+        Run models one block of halos at a time, accumulating statistics.
+        
+        Only one block of halo (and galaxy) histories is ever in memory, so
+        peak memory use is set by `chunk` rather than the size of the halo 
+        catalog (as long as it's stored in HDF5 format). Results are saved
+        in the caches used by `StellarMassFunction`, `LuminosityFunction`, 
+        and `SFRD`, which will just return them from now on.
+        
+        Parameters
+        ----------
+        redshifts : list
+            Redshifts at which to compute stellar mass and luminosity 
+            functions. If None, will only compute the SFRD.
+        zsmf, zlf : list
+            Redshifts at which to compute only the stellar mass function 
+            or only the luminosity function, respectively. Use these to get
+            everything needed (e.g., by a likelihood) in one pass through
+            the catalog.
+        chunk : int
+            Number of halos per block. If None, will use `pop_hist_chunk`.
+        Msbins : np.ndarray
+            log10 stellar masses at which to evaluate SMF (bin centers).
+        wave : int, float
+            Rest wavelength of interest for LF [Angstrom].
+        window, band
+            Passed to `synth.Luminosity`, see `LuminosityFunction`.
+            
+        Returns
+        -------
+        Dictionary containing the SFRD at all redshifts in our grid (keys
+        'z' and 'SFRD'), and stellar mass and luminosity functions ('smf' 
+        and 'lf'), which are themselves dictionaries with redshifts as keys
+        and (bin centers, number density) tuples as values.
+        
+        """
+        
+        if chunk is None:
+            chunk = self.pf['pop_hist_chunk']
+            
+        assert chunk is not None, \
+            "Must supply `chunk` or set `pop_hist_chunk`!"
+        
+        if redshifts is None:
+            redshifts = []
+        
+        zsmf = list(redshifts) + [z for z in (zsmf or []) \
+            if z not in redshifts]
+        zlf = list(redshifts) + [z for z in (zlf or []) \
+            if z not in redshifts]
+        
+        # Same bins as `StellarMassFunction` and `LuminosityFunction`
+        if (Msbins is None) or (type(Msbins) is not np.ndarray):
+            Mbinw = 0.5
+            Msbins = np.arange(6., 13.+Mbinw, Mbinw)
+        else:
+            dx = np.diff(Msbins)
+            assert np.allclose(np.diff(dx), 0)
+            Mbinw = dx[0]
+            
+        mags = np.arange(-28, 5., self.pf['pop_mag_bin'])
+        
+        smf = {z: np.zeros(Msbins.size) for z in zsmf}
+        lf = {z: np.zeros(mags.size) for z in zlf}
+        lf_N = {z: 0.0 for z in zlf}
+        sfrd = 0.0
+        
+        N = self._num_halos
+        
+        pb = ProgressBar(N, name='sam', use=self.pf['progress_bar'])
+        pb.start()
+        
+        for k, i in enumerate(range(0, N, chunk)):
+            
+            self._chunk_id = k
+            self._cache_halos = self._gen_halo_histories(rows=slice(i, i+chunk))
+            hist = self._gen_galaxy_histories()
+            
+            zarr = hist['z']
+            SFR = hist['SFR']
+            nh = hist['nh']
+            
+            sfrd = sfrd + np.sum(SFR * nh * (SFR > 0), axis=0)
+            
+            for z in zsmf:
+                iz = np.argmin(np.abs(z - zarr))
+                smf[z] += np.histogram(hist['Ms'][:,iz], bins=10**bin_c2e(Msbins),
+                    weights=nh[:,iz])[0]
+                
+            for z in zlf:
+                # See `LuminosityFunction`
+                izobs = np.argmin(np.abs(zarr - z))
+                if z > zarr[izobs]:
+                    izobs += 1
+                izobs = min(izobs, len(zarr) - 2)
+                
+                L = self.synth.Luminosity(wave=wave, zobs=z, hist=hist, 
+                    extras=self.extras, window=window, band=band, load=False,
+                    use_cache=False)
+                    
+                _MAB = self.magsys.L_to_MAB(L, z=z)
+                
+                if self.pf['dustcorr_method'] is not None:
+                    MAB = self.dust.Mobs(z, _MAB)
+                else:
+                    MAB = _MAB
+                    
+                ok = np.logical_and(L > 0, np.isfinite(L))
+                lf[z] += np.histogram(MAB[ok==1], bins=bin_c2e(mags),
+                    weights=nh[ok==1,izobs+1])[0]
+                lf_N[z] += np.sum(nh[ok==1,izobs+1])
+                    
+            pb.update(min(i + chunk, N))
+            
+        pb.finish()
+        
+        # Don't leave the last block lying around: it isn't the model!
+        del self._chunk_id, self._cache_halos_, self._histories
+        
+        results = {'z': zarr, 'SFRD': sfrd / rhodot_cgs, 'smf': {}, 'lf': {}}
+        
+        self._tab_sfrd_chunked = zarr, results['SFRD']
+        
+        if not hasattr(self, '_cache_smf_'):
+            self._cache_smf_ = {}
+        if not hasattr(self, '_cache_lf_'):
+            self._cache_lf_ = {}
+            
+        for z in zsmf:
+            results['smf'][z] = Msbins, smf[z] / Mbinw
+            self._cache_smf_[z] = results['smf'][z]
+            
+        for z in zlf:
+            # Normalize like `LuminosityFunction`, i.e., PDF * total number
+            phi = lf_N[z] * lf[z] / np.sum(lf[z]) / self.pf['pop_mag_bin']
+            
+            results['lf'][z] = mags, phi
+            self._cache_lf_[(z, wave, window, band)] = results['lf'][z]
+            
+        return results
     
     @property
     def guide(self):
@@ -530,10 +1119,9 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
     @property
     def tab_cdf(self):
         if not hasattr(self, '_tab_cdf'):
-            mf = lambda logM: self.ClusterMF(10**logM)
-            f_cdf = lambda M: quad(lambda logM: mf(logM) * 10**logM, -3, np.log10(M), 
-                limit=500)[0] / self._norm
-            self._tab_cdf = np.array(map(f_cdf, self.tab_Mcl))
+            logM = np.log10(self.tab_Mcl)
+            mf = self.ClusterMF(self.tab_Mcl) * self.tab_Mcl
+            self._tab_cdf = cumtrapz(mf, x=logM, initial=0.) / self._norm
             
         return self._tab_cdf    
     
@@ -678,238 +1266,216 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
                                                               
         return rhoL / np.mean(erg_per_phot)
 
-    def _gen_stars(self, idnum, Mh): # pragma: no cover
+    @property
+    def _stochastic_kernel(self):
         """
-        Take draws from cluster mass function until stopping criterion met.
-        
-        Return the amount of mass formed in this burst.
+        Tables and parameters needed to form stars cluster by cluster.
+
+        Everything in here is cheap to pickle, since it gets sent to each
+        worker process (see `_evolve_stochastic`).
         """
-    
-        raise NotImplemented('this will need a lot of fixing.')
-        
-        z = self._arr_z[idnum]
-        t = self._arr_t[idnum]
-        dt = (self._arr_t[idnum+1] - self._arr_t[idnum]) # in Myr
-        
-        E_h = self.halos.BindingEnergy(z, Mh)
-        
-        # Statistical approach from here on out.
-        Ms = 0.0
-        
-        Mg = self._arr_Mg_c[idnum] * 1.
-        
-        # Number of supernovae from stars formed previously
-        N_SN_p = self._arr_SN[idnum] * 1.
-        E_UV_p = self._arr_UV[idnum] * 1.
-        # Number of supernovae from stars formed in this timestep.
-        N_SN_0 = 0. 
-        E_UV_0 = 0.
-        
-        N_MS_now = 0
-        m_edg = self.tab_imf_me
-        m_cen = self.tab_imf_mc
-        imf = np.zeros_like(m_cen)
-        
-        fstar_gmc = self.pf['pop_fstar_cloud']
-        
-        delay_fb_sne = self.pf['pop_delay_sne_feedback']
-        delay_fb_rad = self.pf['pop_delay_rad_feedback']
-                            
-        vesc = self.halos.EscapeVelocity(z, Mh) # cm/s
-                        
-        # Form clusters until we use all the gas or blow it all out.    
-        ct = 0
-        Mw = 0.0
-        Mw_rad = 0.0
-        while (Mw + Mw_rad + Ms) < Mg * fstar_gmc:
-            
-            r = np.random.rand()
-            Mc = np.interp(r, self.tab_cdf, self.tab_Mcl)
-            
-            # If proposed cluster would take up all the rest of our 
-            # gas (and then some), don't let it happen.
-            if (Ms + Mc + Mw) >= Mg:
-                break
-            
-            ##
-            # First things first. Figure out the IMF in this cluster.
-            ##
-                
-            # Means we're doing cheap spectral synthesis.
+        if not hasattr(self, '_stochastic_kernel_'):
+
+            if self.pf['pop_delay_rad_feedback'] >= 1:
+                raise NotImplemented('help')
+            if self.pf['pop_sample_imf'] and \
+                self.pf['pop_delay_sne_feedback'] == 1:
+                raise NotImplemented('help')
+
+            stars = self._stars
+
+            kern = \
+            {
+             'fb': self.cosm.fbar_over_fcdm,
+             'fstar': self.pf['pop_fstar_cloud'],
+             'coupling_sne': self.pf['pop_coupling_sne'],
+             'coupling_rad': self.pf['pop_coupling_rad'],
+             'delay_sne': self.pf['pop_delay_sne_feedback'],
+             'feedback_rad': self.pf['pop_feedback_rad'],
+             'force_eq': self.pf['pop_force_equilibrium'],
+             'multiphase': self.pf['pop_multiphase'],
+             'sample_imf': self.pf['pop_sample_imf'],
+             'cl_M': self.tab_Mcl,
+             'cl_cdf': self.tab_cdf,
+             'Mcl_avg': self.Mcl,
+             'nsn_per_m': stars.nsn_per_m,
+            }
+
             if self.pf['pop_sample_imf']:
-                # For now, just scale UV luminosity with Nsn?
-                
-                # Uniform IMF placeholder
-                #r2 = 0.1 + np.random.rand(1000) * (200. - 0.1)
-                r2 = self._stars.draw_stars(1000000)
+                # Mean stellar mass and fraction of stars that go SN.
+                kern['m_avg'] = np.trapz(stars.Ms, x=stars.tab_imf_cdf)
+                kern['p_massive'] = \
+                    1. - np.interp(8., stars.Ms, stars.tab_imf_cdf)
 
-                # Integrate until we get Mc. 
-                m2 = np.cumsum(r2)
+            if self.pf['pop_feedback_rad']:
+                # Mask out low-mass stuff? Only because scaling by N_MS
+                massive = stars.Ms >= 8.
+                imf = stars.tab_imf[massive==1]
+                Ms = stars.Ms[massive==1]
+                norm = np.trapz(imf, x=Ms)
+                kern['Lavg'] = np.trapz(stars.tab_LUV[massive==1] * imf,
+                    x=Ms) / norm
+                kern['tavg'] = np.trapz(stars.tab_life[massive==1] * imf,
+                    x=Ms) / norm
 
-                # What if, by chance, first star drawn is more massive than
-                # Mc?
-                
-                cut = np.argmin(np.abs(m2 - Mc)) + 1
-             
-                if cut >= len(r2):
-                    cut = len(r2) - 1
-                    #print(r2.size, Mc, m2[-1] / Mc)
-                    #raise ValueError('help')
-                
-                hist, edges = np.histogram(r2[0:cut+1], bins=m_edg)
-                imf += hist
-                                
-                N_MS = np.sum(hist[m_cen >= 8.])
-                
-                # Ages of the stars
-                
-                #print((Mw + Ms) / Mg, Nsn, Mc / 1e3)
-                                                                
-            else:
-                # Expected number of SNe if we were forming lots of clusters.
-                lam = Mc * self._stars.nsn_per_m
-                N_MS = np.random.poisson(lam)
-                hist = 0.0
-                
-            ##
-            # Now, take stars and let them feedback on gas.
-            ##    
-
-            ## 
-            # Increment stuff
-            ##      
-            Ms += Mc
-            imf += hist
-            
-            # Move along.
-            if N_MS == 0:
-                ct += 1
-                continue
-            
-            ## 
-            # Can delay feedback or inject it instantaneously.
-            ##
-            if delay_fb_sne == 0:
-                N_SN_0 += N_MS  
-            elif delay_fb_sne == 1:
+            self._stochastic_kernel_ = kern
+
+        return self._stochastic_kernel_
+
+    def _sn_delay_probs(self, t):
+        """
+        Probability that a SN from stars formed at each time `t` goes off
+        in the same time step or in each subsequent time step.
+
+        Returns
+        -------
+        List of (p_now, p_fut) tuples, one per element of `t`. `p_fut` is
+        the probability distribution over future time steps given the SN
+        doesn't go off now, or, if SNe all go off after the same delay, the
+        number of time steps after which they do.
+
+        """
+
+        delay_fb = self.pf['pop_delay_sne_feedback']
+
+        probs = []
+        for i in range(t.size):
+            tfut = t[i:] - t[i]
+
+            if delay_fb == 0:
+                probs.append((1., None))
+            elif delay_fb == 1:
                 ##
                 # SNe all happen at average delay time from formation.
                 ##
-                
-                if self.pf['pop_sample_imf']:
-                    raise NotImplemented('help')
-
-                # In Myr
                 avg_delay = self._stars.avg_sn_delay
-                
+                iSNe = np.argmin(np.abs(tfut - avg_delay))
+                dt = tfut[1] if tfut.size > 1 else np.inf
+
                 # Inject right now if timestep is long.
-                if dt > avg_delay:
-                    N_SN_0 += N_MS     
+                if (dt > avg_delay) or (iSNe == 0):
+                    probs.append((1., None))
                 else:
-                    # Figure out when these guys will blow up.
-                    #N_SN_next += N_MS
-                    
-                    tnow = self._arr_t[idnum]
-                    tfut = self._arr_t[idnum:]
-                                            
-                    iSNe = np.argmin(np.abs((tfut - tnow) - avg_delay))
-                    #if self._arr_t[idnum+iSNe] < avg_delay:
-                    #    iSNe += 1
-                    
-                    print('hey 2', self._arr_t[idnum+iSNe] - tnow)
-                    
-                    self._arr_SN[idnum+iSNe] += N_MS                    
-                                        
-            elif delay_fb_sne == 2:
+                    probs.append((0., iSNe))
+            elif delay_fb == 2:
                 ##
                 # Actually spread SNe out over time according to DTD.
+                # Delays are assigned to the closest time step.
                 ##
-                delays = self._stars.draw_delays(N_MS)
-                
-                tnow = self._arr_t[idnum]
-                tfut = self._arr_t[idnum:]
-                
-                # Could be more precise since closest index may be
-                # slightly shorter than delay time.
-                iSNe = np.array([np.argmin(np.abs((tfut - tnow) - delay)) \
-                    for delay in delays])
-                
-                # Add SNe one by one.
-                for _iSNe in iSNe:
-                    self._arr_SN[idnum+_iSNe] += 1    
-                
-                # Must make some of the SNe happen NOW!
-                N_SN_0 += sum(iSNe == 0)
-                
-            ##
-            # Make a wind
-            ##        
-            Mw = 2 * (N_SN_0 + N_SN_p) * 1e51 * self.pf['pop_coupling_sne'] \
-               / vesc**2 / g_per_msun
-               
-            ##                                 
-            # Stabilize with some radiative feedback?
-            ##
-            if not self.pf['pop_feedback_rad']:
-                ct += 1
-                continue
-                 
-            ##
-            # Dump in UV from 'average' massive star.
-            ##
-            if self.pf['pop_delay_rad_feedback'] == 0:
-            
-                # Mask out low-mass stuff? Only because scaling by N_MS
-                massive = self._stars.Ms >= 8.
-                
-                LUV = self._stars.tab_LUV
-                  
-                Lavg = np.trapz(LUV[massive==1] * self._stars.tab_imf[massive==1], 
-                    x=self._stars.Ms[massive==1]) \
-                     / np.trapz(self._stars.tab_imf[massive==1], 
-                    x=self._stars.Ms[massive==1])
-                   
-                life = self._stars.tab_life 
-                tavg = np.trapz(life[massive==1] * self._stars.tab_imf[massive==1], 
-                    x=self._stars.Ms[massive==1]) \
-                     / np.trapz(self._stars.tab_imf[massive==1], 
-                    x=self._stars.Ms[massive==1])    
-                    
-                corr = np.minimum(tavg / dt, 1.)
-                                    
-                E_UV_0 += Lavg * N_MS * dt * corr * 1e6 * s_per_yr
-                                
-                #print(z, 2 * E_rad / vesc**2 / g_per_msun / Mw)
-                
-                Mw_rad += 2 * (E_UV_0 + E_UV_p) * self.pf['pop_coupling_rad'] \
-                    / vesc**2 / g_per_msun
-            
-            elif self.pf['pop_delay_rad_feedback'] >= 1:
+                ok = self._stars.Ms >= 8.
+                life = self._stars.tab_life[ok==1][-1::-1]
+                cdf = self._stars.tab_dtd_cdf[-1::-1]
+
+                edges = 0.5 * (tfut[1:] + tfut[0:-1])
+                P = 1. - np.interp(edges, life, cdf)
+                P = np.concatenate(([0.], P, [1.]))
+                p = np.diff(P)
+
+                if p[0] == 1:
+                    probs.append((1., None))
+                else:
+                    probs.append((p[0], p[1:] / p[1:].sum()))
+            else:
                 raise NotImplemented('help')
-                
-                delays = self._stars.draw_delays(N_MS)
-                
-                tnow = self._arr_t[idnum]
-                tfut = self._arr_t[idnum:]
-                
-                # Could be more precise since closest index may be
-                # slightly shorter than delay time.
-                iSNe = np.array([np.argmin(np.abs((tfut - tnow) - delay)) \
-                    for delay in delays])
-                
-                # Add SNe one by one.
-                for _iSNe in iSNe:
-                    self._arr_SN[idnum+_iSNe] += 1
-                
-            # Count clusters    
-            ct += 1    
-            
-        ##
-        # Back outside loop over clusters.
-        ##    
-                                    
-        return Ms, Mw, imf
-        
+
+        return probs
+
+    def _gen_stochastic_histories(self, halos, zstop=0):
+        """
+        Evolve all galaxies, forming stars one cluster at a time.
+
+        Halos are split into chunks of `pop_sample_chunk`, each with its own
+        random number stream spawned from `pop_sample_seed`, so results
+        don't depend on whether chunks are run serially or spread over
+        `pop_sample_nprocs` processes.
+
+        .. note :: Individual histories *do* depend on `pop_sample_chunk`,
+            since it sets which halos share a stream (and in what order
+            they draw from it). Changing it gives a statistically
+            equivalent, but different, realization.
+
+        Parameters
+        ----------
+        halos : dict
+            Halo histories, as returned by `_gen_halo_histories`, i.e., in
+            order of *ascending redshift*.
+
+        Returns
+        -------
+        Dictionary of histories in order of *ascending time*.
+
+        """
+
+        # Flip arrays to be in ascending time.
+        z = halos['z'][-1::-1]
+        t = halos['t'][-1::-1]
+        Mh = halos['Mh'][:,-1::-1]
+        MAR = halos['MAR'][:,-1::-1]
+
+        Nh = Mh.shape[0]
+
+        kern = self._stochastic_kernel.copy()
+        kern['t'] = t
+        kern['z'] = z
+        kern['zstop'] = zstop
+        kern['p_delay'] = self._sn_delay_probs(t)
+
+        # Index of time at which gas at each time is available for SF.
+        if self.pf['pop_multiphase']:
+            self._arr_t = t
+            tdyn = self.halos.DynamicalTime(z) / s_per_myr
+            kern['ifut'] = np.array([self.deposit_in(t[i], tdyn[i]) \
+                for i in range(t.size)])
+
+        # Different (but reproducible) random numbers for each block of
+        # halos when streaming them from disk.
+        seed = self.pf['pop_sample_seed']
+        if (seed is not None) and hasattr(self, '_chunk_id'):
+            seed = [seed, self._chunk_id]
+
+        chunk = int(self.pf['pop_sample_chunk'])
+        Nchunks = int(np.ceil(Nh / float(chunk)))
+        seeds = np.random.SeedSequence(seed).spawn(Nchunks)
+
+        def args(k):
+            slc = slice(k * chunk, (k + 1) * chunk)
+            _Mh = Mh[slc]
+            _z2d = z[None,:] * np.ones_like(_Mh)
+            _M = np.where(_Mh > 0, _Mh, 1.)
+            vesc = self.halos.EscapeVelocity(_z2d, _M)
+            Eh = self.halos.BindingEnergy(_z2d, _M)
+            return (_Mh, MAR[slc], vesc, Eh, seeds[k], kern)
+
+        nprocs = self.pf['pop_sample_nprocs']
+        if (nprocs > 1) and (Nchunks > 1):
+            pool = LocalPool(nprocs)
+            results = pool.map(_evolve_stochastic,
+                [args(k) for k in range(Nchunks)])
+            pool.stop()
+        else:
+            results = [_evolve_stochastic(args(k)) for k in range(Nchunks)]
+
+        hist = {key: np.concatenate([res[key] for res in results]) \
+            for key in results[0].keys()}
+
+        hist['Mh'] = Mh
+        hist['MAR'] = MAR
+        hist['nh'] = halos['nh'][:,-1::-1]
+        hist['z'] = z
+        hist['t'] = t
+        hist['zthin'] = halos['zthin'][-1::-1]
+
+        if 'rand' in halos:
+            hist['rand'] = halos['rand'][:,-1::-1]
+
+        # No dust, metals, etc. in this model (yet).
+        for key in ['MZ', 'Md', 'Sd', 'Z']:
+            hist[key] = np.zeros_like(Mh)
+        hist['fcov'] = 1.0
+        hist['pos'] = None
+
+        return hist
+
     def deposit_in(self, tnow, delay):
         """
         Determin index of time-array in which to deposit some gas, energy,
@@ -926,250 +1492,50 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
                 
     def _gen_galaxy_history(self, halo, zobs=0):
         """
-        Evolve a single galaxy in time. 
-        
+        Evolve a single galaxy in time.
+
         Parameters
         ----------
         halo : dict
             Contains growth history of the halo of interest in order of
             *ascending redshift*. Must contain (at least) 'z', 't', 'Mh',
-            and 'nh' keys.
-        
-        """
-        
-        # Grab key pieces of info
-        z = halo['z'][-1::-1]
-        t = halo['t'][-1::-1]
-        Mh_s = halo['Mh'][-1::-1]
-        MAR = halo['MAR'][-1::-1]
-        nh = halo['nh'][-1::-1]
-        
-        self._arr_t = t
-        self._arr_z = z
-        
-        zeros_like_t = np.zeros_like(t)
-        
-        self._arr_SN = zeros_like_t.copy()
-        self._arr_UV = zeros_like_t.copy()
-        self._arr_Mg_c = zeros_like_t.copy()
-        self._arr_Mg_t = zeros_like_t.copy()
-        
-        # Short-hand
-        fb = self.cosm.fbar_over_fcdm
-        Mg_s = fb * Mh_s
-        Nt = len(t)
-        
-        assert np.all(np.diff(t) >= 0)
-
-        zform = max(z[Mh_s>0])
-
-        SFR = np.zeros_like(Mh_s)
-        Ms  = np.zeros_like(Mh_s)
-        Msc = np.zeros_like(Mh_s)
-        #Mg_t  = np.zeros_like(Mh_s)
-        #Mg_c = np.zeros_like(Mh_s)
-        Mw  = np.zeros_like(Mh_s)
-        E_SN  = np.zeros_like(Mh_s)
-        Nsn  = np.zeros_like(Mh_s)
-        L1600 = np.zeros_like(Mh_s)
-        bursty = np.zeros_like(Mh_s)
-        #imf = np.zeros((Mh_s.size, self.tab_imf_mc.size))
-        #fc_r = np.ones_like(Mh_s)
-        #fc_i = np.ones_like(Mh_s)
-                        
-        ok = Mh_s > 0                
-                        
-        # Generate smooth histories 'cuz sometimes we need that.
-        MAR_s = np.array([self.guide.MAR(z=z[k], Mh=Mh_s[k]).squeeze() \
-            for k in range(Nt)])
-        SFE_s = np.array([self.guide.SFE(z=z[k], Mh=Mh_s[k]) \
-            for k in range(Nt)])
-        SFR_s = fb * SFE_s * MAR_s
-        
-        # Some characteristic timescales...
-        tdyn = self.halos.DynamicalTime(z) / s_per_myr
-        
-        # in Myr
-        delay_fb = self.pf['pop_delay_sne_feedback']
-        
-        
-        ###
-        ## THIS SHOULD ONLY HAPPEN WHEN NOT DETERMINISTIC
-        ###
-        ct = 0
-        for i, _Mh in enumerate(Mh_s):
+            'MAR', and 'nh' keys.
 
-            if _Mh == 0:
-                continue
+        """
 
-            if z[i] < zobs:
-                break
-                
-            if i == Nt - 1:
-                break
+        halos = {key: halo[key] for key in ['z', 't', 'zthin']}
+        for key in ['Mh', 'MAR', 'nh', 'rand']:
+            if key in halo:
+                halos[key] = np.atleast_2d(halo[key])
 
-            # In years    
-            dt = (t[i+1] - t[i]) * 1e6
+        hist = self._gen_stochastic_histories(halos, zobs)
 
-            if z[i] == zform:
-                self._arr_Mg_t[i] = fb * _Mh
-                
-            # Determine gas supply
-            if self.pf['pop_multiphase']:
-                ifut = self.deposit_in(t[i], tdyn[i])
-                self._arr_Mg_c[ifut] = self._arr_Mg_t[i] * 1
-            else:
-                self._arr_Mg_c[i] = self._arr_Mg_t[i] * 1
-                    
-            E_h = self.halos.BindingEnergy(z[i], _Mh)
-            
-            ##
-            # Override switch to smooth inflow-driven star formation model.s
-            ##
-            if E_h > (1e51 * self.pf['pop_force_equilibrium']):
-                vesc = self.halos.EscapeVelocity(z[i], _Mh)
-                NSN_per_M = self._stars.nsn_per_m
-                
-                # Assume 1e51 * SNR * dt = 1e51 * SFR * SN/Mstell * dt = E_h
-                eta = 2. * self.pf['pop_coupling_sne'] * 1e51 * NSN_per_M \
-                    / g_per_msun / vesc**2
-                                
-                # SFR = E_h / 1e51 / (SN/Ms) / dt
-                SFR[i]  = fb * MAR[i] / (1. + eta)
-                Ms[i+1] = 0.5 * (SFR[i] + SFR[i-1]) * dt
-                Mg[i+1] = Mg[i] + Macc - Ms[i+1]
-                continue
-                        
-            ##
-            # FORM STARS!
-            ##
-            
-            # Gas we will accrete on this timestep
-            Macc = fb * 0.5 * (MAR[i+1] + MAR[i]) * dt
-            
-            # What fraction of gas is in a phase amenable to star formation?
-            if self.pf['pop_multiphase']:
-                ifut = self.deposit_in(t[i], tdyn[i])
-                self._arr_Mg_c[ifut] += Macc
-            else:
-                # New gas available to me right away in this model.
-                self._arr_Mg_c[i] += Macc
-                
-            ##
-            # Here we go.
-            ##    
-            _Mnew, _Mw, _imf = self._gen_stars(i, _Mh)    
+        for key in hist:
+            if isinstance(hist[key], np.ndarray) and hist[key].ndim == 2:
+                hist[key] = hist[key][0]
 
-            self._arr_Mg_t[i+1] = \
-                max(self._arr_Mg_t[i] + Macc - _Mnew - _Mw, 0.)
- 
-            # Deal with cold gas.    
-            if self.pf['pop_multiphase']:    
-                #pass
-                # Add remaining cold gas to reservoir for next timestep?
-                # Keep gas hot for longer?
-                # Subtract wind from cold gas reservoir?
-                # Question is, do we feedback on gas that's already hot,
-                # or gas that was "on deck" to form stars?
-                
-                #ifut = self.deposit_in(t[i], tdyn[i])
-                #
-                #self._arr_Mg_c[i:ifut] -= _Mw / (float(ifut - i))
-                
-                if self._arr_Mg_c[i+1] < 0:
-                    print("Correcting for negative mass.", z[i])
-                    self._arr_Mg_c[i+1] = 0
-                
-            #else:    
-            #    self._arr_Mg_c[i+1] = self._arr_Mg_t[i+1]
-            
-            # Flag this step as bursty.
-            bursty[i] = 1
-                            
-            # Save SFR. Set Ms, Mg for next iteration.
-            SFR[i]   = _Mnew / dt
-            imf[i]   = _imf
-            Ms[i+1]  = _Mnew # just the stellar mass *formed this step*
-            Msc[i+1] = Msc[i] + _Mnew
-            
-            ct += 1
-            
-        
-        keep = np.ones_like(z)#np.logical_and(z > zobs, z <= zform)
-        
-        data = \
-        { 
-         'SFR': SFR[keep==1],
-         'MAR': MAR_s[keep==1],
-         'Mg': self._arr_Mg_t[keep==1], 
-         'Mg_c':self._arr_Mg_c[keep==1], 
-         'Ms': Msc[keep==1], # *cumulative* stellar mass!
-         'Mh': Mh_s[keep==1], 
-         'nh': nh[keep==1],
-         'Nsn': Nsn[keep==1],
-         'bursty': bursty[keep==1],
-         #'imf': imf[keep==1],
-         'z': z[keep==1],
-         't': t[keep==1],
-         'zthin': halo['zthin'][-1::-1],
-        }
-        
-        if 'rand' in halo:
-            data['rand'] = halo['rand'][-1::-1]
-        
-                
-        return data
-            
+        return hist
+    
     def _gen_galaxy_histories(self, zstop=0): # pragma: no cover
         """
         Take halo histories and paint on galaxy histories in some way.
         
-        If pop_stochastic, must operate on each galaxy individually using
-        `self._gen_galaxy_history`, otherwise, can 'evolve' galaxies
+        If pop_sample_cmf, galaxies form stars cluster by cluster (see
+        `self._gen_stochastic_histories`), otherwise, can 'evolve' galaxies
         deterministically all at once.
         """
                 
         # First, grab halos
         halos = self._gen_halo_histories()
                                         
-        ## 
+        ##
         # Stochastic model
         ##
         if self.pf['pop_sample_cmf']:
-            
-            fields = ['SFR', 'MAR', 'Mg', 'Ms', 'Mh', 'nh', 
-                'Nsn', 'bursty', 'rand']
-            num = halos['Mh'].shape[0]
-            
-            hist = {key:np.zeros_like(halos['Mh']) for key in fields}
-            
-            # This guy is 3-D
-            #hist['imf'] = np.zeros((halos['Mh'].size, halos['z'].size,
-            #    self.tab#_imf_mc.size))
-            
-            for i in range(num):
-                
-                print(i)
-                #halo = {key:halos[key][i] for key in keys}
-                halo = {'t': halos['t'], 'z': halos['z'], 
-                    'zthin': halos['zthin'], 'rand': halos['rand'],
-                    'Mh': halos['Mh'][i], 'nh': halos['nh'][i],
-                    'MAR': halos['MAR'][i]}
-                data = self._gen_galaxy_history(halo, zstop)
-                
-                for key in fields:
-                    hist[key][i] = data[key]
-        
-            hist['z'] = halos['z']
-            hist['t'] = halos['t']
-            hist['zthin'] = halos['zthin']
-        
-            flip = {key:hist[key][-1::-1] for key in hist.keys()}
-        
-            self.histories = flip
-            return flip                                            
-        
-        
+            hist = self._gen_stochastic_histories(halos, zstop)
+            self.histories = hist
+            return hist
+
         ##
         # Simpler models. No need to loop over all objects individually.
         ##
@@ -1244,7 +1610,13 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
         ##
         if self.pf['pop_fduty'] is not None:
             
-            np.random.seed(self.pf['pop_fduty_seed'])
+            # Different (but reproducible) random numbers for each block of
+            # halos when streaming them from disk.
+            seed = self.pf['pop_fduty_seed']
+            if (seed is not None) and hasattr(self, '_chunk_id'):
+                seed = [seed, self._chunk_id]
+            
+            rng = np.random.default_rng(seed)
             
             fduty = self.guide.fduty(z=z2d, Mh=Mh)
             T_on = self.pf['pop_fduty_dt']
@@ -1254,46 +1626,24 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
                 fduty_avg = np.mean(fduty, axis=1)
                 
                 # Create random bursts with length `T_on`
-                dt_tot = t.max() - t.min() # Myr
-                
                 i_on = int(T_on / dt_myr[0])
-                                
-                # t is in ascending order                
-                Nt = float(t.size)
-                on = np.zeros_like(Mh, dtype=bool)
                 
-                for i in range(Nhalos):
-                    
-                    if np.all(SFR[i] == 0):
-                        continue
-                    
-                    r = np.random.rand(t.size)
-                    on_prop = r < fduty[i]
-                                                    
-                    if fduty_avg[i] == 1:
-                        on[i,:] = True
-                    else:                    
-                        ct = 0
-                        while (on[i].sum() / Nt) < fduty_avg[i]:
-                            j = np.random.randint(low=0, high=int(Nt))
-                            
-                            on[i,j:j+i_on] = True
-                        
-                            ct += 1
+                # t is in ascending order
+                on = _burst_mask(rng, fduty_avg, i_on, t.size, 
+                    active=np.any(SFR != 0, axis=1))
 
                 off = np.logical_not(on)
                 
             else:
                 # Random numbers for all mass and redshift points
-                r = np.reshape(np.random.rand(Mh.size), Mh.shape)
+                r = rng.random(Mh.shape)
 
                 off = r >= fduty
             
             SFR[off==True] = 0
 
-        # Never do this!
+        # Halo histories will be float32 too in this case, see `load`.
         if self.pf['conserve_memory']:
-            raise NotImplemented('this is deprecated')
             dtype = np.float32
         else:
             dtype = np.float64
@@ -1624,6 +1974,10 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
         cached_result = self._cache_smf(z, bins)
         if cached_result is not None:
             return cached_result
+            
+        if self.pf['pop_hist_chunk'] is not None:
+            self.RunSAMChunked(zsmf=[z], Msbins=bins)
+            return self._cache_smf(z, bins)
                             
         iz = np.argmin(np.abs(z - self.histories['z']))
         Ms = self.histories['Ms'][:,iz]
@@ -1730,13 +2084,13 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
         
         return None
 
-    def _cache_lf(self, z, x=None, wave=None):
+    def _cache_lf(self, z, x=None, wave=None, window=1, band=None):
         if not hasattr(self, '_cache_lf_'):
             self._cache_lf_ = {}
 
-        if (z, wave) in self._cache_lf_:            
+        if (z, wave, window, band) in self._cache_lf_:            
 
-            _x, _phi = self._cache_lf_[(z, wave)]
+            _x, _phi = self._cache_lf_[(z, wave, window, band)]
             
             if self.pf['debug']:
                 print("# Read LF from cache at (z={}, wave={})".format(
@@ -2073,9 +2427,15 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
         
         """
         
-        cached_result = self._cache_lf(z, x, wave)
+        cached_result = self._cache_lf(z, x, wave, window, band)
         if cached_result is not None:
             return cached_result
+            
+        # Note: to get LFs (and SMFs) at many redshifts in a single pass 
+        # through the halo catalog, call `RunSAMChunked` directly first.
+        if self.pf['pop_hist_chunk'] is not None:
+            self.RunSAMChunked(zlf=[z], wave=wave, window=window, band=band)
+            return self._cache_lf(z, x, wave, window, band)
                                 
         # These are kept in descending redshift just to make life difficult.
         # [The last element corresponds to observation redshift.]
@@ -2127,9 +2487,9 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
         N = np.sum(w[Misok==1]) 
         phi = hist * N
                           
-        self._cache_lf_[(z, wave)] = _x, phi
+        self._cache_lf_[(z, wave, window, band)] = _x, phi
         
-        return self._cache_lf(z, x, wave)
+        return self._cache_lf(z, x, wave, window, band)
         
     def _cache_beta(self, kw_tup):
     
@@ -2737,11 +3097,12 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
         hist = {key:self.histories[key][-1::-1] for key in keys}
         return hist
     
-    def load(self):
+    @property
+    def _fn_hist(self):
         """
-        Load results from past run.
+        Name of file containing halo histories (or dictionary of them).
         """
-                
+        
         fn_hist = self.pf['pop_histories']
         
         # Look for results attached to hmf table
@@ -2757,10 +3118,51 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
                     self.pf['hgh_dlogMmin'])
                     
             fn_hist = path + pref + '.' + suffix
+                
+        return fn_hist
+        
+    @property
+    def _num_halos(self):
+        """
+        Number of halos in catalog, i.e., before any thinning.
+        
+        .. note :: Won't read histories into memory if stored in HDF5.
+        """
+        if not hasattr(self, '_num_halos_'):
+            fn_hist = self._fn_hist
+            if (type(fn_hist) is str) and fn_hist.endswith('.hdf5'):
+                with h5py.File(fn_hist, 'r') as f:
+                    self._num_halos_ = f['nh'].shape[0]
+            else:
+                self._num_halos_ = self.load()['nh'].shape[0]
+                
+        return self._num_halos_
+        
+    def load(self, rows=None):
+        """
+        Load results from past run.
+        
+        Parameters
+        ----------
+        rows : slice
+            If supplied, only read in this block of halos. Only this block
+            will ever be in memory if histories are stored in HDF5 format.
+            
+        """
+                
+        fn_hist = self._fn_hist
+        
+        # Check to see if parameters match
+        if (self.pf['pop_histories'] is not None) and self.pf['verbose']:
+            print("Should check that HMF parameters match!")
+        
+        if rows is None:
+            rows = slice(None)
+        
+        if self.pf['conserve_memory']:
+            dtype = np.float32
         else:
-            # Check to see if parameters match
-            if self.pf['verbose']:
-                print("Should check that HMF parameters match!")
+            dtype = np.float64
                         
         # Read output
         if type(fn_hist) is str:
@@ -2778,9 +3180,9 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
                 prefix = fn_hist.split('.hdf5')[0]
                 
                 if 'mask' in f:
-                    mask = np.array(f[('mask')])
+                    mask = np.array(f[('mask')][rows])
                 else:
-                    mask = np.zeros_like(f[('Mh')])
+                    mask = np.zeros(f[('Mh')][rows].shape, dtype=bool)
                 
                 hist = {}
                 for key in f.keys():
@@ -2792,10 +3194,13 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
                         # Oddly, masking causes a weird issue with a huge
                         # spike at log10(MAR) ~ 1. np.ma operations are 
                         # also considerably slower.
-                        hist[key] = np.array(f[(key)]) * np.logical_not(mask)
+                        hist[key] = np.array(f[(key)][rows], dtype=dtype) \
+                            * np.logical_not(mask)
                         
                         #else:
                         #    hist[key] = np.ma.array(f[(key)], mask=mask)
+                    elif key == 'children':
+                        hist[key] = np.array(f[(key)][rows])
                     else:
                         hist[key] = np.array(f[(key)])
                             
@@ -2828,18 +3233,73 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
             # Assume you know what you're doing.
         else:
             hist = None
+            
+        # HDF5 is already taken care of. Otherwise, everything is in memory
+        # anyways, so just pick out the rows we need.
+        in_hdf5 = (type(fn_hist) is str) and fn_hist.endswith('.hdf5')
+        if (hist is not None) and (rows != slice(None)) and (not in_hdf5):
+            hist = hist.copy()
+            for key in hist:
+                if key in ['cosmology', 't', 'z', 'zform']:
+                    continue
+                if not isinstance(hist[key], np.ndarray):
+                    continue
+                if hist[key].ndim > 1 or key == 'children':
+                    hist[key] = hist[key][rows]
                 
         return hist
         
     def SaveCatalog(self, prefix, redshifts=None, waves=None, fields=None,
-        dlam=20., filters=None, save_spec=True):
+        dlam=20., cam=None, filters=None, save_spec=True, chunk=1000,
+        nprocs=1, clobber=False):
         """
         Create a galaxy catalog over a series of redshifts.
+        
+        Everything goes into a single HDF5 file, `prefix`.hdf5, with one 
+        group per redshift, e.g., 'z=6.0', each containing datasets for
+        physical properties (one per field), spectra ('spec'), and, if 
+        `filters` is not None, apparent magnitudes ('mags', with 'filters'
+        and 'filt_cent' [microns] to describe its columns). Rest wavelengths
+        of spectra are in dataset 'wave' at the top level.
+        
+        Galaxies are processed in blocks of `chunk`, which can be farmed out
+        to `nprocs` worker processes. The parent process is the only one 
+        that writes to disk, and only a few blocks are in flight at any 
+        time, so memory use is bounded by `chunk` and `nprocs`, not by the
+        size of the catalog.
+        
+        Parameters
+        ----------
+        prefix : str
+            Output file will be `prefix`.hdf5.
+        redshifts : list
+            Redshifts of catalog snapshots. Will use the closest grid point
+            to each.
+        waves : np.ndarray
+            Rest wavelengths at which to save spectra [Angstrom].
+        fields : list
+            Physical properties to save, e.g., 'Mh', 'Ms', 'SFR'.
+        cam : str, tuple
+            Single camera or tuple of cameras that contain `filters`.
+        filters : tuple, dict
+            Filters in which to compute photometry. Can be a dictionary with
+            (integer) redshifts as keys.
+        chunk : int
+            Number of galaxies per block.
+        nprocs : int
+            Number of worker processes.
+        
         """
+        
+        global _catalog_pop
+        
+        fn = '{}.hdf5'.format(prefix)
+        if os.path.exists(fn) and (not clobber):
+            raise IOError('File \'{}\' exists! Set clobber=True to overwrite.'.format(fn))
                         
         hist = self.histories
         zarr = hist['z']
-        tarr = hist['t']
+        Ngal = hist['SFR'].shape[0]
         
         if redshifts is None:
             zmin = round(min(zarr))
@@ -2849,50 +3309,105 @@ class GalaxyEnsemble(HaloPopulation,BlobFactory):
             waves = np.arange(40., 3000.+dlam, dlam)
         
         if fields is None:
-            fields = 'Mh', 'Ms', 'SFR', 'Md'
+            fields = 'nh', 'Mh', 'Ms', 'SFR', 'Md'
             # Also, MUV, beta....
-        
-        for i, z in enumerate(redshifts):
             
-            _iz = np.argmin(np.abs(z - zarr))
-            if zarr[_iz] > z:
-                _iz -= 1
-            zactual = zarr[_iz]    
+        if filters is not None:
+            assert cam is not None
+            if type(cam) not in [tuple, list]:
+                cam = [cam]
             
-            ##
-            # Save spectra
-            if save_spec:
-                spec = self.synth.Spectrum(waves, sfh=hist['SFR'], zarr=zarr, 
-                    window=1, zobs=zactual, units='Hz', hist=hist)
+        kw = {'waves': waves, 'fields': fields, 'cam': cam, 
+            'filters': filters, 'save_spec': save_spec, 'dlam': dlam}
+        
+        # List of tasks: one per (redshift, block of galaxies)
+        tasks = []
+        for z in redshifts:
+            _iz = np.argmin(np.abs(z - zarr))
+            for i0 in range(0, Ngal, chunk):
+                tasks.append((zarr[_iz], _iz, i0, min(i0 + chunk, Ngal), kw))
+                
+        # Make sure worker processes inherit the population, which means
+        # they must be forked (not spawned) after this point.
+        _catalog_pop = self
+        
+        if nprocs > 1:
+            try:
+                pool = LocalPool(nprocs, fork=True)
+            except:
+                _catalog_pop = None
+                raise
+        else:
+            pool = None
                     
-                fn_spec = '{}.z={}.spec.hdf5'.format(prefix, zactual)    
+        pb = ProgressBar(len(tasks), name='cat', use=self.pf['progress_bar'])
+        pb.start()
+        
+        f = h5py.File(fn, 'w')
+        f.create_dataset('wave', data=waves)
+        
+        try:
+            # Keep a few blocks in flight so workers are never idle, but no 
+            # more than that to keep memory in check.
+            if pool is not None:
+                for k in range(min(2 * nprocs, len(tasks))):
+                    pool.submit(_catalog_block, tasks[k], k)
+                
+            for k in range(len(tasks)):
+                if pool is None:
+                    z, i0, i1, data = _catalog_block(tasks[k])
+                else:
+                    tag, (z, i0, i1, data) = pool.wait()
+                    if k + 2 * nprocs < len(tasks):
+                        pool.submit(_catalog_block, tasks[k+2*nprocs], 
+                            k + 2 * nprocs)
                     
-                with h5py.File(fn_spec, 'w') as f:
-                    ds = f.create_dataset('spec', data=spec)
-                    ds = f.create_dataset('wave', data=waves)
-                print("Wrote {}.".format(fn_spec))
-            
-            ##
-            # Save basics
-            fn_prop = '{}.z={}.prop.hdf5'.format(prefix, zactual)    
-                
-            with h5py.File(fn_prop, 'w') as f:
-                pass
-            print("Wrote {}.".format(fn_prop))    
-            
-            if filters is None:
-                continue
+                self._write_catalog_block(f, z, i0, i1, data, Ngal)
                 
-            fn_phot = '{}.z={}.phot.hdf5'.format(prefix, zactual)    
-            with h5py.File(fn_phot, 'w') as f:
-                pass
-            print("Wrote {}.".format(fn_phot))
+                pb.update(k)
+        finally:
+            f.close()
+            if pool is not None:
+                pool.stop()
+            _catalog_pop = None
             
+            # Don't let luminosities of the last block masquerade as those
+            # of the whole population.
+            self.synth._cache_lum_ = {}
             
-        # Save files with galaxy properties ('prop') and spectra ('spec').
-        # Could derive photometry and beta later.
+        pb.finish()
+        
+        if self.pf['verbose']:
+            print("# Wrote {}.".format(fn))
             
-    
+        return fn
+        
+    def _write_catalog_block(self, f, z, i0, i1, data, Ngal):
+        """
+        Write results for block of galaxies to open HDF5 file `f`.
+        """
+        
+        grp = f.require_group('z={}'.format(z))
+        
+        for key, val in data.items():
+            if key == 'filters':
+                if key not in grp:
+                    grp.create_dataset(key, 
+                        data=np.array(val, dtype=h5py.string_dtype()))
+                continue
+            elif key == 'filt_cent':
+                if key not in grp:
+                    grp.create_dataset(key, data=val)
+                continue
+                
+            if key not in grp:
+                shape = (Ngal,) + val.shape[1:]
+                chunks = (min(i1 - i0, Ngal),) + val.shape[1:]
+                grp.create_dataset(key, shape=shape, dtype=val.dtype, 
+                    chunks=chunks, compression='gzip', compression_opts=4)
+                        
+            grp[key][i0:i1] = val
+        
     def save(self, prefix, clobber=False):
         """
         Output model (i.e., galaxy trajectories) to file.
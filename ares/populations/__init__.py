@@ -1,2 +1,7 @@
-from ares.populations.Halo import HaloPopulation
-from ares.populations.GalaxyPopulation import GalaxyPopulation
+from ares.util.Lazy import lazy_import
+
+__getattr__, __dir__ = lazy_import(__name__,
+{
+ 'HaloPopulation': ('Halo', 'HaloPopulation'),
+ 'GalaxyPopulation': ('GalaxyPopulation', 'GalaxyPopulation'),
+})
@@ -15,7 +15,7 @@ import numpy as np
 from ..static import Grid
 from ..solvers import Chemistry
 from ..physics.Cosmology import Cosmology
-from ..util.ReadData import _sort_history
+from ..util.WriteData import HistoryBuffer
 from ..util import RestrictTimestep, CheckPoints, ProgressBar, ParameterFile
 
 class GasParcel(object):
@@ -158,16 +158,15 @@ class GasParcel(object):
         self.update_rate_coefficients(self.grid.data)
         self.set_radiation_field()
 
-        all_t = []
-        all_data = []
+        hist = HistoryBuffer(decimate=self.pf['history_decimate'],
+            fn=self.pf['history_file'], clobber=self.pf['history_clobber'])
         for t, dt, data in self.step():
 
             # Re-compute rate coefficients
             self.update_rate_coefficients(data)
 
             # Save data
-            all_t.append(t)
-            all_data.append(data.copy())
+            hist.append(t, data, last=t >= tf)
 
             if t >= tf:
                 break
@@ -176,8 +175,7 @@ class GasParcel(object):
 
         pb.finish()
 
-        self.history = _sort_history(all_data)
-        self.history['t'] = np.array(all_t)
+        self.history = hist.finish()
         
     def step(self, t=0., dt=None, tf=None, data=None):
         """
@@ -237,36 +237,16 @@ class Global21cm(AnalyzeGlobal21cm):
             return    
             
         # Need to generate radiation backgrounds first.
-        if self.pf['radiative_transfer']:
-            self.medium.field.run()
-            self._f_Ja  = self.medium.field._f_Ja
-            self._f_Jlw = self.medium.field._f_Jlw
-        else:
-            self._f_Ja  = lambda z: 0.0 
-            self._f_Jlw = lambda z: 0.0
-            
+        self._init_backgrounds()
+
         # Start timer
         t1 = time.time()
-            
-        tf = self.medium.tf
-        self.medium._insert_inits()
 
-        pb = self.pb = ProgressBar(tf, use=self.pf['progress_bar'], 
-            name='gs-21cm')
-
-        # Lists for data in general
-        self.all_t, self.all_z, self.all_data_igm, self.all_data_cgm, \
-            self.all_RC_igm, self.all_RC_cgm = \
-            self.medium.all_t, self.medium.all_z, self.medium.all_data_igm, \
-            self.medium.all_data_cgm, self.medium.all_RCs_igm, self.medium.all_RCs_cgm
+        self._init_history()
 
-        # Add zeros for Ja
-        for element in self.all_data_igm:
-            element['Ja'] = 0.0
-            element['Jlw'] = 0.0
+        pb = self.pb = ProgressBar(self.medium.tf, use=self.pf['progress_bar'], 
+            name='gs-21cm')
 
-        # List for extrema-finding
-        self.all_dTb = self._init_dTb()        
         for t, z, data_igm, data_cgm, rc_igm, rc_cgm in self.step():            
 
             # Occasionally the progress bar breaks if we're not careful
@@ -299,6 +279,54 @@ class Global21cm(AnalyzeGlobal21cm):
                     break
 
         pb.finish()
+
+        self._finalize_history()
+
+        t2 = time.time()
+
+        self.timer = t2 - t1
+
+        self.is_complete = True
+
+    def _init_backgrounds(self):
+        """
+        Generate radiation backgrounds, i.e., everything that must happen
+        before we evolve the IGM and CGM.
+        """
+
+        if self.pf['radiative_transfer']:
+            self.medium.field.run()
+            self._f_Ja  = self.medium.field._f_Ja
+            self._f_Jlw = self.medium.field._f_Jlw
+        else:
+            self._f_Ja  = lambda z: 0.0 
+            self._f_Jlw = lambda z: 0.0
+
+    def _init_history(self):
+        """
+        Initialize lists for data storage, including initial conditions.
+        """
+
+        self.medium._insert_inits()
+
+        # Lists for data in general
+        self.all_t, self.all_z, self.all_data_igm, self.all_data_cgm, \
+            self.all_RC_igm, self.all_RC_cgm = \
+            self.medium.all_t, self.medium.all_z, self.medium.all_data_igm, \
+            self.medium.all_data_cgm, self.medium.all_RCs_igm, self.medium.all_RCs_cgm
+
+        # Add zeros for Ja
+        for element in self.all_data_igm:
+            element['Ja'] = 0.0
+            element['Jlw'] = 0.0
+
+        # List for extrema-finding
+        self.all_dTb = self._init_dTb()
+
+    def _finalize_history(self):
+        """
+        Sort data into `history` attribute and compute derived quantities.
+        """
         
         self.history_igm = _sort_history(self.all_data_igm, prefix='igm_',
             squeeze=True)
@@ -380,7 +408,8 @@ class Global21cm(AnalyzeGlobal21cm):
                 self.history['igm_h_2'], self.history['igm_e'] * n_H, Tr)
 
             if self.pf['floor_Ts']:
-                Ts = max(Ts, self.medium.parcel_igm.grid.hydr.Ts_floor(z=zall))            
+                Ts = np.maximum(Ts, 
+                    self.medium.parcel_igm.grid.hydr.Ts_floor(z=zall))            
 
             # Compute volume-averaged ionized fraction
             xavg = self.history['cgm_h_2'] \
@@ -395,12 +424,6 @@ class Global21cm(AnalyzeGlobal21cm):
             #self.history['dTb_bulk'] = \
             #   self.medium.parcel_igm.grid.hydr.dTb(zall, 0.0, Ts, Tr)
 
-        t2 = time.time()
-
-        self.timer = t2 - t1
-
-        self.is_complete = True
-
     def step(self):
         """
         Generator for the 21-cm signal.
@@ -0,0 +1,424 @@
+"""
+
+Global21cmEnsemble.py
+
+Description: Evolve many global 21-cm models at once. Each model gets its own
+populations and radiation backgrounds, but the IGM and CGM of all models are
+evolved in lock-step, i.e., we take one (vectorized) time-step for all models
+at a time, rather than running each model from start to finish.
+
+"""
+
+import time
+import numpy as np
+from .GasParcel import GasParcel
+from .Global21cm import Global21cm
+from ..util import ProgressBar
+from ..util.SetDefaultParameterValues import GridParameters, \
+    CosmologyParameters, MultiPhaseParameters
+
+# Parameters that must be common to all members of an ensemble, since they
+# affect how the gas is evolved. Everything else (populations, sources, etc.)
+# is fair game.
+_shared_pars = list(GridParameters().keys()) \
+    + list(CosmologyParameters().keys()) \
+    + list(MultiPhaseParameters().keys()) \
+    + ['radiative_transfer', 'collisional_ionization', 'secondary_ionization',
+       'isothermal', 'expansion', 'compton_scattering', 'recombination',
+       'exotic_heating', 'exotic_heating_func', 'clumping_factor',
+       'approx_He', 'approx_Salpha', 'approx_Salpha_tab',
+       'approx_Salpha_tol', 'approx_thermal_history', 'Tbg',
+       'floor_Ts', 'lya_nmax', 'rate_source', 'initial_redshift',
+       'final_redshift', 'kill_redshift', 'dtDataDump', 'dzDataDump',
+       'logdtDataDump', 'logdzDataDump', 'solver_rtol', 'solver_atol',
+       'interp_rc', 'load_ics', 'cosmological_ics', 'max_timestep',
+       'epsilon_dt', 'initial_timestep', 'time_units', 'restricted_timestep',
+       'stop_igm_h_2', 'stop_cgm_h_2']
+
+def _is_same(val1, val2):
+    if val1 is val2:
+        return True
+    try:
+        return bool(np.all(np.array(val1) == np.array(val2)))
+    except (ValueError, TypeError):
+        return False
+
+class Global21cmEnsemble(object):
+    def __init__(self, pars=None, **kwargs):
+        """
+        Set up many global 21-cm models to be evolved in lock-step.
+
+        Parameters
+        ----------
+        pars : list, dict
+            Parameters that differ between models. Either a list of
+            dictionaries, one per model, or a dictionary of arrays (all the
+            same length), one element per model.
+        kwargs : optional keyword arguments
+            Parameters common to all models.
+
+        .. note :: Only parameters that don't affect how the gas is evolved
+            (see `_shared_pars`) can differ between models, e.g., population
+            parameters.
+
+        """
+
+        if pars is None:
+            pars = [{}]
+        elif isinstance(pars, dict):
+            N = len(list(pars.values())[0])
+            pars = [{key: pars[key][i] for key in pars} for i in range(N)]
+
+        self.pars = pars
+        self.kwargs = kwargs
+        self.is_complete = False
+
+    def __len__(self):
+        return len(self.pars)
+
+    @property
+    def sims(self):
+        """
+        List of Global21cm instances, one per model.
+        """
+        if not hasattr(self, '_sims'):
+            self._sims = []
+            for pars in self.pars:
+                kw = self.kwargs.copy()
+                kw.update(pars)
+                self._sims.append(Global21cm(**kw))
+
+            self._check_shared()
+
+        return self._sims
+
+    @property
+    def histories(self):
+        return [sim.history for sim in self.sims]
+
+    @property
+    def pf(self):
+        return self.sims[0].pf
+
+    def _check_shared(self):
+        for i, sim in enumerate(self._sims):
+            if sim.is_phenom:
+                raise ValueError('Nothing to evolve for phenomenological models!')
+
+            if i == 0:
+                continue
+
+            for par in _shared_pars:
+                if par not in self.pf:
+                    continue
+                if not _is_same(sim.pf[par], self.pf[par]):
+                    raise ValueError(("Parameter `{}` must be the same for " +\
+                        "all models in ensemble!").format(par))
+
+        if not self.pf['include_igm']:
+            raise ValueError('Global21cmEnsemble requires include_igm=True.')
+
+    def _init_zone(self, zone):
+        """
+        Create a GasParcel with one cell per model for this zone.
+        """
+
+        media = [sim.medium for sim in self.sims]
+
+        parcels = [getattr(medium, 'parcel_{}'.format(zone)) \
+            for medium in media]
+
+        kw = getattr(media[0], 'kw_{}'.format(zone)).copy()
+        kw['grid_cells'] = len(self)
+
+        batch = GasParcel(cosm=media[0].cosm, **kw)
+
+        if zone == 'cgm':
+            batch.grid.set_recombination_rate(True)
+            batch._set_chemistry()
+            batch.chem.chemnet.monotonic_EoR = self.pf['monotonic_EoR']
+
+        data = {}
+        for field in parcels[0].grid.data:
+            data[field] = np.concatenate([np.atleast_1d(parcel.grid.data[field])\
+                for parcel in parcels]).astype(float)
+
+        if 'n' not in data:
+            data['n'] = batch.grid.particle_density(data, batch.grid.zi)
+
+        # Rate coefficients that depend on temperature only. For isothermal
+        # gas, these never change.
+        rcs = batch.chem.chemnet.SourceIndependentCoefficients(data['Tk'])
+        if batch.grid.isothermal:
+            batch.chem.rcs = rcs
+
+        # Initial rate coefficients
+        rc = media[0].rates_no_RT(batch.grid)
+
+        # Only need one of these: all models have same time-stepping.
+        batch.checkpoints = parcels[0].checkpoints
+
+        return batch, data, rc
+
+    def _step_zone(self, batch, data, rc, t, dt, cells):
+        """
+        Evolve a zone in some models for a single time-step.
+
+        Returns
+        -------
+        Tuple containing new data and the next time-step allowed by each
+        of the evolved cells.
+        """
+
+        data = batch.chem.EvolveCells(data, t=t[cells], dt=dt[cells],
+            cells=cells, **rc)
+
+        t_next = t[cells] + dt[cells]
+        max_timestep = self.pf['time_units'] * self.pf['max_timestep']
+
+        # Figure out next dt based on max allowed change in evolving fields
+        new_dt = batch.timestep.Limit(batch.chem.q_grid,
+            batch.chem.dqdt_grid, method=batch.pf['restricted_timestep'],
+            per_cell=True)
+
+        # Limit timestep further based on next DD and max allowed increase
+        new_dt = np.minimum(new_dt, 2 * dt[cells])
+        new_dt = np.array([min(new_dt[i],
+            batch.checkpoints.next_dt(t_next[i], new_dt[i])) \
+            for i in range(cells.size)])
+        new_dt = np.minimum(new_dt, max_timestep)
+
+        return data, new_dt
+
+    def _update_rc(self, zone, rc, z, data, cells):
+        """
+        Compute (and save) rate coefficients for a zone in some models.
+        """
+        for i in cells:
+            field = self.sims[i].medium.field
+
+            if zone == 'igm':
+                also = {}
+                for sp in field.grid.absorbers:
+                    also['igm_{!s}'.format(sp)] = data[sp][i:i+1]
+            else:
+                also = {'cgm_h_1': data['h_1'][i:i+1]}
+
+            RC = field.update_rate_coefficients(z[i], zone=zone,
+                return_rc=True, **also)
+
+            for key in rc:
+                rc[key][i] = RC[key][0]
+
+    def step(self):
+        """
+        Generator for the 21-cm signal in all models.
+
+        .. note :: This is the equivalent of `Global21cm.step` (and in turn,
+            `MultiPhaseMedium.step`), except that each iteration takes a
+            single step in all models that haven't finished yet, each with
+            its own time-step. The IGM (CGM) of a model is no longer evolved
+            once its ionized fraction exceeds `stop_igm_h_2`
+            (`stop_cgm_h_2`).
+
+        Returns
+        -------
+        Tuple containing the current time, redshift, dictionaries of IGM and
+        CGM data, and dictionaries of rate coefficients, where each element
+        is an array with one element per model, and lastly the indices of
+        models that took a step on this iteration.
+
+        """
+
+        sims = self.sims
+        N = len(self)
+        pf = self.pf
+
+        grid = sims[0].medium.parcel_igm.grid
+        cosm, hydr = grid.cosm, grid.hydr
+
+        zones = ['igm', 'cgm'] if pf['include_cgm'] else ['igm']
+
+        batch, data, rc, stop = {}, {}, {}, {}
+        for zone in zones:
+            batch[zone], data[zone], rc[zone] = self._init_zone(zone)
+            stop[zone] = np.zeros(N, dtype=bool)
+
+        rc_out = {zone: {key: rc[zone][key].copy() for key in rc[zone]} \
+            for zone in zones}
+
+        t = np.zeros(N)
+        z = pf['initial_redshift'] * np.ones(N)
+        dt = pf['time_units'] * pf['initial_timestep'] * np.ones(N)
+        zf = pf['final_redshift']
+        max_timestep = pf['time_units'] * pf['max_timestep']
+
+        Ja = np.zeros(N)
+        Jlw = np.zeros(N)
+
+        # Models can be shut off from outside, e.g., by `run`.
+        self.finished = np.zeros(N, dtype=bool)
+
+        # Evolve in time!
+        while True:
+
+            active = np.logical_and(z > zf, z >= pf['kill_redshift'])
+            active = np.logical_and(active, ~self.finished)
+
+            if not np.any(active):
+                break
+
+            cells = np.flatnonzero(active)
+
+            # Increment time / redshift
+            t_pre = t.copy()
+            dt_pre = dt.copy()
+            t[cells] += dt[cells]
+            z[cells] -= dt[cells] / cosm.dtdz(z[cells])
+
+            dt_next = 1e50 * np.ones(N)
+            for zone in zones:
+
+                # Hold models that have reached `stop_<zone>_h_2` fixed.
+                if pf['stop_{}_h_2'.format(zone)] is not None:
+                    stop[zone] = np.logical_or(stop[zone],
+                        data[zone]['h_2'] > pf['stop_{}_h_2'.format(zone)])
+
+                ev = cells[~stop[zone][cells]]
+
+                if ev.size == 0:
+                    continue
+
+                # In the IGM, the rate coefficients computed at this redshift
+                # will be applied over the *next* step. In the CGM, they're
+                # applied right away. Same as in MultiPhaseMedium.
+                if zone == 'igm':
+                    self._update_rc(zone, rc_out[zone], z, data[zone], ev)
+                else:
+                    self._update_rc(zone, rc[zone], z, data[zone], ev)
+                    for key in rc[zone]:
+                        rc_out[zone][key][ev] = rc[zone][key][ev]
+
+                data[zone], dt_next[ev] = self._step_zone(batch[zone],
+                    data[zone], rc[zone], t_pre, dt_pre, ev)
+
+                if zone == 'igm':
+                    for key in rc[zone]:
+                        rc[zone][key][ev] = rc_out[zone][key][ev]
+
+                # Temperature-dependent rate coefficients for next step
+                if not batch[zone].grid.isothermal:
+                    batch[zone].chem.chemnet.SourceIndependentCoefficients(
+                        data[zone]['Tk'])
+
+            # Must update timesteps in unison
+            dt[cells] = np.minimum(dt_next[cells], max_timestep)
+
+            ##
+            # 21-cm stuff
+            ##
+            for i in cells:
+                Ja[i] = np.atleast_1d(sims[i]._f_Ja(z[i]))[0]
+                Jlw[i] = np.atleast_1d(sims[i]._f_Jlw(z[i]))[0]
+
+            data_igm = data['igm']
+
+            # Compute spin temperature
+            n_H = cosm.nH(z)
+            Ts = hydr.Ts(z, data_igm['Tk'], Ja, data_igm['h_2'],
+                data_igm['e'] * n_H, Tr=np.zeros(N))
+
+            if pf['floor_Ts'] is not None:
+                Ts = np.maximum(Ts, hydr.Ts_floor(z=z))
+
+            # Compute volume-averaged ionized fraction
+            if pf['include_cgm']:
+                xavg = data['cgm']['h_2'] + (1. - data['cgm']['h_2']) \
+                     * data_igm['h_2']
+            else:
+                xavg = data_igm['h_2']
+
+            # Derive brightness temperature
+            dTb = hydr.dTb(z, xavg, Ts)
+
+            derived = {'Ts': Ts, 'dTb': dTb, 'Ja': Ja, 'Jlw': Jlw}
+
+            data_cgm = data['cgm'] if pf['include_cgm'] else None
+            rc_cgm = rc_out['cgm'] if pf['include_cgm'] else None
+
+            yield t, z, dict(data_igm, **derived), data_cgm, rc_out['igm'], \
+                rc_cgm, cells
+
+    def run(self):
+        """
+        Run all models from start to finish.
+
+        Returns
+        -------
+        Nothing: sets `history` attribute of each element of `sims`.
+
+        """
+
+        if self.is_complete:
+            print("Already ran simulations!")
+            return
+
+        sims = self.sims
+
+        # Need to generate radiation backgrounds first.
+        for sim in sims:
+            sim._init_backgrounds()
+
+        # Start timer
+        t1 = time.time()
+
+        for sim in sims:
+            sim._init_history()
+
+        pb = ProgressBar(sims[0].medium.tf, use=self.pf['progress_bar'],
+            name='gs-21cm-ens')
+        pb.start()
+
+        get = lambda data, i: {key: np.array(data[key][i:i+1]) for key in data}
+
+        for t, z, data_igm, data_cgm, rc_igm, rc_cgm, cells in self.step():
+
+            pb.update(t[cells].min())
+
+            for i in cells:
+                sim = sims[i]
+
+                if (z[i] < self.pf['final_redshift']) or \
+                   (z[i] < self.pf['kill_redshift']):
+                    self.finished[i] = True
+                    continue
+
+                sim.all_z.append(z[i])
+                sim.all_t.append(t[i])
+                sim.all_dTb.append(data_igm['dTb'][i])
+                sim.all_data_igm.append(get(data_igm, i))
+                sim.all_RC_igm.append(get(rc_igm, i))
+
+                if self.pf['include_cgm']:
+                    sim.all_data_cgm.append(get(data_cgm, i))
+                    sim.all_RC_cgm.append(get(rc_cgm, i))
+
+                # Automatically find turning points
+                if sim.pf['track_extrema']:
+                    if sim.track.is_stopping_point(sim.all_z, sim.all_dTb):
+                        self.finished[i] = True
+
+        pb.finish()
+
+        for sim in sims:
+            sim._finalize_history()
+
+        t2 = time.time()
+
+        # Charge each model an equal share of the cost
+        for sim in sims:
+            sim.timer = (t2 - t1) / float(len(self))
+            sim.is_complete = True
+
+        self.timer = t2 - t1
+        self.is_complete = True
@@ -619,8 +619,7 @@ class MetaGalacticBackground(AnalyzeMGB):
             self._rc_tabs = [{} for i in range(self.solver.Npops)]
             # very similar chunk of code lives in update_fluxes...
             # could structure better, but i'm tired.
-            
-            fluxes = {i:None for i in range(self.solver.Npops)}
+
             for i, pop_generator in enumerate(self.solver.generators):
                 
                 kw['zone'] = self.pops[i].zone
@@ -648,43 +647,38 @@ class MetaGalacticBackground(AnalyzeMGB):
                 self._rc_tabs[i]['Ja'] = np.zeros(Nz)
                 self._rc_tabs[i]['Jlw'] = np.zeros(Nz)
             
-                # Need to cycle through redshift here
-                for _iz, redshift in enumerate(zarr):
-                          
-                    # The use of "continue", rather than "break", is
-                    # VERY important because redshifts are in ascending order
-                    # at this point.
-                    if redshift < self.pf['final_redshift']:
-                        # This shouldn't ever happen...
-                        continue
-                        
-                    if redshift < self.pf['kill_redshift']:
-                        continue    
-                    
-                    # Get fluxes if need be
-                    if pop_generator is None:
-                        kw['fluxes'] = None
-                    else:                        
-                        # Fluxes are in order of *descending* redshift!
-                        fluxes[i] = self.history[i][Nz-_iz-1]
-                        kw['fluxes'] = fluxes
-                        
-                    self._rc_tabs[i]['Ja'][_iz] = self._f_Ja(redshift)
-                    self._rc_tabs[i]['Jlw'][_iz] = self._f_Jlw(redshift)    
-                        
-                    # This routine expects fluxes to be a dictionary, with
-                    # the keys being population ID # and the elements lists
-                    # of fluxes in each (sub-) band.    
-                    coeff = self.solver.update_rate_coefficients(redshift, 
-                        popid=i, **kw)
-                                        
-                    self._rc_tabs[i]['k_ion'][_iz,:] = \
-                        coeff['k_ion'].copy()
-                    self._rc_tabs[i]['k_ion2'][_iz,:] = \
-                        coeff['k_ion2'].copy()
-                    self._rc_tabs[i]['k_heat'][_iz,:] = \
-                        coeff['k_heat'].copy()
-                        
+                zarr = np.array(zarr)
+
+                # The use of a mask, rather than truncating, is VERY
+                # important because redshifts are in ascending order at
+                # this point.
+                ok = np.logical_and(zarr >= self.pf['final_redshift'],
+                    zarr >= self.pf['kill_redshift'])
+
+                if not np.any(ok):
+                    continue
+
+                # Get fluxes if need be. Sort them by band, so each element
+                # is a list of fluxes (one per redshift) for that band.
+                if pop_generator is None:
+                    fluxes = None
+                else:
+                    # Fluxes are in order of *descending* redshift!
+                    hist = self.history[i][-1::-1]
+                    fluxes = [[hist[_iz][k] for _iz in range(Nz) if ok[_iz]] \
+                        for k in range(len(hist[0]))]
+
+                self._rc_tabs[i]['Ja'][ok==1] = self._f_Ja(zarr[ok==1])
+                self._rc_tabs[i]['Jlw'][ok==1] = self._f_Jlw(zarr[ok==1])
+
+                # Rates are integrals over the flux history, so do all
+                # redshifts at once.
+                coeff = self.solver.TabulateRateCoefficients(zarr[ok==1],
+                    popid=i, fluxes=fluxes, **kw)
+
+                for key in ['k_ion', 'k_ion2', 'k_heat']:
+                    self._rc_tabs[i][key][ok==1] = coeff[key]
+
             self._interp = [{} for i in range(self.solver.Npops)]
             for i, pop in enumerate(self.pops):
                 if self.solver.redshifts[i] is None:
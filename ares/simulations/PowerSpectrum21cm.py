@@ -6,6 +6,7 @@ from types import FunctionType
 from ..static import Fluctuations
 from .Global21cm import Global21cm
 from ..physics.HaloModel import HaloModel
+from ..util.MPIPool import LocalPool
 from ..util import ParameterFile, ProgressBar
 #from ..analysis.BlobFactory import BlobFactory
 from ..physics.Constants import cm_per_mpc, c, s_per_yr
@@ -17,11 +18,33 @@ from ..analysis.PowerSpectrum import PowerSpectrum as AnalyzePS
 #except ImportError:
 #    import pickle
 
+try:
+    from mpi4py import MPI
+    rank = MPI.COMM_WORLD.rank
+    size = MPI.COMM_WORLD.size
+except ImportError:
+    rank = 0
+    size = 1
+
 defaults = \
 {
  'load_ics': True,
 }
 
+# Simulation being run by worker processes (see PowerSpectrum21cm.run)
+_ps_sim = None
+
+def _ps_step(z):
+    """
+    Compute the power spectrum at redshift `z` for `_ps_sim`.
+    
+    Module-level so that it can be sent to worker processes. Also returns
+    any overlap kernels computed along the way, since workers never write
+    them to disk themselves.
+    """
+    data = _ps_sim._step_z(z)
+    return data, _ps_sim.field.unsaved_overlap_kernels()
+
 class PowerSpectrum21cm(AnalyzePS): # pragma: no cover
     def __init__(self, **kwargs):
         """ Set up a power spectrum calculation. """
@@ -116,23 +139,28 @@ class PowerSpectrum21cm(AnalyzePS): # pragma: no cover
         N = self.z.size
         pb = self.pb = ProgressBar(N, use=self.pf['progress_bar'], 
             name='ps-21cm')
+            
+        nprocs = self.pf['ps_nprocs']
+        use_mpi = self.pf['ps_mpi'] and (size > 1)
 
-        all_ps = []                        
-        for i, (z, data) in enumerate(self.step()):
-
-            # Do stuff
-            all_ps.append(data.copy())
+        if (nprocs > 1) or use_mpi:
+            all_ps = self._run_parallel(pb, nprocs, use_mpi)
+        else:
+            all_ps = []                        
+            for i, (z, data) in enumerate(self.step()):
 
-            if i == 0:
-                keys = data.keys()
+                # Do stuff
+                all_ps.append(data.copy())
                 
-            if not pb.has_pb:
-                pb.start()
+                if not pb.has_pb:
+                    pb.start()
 
-            pb.update(i)
+                pb.update(i)
 
         pb.finish()
         
+        keys = all_ps[0].keys()
+        
         self.all_ps = all_ps
         
         hist = {}
@@ -223,313 +251,422 @@ class PowerSpectrum21cm(AnalyzePS): # pragma: no cover
     def tab_zeta(self):
         pass    
     
+    def _run_parallel(self, pb, nprocs=1, use_mpi=False):
+        """
+        Compute the power spectrum at all redshifts in parallel.
+        
+        Redshifts are distributed round-robin over MPI ranks if `use_mpi`,
+        otherwise over a pool of `nprocs` local processes. Either way, the
+        mean history, HMF tables, etc. are computed once, up front, and 
+        inherited by all workers.
+        
+        Returns
+        -------
+        List of dictionaries, one per redshift, in the same order as 
+        `self.z`.
+        
+        """
+        
+        global _ps_sim
+        
+        self._prepare()
+        
+        N = self.z.size
+        all_ps = [None] * N
+        
+        pb.start()
+        
+        # Only the root process writes overlap kernels to disk, once all
+        # redshifts are done.
+        self.field.defer_overlap_save = True
+        
+        if use_mpi:
+            mine = {}
+            for i in range(rank, N, size):
+                mine[i] = self._step_z(self.z[i])
+                pb.update(i)
+                
+            # Everybody gets everything
+            for results in MPI.COMM_WORLD.allgather(mine):
+                for i in results:
+                    all_ps[i] = results[i]
+            
+            kernels = MPI.COMM_WORLD.gather(
+                self.field.unsaved_overlap_kernels(), root=0)
+            
+            self.field.defer_overlap_save = False
+            if rank == 0:
+                for _kernels in kernels:
+                    self.field.save_overlap_kernels(_kernels)
+                    
+            return all_ps
+        
+        # Workers are forked, so they must be created after _prepare
+        _ps_sim = self
+        try:
+            pool = LocalPool(nprocs, fork=True)
+        except:
+            _ps_sim = None
+            self.field.defer_overlap_save = False
+            raise
+        
+        kernels = {}
+        try:
+            for i, z in enumerate(self.z):
+                pool.submit(_ps_step, z, i)
+                
+            for j in range(N):
+                i, (data, _kernels) = pool.wait()
+                all_ps[i] = data
+                kernels.update(_kernels)
+                pb.update(j)
+        finally:
+            pool.stop()
+            _ps_sim = None
+            self.field.defer_overlap_save = False
+            
+        self.field.save_overlap_kernels(kernels)
+            
+        return all_ps
+        
+    def _prepare(self):
+        """
+        Compute everything that all redshifts have in common.
+        
+        This includes the mean (global 21-cm) history, halo mass function,
+        and minimum mass, so that workers can share them (read-only) rather
+        than each re-computing them.
+        """
+        
+        # Run the global 21-cm calculation if we haven't already
+        self.mean_history
+        
+        # Set a few things before we get moving.
+        self.field.tab_Mmin = self.tab_Mmin
+        
+        # Load up HMF tables, output scales
+        self.halos.tab_M, self.R, self.k
+        
     def step(self):
         """
         Generator for the power spectrum.
         """
 
-        # Set a few things before we get moving.
-        self.field.tab_Mmin = self.tab_Mmin    
+        self._prepare()
         
         for i, z in enumerate(self.z):
+            yield z, self._step_z(z)
+            
+    def _step_z(self, z):
+        """
+        Compute the power spectrum (and related quantities) at redshift `z`.
+        
+        Each redshift is independent of the others once the mean history
+        is known (see `_prepare`).
+        
+        Returns
+        -------
+        Dictionary of results.
+        
+        """
+        
+        data = {}
+            
+        ## 
+        # First, loop over populations and determine total
+        # UV and X-ray outputs. 
+        ##          
+        
+        # Prepare for the general case of Mh-dependent things
+        Nion = np.zeros_like(self.halos.tab_M)
+        Nlya = np.zeros_like(self.halos.tab_M)
+        fXcX = np.zeros_like(self.halos.tab_M)
+        zeta_ion = zeta = np.zeros_like(self.halos.tab_M)
+        zeta_lya = np.zeros_like(self.halos.tab_M)
+        zeta_X = np.zeros_like(self.halos.tab_M)
+        #Tpro = None
+        for j, pop in enumerate(self.pops):
+            pop_zeta = pop.IonizingEfficiency(z=z)
+            
+            if pop.is_src_ion:
 
-            data = {}
-                
-            ## 
-            # First, loop over populations and determine total
-            # UV and X-ray outputs. 
-            ##          
-            
-            # Prepare for the general case of Mh-dependent things
-            Nion = np.zeros_like(self.halos.tab_M)
-            Nlya = np.zeros_like(self.halos.tab_M)
-            fXcX = np.zeros_like(self.halos.tab_M)
-            zeta_ion = zeta = np.zeros_like(self.halos.tab_M)
-            zeta_lya = np.zeros_like(self.halos.tab_M)
-            zeta_X = np.zeros_like(self.halos.tab_M)
-            #Tpro = None
-            for j, pop in enumerate(self.pops):
-                pop_zeta = pop.IonizingEfficiency(z=z)
-                
-                if pop.is_src_ion:
-
-                    if type(pop_zeta) is tuple:
-                        _Mh, _zeta = pop_zeta
-                        zeta += np.interp(self.halos.tab_M, _Mh, _zeta)
-                        Nion += pop.src.Nion
-                    else:
-                        zeta += pop_zeta
-                        Nion += pop.pf['pop_Nion']
-                        Nlya += pop.pf['pop_Nlw']
-
-                    zeta = np.maximum(zeta, 1.) # why?
-
-                if pop.is_src_heat:
-                    pop_zeta_X = pop.HeatingEfficiency(z=z)
-                    zeta_X += pop_zeta_X
-
-                if pop.is_src_lya:
+                if type(pop_zeta) is tuple:
+                    _Mh, _zeta = pop_zeta
+                    zeta += np.interp(self.halos.tab_M, _Mh, _zeta)
+                    Nion += pop.src.Nion
+                else:
+                    zeta += pop_zeta
+                    Nion += pop.pf['pop_Nion']
                     Nlya += pop.pf['pop_Nlw']
-                    #Nlya += pop.src.Nlw
-
-            # Only used if...ps_lya_method==0?
-            zeta_lya += zeta * (Nlya / Nion)
-                                                                        
-            ##
-            # Make scalar if it's a simple model
-            ##
-            if np.all(np.diff(zeta) == 0):
-                zeta = zeta[0]
-            if np.all(np.diff(zeta_X) == 0):
-                zeta_X = zeta_X[0]    
-            if np.all(np.diff(zeta_lya) == 0):
-                zeta_lya = zeta_lya[0]
-                
-            self.field.zeta = zeta
-            self.field.zeta_X = zeta_X
-                            
-            self.zeta = zeta    
-                
-            ##
-            # Figure out scaling from ionized regions to heated regions.
-            # Right now, only constant (relative) scaling is allowed.
-            ##    
-            asize = self.pf['bubble_shell_asize_zone_0']
-            if self.pf['ps_include_temp'] and asize is not None:
-                
-                self.field.is_Rs_const = False
-                
-                if type(asize) is FunctionType:
-                    R_s = lambda R, z: R + asize(z)
-                else:    
-                    R_s = lambda R, z: R + asize
-                
-            elif self.pf['ps_include_temp'] and self.pf['ps_include_ion']:
-                fvol = self.pf["bubble_shell_rvol_zone_0"]
-                frad = self.pf['bubble_shell_rsize_zone_0']
-                
-                assert (fvol is not None) + (frad is not None) <= 1
+
+                zeta = np.maximum(zeta, 1.) # why?
+
+            if pop.is_src_heat:
+                pop_zeta_X = pop.HeatingEfficiency(z=z)
+                zeta_X += pop_zeta_X
+
+            if pop.is_src_lya:
+                Nlya += pop.pf['pop_Nlw']
+                #Nlya += pop.src.Nlw
+
+        # Only used if...ps_lya_method==0?
+        zeta_lya += zeta * (Nlya / Nion)
+                                                                    
+        ##
+        # Make scalar if it's a simple model
+        ##
+        if np.all(np.diff(zeta) == 0):
+            zeta = zeta[0]
+        if np.all(np.diff(zeta_X) == 0):
+            zeta_X = zeta_X[0]    
+        if np.all(np.diff(zeta_lya) == 0):
+            zeta_lya = zeta_lya[0]
+            
+        self.field.zeta = zeta
+        self.field.zeta_X = zeta_X
+                        
+        self.zeta = zeta    
+            
+        ##
+        # Figure out scaling from ionized regions to heated regions.
+        # Right now, only constant (relative) scaling is allowed.
+        ##    
+        asize = self.pf['bubble_shell_asize_zone_0']
+        if self.pf['ps_include_temp'] and asize is not None:
+            
+            self.field.is_Rs_const = False
+            
+            if type(asize) is FunctionType:
+                R_s = lambda R, z: R + asize(z)
+            else:    
+                R_s = lambda R, z: R + asize
+            
+        elif self.pf['ps_include_temp'] and self.pf['ps_include_ion']:
+            fvol = self.pf["bubble_shell_rvol_zone_0"]
+            frad = self.pf['bubble_shell_rsize_zone_0']
+            
+            assert (fvol is not None) + (frad is not None) <= 1
+            
+            if fvol is not None:
+                assert frad is None
                 
-                if fvol is not None:
-                    assert frad is None
+                # Assume independent variable is redshift for now.
+                if type(fvol) is FunctionType:
+                    frad = lambda z: (1. + fvol(z))**(1./3.) - 1.
+                    self.field.is_Rs_const = False
+                else:
+                    frad = lambda z: (1. + fvol)**(1./3.) - 1.
                     
-                    # Assume independent variable is redshift for now.
-                    if type(fvol) is FunctionType:
-                        frad = lambda z: (1. + fvol(z))**(1./3.) - 1.
-                        self.field.is_Rs_const = False
-                    else:
-                        frad = lambda z: (1. + fvol)**(1./3.) - 1.
-                        
-                elif frad is not None:
-                    if type(frad) is FunctionType:
-                        self.field.is_Rs_const = False
-                    else:
-                        frad = lambda z: frad
+            elif frad is not None:
+                if type(frad) is FunctionType:
+                    self.field.is_Rs_const = False
                 else:
-                    # If R_s = R_s(z), must re-compute overlap volumes on each
-                    # step. Should set attribute if this is the case.
-                    raise NotImplemented('help')
-                
-                R_s = lambda R, z: R * (1. + frad(z))
-                
-                
+                    frad = lambda z: frad
             else:
-                R_s = lambda R, z: None    
-                Th = None
-                
-            # Must be constant, for now.
-            Th = self.pf["bubble_shell_ktemp_zone_0"]
+                # If R_s = R_s(z), must re-compute overlap volumes on each
+                # step. Should set attribute if this is the case.
+                raise NotImplemented('help')
             
-            self.R_s = R_s
-            self.Th = Th
-                
-                
-            ##
-            # First: some global quantities we'll need
-            ##
-            Tcmb = self.cosm.TCMB(z)
-            Tk = np.interp(z, self.mean_history['z'][-1::-1],
-                self.mean_history['igm_Tk'][-1::-1])
-            Ts = np.interp(z, self.mean_history['z'][-1::-1],
-                self.mean_history['Ts'][-1::-1])
-            Ja = np.interp(z, self.mean_history['z'][-1::-1],
-                self.mean_history['Ja'][-1::-1])
-            xHII, ne = [0] * 2
-            
-            xa = self.hydr.RadiativeCouplingCoefficient(z, Ja, Tk)
-            xc = self.hydr.CollisionalCouplingCoefficient(z, Tk)
-            xt = xa + xc
-            
-            # Won't be terribly meaningful if temp fluctuations are off.
-            C = self.field.TempToContrast(z, Th=Th, Tk=Tk, Ts=Ts, Ja=Ja)            
-            data['c'] = C
-            data['Ts'] = Ts
-            data['Tk'] = Tk
-            data['xa'] = xa
-            data['Ja'] = Ja
-            
-            
-            
-            # Assumes strong coupling. Mapping between temperature 
-            # fluctuations and contrast fluctuations.
-            #Ts = Tk
-            
-            
-            # Add beta factors to dictionary
-            for f1 in ['x', 'd', 'a']:
-                func = self.hydr.__getattribute__('beta_%s' % f1)
-                data['beta_%s' % f1] = func(z, Tk, xHII, ne, Ja)
-            
-            Qi_gs = np.interp(z, self.gs.history['z'][-1::-1], 
-                self.gs.history['cgm_h_2'][-1::-1])
-            
-            # Ionization fluctuations
-            if self.pf['ps_include_ion']:
-            
-                Ri, Mi, Ni = self.field.BubbleSizeDistribution(z, ion=True)
-            
-                data['n_i'] = Ni
-                data['m_i'] = Mi
-                data['r_i'] = Ri
-                data['delta_B'] = self.field._B(z, ion=True)
-            else:
-                Ri = Mi = Ni = None    
+            R_s = lambda R, z: R * (1. + frad(z))
             
-            Qi = self.field.MeanIonizedFraction(z)
             
-            Qi_bff = self.field.BubbleFillingFactor(z)
+        else:
+            R_s = lambda R, z: None    
+            Th = None
             
-            xibar = Qi_gs                
+        # Must be constant, for now.
+        Th = self.pf["bubble_shell_ktemp_zone_0"]
+        
+        self.R_s = R_s
+        self.Th = Th
+            
+            
+        ##
+        # First: some global quantities we'll need
+        ##
+        Tcmb = self.cosm.TCMB(z)
+        Tk = np.interp(z, self.mean_history['z'][-1::-1],
+            self.mean_history['igm_Tk'][-1::-1])
+        Ts = np.interp(z, self.mean_history['z'][-1::-1],
+            self.mean_history['Ts'][-1::-1])
+        Ja = np.interp(z, self.mean_history['z'][-1::-1],
+            self.mean_history['Ja'][-1::-1])
+        xHII, ne = [0] * 2
+        
+        kern = self.hydr.SpinTemperatureKernel(z, Tk, Ja)
+        xa, xc = kern['xa'], kern['xc']
+        xt = xa + xc
+        
+        # Won't be terribly meaningful if temp fluctuations are off.
+        C = self.field.TempToContrast(z, Th=Th, Tk=Tk, Ts=Ts, Ja=Ja)            
+        data['c'] = C
+        data['Ts'] = Ts
+        data['Tk'] = Tk
+        data['xa'] = xa
+        data['Ja'] = Ja
+        
+        
+        
+        # Assumes strong coupling. Mapping between temperature 
+        # fluctuations and contrast fluctuations.
+        #Ts = Tk
+        
+        
+        # Add beta factors to dictionary
+        for f1 in ['x', 'd', 'a']:
+            func = self.hydr.__getattribute__('beta_%s' % f1)
+            data['beta_%s' % f1] = func(z, Tk, xHII, ne, Ja)
+        
+        Qi_gs = np.interp(z, self.gs.history['z'][-1::-1], 
+            self.gs.history['cgm_h_2'][-1::-1])
+        
+        # Ionization fluctuations
+        if self.pf['ps_include_ion']:
+        
+            Ri, Mi, Ni = self.field.BubbleSizeDistribution(z, ion=True)
+        
+            data['n_i'] = Ni
+            data['m_i'] = Mi
+            data['r_i'] = Ri
+            data['delta_B'] = self.field._B(z, ion=True)
+        else:
+            Ri = Mi = Ni = None    
+        
+        Qi = self.field.MeanIonizedFraction(z)
+        
+        Qi_bff = self.field.BubbleFillingFactor(z)
+        
+        xibar = Qi_gs                
+                        
+        #print(z, Qi_bff, Qi, xibar, Qi_bff / Qi)
+                        
+        if self.pf['ps_include_temp']:
+            # R_s=R_s(Ri,z)
+            Qh = self.field.MeanIonizedFraction(z, ion=False)
+            data['Qh'] = Qh
+        else:
+            data['Qh'] = Qh = 0.0
+        
+        # Interpolate global signal onto new (coarser) redshift grid.
+        dTb_ps = np.interp(z, self.gs.history['z'][-1::-1], 
+            self.gs.history['dTb'][-1::-1])
+        
+        xavg_gs = np.interp(z, self.gs.history['z'][-1::-1], 
+            self.gs.history['xavg'][-1::-1])
                             
-            #print(z, Qi_bff, Qi, xibar, Qi_bff / Qi)
+        data['dTb'] = dTb_ps
+        
+        #data['dTb_bulk'] = np.interp(z, self.gs.history['z'][-1::-1], 
+        #    self.gs.history['dTb_bulk'][-1::-1])
+
+        
+        ##
+        # Correct for fraction of ionized and heated volumes
+        # and densities!
+        ##            
+        if self.pf['ps_include_temp']:
+            data['dTb_vcorr'] = None#(1 - Qh - Qi) * data['dTb_bulk'] \
+                #+ Qh * self.hydr.dTb(z, 0.0, Th)
+        else:
+            data['dTb_vcorr'] = None#data['dTb_bulk'] * (1. - Qi)
+        
+        if self.pf['ps_include_xcorr_ion_rho']:
+            pass
+        if self.pf['ps_include_xcorr_ion_hot']:
+            pass
+            
+        # Just for now    
+        data['dTb0'] = data['dTb']
+        data['dTb0_2'] = data['dTb0_1'] = data['dTb_vcorr']
+        
+        #if self.pf['include_ion_fl']:
+        #    if self.pf['ps_rescale_Qion']:
+        #        xibar = min(np.interp(z, self.pops[0].halos.z,
+        #            self.pops[0].halos.fcoll_Tmin) * zeta, 1.)
+        #        Qi = xibar
+        #        
+        #        xibar = np.interp(z, self.mean_history['z'][-1::-1],
+        #            self.mean_history['cgm_h_2'][-1::-1])
+        #        
+        #    else:
+        #        Qi = self.field.BubbleFillingFactor(z, zeta)
+        #        xibar = 1. - np.exp(-Qi)
+        #else:
+        #    Qi = 0.
+        
+        
                             
-            if self.pf['ps_include_temp']:
-                # R_s=R_s(Ri,z)
-                Qh = self.field.MeanIonizedFraction(z, ion=False)
-                data['Qh'] = Qh
-            else:
-                data['Qh'] = Qh = 0.0
+        #if self.pf['ps_force_QHII_gs'] or self.pf['ps_force_QHII_fcoll']:
+        #    rescale_Q = True
+        #else:
+        #    rescale_Q = False
             
-            # Interpolate global signal onto new (coarser) redshift grid.
-            dTb_ps = np.interp(z, self.gs.history['z'][-1::-1], 
-                self.gs.history['dTb'][-1::-1])
+        #Qi = np.mean([QHII_gs, self.field.BubbleFillingFactor(z, zeta)])    
+                                                            
+        #xibar = np.interp(z, self.mean_history['z'][-1::-1],
+        #    self.mean_history['cgm_h_2'][-1::-1])
             
-            xavg_gs = np.interp(z, self.gs.history['z'][-1::-1], 
-                self.gs.history['xavg'][-1::-1])
-                                
-            data['dTb'] = dTb_ps
+        # Avoid divide by zeros when reionization is over
+        if Qi == 1:
+            Tbar = 0.0
+        else:
+            Tbar = data['dTb0_2']
+                            
+        xbar = 1. - xibar
+        data['Qi'] = Qi
+        data['xibar'] = xibar
+        data['dTb0'] = Tbar            
+        #data['dTb_bulk'] = dTb_ps / (1. - xavg_gs)
+                    
+        ##
+        # 21-cm fluctuations
+        ##
+        if self.pf['ps_include_21cm']:
             
-            #data['dTb_bulk'] = np.interp(z, self.gs.history['z'][-1::-1], 
-            #    self.gs.history['dTb_bulk'][-1::-1])
-
+            data['cf_21'] = self.field.CorrelationFunction(z,
+                R=self.R, term='21', R_s=R_s(Ri,z), Ts=Ts, Th=Th,
+                Tk=Tk, Ja=Ja, k=self.k)
+                                    
+            # Always compute the 21-cm power spectrum. Individual power
+            # spectra can be saved by setting ps_save_components=True.
+            data['ps_21'] = self.field.PowerSpectrumFromCF(self.k, 
+                data['cf_21'], self.R, 
+                split_by_scale=self.pf['ps_split_transform'],
+                epsrel=self.pf['ps_fht_rtol'],
+                epsabs=self.pf['ps_fht_atol'])
+                                    
+        # Should just do the above, and then loop over whatever is in 
+        # the cache and save also. If ps_save_components is True, then
+        # FT everything we haven't already. 
+        for term in ['dd', 'ii', 'id', 'psi', 'phi']:
+            # Should change suffix to _ev
+            jp_1 = self.field._cache_jp(z, term)
+            cf_1 = self.field._cache_cf(z, term)
             
-            ##
-            # Correct for fraction of ionized and heated volumes
-            # and densities!
-            ##            
-            if self.pf['ps_include_temp']:
-                data['dTb_vcorr'] = None#(1 - Qh - Qi) * data['dTb_bulk'] \
-                    #+ Qh * self.hydr.dTb(z, 0.0, Th)
-            else:
-                data['dTb_vcorr'] = None#data['dTb_bulk'] * (1. - Qi)
+            if (jp_1 is None and cf_1 is None) and (term not in ['psi', 'phi', 'oo']):
+                continue
+                    
+            _cf = self.field.CorrelationFunction(z, 
+                R=self.R, term=term, R_s=R_s(Ri,z), Ts=Ts, Th=Th,
+                Tk=Tk, Ja=Ja, k=self.k)
+                    
+            data['cf_{}'.format(term)] = _cf.copy()
             
-            if self.pf['ps_include_xcorr_ion_rho']:
-                pass
-            if self.pf['ps_include_xcorr_ion_hot']:
-                pass
-                
-            # Just for now    
-            data['dTb0'] = data['dTb']
-            data['dTb0_2'] = data['dTb0_1'] = data['dTb_vcorr']
-            
-            #if self.pf['include_ion_fl']:
-            #    if self.pf['ps_rescale_Qion']:
-            #        xibar = min(np.interp(z, self.pops[0].halos.z,
-            #            self.pops[0].halos.fcoll_Tmin) * zeta, 1.)
-            #        Qi = xibar
-            #        
-            #        xibar = np.interp(z, self.mean_history['z'][-1::-1],
-            #            self.mean_history['cgm_h_2'][-1::-1])
-            #        
-            #    else:
-            #        Qi = self.field.BubbleFillingFactor(z, zeta)
-            #        xibar = 1. - np.exp(-Qi)
-            #else:
-            #    Qi = 0.
-            
-            
-                                
-            #if self.pf['ps_force_QHII_gs'] or self.pf['ps_force_QHII_fcoll']:
-            #    rescale_Q = True
-            #else:
-            #    rescale_Q = False
-                
-            #Qi = np.mean([QHII_gs, self.field.BubbleFillingFactor(z, zeta)])    
-                                                                
-            #xibar = np.interp(z, self.mean_history['z'][-1::-1],
-            #    self.mean_history['cgm_h_2'][-1::-1])
-                
-            # Avoid divide by zeros when reionization is over
-            if Qi == 1:
-                Tbar = 0.0
-            else:
-                Tbar = data['dTb0_2']
-                                
-            xbar = 1. - xibar
-            data['Qi'] = Qi
-            data['xibar'] = xibar
-            data['dTb0'] = Tbar            
-            #data['dTb_bulk'] = dTb_ps / (1. - xavg_gs)
-                        
-            ##
-            # 21-cm fluctuations
-            ##
-            if self.pf['ps_include_21cm']:
-                
-                data['cf_21'] = self.field.CorrelationFunction(z,
-                    R=self.R, term='21', R_s=R_s(Ri,z), Ts=Ts, Th=Th,
-                    Tk=Tk, Ja=Ja, k=self.k)
-                                        
-                # Always compute the 21-cm power spectrum. Individual power
-                # spectra can be saved by setting ps_save_components=True.
-                data['ps_21'] = self.field.PowerSpectrumFromCF(self.k, 
-                    data['cf_21'], self.R, 
-                    split_by_scale=self.pf['ps_split_transform'],
-                    epsrel=self.pf['ps_fht_rtol'],
-                    epsabs=self.pf['ps_fht_atol'])
-                                        
-            # Should just do the above, and then loop over whatever is in 
-            # the cache and save also. If ps_save_components is True, then
-            # FT everything we haven't already. 
-            for term in ['dd', 'ii', 'id', 'psi', 'phi']:
-                # Should change suffix to _ev
-                jp_1 = self.field._cache_jp(z, term)
-                cf_1 = self.field._cache_cf(z, term)
+            if not self.pf['ps_output_components']:
+                continue
                 
-                if (jp_1 is None and cf_1 is None) and (term not in ['psi', 'phi', 'oo']):
-                    continue
-                        
-                _cf = self.field.CorrelationFunction(z, 
-                    R=self.R, term=term, R_s=R_s(Ri,z), Ts=Ts, Th=Th,
-                    Tk=Tk, Ja=Ja, k=self.k)
-                        
-                data['cf_{}'.format(term)] = _cf.copy()
-                
-                if not self.pf['ps_output_components']:
-                    continue
-                    
-                data['ps_{}'.format(term)] = \
-                    self.field.PowerSpectrumFromCF(self.k, 
-                    data['cf_{}'.format(term)], self.R, 
-                    split_by_scale=self.pf['ps_split_transform'],
-                    epsrel=self.pf['ps_fht_rtol'],
-                    epsabs=self.pf['ps_fht_atol'])    
+            data['ps_{}'.format(term)] = \
+                self.field.PowerSpectrumFromCF(self.k, 
+                data['cf_{}'.format(term)], self.R, 
+                split_by_scale=self.pf['ps_split_transform'],
+                epsrel=self.pf['ps_fht_rtol'],
+                epsabs=self.pf['ps_fht_atol'])    
+            
+        # Always save the matter correlation function.        
+        data['cf_dd'] = self.field.CorrelationFunction(z, 
+            term='dd', R=self.R)
                 
-            # Always save the matter correlation function.        
-            data['cf_dd'] = self.field.CorrelationFunction(z, 
-                term='dd', R=self.R)
-                    
-            yield z, data
+        return data
             
     def save(self, prefix, suffix='pkl', clobber=False, fields=None):
         """
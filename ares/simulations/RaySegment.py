@@ -12,9 +12,9 @@ Description:
 
 import numpy as np
 from ..util import ProgressBar
+from ..util.WriteData import HistoryBuffer
 from .GasParcel import GasParcel
 from ..solvers import RadialField
-from ..util.ReadData import _sort_history
 from ..analysis.RaySegment import RaySegment as AnalyzeRay
 
 class RaySegment(AnalyzeRay):
@@ -90,8 +90,8 @@ class RaySegment(AnalyzeRay):
         pb = ProgressBar(tf, use=self.pf['progress_bar'])
         pb.start()
 
-        all_t = []
-        all_data = []
+        hist = HistoryBuffer(decimate=self.pf['history_decimate'],
+            fn=self.pf['history_file'], clobber=self.pf['history_clobber'])
         for t, dt, data in self.step():
 
             # Compute ionization / heating rate coefficient
@@ -101,8 +101,7 @@ class RaySegment(AnalyzeRay):
             self.update_rate_coefficients(data, **RCs)
                         
             # Save data
-            all_t.append(t)
-            all_data.append(data.copy())
+            hist.append(t, data, last=t >= tf)
             
             if t >= tf:
                 break
@@ -111,8 +110,7 @@ class RaySegment(AnalyzeRay):
 
         pb.finish()
 
-        to_return = _sort_history(all_data)
-        to_return['t'] = np.array(all_t)
+        to_return = hist.finish()
         
         self.history = to_return
 
@@ -1,8 +1,12 @@
-from ares.simulations.GasParcel import GasParcel
-from ares.simulations.RaySegment import RaySegment
-from ares.simulations.Global21cm import Global21cm
-from ares.simulations.MultiPhaseMedium import MultiPhaseMedium
-from ares.simulations.PowerSpectrum21cm import PowerSpectrum21cm
-from ares.simulations.MetaGalacticBackground import MetaGalacticBackground
-
+from ares.util.Lazy import lazy_import
 
+__getattr__, __dir__ = lazy_import(__name__,
+{
+ 'GasParcel': ('GasParcel', 'GasParcel'),
+ 'RaySegment': ('RaySegment', 'RaySegment'),
+ 'Global21cm': ('Global21cm', 'Global21cm'),
+ 'Global21cmEnsemble': ('Global21cmEnsemble', 'Global21cmEnsemble'),
+ 'MultiPhaseMedium': ('MultiPhaseMedium', 'MultiPhaseMedium'),
+ 'PowerSpectrum21cm': ('PowerSpectrum21cm', 'PowerSpectrum21cm'),
+ 'MetaGalacticBackground': ('MetaGalacticBackground', 'MetaGalacticBackground'),
+})
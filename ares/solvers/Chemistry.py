@@ -55,6 +55,9 @@ class Chemistry(object):
             nsteps=1e4, atol=atol, rtol=rtol)
         
         self.solver._integrator.iwork[2] = -1
+        
+        self.atol = atol
+        self.rtol = rtol
             
         # Empty arrays in the shapes we often need
         self.zeros_gridxq = np.zeros([self.grid.dims, 
@@ -146,6 +149,133 @@ class Chemistry(object):
 
         return newdata  
 
+    @property
+    def solver_cells(self):
+        """
+        ODE solver for many cells at once. See `EvolveCells`.
+        """
+        if not hasattr(self, '_solver_cells'):
+            # Cells don't talk to each other, so the Jacobian is block
+            # diagonal, i.e., banded.
+            Nev = len(self.grid.evolving_fields)
+            self._solver_cells = ode(self._RateEquationsCells).set_integrator(
+                'lsoda', nsteps=1e4, atol=self.atol, rtol=self.rtol, 
+                lband=Nev-1, uband=Nev-1)
+                
+        return self._solver_cells
+        
+    def _RateEquationsCells(self, s, y, args):
+        """
+        Right-hand side of rate equations for all cells, with time in units
+        of each cell's time-step, so that all cells finish at s = 1.
+        """
+        cells, k_ion, k_ion2, k_heat, ntot, t, dt = args
+        
+        time = t + s * dt
+        q = y.reshape(cells.size, -1).T
+        
+        dqdt = self.chemnet.RateEquations(time, q, 
+            (cells, k_ion, k_ion2, k_heat, ntot, time))
+            
+        return (dqdt * dt).T.ravel()
+        
+    def EvolveCells(self, data, t, dt, cells=None, **kwargs):
+        """
+        Evolve some (or all) cells, each by its own time-step.
+        
+        Unlike `Evolve`, which calls the ODE solver once per cell, this
+        solves the rate equations for all cells as one (block diagonal) 
+        system, which is much faster when there are many cells and each
+        is cheap, e.g., many realizations of a single-zone model.
+        
+        Parameters
+        ----------
+        data : dictionary
+            Dictionary containing elements for each field in the grid.
+            Each element is itself a 1-D array of values.
+        t : float, np.ndarray
+            Current time, in each cell.
+        dt : float, np.ndarray
+            Current time-step, in each cell.
+        cells : np.ndarray
+            Indices of cells to evolve. If None, will evolve them all.
+            
+        Returns
+        -------
+        Dictionary of new data. Fields in cells that were not evolved are
+        left untouched.
+        
+        """
+        
+        if cells is None:
+            cells = np.arange(self.grid.dims)
+        else:
+            cells = np.atleast_1d(cells)
+        
+        Nc = cells.size
+        t = t * np.ones(Nc)
+        dt = dt * np.ones(Nc)
+        
+        if self.grid.expansion:
+            z = self.grid.cosm.TimeToRedshiftConverter(0, t, self.grid.zi)
+            dz = dt / self.grid.cosm.dtdz(z)
+        else:
+            z = dz = 0
+            
+        newdata = {}
+        for field in data:
+            newdata[field] = data[field].copy()
+            
+        sub = {field: data[field][cells] for field in data}    
+            
+        if 'he_1' in self.grid.absorbers:
+            i = self.grid.absorbers.index('he_1')
+            self.chemnet.psi[cells,i] *= sub['he_2'] / sub['he_1']
+            
+        # Make sure we've got number densities (in the cells we're evolving)
+        if 'n' not in sub:
+            sub['n'] = self.grid.particle_density(sub, z)
+            newdata['n'] = np.zeros(self.grid.dims)
+            
+        if not kwargs:
+            kwargs = self.rcs.copy()
+            
+        # Rate coefficients with cell dimension last
+        if self.rtON:
+            k_ion = kwargs['k_ion'][cells].T
+            k_ion2 = np.moveaxis(kwargs['k_ion2'][cells], 0, -1)
+            k_heat = kwargs['k_heat'][cells].T
+        else:
+            k_ion = k_heat = np.zeros((self.grid.N_absorbers, Nc))
+            k_ion2 = np.zeros([self.grid.N_absorbers] * 2 + [Nc])
+        
+        q = np.array([sub[sp] for sp in self.grid.evolving_fields]).T
+        
+        args = (cells, k_ion, k_ion2, k_heat, sub['n'], t, dt)
+        
+        self.solver_cells.set_initial_value(q.ravel(), 0.0).set_f_params(args)
+        self.solver_cells.integrate(1.0)
+        
+        self.q_grid = q
+        self.dqdt_grid = self.chemnet.dqdt.T.copy()
+        
+        y = self.solver_cells.y.reshape(Nc, -1)
+        for i, field in enumerate(self.grid.evolving_fields):
+            sub[field] = y[:,i]
+            newdata[field][cells] = y[:,i]
+            
+        # Compute particle density
+        newdata['n'][cells] = self.grid.particle_density(sub, z - dz)
+        
+        # Fix helium fractions if approx_He==True.
+        if self.grid.pf['include_He']:
+            if self.grid.pf['approx_He']:
+                newdata['he_1'][cells] = newdata['h_1'][cells]
+                newdata['he_2'][cells] = newdata['h_2'][cells]
+                newdata['he_3'][cells] = 0.0
+                
+        return newdata
+
     def _sort_kwargs_by_cell(self, kwargs):
         """
         Convert kwargs dictionary to list.
@@ -692,6 +692,119 @@ class UniformBackground(object):
 
         return to_return
 
+    def TabulateRateCoefficients(self, z, popid, fluxes=None, **kwargs):
+        """
+        Compute ionization and heating rate coefficients for a single
+        population at many redshifts at once.
+
+        Parameters
+        ----------
+        z : np.ndarray
+            Redshifts.
+        popid : int
+            ID number for population of interest.
+        fluxes : list
+            Fluxes in each band of this population, each element being a
+            sequence of fluxes, one per redshift (e.g., an array with shape
+            (z, E)). None if this population has no RTE solution.
+
+        Returns
+        -------
+        Dictionary containing ionization and heating rate coefficients,
+        with redshift as the first dimension.
+
+        """
+
+        Nz = len(z)
+        k_ion = np.zeros([Nz, self.grid.N_absorbers])
+        k_ion2 = np.zeros([Nz, self.grid.N_absorbers, self.grid.N_absorbers])
+        k_heat = np.zeros([Nz, self.grid.N_absorbers])
+
+        # Loop over absorbing species
+        for j, species in enumerate(self.grid.absorbers):
+
+            if not np.any(self.solve_rte[popid]):
+                self._tabulate_by_band_and_species(z, popid, j, None, None,
+                    k_ion, k_ion2, k_heat, **kwargs)
+                continue
+
+            # Sum over bands
+            for k, band in enumerate(self.energies[popid]):
+
+                if self.effects_by_pop[popid][k] is None:
+                    continue
+
+                # Still may not necessarily solve the RTE
+                if self.solve_rte[popid][k]:
+                    flux = None if fluxes is None else fluxes[k]
+                    self._tabulate_by_band_and_species(z, popid, j, k, flux,
+                        k_ion, k_ion2, k_heat, **kwargs)
+                else:
+                    self._tabulate_by_band_and_species(z, popid, j, None,
+                        None, k_ion, k_ion2, k_heat, **kwargs)
+
+        to_return = \
+        {
+         'k_ion': k_ion,
+         'k_ion2': k_ion2,
+         'k_heat': k_heat,
+        }
+
+        return to_return
+
+    def _tabulate_by_band_and_species(self, z, i, j, k, flux, k_ion, k_ion2,
+        k_heat, **kwargs):
+        """
+        i, j, k = source, species, band.
+
+        Rates are integrals of the flux over energy, so, if we've got the
+        fluxes at all redshifts, do all redshifts at once. Otherwise, fall
+        back to computing rates one redshift at a time.
+        """
+
+        def one_at_a_time(func, **kw):
+            rates = np.zeros(len(z))
+            for _iz, redshift in enumerate(z):
+                if flux is not None:
+                    kw['fluxes'] = {i: [None] * (k + 1)}
+                    kw['fluxes'][i][k] = flux[_iz]
+                else:
+                    kw['fluxes'] = {i: None}
+                rates[_iz] = func(redshift, popid=i, band=k, **kw)
+            return rates
+
+        kw = kwargs.copy()
+
+        if kwargs['zone'] in ['igm', 'both']:
+            ion = self.volume.TabulateIonizationRateIGM(z, flux, species=j,
+                popid=i, band=k, **kw)
+            if ion is None:
+                ion = one_at_a_time(self.volume.IonizationRateIGM,
+                    species=j, **kw)
+
+            heat = self.volume.TabulateHeatingRate(z, flux, species=j,
+                popid=i, band=k, **kw)
+            if heat is None:
+                heat = one_at_a_time(self.volume.HeatingRate, species=j,
+                    **kw)
+
+            k_ion[:,j] += ion
+            k_heat[:,j] += heat
+
+            for h, donor in enumerate(self.grid.absorbers):
+                ion2 = self.volume.TabulateSecondaryIonizationRateIGM(z, flux,
+                    species=j, donor=h, popid=i, band=k, **kw)
+                if ion2 is None:
+                    ion2 = one_at_a_time(
+                        self.volume.SecondaryIonizationRateIGM, species=j,
+                        donor=h, **kw)
+
+                k_ion2[:,j,h] += ion2
+
+        elif kwargs['zone'] in ['cgm', 'both']:
+            k_ion[:,j] += one_at_a_time(self.volume.IonizationRateCGM,
+                species=j, **kw)
+
     def _update_by_band_and_species(self, z, i, j, k, **kwargs):
         """
         i, j, k = source, species, band.
@@ -1187,8 +1300,7 @@ class UniformBackground(object):
             # should.
             Inu[-1] = 1.
         else:
-            for i in range(Nf): 
-                Inu[i] = pop.src.Spectrum(E[i])
+            Inu[:] = pop.src.Spectrum(np.asarray(E))
 
         # Convert to photon *number* (well, something proportional to it)
         Inu_hat = Inu / E
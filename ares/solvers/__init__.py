@@ -1,5 +1,9 @@
-from ares.solvers.Chemistry import Chemistry
-from ares.solvers.RadialField import RadialField
-from ares.solvers.OpticalDepth import OpticalDepth
-from ares.solvers.UniformBackground import UniformBackground
+from ares.util.Lazy import lazy_import
 
+__getattr__, __dir__ = lazy_import(__name__,
+{
+ 'Chemistry': ('Chemistry', 'Chemistry'),
+ 'RadialField': ('RadialField', 'RadialField'),
+ 'OpticalDepth': ('OpticalDepth', 'OpticalDepth'),
+ 'UniformBackground': ('UniformBackground', 'UniformBackground'),
+})
@@ -14,7 +14,7 @@ import numpy as np
 from .Star import _Planck
 from .Source import Source
 from types import FunctionType
-from scipy.integrate import quad
+from scipy.integrate import quad, quad_vec
 from ..util.Math import interp1d
 from ..util.ReadData import read_lit
 from ..util.SetDefaultParameterValues import BlackHoleParameters
@@ -208,22 +208,20 @@ class BlackHole(Source):
         N = (ma - mi) / dlogE + 1
         Earr = 10**np.arange(mi, ma+dlogE, dlogE)
         
-        if type(E) is np.ndarray:
-            nout = []
-            for nrg in E:
-                gf = [self._GreensFunctionSIMPL(EE, nrg) for EE in Earr]
-                integrand = np.array(list(map(nin, Earr))) * np.array(gf) * Earr
-                
-                nout.append((1.0 - fsc) * nin(nrg) + fsc \
-                    * np.trapz(integrand, dx=dlogE) * np.log(10.))
-                    
-            nout = np.array(nout)        
-        else:
-            gf = [self._GreensFunctionSIMPL(EE, E) for EE in Earr]
-            integrand = np.array(list(map(nin, Earr))) * np.array(gf) * Earr
+        # Seed photons on the grid don't depend on E, so just do this once
+        if (not hasattr(self, '_cache_nin_')) or (self._cache_nin_[0] != t):
+            self._cache_nin_ = t, nin(Earr)
+        
+        E1 = np.atleast_1d(E)
+        gf = self._GreensFunctionSIMPL(Earr[None,:], E1[:,None])
+        integrand = self._cache_nin_[1][None,:] * gf * Earr[None,:]
+        
+        nout = fsc * np.trapz(integrand, dx=dlogE, axis=1) * np.log(10.)
             
-            nout = (1.0 - fsc) * nin(E) + fsc \
-                * np.trapz(integrand, dx=dlogE) * np.log(10.)
+        if np.ndim(E) == 0:
+            nout = (1.0 - fsc) * nin(E) + nout[0]
+        else:
+            nout = (1.0 - fsc) * nin(E1) + nout
          
         # Output spectrum
         return nout * E
@@ -239,17 +237,14 @@ class BlackHole(Source):
         Gamma = -self.pf['source_alpha'] + 1.0
         
         if self.pf['source_uponly']:
-            if Eout >= Ein:
-                return (Gamma - 1.0) * (Eout / Ein)**(-1.0 * Gamma) / Ein
-            else:
-                return 0.0
+            return np.where(Eout >= Ein, 
+                (Gamma - 1.0) * (Eout / Ein)**(-1.0 * Gamma) / Ein, 0.0)
         else:
-            if Eout >= Ein:
-                return (Gamma - 1.0) * (Gamma + 2.0) / (1.0 + 2.0 * Gamma) * \
-                    (Eout / Ein)**(-1.0 * Gamma) / Ein
-            else:
-                return (Gamma - 1.0) * (Gamma + 2.0) / (1.0 + 2.0 * Gamma) * \
-                    (Eout / Ein)**(Gamma + 1.0) / Ein
+            return np.where(Eout >= Ein, 
+                (Gamma - 1.0) * (Gamma + 2.0) / (1.0 + 2.0 * Gamma) * \
+                (Eout / Ein)**(-1.0 * Gamma) / Ein,
+                (Gamma - 1.0) * (Gamma + 2.0) / (1.0 + 2.0 * Gamma) * \
+                (Eout / Ein)**(Gamma + 1.0) / Ein)
     
     def _MultiColorDisk(self, E, t=0.0):
         """
@@ -273,10 +268,10 @@ class BlackHole(Source):
         integrand = lambda T, nrg: (T / self.T_in)**(-11. / 3.) \
             * _Planck(nrg, T) / self.T_in
             
-        if type(E) == np.ndarray:
-            result = \
-                np.array([quad(lambda T: integrand(T, nrg), 
-                    self.T_out, self.T_in)[0] for nrg in E])
+        if np.ndim(E) > 0:
+            # All energies at once, sharing one adaptive mesh in T
+            result = quad_vec(lambda T: integrand(T, np.asarray(E)), 
+                self.T_out, self.T_in)[0]
         else:
             result = quad(lambda T: integrand(T, E), self.T_out, self.T_in)[0]
             
@@ -32,6 +32,26 @@ except ImportError:
 np.seterr(all='ignore')   # exp overflow occurs when integrating BB
                           # will return 0 as it should for x large
 
+# Band integrals over source SEDs, shared by all instances with identical
+# source parameters (e.g., many models in a parameter study).
+_norm_cache = {}
+_norm_cache_max = 10000
+
+def _freeze(val):
+    """
+    Convert a parameter value to something hashable, or raise TypeError.
+    """
+    if isinstance(val, (int, float, str, bool, np.number, type(None))):
+        return val
+    elif isinstance(val, (list, tuple)):
+        return tuple([_freeze(element) for element in val])
+    elif isinstance(val, np.ndarray):
+        return (val.shape, tuple(val.ravel().tolist()))
+    elif isinstance(val, dict):
+        return tuple([(k, _freeze(val[k])) for k in sorted(val.keys())])
+    
+    raise TypeError('Cannot freeze object of type {!s}'.format(type(val)))
+
 class Source(object):
     def __init__(self, grid=None, cosm=None, logN=None, init_tabs=True, 
         **kwargs):
@@ -232,6 +252,54 @@ class Source(object):
             
         return self._sharp_points    
         
+    @property
+    def _norm_key(self):
+        """
+        Hashable summary of all source parameters, or None if the SED can't
+        be summarized that way (e.g., user-supplied functions or arrays).
+        """
+        if not hasattr(self, '_norm_key_'):
+            key = [self.__class__.__name__]
+            for par in sorted(self.pf.keys()):
+                if not par.startswith('source_'):
+                    continue
+                try:
+                    key.append((par, _freeze(self.pf[par])))
+                except TypeError:
+                    key = None
+                    break
+            
+            # Time-dependent SEDs can't be summarized by parameters alone
+            if ('source_evolving' in self.pf) and self.pf['source_evolving']:
+                key = None
+                
+            if key is not None and self.logN > 0:
+                key.append(('y', self.cosm.y))
+            
+            self._norm_key_ = None if key is None else tuple(key)
+                    
+        return self._norm_key_
+        
+    def _BandIntegral(self, name, integrand, Emin, Emax):
+        """
+        Integrate some function of the SED over (Emin, Emax).
+        
+        Results are cached by name, band, and source parameters, so that
+        new instances of identical sources needn't repeat the integral.
+        """
+        
+        if self._norm_key is None:
+            return quad(integrand, Emin, Emax, points=self.sharp_points)[0]
+        
+        key = (name, Emin, Emax, self._norm_key)
+        if key not in _norm_cache:
+            if len(_norm_cache) >= _norm_cache_max:
+                _norm_cache.clear()
+            _norm_cache[key] = \
+                quad(integrand, Emin, Emax, points=self.sharp_points)[0]
+            
+        return _norm_cache[key]
+        
     @property
     def _normL(self):
         if not hasattr(self, '_normL_'):
@@ -241,19 +309,19 @@ class Source(object):
                 En = self.pf['source_Enorm']
                 
                 if self.intrinsic_hardening:
-                    self._normL_ = 1. / self._Intensity(En),
+                    self._normL_ = 1. / self._Intensity(En)
                 else:    
                     self._normL_ = 1. / (self._Intensity(En) / self._hardening_factor(En))
             else:
                 if self.intrinsic_hardening:
-                    self._normL_ = 1. / quad(self._Intensity,
-                        self.pf['source_EminNorm'], 
-                        self.pf['source_EmaxNorm'], points=self.sharp_points)[0]
+                    self._normL_ = 1. / self._BandIntegral('norm', 
+                        self._Intensity, self.pf['source_EminNorm'], 
+                        self.pf['source_EmaxNorm'])
                 else:    
                     integrand = lambda EE: self._Intensity(EE) / self._hardening_factor(EE)
-                    self._normL_ = 1. / quad(integrand,
-                        self.pf['source_EminNorm'], 
-                        self.pf['source_EmaxNorm'], points=self.sharp_points)[0]
+                    self._normL_ = 1. / self._BandIntegral('norm_intr',
+                        integrand, self.pf['source_EminNorm'], 
+                        self.pf['source_EmaxNorm'])
                                 
         return self._normL_
 
@@ -390,8 +458,8 @@ class Source(object):
         integrand = lambda EE: self.Spectrum(EE) * EE
         norm = lambda EE: self.Spectrum(EE)
         
-        return quad(integrand, Emin, Emax, points=self.sharp_points)[0] \
-             / quad(norm, Emin, Emax, points=self.sharp_points)[0]
+        return self._BandIntegral('E', integrand, Emin, Emax) \
+             / self._BandIntegral('L', norm, Emin, Emax)
         
     @property
     def qdot_bar(self):
@@ -415,8 +483,8 @@ class Source(object):
         i2 = lambda E: self.Spectrum(E) / E
     
         # Must convert units
-        final = quad(i1, Emin, Emax, points=self.sharp_points)[0] \
-              / quad(i2, Emin, Emax, points=self.sharp_points)[0]
+        final = self._BandIntegral('L', i1, Emin, Emax) \
+              / self._BandIntegral('N', i2, Emin, Emax)
     
         return final
     
@@ -557,8 +625,8 @@ class Source(object):
         
         Parameters
         ----------
-        E: float
-            Emission energy in eV
+        E: float, np.ndarray
+            Emission energy (or energies) in eV
         t: float
             Time in seconds since source turned on.   
         i: int
@@ -573,7 +641,13 @@ class Source(object):
         """   
         
         if self.pf['source_Ekill'] is not None:
-            if self.pf['source_Ekill'][0] <= E <= self.pf['source_Ekill'][1]:
+            Ekill = self.pf['source_Ekill']
+            if np.ndim(E) > 0:
+                E = np.asarray(E)
+                kill = np.logical_and(E >= Ekill[0], E <= Ekill[1])
+                return np.where(kill, 0.0, 
+                    self._normL * self._Intensity(E, t=t))
+            elif Ekill[0] <= E <= Ekill[1]:
                 return 0.0
                 
         return self._normL * self._Intensity(E, t=t)
@@ -608,10 +682,15 @@ class Source(object):
         else:
             f = lambda x: 1.0    
             
-        L = self.Lbol * quad(lambda x: self.Spectrum(x) * f(x), Emin, Emax,
-            points=self.sharp_points)[0] 
-        Q = self.Lbol * quad(lambda x: self.Spectrum(x) * f(x) / x, Emin, 
-            Emax, points=self.sharp_points)[0] / erg_per_ev
+        if energy_weighted:
+            names = 'E', 'L'
+        else:
+            names = 'L', 'N'    
+            
+        L = self.Lbol * self._BandIntegral(names[0], 
+            lambda x: self.Spectrum(x) * f(x), Emin, Emax)
+        Q = self.Lbol * self._BandIntegral(names[1], 
+            lambda x: self.Spectrum(x) * f(x) / x, Emin, Emax) / erg_per_ev
                         
         return L / Q / erg_per_ev, Q            
 
@@ -10,6 +10,8 @@ Description:
 
 """
 
+import os
+import hashlib
 import numpy as np
 from .Source import Source
 from ..util.Math import interp1d
@@ -226,6 +228,10 @@ class SynthesisMaster(Source):
                 k = np.argmin(np.abs(Z - Zvals))
                 raw = self.data # just to be sure it has been read in.
                 data = self._data_all_Z[k,j]
+                # Normalize here rather than in `data`, so we never have to
+                # read the whole (possibly memory-mapped) table.
+                if self.pf['source_ssp']:
+                    data = data * self.pf['source_mass'] / 1e6
             else:
                 data = self.data[j,:]
             
@@ -412,16 +418,25 @@ class SynthesisMaster(Source):
             print("Emin={}, Emax={}".format(Emin, Emax))
             raise ValueError('Are EminNorm and EmaxNorm set properly?')
 
-        # Count up the photons in each spectral bin for all times
-        flux = np.zeros_like(self.times)
-        for i in range(self.times.size):
-            if energy_units:
-                integrand = self.data[i1:i0,i] * self.wavelengths[i1:i0]
-            else:
-                integrand = self.data[i1:i0,i] * self.wavelengths[i1:i0] \
-                    / (self.energies[i1:i0] * erg_per_ev)
-                        
-            flux[i] = np.trapz(integrand, x=np.log(self.wavelengths[i1:i0]))
+        if not hasattr(self, '_cache_ie_'):
+            self._cache_ie_ = {}
+            
+        key = (i0, i1, energy_units)
+        if key in self._cache_ie_:
+            return self._cache_ie_[key].copy()
+
+        # Count up the photons in each spectral bin for all times at once
+        wave = self.wavelengths[i1:i0]
+        if energy_units:
+            integrand = self.data[i1:i0,:] * wave[:,None]
+        else:
+            integrand = self.data[i1:i0,:] * wave[:,None] \
+                / (self.energies[i1:i0,None] * erg_per_ev)
+                    
+        flux = np.trapz(integrand, x=np.log(wave), axis=0)
+        
+        self._cache_ie_[key] = flux
+        flux = flux.copy()
                 
         # Current units: 
         # if pop_ssp: photons / sec / Msun
@@ -517,6 +532,99 @@ class SynthesisModel(SynthesisMaster):
     @property
     def metallicities(self):
         return self._litinst.metallicities
+        
+    @property
+    def _cache_prefix(self):
+        """
+        Path (minus suffix) to binary copy of the SPS tables for this model.
+        
+        Everything but the metallicity goes into the name, since all 
+        metallicities are stored together. None if caching is turned off, 
+        or if source_sps_cache=True and $ARES isn't set.
+        """
+        if not hasattr(self, '_cache_prefix_'):
+            path = self.pf['source_sps_cache']
+            if path is True:
+                ARES = os.environ.get('ARES')
+                path = None if ARES is None else \
+                    os.path.join(ARES, 'input', 'sps_cache')
+            
+            if path in [None, False]:
+                self._cache_prefix_ = None
+                return self._cache_prefix_
+            
+            pars = ['source_sed', 'source_ssp', 'source_nebular', 
+                'source_binaries', 'source_imf', 'source_tracks', 
+                'source_tracks_fn', 'source_sed_degrade']
+            key = repr([self.pf[par] if par in self.pf else None \
+                for par in pars])
+            tag = hashlib.md5(key.encode('utf-8')).hexdigest()[0:12]
+            
+            self._cache_prefix_ = '{}/{}_{}'.format(path, 
+                self.pf['source_sed'], tag)
+            
+        return self._cache_prefix_
+        
+    def _load_all_Z(self):
+        """
+        Load SEDs for all metallicities, via binary cache if possible.
+        
+        On the first call for a given model, the original tables are read
+        and stacked into a (metallicity, wavelength, time) array that is 
+        saved in .npy format. Later calls memory-map that file, so only 
+        the slices we actually use get read from disk.
+        
+        Returns
+        -------
+        Tuple: (wavelengths, SEDs, filenames), where SEDs has dimensions
+        (metallicity, wavelength, time) with metallicities in ascending order.
+        
+        """
+        
+        Zall = np.sort(list(self.metallicities.values()))
+        
+        fn_w = self._cache_prefix + '_waves.npy'
+        fn_d = self._cache_prefix + '_seds.npy'
+        
+        if os.path.exists(fn_w) and os.path.exists(fn_d):
+            waves = np.load(fn_w)
+            data = np.load(fn_d, mmap_mode='r')
+            
+            if data.shape == (Zall.size, waves.size, len(self.times)):
+                return waves, data, [fn_d]
+        
+        # Read original tables one metallicity at a time.
+        kw = dict(self.pf)
+        _data = []
+        _fn = []
+        for Z in Zall:
+            kw['source_Z'] = Z
+            waves, _d, fn = self._litinst._load(**kw)
+            _data.append(_d)
+            _fn.append(fn)
+        
+        data = np.array(_data)    
+        
+        # Write to temporary files first so other processes never find 
+        # a partially written table.
+        try:
+            path = os.path.dirname(self._cache_prefix)
+            if not os.path.exists(path):
+                os.makedirs(path)
+            
+            for fn, arr in [(fn_w, waves), (fn_d, data)]:
+                tmp = '{}.{}.tmp'.format(fn, os.getpid())
+                with open(tmp, 'wb') as f:
+                    np.save(f, arr)
+                os.replace(tmp, fn)
+            
+            # Don't hang on to the whole table if we don't have to.
+            data = np.load(fn_d, mmap_mode='r')
+        except OSError:
+            if self.pf['verbose']:
+                print("# Could not write SPS cache to {}.".format(path))
+        
+        return waves, data, _fn
            
     @property
     def _nebula(self):
@@ -562,10 +670,26 @@ class SynthesisModel(SynthesisMaster):
             Zall_l = list(self.metallicities.values())
             Zall = np.sort(Zall_l)
                         
+            use_cache = (self.pf['source_sed_by_Z'] is None) \
+                and (self._cache_prefix is not None)
+            
             # Check to see dimensions of tmp. Depending on if we're 
             # interpolating in Z, it might be multiple arrays.
+            if use_cache:
+                self._wavelengths, _tmp, _fn = self._load_all_Z()
+                
+                if self.pf['verbose']:
+                    for _fn_ in _fn:
+                        print("# Loaded {}".format(_fn_.replace(
+                            self.cosm.path_ARES, '$ARES')))
+                
+                self._data_all_Z = _tmp
+                
             if (self.pf['source_Z'] in Zall_l):
-                if self.pf['source_sed_by_Z'] is not None:
+                if use_cache:
+                    k = np.argmin(np.abs(Zall - self.pf['source_Z']))
+                    self._data = np.array(_tmp[k])
+                elif self.pf['source_sed_by_Z'] is not None:
                     _tmp = self.pf['source_sed_by_Z'][1]
                     self._data = _tmp[np.argmin(np.abs(Zall - self.pf['source_Z']))]
                 else:
@@ -576,7 +700,9 @@ class SynthesisModel(SynthesisMaster):
                         print("# Loaded {}".format(_fn.replace(self.cosm.path_ARES, 
                             '$ARES')))
             else:
-                if self.pf['source_sed_by_Z'] is not None:
+                if use_cache:
+                    pass
+                elif self.pf['source_sed_by_Z'] is not None:
                     _tmp = self.pf['source_sed_by_Z'][1]
                     assert len(_tmp) == len(Zall)
                 else:
@@ -588,8 +714,8 @@ class SynthesisModel(SynthesisMaster):
                         for _fn_ in _fn:
                             print("# Loaded {}".format(_fn_.replace(self.cosm.path_ARES, '$ARES')))   
 
-                # Shape is (Z, wavelength, time)?
-                to_interp = np.array(_tmp)
+                # Shape is (Z, wavelength, time)
+                to_interp = np.asanyarray(_tmp)
                 self._data_all_Z = to_interp
                 
                 # If outside table's metallicity range, just use endpoints
@@ -598,17 +724,14 @@ class SynthesisModel(SynthesisMaster):
                 elif self.pf['source_Z'] < min(Zall):
                     _raw_data = np.log10(to_interp[0])
                 else:
-                    # At each time, interpolate between SEDs at two different
-                    # metallicities. Note: interpolating to log10(SED) caused
-                    # problems when nebular emission was on and when 
-                    # starburst99 was being used (mysterious),
-                    # hence the log-linear approach here.                    
-                    _raw_data = np.zeros_like(to_interp[0])
-                    for i, t in enumerate(self._litinst.times):
-                        inter = interp1d(np.log10(Zall), 
-                            to_interp[:,:,i], axis=0, 
-                            fill_value=0.0, kind=self.pf['interp_Z'])
-                        _raw_data[:,i] = inter(np.log10(self.pf['source_Z']))
+                    # Interpolate between SEDs at different metallicities,
+                    # all wavelengths and times at once. Note: interpolating
+                    # to log10(SED) caused problems when nebular emission 
+                    # was on and when starburst99 was being used (mysterious),
+                    # hence the log-linear approach here.
+                    inter = interp1d(np.log10(Zall), to_interp, axis=0, 
+                        fill_value=0.0, kind=self.pf['interp_Z'])
+                    _raw_data = inter(np.log10(self.pf['source_Z']))
                                                                 
                 self._data = _raw_data
                 
@@ -619,10 +742,10 @@ class SynthesisModel(SynthesisMaster):
                 
             # Normalize by SFR or cluster mass.    
             if self.pf['source_ssp']:
-                # The factor of a million is built-in to the lookup tables
+                # The factor of a million is built-in to the lookup tables.
+                # Note: _data_all_Z is left alone (it may be a read-only 
+                # memory-mapped table), see `L_per_sfr_of_t`.
                 self._data *= self.pf['source_mass'] / 1e6
-                if hasattr(self, '_data_all_Z'):
-                    self._data_all_Z *= self.pf['source_mass'] / 1e6
             else:    
                 #raise NotImplemented('need to revisit this.')
                 self._data *= self.pf['source_sfr']
@@ -47,7 +47,9 @@ class DeltaFunction(Source):
         at photon energy E.  Normalization handled separately.
         """
         
-        if E != self.E:
+        if np.ndim(E) > 0:
+            return np.where(np.asarray(E) == self.E, 1.0, 0.0)
+        elif E != self.E:
             return 0.0
         else:
             return 1.0    
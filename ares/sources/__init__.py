@@ -1,10 +1,15 @@
-from ares.sources.Toy import Toy
-from ares.sources.Star import Star
-from ares.sources.StarQS import StarQS
-from ares.sources.Diffuse import Diffuse
-from ares.sources.Toy import DeltaFunction
-from ares.sources.BlackHole import BlackHole
-from ares.sources.Composite import Composite
-from ares.sources.SynthesisModel import SynthesisModel
-from ares.sources.SynthesisModelToy import SynthesisModelToy
-from ares.sources.SynthesisModelSBS import SynthesisModelSBS
+from ares.util.Lazy import lazy_import
+
+__getattr__, __dir__ = lazy_import(__name__,
+{
+ 'Toy': ('Toy', 'Toy'),
+ 'Star': ('Star', 'Star'),
+ 'StarQS': ('StarQS', 'StarQS'),
+ 'Diffuse': ('Diffuse', 'Diffuse'),
+ 'DeltaFunction': ('Toy', 'DeltaFunction'),
+ 'BlackHole': ('BlackHole', 'BlackHole'),
+ 'Composite': ('Composite', 'Composite'),
+ 'SynthesisModel': ('SynthesisModel', 'SynthesisModel'),
+ 'SynthesisModelToy': ('SynthesisModelToy', 'SynthesisModelToy'),
+ 'SynthesisModelSBS': ('SynthesisModelSBS', 'SynthesisModelSBS'),
+})
@@ -118,6 +118,13 @@ class ChemicalNetwork(object):
             Extra information needed to compute rates. They are, in order:
             [cell #, ionization rate coefficient (IRC), secondary IRC,
              photo-heating rate coefficient, particle density, time]
+            
+        .. note :: To solve for many cells at once, supply an array of cell
+            indices, and give `q` shape (number of equations, number of 
+            cells). The rate coefficients then carry the cell dimension last,
+            and particle density and time are arrays with one element per
+            cell. See `Chemistry.EvolveCells`.
+            
         """       
     
         self.q = q
@@ -314,15 +321,19 @@ class ChemicalNetwork(object):
             
         # Can effectively turn off ionization equations once EoR is over.
         if self.monotonic_EoR:
-            if x['h_1'] <= self.monotonic_EoR:
-                dqdt['h_1'] = dqdt['h_2'] = 0.0
+            off = x['h_1'] <= self.monotonic_EoR
+            dqdt['h_1'] = np.where(off, 0.0, dqdt['h_1'])
+            dqdt['h_2'] = np.where(off, 0.0, dqdt['h_2'])
             if self.include_He:
-                if x['he_1'] <= self.monotonic_EoR:
-                    dqdt['he_1'] = 0.0
-                if x['he_2'] <= self.monotonic_EoR:
-                    dqdt['he_2'] = 0.0
+                dqdt['he_1'] = np.where(x['he_1'] <= self.monotonic_EoR, 0.0,
+                    dqdt['he_1'])
+                dqdt['he_2'] = np.where(x['he_2'] <= self.monotonic_EoR, 0.0,
+                    dqdt['he_2'])
                         
-        self.dqdt = self.zeros_q.copy()
+        if np.ndim(q) > 1:
+            self.dqdt = np.zeros_like(q)
+        else:
+            self.dqdt = self.zeros_q.copy()
         for i, sp in enumerate(self.grid.qmap):
             self.dqdt[i] = dqdt[sp]
 
@@ -10,6 +10,8 @@ Description:
 
 """
 
+import os
+import hashlib
 import numpy as np
 from math import factorial
 from ..physics import Cosmology
@@ -27,6 +29,17 @@ from ..physics.CrossSections import PhotoIonizationCrossSection
 from ..physics.Constants import g_per_msun, cm_per_mpc, dnu, s_per_yr, c, \
     s_per_myr, erg_per_ev, k_B, m_p, dnu, g_per_msun
 
+try:
+    import h5py
+except ImportError:
+    pass
+    
+try:
+    from mpi4py import MPI
+    rank = MPI.COMM_WORLD.rank
+except ImportError:
+    rank = 0
+
 root2 = np.sqrt(2.)
 four_pi = 4. * np.pi
 
@@ -98,10 +111,10 @@ class Fluctuations(object): # pragma: no cover
             
             Vo[LS == 1] = 0.0
 
-            if type(R1) == np.ndarray:
-                Vo[SS == 1] = 4. * np.pi * R1[SS == 1]**3 / 3.
-            else:
-                Vo[SS == 1] = 4. * np.pi * R1**3 / 3.
+            # Inputs may broadcast, e.g., separations along one axis and
+            # bubble radii along another.
+            V1 = np.broadcast_to(4. * np.pi * R1**3 / 3., Vo.shape)
+            Vo[SS == 1] = V1[SS == 1]
             
         return Vo
         
@@ -415,6 +428,10 @@ class Fluctuations(object): # pragma: no cover
             
         self._tab_Mmin = value
         
+        # Bubble size distribution depends on Mmin
+        if hasattr(self, '_cache_bsd_'):
+            del self._cache_bsd_
+        
     def Mmin(self, z):
         return np.interp(z, self.halos.tab_z, self.tab_Mmin)
 
@@ -447,14 +464,15 @@ class Fluctuations(object): # pragma: no cover
             zeta = self.zeta_X
         
         
-        iz = np.argmin(np.abs(z - self.halos.tab_z))
         s = self.sigma
         S = s**2
         
         #return 1. + ((self.LinearBarrier(z, zeta, zeta) / S - (1. / self._B0(z, zeta))) \
         #    / self._growth_factor(z))
         
-        return 1. + (self._B0(z, zeta)**2 / S / self._B(z, zeta, zeta))        
+        B0 = np.expand_dims(self._B0(z, zeta), -1)
+        
+        return 1. + (B0**2 / S / self._B(z, zeta, zeta))
             
     def bubble_bias(self, z, ion=True):
         """
@@ -618,15 +636,16 @@ class Fluctuations(object): # pragma: no cover
         bHII = self.bubble_bias(z, ion)
         bbar = self.mean_bubble_bias(z, ion)
         
-        if R < self.halos.tab_R.min():
+        if np.any(R < self.halos.tab_R.min()):
             print("R too small")
-        if R > self.halos.tab_R.max():
+        if np.any(R > self.halos.tab_R.max()):
             print("R too big")
 
         xi_dd = self.spline_cf_mm(z)(np.log(R))
 
+        # If R is an array, result has shape (len(R), len(bHII))
         #if term == 'ii':
-        return bHII * bbar * xi_dd
+        return np.multiply.outer(xi_dd, bHII * bbar)
         #elif term == 'id':
         #    return bHII * bbar * xi_dd 
         #else:
@@ -649,7 +668,6 @@ class Fluctuations(object): # pragma: no cover
         else:
             zeta = self.zeta_X
 
-        iz = np.argmin(np.abs(z - self.halos.tab_z))
         s = self.sigma
         
         # Variance on scale of smallest collapsed object
@@ -663,7 +681,6 @@ class Fluctuations(object): # pragma: no cover
         else:
             zeta = self.zeta_X
             
-        iz = np.argmin(np.abs(z - self.halos.tab_z))
         s = self.sigma #* self.halos.growth_factor[iz]
                 
         sigma_min = self.sigma_min(z)
@@ -680,13 +697,16 @@ class Fluctuations(object): # pragma: no cover
         else:
             zeta = self.zeta_X
         
-        iz = np.argmin(np.abs(z - self.halos.tab_z))
         s = self.sigma #/ self.halos.growth_factor[iz]
         
         if zeta_min is None:
             zeta_min = zeta
         
-        return self._B0(z, ion) + self._B1(z, ion) * s**2
+        # Redshift (if an array) along first axis, mass along second
+        B0 = np.expand_dims(self._B0(z, ion), -1)
+        B1 = np.expand_dims(self._B1(z, ion), -1)
+        
+        return B0 + B1 * s**2
     
     def Barrier(self, z, ion=True, zeta_min=None):
         """
@@ -704,11 +724,11 @@ class Fluctuations(object): # pragma: no cover
         #iz = np.argmin(np.abs(z - self.halos.tab_z))
         #D = self.halos.growth_factor[iz]
 
-        sigma_min = self.sigma_min(z)
+        sigma_min = np.expand_dims(self.sigma_min(z), -1)
         #Mmin = self.Mmin(z)
         #sigma_min = np.interp(Mmin, self.halos.M, self.halos.sigma_0)
 
-        delta = self._delta_c(z)
+        delta = np.expand_dims(self._delta_c(z), -1)
 
         return delta - np.sqrt(2.) * self._K(zeta) \
             * np.sqrt(sigma_min**2 - self.sigma**2)
@@ -769,46 +789,94 @@ class Fluctuations(object): # pragma: no cover
         
         return self._dlns_dlnm
 
+    def _cache_bsd(self, ion=True, rescale=True):
+        if not hasattr(self, '_cache_bsd_'):
+            self._cache_bsd_ = {}
+            
+        # Efficiencies can be reset at each redshift, so key on them too.
+        # Heated regions depend on zeta as well, since the rescaled BSD
+        # is normalized to Qh = zeta_X * fcoll - Qi.
+        if ion:
+            zetas = (self.zeta,)
+        else:
+            zetas = (self.zeta, self.zeta_X)
+        
+        key = (ion, rescale) \
+            + tuple(np.asarray(zeta, dtype=float).tobytes() for zeta in zetas)
+        
+        if key not in self._cache_bsd_:
+            self._cache_bsd_[key] = {}
+            
+        return self._cache_bsd_[key]
+        
     def BubbleSizeDistribution(self, z, ion=True, rescale=True):
         """
         Compute the ionized bubble size distribution.
         
         Parameters
         ----------
-        z: int, float
-            Redshift of interest.
-        zeta : int, float, np.ndarray
-            Ionizing efficiency.
+        z: int, float, np.ndarray
+            Redshift(s) of interest. If an array, all redshifts are 
+            computed at once.
             
         Returns
         -------
         Tuple containing (in order) the bubble radii, masses, and the
         differential bubble size distribution. Each is an array of length
         self.halos.tab_M, i.e., with elements corresponding to the masses
-        used to compute the variance of the density field.
+        used to compute the variance of the density field. If `z` is an
+        array, each has shape (len(z), len(self.halos.tab_M)).
+        
+        .. note :: Results are memoized (and read-only), since just about 
+            every correlation function term needs them.
             
         """
         
-        if ion:
-            zeta = self.zeta
-        else:
-            zeta = self.zeta_X
-            
         if ion and not self.pf['ps_include_ion']:
-            R_i = M_b = dndm = np.zeros_like(self.m)
+            R_i = M_b = dndm = np.zeros(np.shape(z) + self.m.shape)
             return R_i, M_b, dndm
         if (not ion) and not self.pf['ps_include_temp']:
-            R_i = M_b = dndm = np.zeros_like(self.m)    
+            R_i = M_b = dndm = np.zeros(np.shape(z) + self.m.shape)
             return R_i, M_b, dndm
+        
+        cache = self._cache_bsd(ion, rescale)
+        
+        zarr = np.atleast_1d(z)
+        todo = np.array([red for red in zarr if red not in cache])
+        
+        if todo.size > 0:
+            tab = self._BubbleSizeDistribution(todo, ion=ion, rescale=rescale)
+            for i, red in enumerate(todo):
+                cache[red] = tuple(arr[i] for arr in tab)
+                for arr in cache[red]:
+                    arr.flags.writeable = False
+        
+        if np.ndim(z) == 0:
+            return cache[z]
+        
+        return tuple(np.array([cache[red][j] for red in zarr]) \
+            for j in range(3))
+            
+    def _BubbleSizeDistribution(self, z, ion=True, rescale=True):
+        """
+        Compute the bubble size distribution at an array of redshifts.
+        
+        Returns
+        -------
+        Tuple containing (in order) the bubble radii, masses, and the
+        differential bubble size distribution, each of shape 
+        (len(z), len(self.halos.tab_M)).
+        
+        """
+        
+        if ion:
+            zeta = self.zeta
+        else:
+            zeta = self.zeta_X
             
-        reionization_over = False 
-           
         # Comoving matter density
         rho0_m = self.cosm.mean_density0
         rho0_b = rho0_m * self.cosm.fbaryon 
-        
-        # Mean (over-)density of bubble material
-        delta_B = self._B(z, ion)
            
         if self.bsd_model is None:
             if self.pf['bubble_density'] is not None:
@@ -818,23 +886,28 @@ class Fluctuations(object): # pragma: no cover
             else:
                 raise NotImplementedError('help')
         
+            reionization_over = np.zeros(z.size, dtype=bool)
+            
         elif self.bsd_model == 'hmf':
             M_b = self.halos.tab_M * zeta
             # Assumes bubble material is at cosmic mean density
             R_i = (3. * M_b / rho0_b / 4. / np.pi)**(1./3.)
-            iz = np.argmin(np.abs(z - self.halos.tab_z))
-            dndm = self.halos.tab_dndm[iz].copy()
+            iz = np.argmin(np.abs(z[:,None] - self.halos.tab_z), axis=1)
+            dndm = self.halos.tab_dndm[iz]
+            
+            reionization_over = np.zeros(z.size, dtype=bool)
         
         elif self.bsd_model == 'fzh04':
             # Just use array of halo mass as array of ionized region masses.
             # Arbitrary at this point, just need an array of masses.
             # Plus, this way, the sigma's from the HMF are OK.
             M_b = self.m 
+            
+            # Mean (over-)density of bubble material
+            delta_B = self._B(z, ion)
                                     
             # Radius of ionized regions as function of delta (mass)
             R_i = (3. * M_b / rho0_m / (1. + delta_B) / 4. / np.pi)**(1./3.)
-        
-            V_i = four_pi * R_i**3 / 3.
             
             # This is Eq. 9.38 from Steve's book.
             # The factors of 2, S, and M_b are from using dlns instead of 
@@ -845,27 +918,33 @@ class Fluctuations(object): # pragma: no cover
             # Reionization is over!
             # Only use barrier condition if we haven't asked to rescale
             # or supplied Q ourselves.
-            if self._B0(z, ion) <= 0:
-                reionization_over = True
-                dndm = np.zeros_like(dndm)
-                            
-            #elif Q is not None:
-            #    if Q == 1:
-            #        reionization_over = True
-            #        dndm = np.zeros_like(dndm)
-
+            reionization_over = self._B0(z, ion) <= 0
+            dndm[reionization_over] = 0.0
+            
         else:
             raise NotImplementedError('Unrecognized option: %s' % self.pf['bubble_size_dist'])
-            
+        
+        shape = (z.size, np.size(M_b))
+        R_i = np.array(np.broadcast_to(R_i, shape))
+        M_b = np.array(np.broadcast_to(M_b, shape))
+        dndm = np.array(np.broadcast_to(dndm, shape))
+        V_i = four_pi * R_i**3 / 3.
+        
+        if not rescale:
+            return R_i, M_b, dndm
         
         # This is a trick to guarantee that the integral over the bubble
-        # size distribution yields the mean ionized fraction.    
-        if (not reionization_over) and rescale:
-            Mmin = self.Mmin(z) * zeta
-            iM = np.argmin(np.abs(M_b - Mmin))
-            Qi = np.trapz(dndm[iM:] * V_i[iM:] * M_b[iM:], x=np.log(M_b[iM:]))
-            xibar = self.MeanIonizedFraction(z, ion=ion)
-            dndm *= -np.log(1. - xibar) / Qi
+        # size distribution yields the mean ionized fraction.
+        for i, red in enumerate(z):
+            if reionization_over[i]:
+                continue
+            
+            Mmin = self.Mmin(red) * zeta
+            iM = np.argmin(np.abs(M_b[i] - Mmin))
+            Qi = np.trapz(dndm[i,iM:] * V_i[i,iM:] * M_b[i,iM:], 
+                x=np.log(M_b[i,iM:]))
+            xibar = self.MeanIonizedFraction(red, ion=ion)
+            dndm[i] *= -np.log(1. - xibar) / Qi
                         
         return R_i, M_b, dndm
         
@@ -889,8 +968,7 @@ class Fluctuations(object): # pragma: no cover
         
         zeros = np.zeros_like(self.sigma)
             
-        B0 = self._B0(z, ion)
-        B1 = self._B1(z, ion)
+        B0 = np.expand_dims(self._B0(z, ion), -1)
         Bl = self.LinearBarrier(z, ion=ion, zeta_min=zeta_min)
         p = (B0 / np.sqrt(2. * np.pi * S**3)) * np.exp(-0.5 * Bl**2 / S)
         
@@ -974,29 +1052,143 @@ class Fluctuations(object): # pragma: no cover
     def is_Rs_const(self, value):
         self._is_Rs_const = value
     
-    def _cache_Vo(self, z):
-        if not hasattr(self, '_cache_Vo_'):
-            self._cache_Vo_ = {}
-
-        if z in self._cache_Vo_:
-            return self._cache_Vo_[z]
+    def _overlap_key(self, R, R_i, R_s, R3):
+        """
+        Overlap volumes depend only on geometry (and the temperature model),
+        not on redshift, so key them by the radii themselves.
+        """
         
-        #if self.is_Rs_const and len(self._cache_Vo_.keys()) > 0:
-        #    return self._cache_Vo_[self._cache_Vo_.keys()[0]]
-
-        return None
+        h = hashlib.md5()
+        for arr in [R, R_i, R_s, R3]:
+            h.update(np.ascontiguousarray(arr, dtype=float).tobytes())
         
-    def _cache_IV(self, z):
-        if not hasattr(self, '_cache_IV_'):
-            self._cache_IV_ = {}
-    
-        if z in self._cache_IV_:
-            return self._cache_IV_[z]
+        h.update('{} {}'.format(int(self.pf['ps_include_temp']), 
+            self.pf['ps_temp_model']).encode())
             
-        #if self.is_Rs_const and len(self._cache_IV_.keys()) > 0:
-        #    return self._cache_IV_[self._cache_IV_.keys()[0]]    
+        return h.hexdigest()
+        
+    def overlap_kernels(self, R, R_i, R_s, R3):
+        """
+        Overlap and intersectional volumes for all separations `R` and radii
+        `R_i`, `R_s`, and `R3` at once.
+        
+        These are geometric, so they're shared by all redshifts with the 
+        same radii. Kept in memory, and also on disk if ps_overlap_cache is
+        the name of an HDF5 file. Only the root process ever writes to that
+        file; if `defer_overlap_save` is True (e.g., in worker processes), 
+        new kernels are held until collected via `unsaved_overlap_kernels`.
+        
+        Returns
+        -------
+        Tuple: (overlap volumes, intersectional volumes), each an array of
+        shape (6, len(R), len(R_i)). See `overlap_volumes` and 
+        `intersectional_volumes` for the order of the first axis.
+        
+        """
+        
+        if not hasattr(self, '_overlap_kernels'):
+            self._overlap_kernels = {}
+        
+        key = self._overlap_key(R, R_i, R_s, R3)
+        
+        if key in self._overlap_kernels:
+            return self._overlap_kernels[key]
+        
+        fn = self.pf['ps_overlap_cache']
+        if (fn is not None) and os.path.exists(fn):
+            try:
+                with h5py.File(fn, 'r') as f:
+                    if key in f:
+                        self._overlap_kernels[key] = \
+                            np.array(f[key]['Vo']), np.array(f[key]['IV'])
+                        return self._overlap_kernels[key]
+            except OSError:
+                # Probably locked by another process. Just re-compute.
+                pass
+                    
+        shape = (R.size, R_i.size)
+        Vo = np.array([np.broadcast_to(V, shape) \
+            for V in self.overlap_volumes(R[:,None], R_i, R_s)])
+        IV = np.array([np.broadcast_to(V, shape) \
+            for V in self.intersectional_volumes(R[:,None], R_i, R_s, R3)])
+        
+        self._overlap_kernels[key] = Vo, IV
+        
+        if fn is not None:
+            self._overlap_kernels_unsaved.add(key)
+            if not self.defer_overlap_save:
+                self.save_overlap_kernels()
+        
+        return Vo, IV
+        
+    @property
+    def defer_overlap_save(self):
+        if not hasattr(self, '_defer_overlap_save'):
+            self._defer_overlap_save = False
+        return self._defer_overlap_save
     
-        return None    
+    @defer_overlap_save.setter
+    def defer_overlap_save(self, value):
+        self._defer_overlap_save = bool(value)
+        
+    @property
+    def _overlap_kernels_unsaved(self):
+        if not hasattr(self, '_overlap_kernels_unsaved_'):
+            self._overlap_kernels_unsaved_ = set()
+        return self._overlap_kernels_unsaved_
+        
+    def unsaved_overlap_kernels(self):
+        """
+        Return (and forget about) kernels not yet written to disk.
+        
+        Returns
+        -------
+        Dictionary of (overlap volumes, intersectional volumes) tuples, with
+        keys from `_overlap_key`, to be handed to `save_overlap_kernels` by
+        the root process.
+        
+        """
+        kernels = {key: self._overlap_kernels[key] \
+            for key in self._overlap_kernels_unsaved}
+        self._overlap_kernels_unsaved.clear()
+        return kernels
+        
+    def save_overlap_kernels(self, kernels=None):
+        """
+        Write kernels that aren't already there to ps_overlap_cache.
+        
+        Parameters
+        ----------
+        kernels : dict
+            Kernels computed elsewhere, e.g., by worker processes (see
+            `unsaved_overlap_kernels`). Will be added to those in memory.
+        
+        """
+        
+        if kernels is not None:
+            if not hasattr(self, '_overlap_kernels'):
+                self._overlap_kernels = {}
+            self._overlap_kernels.update(kernels)
+            self._overlap_kernels_unsaved.update(kernels.keys())
+        
+        fn = self.pf['ps_overlap_cache']
+        if (fn is None) or (rank > 0) or (not self._overlap_kernels_unsaved):
+            return
+            
+        try:
+            with h5py.File(fn, 'a') as f:
+                for key in sorted(self._overlap_kernels_unsaved):
+                    if key in f:
+                        continue
+                    Vo, IV = self._overlap_kernels[key]
+                    grp = f.create_group(key)
+                    grp.create_dataset('Vo', data=Vo)
+                    grp.create_dataset('IV', data=IV)
+        except OSError:
+            # Somebody else has the file open. Try again next time.
+            return
+            
+        self._overlap_kernels_unsaved.clear()
         
     def _cache_p(self, z, term):
         if not hasattr(self, '_cache_p_'):
@@ -1655,29 +1847,11 @@ class Fluctuations(object): # pragma: no cover
         Mmin = self.Mmin(z) * self.zeta
         iM = np.argmin(np.abs(M_b - Mmin))
         
-        # Only need overlap volumes once per redshift
-        all_OV_z = self._cache_Vo(z)
-        if all_OV_z is None:
-            all_OV_z = np.zeros((len(R), 6, len(R_i)))
-            for i, sep in enumerate(R):
-                all_OV_z[i,:,:] = \
-                    np.array(self.overlap_volumes(sep, R_i, R_s))
-
-            self._cache_Vo_[z] = all_OV_z.copy()
-
-            #print("Generated z={} overlap_volumes".format(z))
-           
-        #else:    
-        #   print("Read in z={} overlap_volumes".format(z))
-           
-        all_IV_z = self._cache_IV(z)
-        if all_IV_z is None:
-            all_IV_z = np.zeros((len(R), 6, len(R_i)))
-            for i, sep in enumerate(R):
-                all_IV_z[i,:,:] = \
-                    np.array(self.intersectional_volumes(sep, R_i, R_s, R3))
-        
-            self._cache_IV_[z] = all_IV_z.copy()    
+        # Overlap volumes depend only on the radii, so are shared by all
+        # redshifts with the same bubble sizes. 
+        # Yields: V11, V12, V22, V1n, V2n, Van, each of shape (len(R), len(R_i))
+        # Remember: these radii arrays depend on redshift (through delta_B)
+        all_V, all_IV = self.overlap_kernels(R, R_i, R_s, R3)
         
         Mmin_b = self.Mmin(z) * self.zeta
         Mmin_h = self.Mmin(z)
@@ -1690,390 +1864,234 @@ class Fluctuations(object): # pragma: no cover
             f_h = -np.log(1. - Qh) / Qh_int
         else:
             f_h = 1.       
-                            
-        #dR = np.diff(10**bin_c2e(np.log(R)))#np.concatenate((np.diff(R), [np.diff(R)[-1]]))  
-        #dR = 10**np.arange(np.log(R).min(), np.log(R).max() + 2 * dlogR, dlogR)    
-                
-        # Loop over scales
+        
+        ##
+        # Note: rather than looping over scales, every quantity below is an
+        # array of shape (len(R), len(self.m)), which we then integrate over
+        # bubble mass (the last axis) to get a total probability at each
+        # separation.
+        ##
+        
+        # For two-halo terms, need bias of sources.
+        if self.pf['ps_include_bias']:
+            # Should modify for temp_model==2
+            if self.pf['ps_include_temp']:
+                if self.pf['ps_temp_model'] == 2 and 'h' in term:
+                    _ion = False
+                else:
+                    _ion = True
+            else:
+                _ion = True
+            ep = self.excess_probability(z, R, ion=_ion)
+        else:
+            ep = np.zeros_like(self.m)
+        
         P1 = np.zeros(R.size)
         P2 = np.zeros(R.size)
         PT = np.zeros(R.size)
-        for i, sep in enumerate(R):
+        
+        ##
+        # For each zone, figure out volume of region where a
+        # single source can ionize/heat/couple both points, as well
+        # as the region where a single source is not enough (Vss_ne)
+        ##
+        if term == 'ii':
             
-            ##
-            # Note: each element of this loop we're constructing an array
-            # over bubble mass, which we then integrate over to get a total
-            # probability. The shape of every quantity should be `self.m`.
-            ##
-                        
-            # Yields: V11, V12, V22, V1n, V2n, Van
-            # Remember: these radii arrays depend on redshift (through delta_B)
-            all_V = all_OV_z[i]
-            all_IV = all_IV_z[i]
-        
-            # For two-halo terms, need bias of sources.
-            if self.pf['ps_include_bias']:
-                # Should modify for temp_model==2
-                if self.pf['ps_include_temp']:
-                    if self.pf['ps_temp_model'] == 2 and 'h' in term:
-                        _ion = False
-                    else:
-                        _ion = True
+            Vo = all_V[0]
+            
+            # You might think: hey! If temperature fluctuations are on,
+            # we need to make sure the second point isn't *heated* by
+            # the first point. This gets into issues of overlap. By not
+            # introducing this correction, we're saying "yes, the second
+            # point can still lie in the heated region of the first 
+            # (ionized) point, but that point itself may actually be 
+            # ionized, since the way we construct regions doesn't know that
+            # a heated region may actually live in the ionized region of 
+            # another bubble." That is, a heated point can be ionized but an
+            # ionized pt can't later be designated a hot point.
+            Vne1 = Vne2 = V_i - Vo
+                
+            _P1 = self.get_prob(z, M_b, dndm_b, Mmin_b, Vo, True)
+            
+            _P2_1 = self.get_prob(z, M_b, dndm_b, Mmin_b, Vne1, True)
+            _P2_2 = self.get_prob(z, M_b, dndm_b, Mmin_b, Vne2, True, ep)
+            
+            _P2 = (1. - _P1) * _P2_1 * _P2_2
+                                            
+            if self.pf['ps_volfix'] and Qi > 0.5:
+                P1 = _P1
+                P2 = (1. - P1) * _P2_1**2
+            else:
+                P1 = _P1
+                P2 = _P2
+
+        # Probability that one point is ionized, other in "bulk IGM"
+        elif term == 'ib':
+            # Probability that a single source does something to 
+            # each point. If no temp fluctuations, same as _Pis                 
+            P1_iN = self.get_prob(z, M_b, dndm_b, Mmin_b, all_V[3], True)
+
+            # "probability of an ionized pt 2 given ionized pt 1"
+            Pigi = self.get_prob(z, M_b, dndm_b, Mmin_b, V_i-all_V[0], True, ep)
+
+            if self.pf['ps_include_temp']:
+                if self.pf['ps_temp_model'] == 1:
+                    Vne2 = V_ioh - all_IV[2] - (V_i - all_IV[1])
+                    # "probability of a heated pt 2 given ionized pt 1"
+                    Phgi = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne2, 
+                        True, ep)
+                    
+                    P2 = P1_iN * (1. - Pigi - Phgi)   
                 else:
-                    _ion = True
-                ep = self.excess_probability(z, sep, ion=_ion)
+                    P2 = Qi * (1. - Qi - Qh) * Rones
             else:
-                ep = np.zeros_like(self.m)
+                P2 = P1_iN * (1. - Pigi)
 
-            ##
-            # For each zone, figure out volume of region where a
-            # single source can ionize/heat/couple both points, as well
-            # as the region where a single source is not enough (Vss_ne)
-            ##
-            if term == 'ii':
-                
-                Vo = all_V[0]
+        elif term == 'hb':
+            
+            if self.pf['ps_temp_model'] == 2:    
+                P1_hN = self.get_prob(z, M_s, dndm_s, Mmin_s, all_V[4], True)
+            else:
+                # Probability that single source can heat one pt but 
+                # does nothing to the other.
+                P1_hN = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, all_V[4],
+                    True)
+                
+            # Given that the first point is heated, what is the probability
+            # that the second pt is heated or ionized by a different source?
+            # We want the complement of that.
+            
+            # Volume in which I heat but don't ionize (or heat) the other pt, 
+            # i.e., same as the two-source term for <hh'>
+            Vne2 = V_ioh - all_IV[2] - (V_i - all_IV[1])
                             
-                # Subtract off more volume if heating is ON.
-                #if self.pf['ps_include_temp']:
-                #    #Vne1 = Vne2 = V_i - self.IV(sep, R_i, R_s)
-                #    Vne1 = Vne2 = V_i - all_IV[1]
-                #else:
-                
-                # You might think: hey! If temperature fluctuations are on,
-                # we need to make sure the second point isn't *heated* by
-                # the first point. This gets into issues of overlap. By not
-                # introducing this correction (commented out above), we're 
-                # saying "yes, the second point can still lie in the heated
-                # region of the first (ionized) point, but that point itself
-                # may actually be ionized, since the way we construct regions
-                # doesn't know that a heated region may actually live in the
-                # ionized region of another bubble." That is, a heated point
-                # can be ionized but an ionized pt can't later be designated
-                # a hot point.
-                Vne1 = Vne2 = V_i - Vo
-                    
-                _P1 = self.get_prob(z, M_b, dndm_b, Mmin_b, Vo, True)
-                
-                _P2_1 = self.get_prob(z, M_b, dndm_b, Mmin_b, Vne1, True)
-                _P2_2 = self.get_prob(z, M_b, dndm_b, Mmin_b, Vne2, True, ep)
+            # Volume in which single source ioniz
+            V2ii = V_i - all_V[0]
+            
+            Phgh = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne2, True, ep)
+            Pigh = self.get_prob(z, M_b, dndm_b, Mmin_b, V2ii, True, ep)
+            
+            P2 = P1_hN * (1. - Phgh - Pigh)
+            
+        elif term == 'hh':
+            
+            # Excursion set approach for temperature.
+            if self.pf['ps_temp_model'] == 2:
+                Vo = all_V[2]
+                        
+                Vne1 = Vne2 = V_h - Vo
                 
+                _P1 = self.get_prob(z, M_s, dndm_s, Mmin_s, Vo, True)
+            
+                _P2_1 = self.get_prob(z, M_s, dndm_s, Mmin_s, Vne1, True)
+                _P2_2 = self.get_prob(z, M_s, dndm_s, Mmin_s, Vne2, True, ep)
+            
                 _P2 = (1. - _P1) * _P2_1 * _P2_2
-                                                
-                if self.pf['ps_volfix'] and Qi > 0.5:
-                    P1[i] = _P1
-                    P2[i] = (1. - P1[i]) * _P2_1**2
-                                        
-                else:
-                    P1[i] = _P1
-                    P2[i] = _P2
-
-            # Probability that one point is ionized, other in "bulk IGM"
-            elif term == 'ib':
-                Vo_iN = all_V[3] # region in which a source ionized one point
-                                 # and does nothing to the other.
-
-                # Probability that a single source does something to 
-                # each point. If no temp fluctuations, same as _Pis                 
-                P1_iN = self.get_prob(z, M_b, dndm_b, Mmin_b, all_V[3], True)
-
-                # "probability of an ionized pt 2 given ionized pt 1"
-                Pigi = self.get_prob(z, M_b, dndm_b, Mmin_b, V_i-all_V[0], True, ep)
-
-                if self.pf['ps_include_temp']:
-                    if self.pf['ps_temp_model'] == 1:
-                        Vne2 = V_ioh - all_IV[2] - (V_i - all_IV[1])
-                        # "probability of a heated pt 2 given ionized pt 1"
-                        Phgi = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne2, True, ep)
-                        
-                        P2[i] = P1_iN * (1. - Pigi - Phgi)   
-                    else:
-                        P2[i] = Qi * (1. - Qi - Qh)
-                else:
-                    P2[i] = P1_iN * (1. - Pigi)
-
-            elif term == 'hb':
                 
-                #if self.pf['ps_temp_model'] == 2:
-                #    print('Ignoring hb term for now...')
-                #    continue
-                #else:
-                #    pass
+                P1 = _P1
+                P2 = _P2
                 
-                if self.pf['ps_temp_model'] == 2:    
-                    P1_hN = self.get_prob(z, M_s, dndm_s, Mmin_s, all_V[4], True)
-                    
-                    # Given that the first point is heated, what is the probability
-                    # that the second pt is heated or ionized by a different source?
-                    # We want the complement of that.
-                    
-                    # Volume in which I heat but don't ionize (or heat) the other pt, 
-                    # i.e., same as the two-source term for <hh'>
-                    #Vne2 = Vh - self.IV(sep, R_i, R_s)
-                    Vne2 = V_ioh - all_IV[2] - (V_i - all_IV[1])
-                                    
-                    # Volume in which single source ioniz
-                    V2ii = V_i - all_V[0]
-                    
-                    Phgh = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne2, True, ep)
-                    Pigh = self.get_prob(z, M_b, dndm_b, Mmin_b, V2ii, True, ep)
-                    
-                    #P1[i] = P1_hN 
-                    #ih2 = _P_ih_2[i]
-                    #hh2 = _P_hh_2[i]
-                    P2[i] = P1_hN * (1. - Phgh - Pigh)
-                else:    
-                    # Probability that single source can heat one pt but 
-                    # does nothing to the other.
-                    P1_hN = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, all_V[4], True)
-                    
-                    # Given that the first point is heated, what is the probability
-                    # that the second pt is heated or ionized by a different source?
-                    # We want the complement of that.
-                    
-                    # Volume in which I heat but don't ionize (or heat) the other pt, 
-                    # i.e., same as the two-source term for <hh'>
-                    #Vne2 = Vh - self.IV(sep, R_i, R_s)
-                    Vne2 = V_ioh - all_IV[2] - (V_i - all_IV[1])
-                                    
-                    # Volume in which single source ioniz
-                    V2ii = V_i - all_V[0]
-                    
-                    Phgh = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne2, True, ep)
-                    Pigh = self.get_prob(z, M_b, dndm_b, Mmin_b, V2ii, True, ep)
-                    
-                    
-                    #P1[i] = P1_hN 
-                    #ih2 = _P_ih_2[i]
-                    #hh2 = _P_hh_2[i]
-                    P2[i] = P1_hN * (1. - Phgh - Pigh)
+            else:
                 
+                # Region in which two points are heated by the same source
+                Vo = all_V[2]
+                                     
+                # Subtract off region of the intersection HH volume
+                # in which source 1 would do *anything* to point 2.
+                # For ionization, this is just Vi - Vo
+                Vne1 = V_ioh - all_IV[2] - (V_i - all_IV[1])
+                Vne2 = Vne1
                 
-            elif term == 'hh':
+                _P1 = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vo, True)                
                 
+                _P2_1 = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne1, True)
+                _P2_2 = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne2, True,
+                    ep)    
+                                
+                _P2 = (1. - _P1) * _P2_1 * _P2_2
                 
-                # Excursion set approach for temperature.
-                if self.pf['ps_temp_model'] == 2:
-                    Vo = all_V[2]
-                            
-                    Vne1 = Vne2 = V_h - Vo
-                    
-                    _P1 = self.get_prob(z, M_s, dndm_s, Mmin_s, Vo, True)
-                
-                    _P2_1 = self.get_prob(z, M_s, dndm_s, Mmin_s, Vne1, True)
-                    _P2_2 = self.get_prob(z, M_s, dndm_s, Mmin_s, Vne2, True, ep)
-                
-                    #_P2_1 -= Qi
-                    #_P2_1 -= Qi
-                
-                    _P2 = (1. - _P1) * _P2_1 * _P2_2
-                                                                    
-                    #if self.pf['ps_volfix'] and Qi > 0.5:
-                    #    P1[i] = _P1
-                    #    P2[i] = (1. - P1[i]) * _P2_1**2
-                    #                    
-                    #else:
-                    P1[i] = _P1
-                    P2[i] = _P2
-                    
+                # The BSD is normalized so that its integral will recover
+                # zeta * fcoll.
+                                                   
+                # Start chugging along on two-bubble term   
+                bad = Vne1 < 1e-12
+                for i in np.flatnonzero(np.any(bad, axis=1)):
+                    N = np.sum(bad[i])
+                    print('z={}, R={}: Vss_ne_1 (hh) < 0 {} / {} times'.format(
+                        z, R[i], N, len(R_s)))
+                    print(np.all(V_ioh > V_i), np.all(V_ioh > all_IV[2][i]), 
+                        all_IV[2][i,-1], all_IV[1][i,-1])
+                
+                # Must correct for the fact that Qi+Qh<=1
+                if self.heating_ongoing:
+                    P1 = _P1
+                    P2 = _P2
                 else:
+                    P1 = _P1 * (1. - Qh - Qi)
+                    P2 = Qh**2 * Rones
                 
-                    #Vii = all_V[0]
-                    #_integrand1 = dndm * Vii
-                    #
-                    #_exp_int1 = np.exp(-simps(_integrand1[iM:] * M_b[iM:],
-                    #    x=np.log(M_b[iM:])))
-                    #_P1_ii = (1. - _exp_int1)
-                    
-                    # Region in which two points are heated by the same source
-                    Vo = all_V[2]
-                                         
-                    # Subtract off region of the intersection HH volume
-                    # in which source 1 would do *anything* to point 2.
-                    #Vss_ne_1 = Vh - (Vo - self.IV(sep, R_i, R_s) + all_V[0])
-                    #Vne1 = Vne2 = Vh - Vo
-                    # For ionization, this is just Vi - Vo
-                    #Vne1 = V2 - all_IV[2] - (V1 - all_IV[1])
-                    Vne1 = V_ioh - all_IV[2] - (V_i - all_IV[1])
-                    #Vne1 =  V2 - self.IV(sep, R_s, R_s) - (V1 - self.IV(sep, R_i, R_s))
-                    Vne2 = Vne1
-                    
-                    # Shouldn't max(Vo) = Vh?
-                    
-                    #_P1, _P2 = self.get_prob(z, zeta, Vo, Vne1, Vne2, corr, term)
-                                    
-                    _P1 = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vo, True)                
-                    
-                    _P2_1 = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne1, True)
-                    _P2_2 = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne2, True, ep)    
-                                    
-                    # kludge! to account for Qh = 1 - Qi at late times.
-                    # Integrals above will always get over-estimated for hot
-                    # regions.
-                    #_P2_1 = min(Qh, _P2_1)
-                    #_P2_2 = min(Qh, _P2_2)
-                                    
-                    _P2 = (1. - _P1) * _P2_1 * _P2_2
-                    
-                    # The BSD is normalized so that its integral will recover
-                    # zeta * fcoll.
-                                                       
-                    # Start chugging along on two-bubble term   
-                    if np.any(Vne1 < 1e-12):
-                        N = sum(Vne1 < 1e-12)
-                        print('z={}, R={}: Vss_ne_1 (hh) < 0 {} / {} times'.format(z, sep, N, len(R_s)))
-                        #print(Vne1[Vne1 < 1e-12])
-                        print(np.all(V_ioh > V_i), np.all(V_ioh > all_IV[2]), all_IV[2][-1], all_IV[1][-1])
-                    
-                    # Must correct for the fact that Qi+Qh<=1
-                    if self.heating_ongoing:
-                        P1[i] = _P1
-                        P2[i] = _P2
-                    else:
-                        P1[i] = _P1 * (1. - Qh - Qi)
-                        P2[i] = Qh**2
-                    
-            elif term == 'ih':
-                
-                if self.pf['ps_temp_model'] == 2:
-                    continue
-                
-                if not self.pf['ps_include_xcorr_ion_hot']:
-                    P1[i] = 0.0
-                    P2[i] = Qh * Qi
-                    continue
-                
-                #Vo_sh_r1, Vo_sh_r2, Vo_sh_r3 = \
-                #    self.overlap_region_shell(sep, R_i, R_s)
-                #Vo = 2. * Vo_sh_r2 - Vo_sh_r3
+        elif term == 'ih':
+            
+            if self.pf['ps_temp_model'] == 2:
+                pass
+            elif not self.pf['ps_include_xcorr_ion_hot']:
+                P2 = Qh * Qi * Rones
+            else:
                 Vo = all_V[1]
                 
-                #V1 = 4. * np.pi * R_i**3 / 3.
-                #V2 = 4. * np.pi * R_s**3 / 3.
-                #Vh = 4. * np.pi * (R_s**3 - R_i**3) / 3.
-
-                # Volume in which I ionize but don't heat (or ionize) the other pt.
+                # Volume in which I ionize but don't heat (or ionize) the 
+                # other pt.
                 Vne1 = V_i - all_IV[1]
                          
-                # Volume in which I heat but don't ionize (or heat) the other pt, 
-                # i.e., same as the two-source term for <hh'>
-                #Vne2 = Vh - self.IV(sep, R_i, R_s)
+                # Volume in which I heat but don't ionize (or heat) the 
+                # other pt, i.e., same as the two-source term for <hh'>
                 Vne2 =  V_ioh - all_IV[2] - (V_i - all_IV[1])
-                #Vne2 =  V2 - self.IV(sep, R_s, R_s) - (V1 - self.IV(sep, R_i, R_s))
-        
-                if np.any(Vne2 < 0):
-                    N = sum(Vne2 < 0)
-                    print('R={}: Vss_ne_2 (ih) < 0 {} / {} times'.format(sep, N, len(R_s)))
-            
-            
-                #_P1, _P2 = self.get_prob(z, zeta, Vo, Vne1, Vne2, corr, term)
+                
+                bad = Vne2 < 0
+                for i in np.flatnonzero(np.any(bad, axis=1)):
+                    N = np.sum(bad[i])
+                    print('R={}: Vss_ne_2 (ih) < 0 {} / {} times'.format(R[i],
+                        N, len(R_s)))
                 
                 _P1 = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vo, True)
                 
                 _P2_1 = self.get_prob(z, M_b, dndm_b, Mmin_b, Vne1, True)
-                _P2_2 = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne2, True, ep)
-                
-                # Kludge!
-                #_P2_1 = min(_P2_2, Qi)
-                #_P2_2 = min(_P2_2, Qh)
+                _P2_2 = self.get_prob(z, M_b, dndm_b * f_h, Mmin_b, Vne2, True,
+                    ep)
                 
                 _P2 = (1. - _P1) * _P2_1 * _P2_2
                 
-                #
-                #P2[i] = min(_P2, Qh * Qi)
-                
                 if self.heating_ongoing:
-                    P1[i] = _P1
-                    P2[i] = _P2
+                    P1 = _P1
+                    P2 = _P2
                 else:
-                    P1[i] = _P1 * (1. - Qh - Qi)
-                    P2[i] = Qh * Qi
-            
-            ## 
-            # Density stuff from here down
-            ##    
-            if term.count('d') == 0:
-                continue
-
-                
-            if not (self.pf['ps_include_xcorr_ion_rho'] \
-                 or self.pf['ps_include_xcorr_hot_rho']):
-                # These terms will remain zero
-                #if term.count('d') > 0:
-                continue
-            
-            ##
-            # First, grab a bunch of stuff we'll need.
-            ##
-                
-            # Ionization auto-correlations
-            #Pii, Pii_1, Pii_2 = \
-            #    self.ExpectationValue2pt(z, zeta, R, term='ii',
-            #    R_s=R_s, R3=R3, Th=Th, Ts=Ts)
-            
-            Vo = all_V[0]
-            Vne1 = V_i - Vo
-            
-            Vo_hh = all_V[2]
-            
-            # These are functions of mass
-            Vsh_sph = 4. * np.pi * R_s**3 / 3.
-            Vsh = 4. * np.pi * (R_s**3 - R_i**3) / 3.
-            
-            # Mean bubble density
-            #B = self._B(z, zeta)
-            #rho0 = self.cosm.mean_density0
-            #delta = M_b / V_i / rho0 - 1.
+                    P1 = _P1 * (1. - Qh - Qi)
+                    P2 = Qh * Qi * Rones
+        
+        ## 
+        # Density stuff from here down. If neither of these is on, these
+        # terms will remain zero.
+        ##    
+        if term.count('d') > 0 and (self.pf['ps_include_xcorr_ion_rho'] \
+             or self.pf['ps_include_xcorr_hot_rho']):
             
             M_h = self.halos.tab_M
             iM_h = np.argmin(np.abs(self.Mmin(z) - M_h))
             dndm_h = self.halos.tab_dndm[iz_hmf]
-            fcoll_h = self.halos.tab_fcoll[iz_hmf,iM_h]
-            
-            # Luminous halos, i.e., Mh > Mmin
-            Q_lhal = self.Qhal(z, Mmin=Mmin)
-            # Dark halos, i.e., those outside bubbles
-            
-            Q_dhal = self.Qhal(z, Mmax=Mmin)
-            # All halos
-            Q_hal = self.Qhal(z)
-            
-            # Since integration must be perfect
-            Q_dhal = Q_hal - Q_lhal
                         
             R_hal = self.halos.VirialRadius(M_h, z) / 1e3 # Convert to Mpc
             V_hal = four_pi * R_hal**3 / 3.
             
-            # Bias of bubbles and halos
-            ##
-            db = self._B(z, ion=True)
+            # Bias of halos, excess probability of a halo near a bubble.
+            # Shape (len(R), len(M_h))
             bh = self.halos.Bias(z)
-            bb = self.bubble_bias(z, ion=True)
-            xi_dd_r = xi_dd[i]#self.spline_cf_mm(z)(np.log(sep))
-            
-            bh_bar = self.mean_halo_bias(z)
             bb_bar = self.mean_bubble_bias(z, ion=True)
-            ep_bh = bh * bb_bar * xi_dd_r
-            exc = bh_bar * bb_bar * xi_dd_r 
+            ep_bh = np.multiply.outer(xi_dd, bh * bb_bar)
             
             # Mean density of halos (mass is arbitrary)
             delta_hal_bar = self.mean_halo_overdensity(z)
-            nhal_avg = self.mean_halo_abundance(z)
-            
-            # <d> = 0 = <d_i> * Qi + <d_hal> * Q_hal + <d_nohal> * Q_nh
-            # Problem is Q_hal and Q_i are not mutually exclusive. 
-            # Actually: they are inclusive! At least above Mmin.
-            delta_nothal_bar = -delta_hal_bar * Q_hal / (1. - Q_hal)
-            
-            avg_c = self.ExpectationValue1pt(z, term='c', 
-                R_s=R_s, R3=R3, Th=Th, Ts=Ts, Tk=Tk, Ja=Ja)
-                                
-            #dnh = -dh_avg * fcoll_h / (1. - fcoll_h)
-            
-            #_P1_ii = self.get_prob(z, M_b, dndm_b, Mmin_b, Vo, True)
-            #delta_i_bar = self.mean_bubble_overdensity(z, zeta)
             
-            if term == 'id':                    
+            if term in ['id', 'idd']:
                 ##
                 # Analog of one source or one bubble term is P_in, i.e.,
                 # probability that points are in the same bubble.
@@ -2082,272 +2100,39 @@ class Fluctuations(object): # pragma: no cover
                 # In the latter case, the density can be anything, while
                 # in the former it will be the mean bubble density.
                 ##
-                                    
-                # Actually think about halos
-                    
-                # <x_i d'> = \int d' f(d; x_i=1) f(x_i=1) f(d'; d) dd'
-                # Crux is f(d'; d): could be 3-d integral in general.
-                                
-                # Loop over bubble density.
-                #ixd_inner = np.zeros(self.m.size)
-                #for k, d1 in enumerate(db):
-                #    
-                #    # Excess probability of halo with mass mh
-                #    # given bubble nearby 
-                #    exc = 0.0#bh * bb[k] * xi_dd_r
-                #    
-                #    #Ph = np.minimum(Ph, 1.)
-                #    
-                #    # <d> = fcoll_V * dh + Qi * di + rest
-                #    #Pn = 1. - Ph
-                #    #if sep < R_i[k]:
-                #    #    dn = d1
-                #    #else:
-                #    #dn = delta_n_bar
-                #
-                #    # How to guarantee that <x_i d'> -> 0 on L.S.?
-                #    # Is the key formalizing whether we're at the 
-                #    # center of the bubble or not?
-                #    integ = dndm_h * V_h * (1. + exc)
-                #
-                #    # Don't truncate at Mmin! Don't need star-forming
-                #    # galaxy, just need mass.
-                #    ixd_inner[k] = np.trapz(integ * M_h, x=np.log(M_h))
-                 
-                
-                
-                #_integrand = dndm_h * (M_h / rho_bar) * bh
-                #fcorr = 1. - np.trapz(_integrand * M_h, x=np.log(M_h))
                 
                 # Just halos *outside* bubbles
-                hal = np.trapz(dndm_h[:iM_h] * V_hal[:iM_h] * (1. + ep_bh[:iM_h]) * M_h[:iM_h],
-                    x=np.log(M_h[:iM_h]))
+                hal = np.trapz(dndm_h[:iM_h] * V_hal[:iM_h] \
+                    * (1. + ep_bh[:,:iM_h]) * M_h[:iM_h],
+                    x=np.log(M_h[:iM_h]), axis=-1)
                 bub = np.trapz(dndm_b[iM:] * V_i[iM:] * self.m[iM:], 
                     x=np.log(self.m[iM:]))
                     
                 P_ihal = (1. - np.exp(-bub)) * (1. - np.exp(-hal))
                 
-                #P2[i] = P_ihal * delta_hal_bar + _P_ib[i] * delta_b_bar
-                P1[i] = _P_ii_1[i] * delta_i_bar
-                P2[i] = _P_ii_2[i] * delta_i_bar + _P_ib[i] * delta_b_bar \
-                      + P_ihal * delta_hal_bar
-                                            
-                #P2[i] = Phal * dh_avg + np.exp(-hal) * dnih_avg
-                
-                #P2[i] += np.exp(-hal) * dnih_avg * Qi
-                
-                #P2[i] += _P_in[i] * delta_n_bar
-                            
+                if term == 'id':
+                    P1 = _P_ii_1 * delta_i_bar
+                    P2 = _P_ii_2 * delta_i_bar + _P_ib * delta_b_bar \
+                       + P_ihal * delta_hal_bar
+                else:
+                    P1 = _P_ii_1 * delta_i_bar**2
+                    P2 = _P_ii_2 * delta_i_bar**2 \
+                       + _P_ib * delta_b_bar * delta_i_bar \
+                       + P_ihal * delta_hal_bar * delta_i_bar
+                                
             elif term in ['cd', 'cdip']:
-                continue
-                        
-            elif term == 'idd':
-                
-                hal = np.trapz(dndm_h[:iM_h] * V_hal[:iM_h] * (1. + ep_bh[:iM_h]) * M_h[:iM_h],
-                    x=np.log(M_h[:iM_h]))
-                bub = np.trapz(dndm_b[iM:] * V_i[iM:] * self.m[iM:], 
-                    x=np.log(self.m[iM:]))
-                    
-                P_ihal = (1. - np.exp(-bub)) * (1. - np.exp(-hal))
-                
-                #P2[i] = P_ihal * delta_hal_bar + _P_ib[i] * delta_b_bar
-                P1[i] = _P_ii_1[i] * delta_i_bar**2
-                P2[i] = _P_ii_2[i] * delta_i_bar**2 \
-                      + _P_ib[i] * delta_b_bar * delta_i_bar\
-                      + P_ihal * delta_hal_bar * delta_i_bar
-
-                #exc = bh_bar * bb_bar * xi_dd_r
-                #                         
-                #hal = np.trapz(dndm_h * V_hal * (1. + exc) * M_h,
-                #    x=np.log(M_h))
-                #bub = np.trapz(dndm_b[iM:] * V_i[iM:] * self.m[iM:], 
-                #    x=np.log(self.m[iM:]))
-                #                            
-                #P2[i] = ((1. - np.exp(-hal)) * delta_hal_bar 
-                #      + np.exp(-hal) * delta_nothal_bar) \
-                #      * (1. - np.exp(-bub)) * delta_i_bar
-                                                    
-                
-                    
-                #_P1 = _P_ii_1[i] * delta_i_bar**2
-                #
-                ##_P2 = _P_ii_2[i] * delta_i_bar**2 \
-                ##    + Qi * (1. - _P_ii_1[i]) * delta_i_bar * delta_n_bar \
-                ##    - Qi**2 * delta_i_bar**2
-                ##
-                #P1[i] = _P1
-                #
-                ##P2[i] = Qi * xi_dd[i] # There's gonna be a bias here
-                ##P2[i] = _P_ii_2[i] * delta_i_bar**2 - Qi**2 * delta_i_bar**2
-                #
-                ##continue
-                #
-                #idd_ii = np.zeros(self.m.size)
-                #idd_in = np.zeros(self.m.size)
-                #
-                ## Convert from dm to dd
-                ##dmdd = np.diff(self.m) / np.diff(db)
-                ##dmdd = np.concatenate(([0], dmdd))                    
-                #
-                ## Should be able to speed this up
-                #
-                #for k, d1 in enumerate(db):
-                #        
-                #
-                #    exc = bb[k] * bb * xi_dd_r
-                #    
-                #    grand = db[k] * dndm_b[k] * V_i[k] \
-                #          * db * dndm_b * V_i \
-                #          * (1. + exc)
-                #        
-                #    idd_ii[k] = np.trapz(grand[iM:] * self.m[iM:], 
-                #        x=np.log(self.m[iM:]))
-                #    
-                #    #exc_in = bb[k] * bh * xi_dd_r
-                #    #                        
-                #    #grand_in = db[k] * dndm_b[k] * V_i[k] #\
-                #    #      #* dh * dndm_h * Vvir \
-                #    #      #* (1. + exc_in)
-                #    #
-                #    #idd_in[k] = np.trapz(grand_in[iM_h:] * M_h[iM_h:], 
-                #    #    x=np.log(M_h[iM_h:]))
-                #    
-                ##idd_in = np.trapz(db[iM:] * dndm_b[iM:] * V_i[iM:] * delta_n_bar * self.m[iM:],
-                ##    x=np.log(self.m[iM:]))  
-                #    
-                #                                                                           
-                #P2[i] = _P_ii_2[i]  \
-                #    * np.trapz(idd_ii[iM:] * self.m[iM:], 
-                #        x=np.log(self.m[iM:]))
-                #
-                ## Another term for <x_i x'> possibility. Doesn't really
-                ## fall into the one bubble two bubble language, so just
-                ## sticking it in P2.
-                ## Assumes neutral phase is at cosmic mean neutral density
-                ## Could generalize...
-                #P2[i] += _P_ib[i] * delta_i_bar * delta_b_bar
-                #
-                ## We're neglecting overdensities by just using the 
-                ## mean neutral density 
-                #        
-                #continue
+                pass
                 
             elif term == 'iid':
-            
                 # This is like the 'id' term except the second point
                 # has to be ionized. 
-                P2[i] = _P_ii[i] * delta_i_bar
-            elif term == 'iidd':
-
-                P2[i] = _P_ii[i] * delta_i_bar**2
-
-                continue
-                
-                # Might have to actually do a double integral here.
-                
-                iidd_2 = np.zeros(self.m.size)
-                                    
-                # Convert from dm to dd
-                #dmdd = np.diff(self.m) / np.diff(db)
-                #dmdd = np.concatenate(([0], dmdd))                    
+                P2 = _P_ii * delta_i_bar
                 
-                # Should be able to speed this up
-                
-                for k, d1 in enumerate(db):                    
-                    exc = bb[k] * bb * xi_dd_r
-                    
-                    grand = db[k] * dndm_b[k] * V_i[k] \
-                          * db * dndm_b * V_i \
-                          * (1. + exc)
-                        
-                    iidd_2[k] = np.trapz(grand[iM:] * self.m[iM:], 
-                        x=np.log(self.m[iM:]))
-                                                                                                        
-                P2[i] = _P_ii_2[i]  \
-                    * np.trapz(iidd_2[iM:] * self.m[iM:], 
-                        x=np.log(self.m[iM:]))
-                        
-            #elif term == 'cd':
-            #    
-            #    if self.pf['ps_include_xcorr_hot_rho'] == 0:
-            #        break
-            #    elif self.pf['ps_include_xcorr_hot_rho'] == 1:
-            #        hal = np.trapz(dndm_h * V_hal * (1. + exc) * M_h,
-            #            x=np.log(M_h))
-            #        hot = np.trapz(dndm_b[iM:] * V_h[iM:] * self.m[iM:], 
-            #            x=np.log(self.m[iM:]))
-            #        P2[i] = ((1. - np.exp(-hal)) * dh_avg + np.exp(-hal) * dnih_avg) \
-            #          * (1. - np.exp(-hot)) * avg_c
-            #    elif self.pf['ps_include_xcorr_hot_rho'] == 2:
-            #        P2[i] = _P_hh[i] * delta_h_bar + _P_hb[i] * delta_b_bar
-            #    else:
-            #        raise NotImplemented('help')
-            #
-            #elif term == 'ccd':
-            #
-            #
-            #    _P1 = _P_hh_1[i] * delta_i_bar
-            #    #B = self._B(z, zeta)
-            #    #_P1 = delta_i_bar \
-            #     #   * self.get_prob(z, M_b, dndm_b, Mmin_b, Vo, True) \
-            #     
-            #
-            #    _P2 = _P_hh_2[i] * delta_i_bar
-            #        
-            #    #_P2 = (1. - _P_ii_1[i]) * delta_i_bar \
-            #    #    * self.get_prob(z, M_b, dndm_b, Mmin_b, Vne1, True) \
-            #    #    * self.get_prob(z, M_b, dndm_b, Mmin_b, Vne1, True, ep)
-            #    #    #* self.get_prob(z, M_h, dndm_h, Mmi\n_h, Vvir, False, ep_bb)
-            #
-            #    P1[i] = _P1
-            #    P2[i] = _P2  
-            #
-            elif term == 'cdd':
-
-                raise NotImplemented('help')
-                hal = np.trapz(dndm_h * V_hal * (1. + exc) * M_h,
-                    x=np.log(M_h))
-                hot = np.trapz(dndm_b[iM:] * Vsh[iM:] * self.m[iM:], 
-                    x=np.log(self.m[iM:]))
-                hoi = np.trapz(dndm_b[iM:] * Vsh_sph[iM:] * self.m[iM:], 
-                    x=np.log(self.m[iM:]))    # 'hot or ionized'
-                # One point in shell, other point in halo
-                # One point ionized, other point in halo
-                # Q. Halos exist only in ionized regions?
+            elif term == 'iidd':
+                P2 = _P_ii * delta_i_bar**2
                 
-            elif term == 'ccdd':
-                raise NotImplemented('help')    
-
-                # Add in bulk IGM correction.
-                # Add routines for calculating 'ib' and 'hb'?
-                P2[i] = _P_hh[i] * delta_h_bar**2 \
-                      + _P_bb[i] * delta_h_bar**2 \
-                      + _P_hb[i] * delta_h_bar * delta_b_bar
-                continue
-            
-                # Might have to actually do a double integral here.
-            
-                iidd_2 = np.zeros(self.m.size)
-            
-                # Convert from dm to dd
-                #dmdd = np.diff(self.m) / np.diff(db)
-                #dmdd = np.concatenate(([0], dmdd))                    
-            
-                # Should be able to speed this up
-            
-                for k, d1 in enumerate(db):                    
-                    exc = bb[k] * bb * xi_dd_r
-            
-                    grand = db[k] * dndm_b[k] * V_i[k] \
-                          * db * dndm_b * V_i \
-                          * (1. + exc)
-            
-                    iidd_2[k] = np.trapz(grand[iM:] * self.m[iM:], 
-                        x=np.log(self.m[iM:]))
-            
-                P2[i] = _P_ii_2[i]  \
-                    * np.trapz(iidd_2[iM:] * self.m[iM:], 
-                        x=np.log(self.m[iM:]))          
+            elif term in ['cdd', 'ccdd']:
+                raise NotImplementedError('term=\'{}\' not yet implemented.'.format(term))
                 
             else:
                 raise NotImplementedError('No method found for term=\'{}\''.format(term))
@@ -2563,6 +2348,10 @@ class Fluctuations(object): # pragma: no cover
     def get_prob(self, z, M, dndm, Mmin, V, exp=True, ep=0.0, Mmax=None):
         """
         Basically do an integral over some distribution function.
+        
+        .. note :: `V` and `ep` may have an extra leading dimension (e.g., 
+            separation), in which case we integrate over the last axis and
+            return an array.
         """
         
         # Set lower integration limit
@@ -2576,7 +2365,8 @@ class Fluctuations(object): # pragma: no cover
         # One-source term
         integrand = dndm * V * (1. + ep)
                  
-        integr = np.trapz(integrand[iM:iM2] * M[iM:iM2], x=np.log(M[iM:iM2])) 
+        integr = np.trapz(integrand[...,iM:iM2] * M[iM:iM2], 
+            x=np.log(M[iM:iM2]), axis=-1)
         
         # Exponentiate?
         if exp:
@@ -677,13 +677,50 @@ class Grid(object):
     def ColumnDensity(self, data):
         """ Compute column densities for all absorbing species. """    
         
+        N_by_cell, logN_by_cell, Nc_by_cell = self.ColumnDensityByCell(data)
+        
         N = {}
         Nc = {}
         logN = {}
-        for absorber in self.absorbers:
-            Nc[absorber] = self.dr * data[absorber] * self.x_to_n[absorber]            
-            N[absorber] = np.cumsum(Nc[absorber])
-            logN[absorber] = np.log10(N[absorber])
+        for i, absorber in enumerate(self.absorbers):
+            Nc[absorber] = Nc_by_cell[:,i]
+            N[absorber] = N_by_cell[:,i]
+            logN[absorber] = logN_by_cell[:,i]
+            
+        return N, logN, Nc
+        
+    def ColumnDensityByCell(self, data, N=None, logN=None, Nc=None):
+        """
+        Compute column densities for all absorbing species at once.
+        
+        Parameters
+        ----------
+        data : dict
+            Dataset for a single snapshot.
+        N, logN, Nc : np.ndarray
+            If supplied, arrays of shape (grid cells, absorbers) to fill in
+            place with the column density to each cell, its log, and the
+            column density of each cell, respectively.
+        
+        Returns
+        -------
+        Tuple: N, logN, Nc, each with shape (grid cells, absorbers).
+        
+        """
+        
+        if N is None:
+            N = self.zeros_grid_x_absorbers
+        if logN is None:
+            logN = self.zeros_grid_x_absorbers
+        if Nc is None:
+            Nc = self.zeros_grid_x_absorbers
+        
+        for i, absorber in enumerate(self.absorbers):
+            np.multiply(self.dr, data[absorber], out=Nc[:,i])
+            Nc[:,i] *= self.x_to_n[absorber]
+        
+        np.cumsum(Nc, axis=0, out=N)
+        np.log10(N, out=logN)
             
         return N, logN, Nc
 
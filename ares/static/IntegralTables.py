@@ -683,25 +683,21 @@ class IntegralTable:
                     
         else:    
             
-            # Otherwise, continuous spectrum                
-            if self.pf['photon_conserving']:
-                integrand = lambda E: \
-                    self.esec.DepositionFraction(x,E=E-Ei, channel='heat') * \
-                    self.src.Spectrum(E, t=t) * \
-                    np.exp(-self.SpecificOpticalDepth(E, N)[0]) / E
-            else:
-                integrand = lambda E: \
-                    self.esec.DepositionFraction(x, E=E-Ei, channel='heat') * \
-                    PhotoIonizationCrossSection(E, absorber) * \
-                    self.src.Spectrum(E, t = t) * \
-                    np.exp(-self.SpecificOpticalDepth(E, N)[0]) / E \
-                    / self.E_th[absorber]    
-            
-            # Integrate over energies in lookup table
+            # Otherwise, continuous spectrum. Evaluate integrand at all 
+            # energies in lookup table at once.
             c = self.E >= max(Ei, self.src.Emin)
-            c &= self.E <= self.src.Emax                       
-            samples = np.array([integrand(E) for E in self.E[c]])[..., 0]
-                 
+            c &= self.E <= self.src.Emax
+            E = self.E[c]
+            
+            samples = \
+                self.esec.DepositionFraction(x, E=E-Ei, channel='heat') * \
+                self.src.Spectrum(E, t=t) * \
+                np.exp(-self.SpecificOpticalDepth(E, N)) / E
+            
+            if not self.pf['photon_conserving']:
+                samples *= self.grid.bf_cross_sections[absorber](E) \
+                    / self.E_th[absorber]
+            
             integral = simps(samples, self.E[c]) / erg_per_ev     
         
         if not self.pf['photon_conserving']:
@@ -720,24 +716,20 @@ class IntegralTable:
         
             Ei = self.E_th[absorber]
             
-            # Otherwise, continuous spectrum    
-            if self.pf['photon_conserving']:
-                integrand = lambda E: \
-                    self.esec.DepositionFraction(x, E=E-Ei, channel='heat') * \
-                    self.src.Spectrum(E, t = t) * \
-                    np.exp(-self.SpecificOpticalDepth(E, N)[0])
-            else:
-                integrand = lambda E: \
-                    self.esec.DepositionFraction(x, E=E-Ei, channel='heat') * \
-                    PhotoIonizationCrossSection(E, species) * \
-                    self.src.Spectrum(E, t = t) * \
-                    np.exp(-self.SpecificOpticalDepth(E, N)[0]) \
-                    / self.E_th[absorber]
-            
-            # Integrate over energies in lookup table
+            # Otherwise, continuous spectrum. Evaluate integrand at all 
+            # energies in lookup table at once.
             c = self.E >= max(Ei, self.src.Emin)
             c &= self.E <= self.src.Emax
-            samples = np.array([integrand(E) for E in self.E[c]])[..., 0]
+            E = self.E[c]
+            
+            samples = \
+                self.esec.DepositionFraction(x, E=E-Ei, channel='heat') * \
+                self.src.Spectrum(E, t=t) * \
+                np.exp(-self.SpecificOpticalDepth(E, N))
+            
+            if not self.pf['photon_conserving']:
+                samples *= self.grid.bf_cross_sections[absorber](E) \
+                    / self.E_th[absorber]
             
             integral = simps(samples, self.E[c])  
         
@@ -757,25 +749,19 @@ class IntegralTable:
         
             Ej = self.E_th[donor]
             
-            # Otherwise, continuous spectrum                
-            if self.pf['photon_conserving']:
-                integrand = lambda E: \
-                    self.esec.DepositionFraction(x, E=E-Ej, channel=absorber) * \
-                    self.src.Spectrum(E, t = t) * \
-                    np.exp(-self.SpecificOpticalDepth(E, N)[0]) / E
-            
-            #else:
-            #    integrand = lambda E: 1e10 * \
-            #        self.esec.DepositionFraction(E, xHII, channel = species + 1) * \
-            #        PhotoIonizationCrossSection(E, species) * \
-            #        self.src.Spectrum(E, t = t) * \
-            #        np.exp(-self.SpecificOpticalDepth(E, ncol)[0]) / E \
-            #        / self.E_th[absorber]
+            # Otherwise, continuous spectrum. Evaluate integrand at all 
+            # energies in lookup table at once.
+            if not self.pf['photon_conserving']:
+                raise NotImplementedError('Only photon-conserving tables supported for secondary ionization.')
             
-            # Integrate over energies in lookup table    
             c = self.E >= max(Ej, self.src.Emin)
             c &= self.E <= self.src.Emax
-            samples = np.array([integrand(E) for E in self.E[c]])[..., 0]
+            E = self.E[c]
+            
+            samples = \
+                self.esec.DepositionFraction(x, E=E-Ej, channel=absorber) * \
+                self.src.Spectrum(E, t=t) * \
+                np.exp(-self.SpecificOpticalDepth(E, N)) / E
             
             integral = simps(samples, self.E[c]) / erg_per_ev
             
@@ -795,23 +781,20 @@ class IntegralTable:
         
             Ej = self.E_th[donor]
             
-            # Otherwise, continuous spectrum    
-            if self.pf['photon_conserving']:
-                integrand = lambda E: \
-                    self.esec.DepositionFraction(x, E=E-Ej, channel=absorber) * \
-                    self.src.Spectrum(E, t = t) * \
-                    np.exp(-self.SpecificOpticalDepth(E, N)[0])
-            #else:
-            #    integrand = lambda E: PhotoIonizationCrossSection(E, species) * \
-            #        self.src.Spectrum(E, t = t) * \
-            #        np.exp(-self.SpecificOpticalDepth(E, ncol)[0])
-            #        / self.E_th[absorber]
-               
-            # Integrate over energies in lookup table        
+            # Otherwise, continuous spectrum. Evaluate integrand at all 
+            # energies in lookup table at once.
+            if not self.pf['photon_conserving']:
+                raise NotImplementedError('Only photon-conserving tables supported for secondary ionization.')
+            
             c = self.E >= max(Ej, self.src.Emin)
             c &= self.E <= self.src.Emax
-            samples = np.array([integrand(E) for E in self.E[c]])[..., 0]
-                 
+            E = self.E[c]
+            
+            samples = \
+                self.esec.DepositionFraction(x, E=E-Ej, channel=absorber) * \
+                self.src.Spectrum(E, t=t) * \
+                np.exp(-self.SpecificOpticalDepth(E, N))
+            
             integral = simps(samples, self.E[c])
               
         if not self.pf['photon_conserving']:
@@ -571,68 +571,89 @@ class SpectralSynthesis(object):
         else:
             raise ValueError('This shouldn\'t happen')  
             
-        # Might be running over lots of galaxies
-        batch_mode = False 
-        if flux_obs.ndim == 2:
-            batch_mode = True    
-                    
-        # Convert microns to cm. micron * (m / 1e6) * (1e2 cm / m)
-        freq_obs = c / (wave_obs * 1e-4)
-                    
         # Why do NaNs happen? Just nircam. 
         flux_obs[np.isnan(flux_obs)] = 0.0
         
-        # Loop over filters and re-weight spectrum
+        # Filters we'll actually use
+        if rest_wave is None:
+            filts = list(all_filters)
+        else:
+            filts = []
+            for filt in all_filters:
+                cent = filter_data[filt][2]
+                cent_r = cent * 1e4 / (1. + zobs)
+                if (cent_r < rest_wave[0]) or (cent_r > rest_wave[1]):
+                    continue
+                filts.append(filt)
+            
+        # Filter transmission, re-gridded and normalized, for all filters 
+        # at once. Cached, since we usually hit the same (zobs, filters) 
+        # for many batches of galaxies.
+        xphot, wphot, R = self._response_matrix(cam, filter_data, filts, 
+            wave_obs, zobs)
+            
+        # Remember: observed flux is in erg/s/cm^2/Hz
+        # Integrate over frequency to get integrated flux in bands defined
+        # by filters, for all filters (and galaxies) at once.
+        # Shape: (Nfilters, Ngalaxies) in batch mode, (Nfilters) otherwise.
+        yphot_corr = R.dot(flux_obs.T)
+                
+        # Convert to magnitudes and return
+        return all_filters, xphot, wphot, -2.5 * np.log10(yphot_corr / flux_AB)
+        
+    def _response_matrix(self, cam, filter_data, filts, wave_obs, zobs):
+        """
+        Compile transmission curves of `filts` into a response matrix.
+        
+        Each row contains a filter's transmission re-gridded onto the 
+        observed wavelengths, weighted by the frequency bin widths and 
+        normalized by the integrated transmission, so that a matrix 
+        product with an observed spectrum (in erg/s/cm^2/Hz) yields the mean
+        flux in each band.
+        
+        Returns
+        -------
+        Tuple containing filter midpoints [microns], widths [microns], and
+        the response matrix (scipy.sparse.csr_matrix) with shape 
+        (number of filters, number of wavelengths).
+        
+        """
+        
+        if not hasattr(self, '_cache_phot_'):
+            self._cache_phot_ = {}
+            
+        key = (cam, tuple(filts), zobs, wave_obs.size, wave_obs[0], 
+            wave_obs[-1])
+        
+        if key in self._cache_phot_:
+            return self._cache_phot_[key]
+        
+        from scipy.sparse import csr_matrix
+            
+        # Convert microns to cm. micron * (m / 1e6) * (1e2 cm / m)
+        freq_obs = c / (wave_obs * 1e-4)
+        dnu = -1. * np.diff(freq_obs)
+        
         xphot = []      # Filter centroids
         wphot = []      # Filter width
-        yphot_corr = [] # Magnitudes corrected for filter transmissions.
-    
-        # Loop over filters, compute fluxes in band (accounting for 
-        # transmission fraction) and convert to observed magnitudes.
-        for filt in all_filters:
-
+        R = np.zeros((len(filts), wave_obs.size))
+        for i, filt in enumerate(filts):
             x, T, cent, dx, Tavg = filter_data[filt]
             
-            if rest_wave is not None:
-                cent_r = cent * 1e4 / (1. + zobs)
-                if (cent_r < rest_wave[0]) or (cent_r > rest_wave[1]):
-                    continue
-                        
             # Re-grid transmission onto provided wavelength axis.
             T_regrid = np.interp(wave_obs, x, T, left=0, right=0)
-            #func = interp1d(x, T, kind='cubic', fill_value=0.0,
-            #    bounds_error=False)
-            #T_regrid = func(wave_obs)
             
-            #T_regrid = np.interp(np.log(wave_obs), np.log(x), T, left=0., 
-            #    right=0)
-                 
-            # Remember: observed flux is in erg/s/cm^2/Hz
-
-            # Integrate over frequency to get integrated flux in band
-            # defined by filter.
-            if batch_mode:
-                integrand = -1. * flux_obs * T_regrid[None,:]                
-                _yphot = np.sum(integrand[:,0:-1] * np.diff(freq_obs)[None,:],
-                    axis=1)
-            else:    
-                integrand = -1. * flux_obs * T_regrid
-                _yphot = np.sum(integrand[0:-1] * np.diff(freq_obs))
-                
-                #_yphot = np.trapz(integrand, x=freq_obs)
+            corr = np.sum(T_regrid[0:-1] * dnu)
+            R[i,0:-1] = T_regrid[0:-1] * dnu / corr
             
-            corr = np.sum(T_regrid[0:-1] * -1. * np.diff(freq_obs), axis=-1)
-                                                                               
             xphot.append(cent)
-            yphot_corr.append(_yphot / corr)
             wphot.append(dx)
+            
+        result = np.array(xphot), np.array(wphot), csr_matrix(R)
         
-        xphot = np.array(xphot)
-        wphot = np.array(wphot)
-        yphot_corr = np.array(yphot_corr)
-                
-        # Convert to magnitudes and return
-        return all_filters, xphot, wphot, -2.5 * np.log10(yphot_corr / flux_AB)
+        self._cache_phot_[key] = result
+        
+        return result
         
     def Spectrum(self, waves, sfh=None, tarr=None, zarr=None, window=1,
         zobs=None, tobs=None, band=None, idnum=None, units='Hz', hist={},
@@ -962,4 +962,299 @@ class GlobalVolume(object):
         Ja = e_ax * (1 + z)**2 * c / self.cosm.HubbleParameter(z)
         
         return Ja
-    
\ No newline at end of file
+    
+    def _quadrature_weights(self, popid, band, integrator, imin=0, imax=None):
+        """
+        Weights such that integrating y (sampled at the energies of the given
+        band) over log-energy is just an inner product, i.e., y @ weights.
+
+        All the sampled integrators are linear in y, so we can get the
+        weights by integrating the identity matrix once and caching them.
+        """
+
+        if not hasattr(self, '_quadrature_weights_'):
+            self._quadrature_weights_ = {}
+
+        key = (popid, band, integrator, imin, imax)
+        if key in self._quadrature_weights_:
+            return self._quadrature_weights_[key]
+
+        E = self.E[popid][band]
+        x = self.logE[popid][band][imin:imax]
+        eye = np.eye(x.size)
+
+        if integrator == 'trapz':
+            w = np.trapz(eye, x=x, axis=1)
+        elif integrator == 'simps':
+            w = simps(eye, x=x, axis=1)
+        else:
+            raise NotImplemented('help')
+
+        weights = np.zeros(E.size)
+        weights[imin:imax] = w * E[imin:imax] * log10
+
+        self._quadrature_weights_[key] = weights
+
+        return weights
+
+    def _interp_in_xe(self, tab, igm_e):
+        """
+        Linearly interpolate table of deposition fractions, with shape
+        (number of energies, number of ionized fractions), to `igm_e`, which
+        may have any shape. The result has an extra trailing energy axis.
+        """
+
+        x = self.esec.x
+        i_x = np.searchsorted(x, igm_e, side='right') - 1
+        i_x = np.minimum(np.maximum(i_x, 0), x.size - 2)
+        j = i_x + 1
+
+        w = (igm_e - x[i_x]) / (x[j] - x[i_x])
+        w[igm_e <= x[0]] = 0.0
+
+        return tab[:,i_x].T + (tab[:,j] - tab[:,i_x]).T * w[...,None]
+
+    def _can_tabulate(self, popid, band, fluxes):
+        """
+        Can we compute rate coefficients for all redshifts at once?
+
+        Only if this band has a detailed solution to the RTE and we know the
+        fluxes, i.e., rates are just integrals over a discrete set of points.
+        """
+
+        if (fluxes is None) or (band is None):
+            return False
+
+        if not self.background.solve_rte[popid][band]:
+            return False
+
+        if self.sampled_integrator == 'romb':
+            return False
+
+        pop = self.pops[popid]
+        bands = np.array(self.background.bands_by_pop[popid])
+        if not np.any(bands > pop.pf['pop_Emin_xray']):
+            return False
+
+        if self.sigma_E['h_1'][popid][band] is None:
+            return False
+
+        return True
+
+    def TabulateIonizationRateIGM(self, z, fluxes, species=0, popid=0,
+        band=0, **kwargs):
+        """
+        Compute volume averaged ionization rate at many redshifts at once.
+
+        Parameters
+        ----------
+        z : np.ndarray
+            Redshifts.
+        fluxes : np.ndarray, list
+            Fluxes in this band at each redshift, with shape (z, E).
+
+        Returns
+        -------
+        Array of ionization rates (or rate coefficients if return_rc=True),
+        or None if this band doesn't have a discrete RTE solution, in which
+        case, call `IonizationRateIGM` one redshift at a time.
+
+        """
+
+        pop = self.pops[popid]
+
+        if (not self._can_tabulate(popid, band, fluxes)) or \
+            (pop.pf['pop_ion_rate_igm'] is not None):
+            return None
+
+        z = np.atleast_1d(z)
+        fluxes = np.array(fluxes)
+
+        if not pop.is_src_ion_igm:
+            return np.zeros_like(z)
+
+        kw = self._fix_kwargs(**kwargs)
+
+        species_str = species_i_to_str[species]
+
+        weights = self._quadrature_weights(popid, band, 'simps')
+
+        # Full calculation - much like computing integrated flux
+        norm = J21_num * self.sigma0
+
+        ion = np.dot(fluxes,
+            weights * self.sigma_E[species_str][popid][band] / ev_per_hz)
+
+        # Re-normalize
+        ion *= 4. * np.pi
+
+        if not kw['return_rc']:
+            ion *= self.coefficient_to_rate(z, species, **kw)
+
+        ion[z > pop.zform] = 0.0
+
+        return ion
+
+    def TabulateHeatingRate(self, z, fluxes, species=0, popid=0, band=0,
+        **kwargs):
+        """
+        Compute heating rate density at many redshifts at once.
+
+        Parameters
+        ----------
+        z : np.ndarray
+            Redshifts.
+        fluxes : np.ndarray, list
+            Fluxes in this band at each redshift, with shape (z, E).
+        igm_e : int, float, np.ndarray
+            Electron fraction, either a single value or one per redshift.
+
+        Returns
+        -------
+        Array of heating rates (or rate coefficients if return_rc=True), or
+        None if this band doesn't have a discrete RTE solution, in which
+        case, call `HeatingRate` one redshift at a time.
+
+        """
+
+        pop = self.pops[popid]
+
+        if (not self._can_tabulate(popid, band, fluxes)) or \
+            (pop.pf['pop_heat_rate'] is not None):
+            return None
+
+        z = np.atleast_1d(z)
+        fluxes = np.array(fluxes)
+
+        if not pop.is_src_heat_igm:
+            return np.zeros_like(z)
+
+        kw = self._fix_kwargs(**kwargs)
+
+        species_str = species_i_to_str[species]
+        E = self.E[popid][band]
+
+        igm_e = kw['igm_e'] * np.ones_like(z)
+
+        # Fraction of photo-electron energy deposited as heat, with shape
+        # (z, E) or (z, 1).
+        if pop.pf['pop_fXh'] is not None:
+            fheat = pop.pf['pop_fXh'] * np.ones((z.size, 1))
+        elif self.esec.method > 1:
+            fheat = self._interp_in_xe(self.fheat[popid][band], igm_e)
+        else:
+            fheat = self.esec.DepositionFraction(igm_e)[:,None]
+
+        integrand = self.sigma_E[species_str][popid][band] \
+            * (E - E_th[species])
+
+        if self.approx_He:
+            integrand += self.cosm.y * self.sigma_E['he_1'][popid][band] \
+                * (E - E_th[1])
+
+        # Figure out integration limits, just like `HeatingRate`.
+        if kw['Emax'] is not None:
+            imax = np.argmin(np.abs(E - kw['Emax']))
+            if imax == 0:
+                return np.zeros_like(z)
+            elif imax == (len(E) - 1):
+                imax = None
+            imin = 0
+            integrator = 'simps'
+        else:
+            imin = np.argmin(np.abs(E - pop.pf['pop_Emin']))
+            imax = None
+            if self.sampled_integrator == 'trapz':
+                integrator = 'trapz'
+            else:
+                integrator = 'simps'
+
+        weights = self._quadrature_weights(popid, band, integrator, imin, imax)
+
+        heat = np.sum(fluxes * fheat * (integrand * weights / ev_per_hz),
+            axis=1)
+
+        # Re-normalize, get rid of per steradian units
+        heat *= 4. * np.pi * erg_per_ev
+
+        if not kw['return_rc']:
+            heat *= self.coefficient_to_rate(z, species, **kw)
+
+        heat[z >= pop.zform] = 0.0
+
+        return heat
+
+    def TabulateSecondaryIonizationRateIGM(self, z, fluxes, species=0,
+        donor=0, popid=0, band=0, **kwargs):
+        """
+        Compute volume averaged secondary ionization rate at many redshifts.
+
+        Parameters
+        ----------
+        z : np.ndarray
+            Redshifts.
+        fluxes : np.ndarray, list
+            Fluxes in this band at each redshift, with shape (z, E).
+        igm_e : int, float, np.ndarray
+            Electron fraction, either a single value or one per redshift.
+
+        Returns
+        -------
+        Array of ionization rates (or rate coefficients if return_rc=True),
+        or None if this band doesn't have a discrete RTE solution, in which
+        case, call `SecondaryIonizationRateIGM` one redshift at a time.
+
+        """
+
+        pop = self.pops[popid]
+
+        if not self._can_tabulate(popid, band, fluxes):
+            return None
+
+        z = np.atleast_1d(z)
+        fluxes = np.array(fluxes)
+
+        if (self.pf['secondary_ionization'] == 0) or \
+           (not pop.pf['pop_ion_src_igm']):
+            return np.zeros_like(z)
+
+        if ((donor or species) in [1,2]) and (not self.pf['include_He']):
+            return np.zeros_like(z)
+
+        kw = self._fix_kwargs(**kwargs)
+
+        species_str = species_i_to_str[species]
+        donor_str = species_i_to_str[donor]
+        E = self.E[popid][band]
+
+        igm_e = kw['igm_e'] * np.ones_like(z)
+
+        # Shape (z, E) or (z, 1)
+        if self.esec.method > 1:
+            fion = self._interp_in_xe(self.fion[species_str][popid][band],
+                igm_e)
+            fion_const = 1.
+        else:
+            fion = np.ones((z.size, 1))
+            fion_const = self.esec.DepositionFraction(igm_e,
+                channel=species_str)
+
+        integrand = fion * self.sigma_E[donor_str][popid][band] \
+            * (E - E_th[donor])
+
+        if self.pf['approx_He']:
+            integrand += self.cosm.y * self.sigma_E['he_1'][popid][band] \
+                * (E - E_th[1])
+
+        weights = self._quadrature_weights(popid, band, 'simps')
+
+        ion = np.sum(fluxes * integrand * weights, axis=1) / E_th[species] \
+            / ev_per_hz
+
+        # Re-normalize
+        ion *= 4. * np.pi * fion_const
+
+        if not kw['return_rc']:
+            ion *= self.coefficient_to_rate(z, species, **kw)
+
+        return ion
@@ -53,7 +53,7 @@ class LocalVolume:
             if self.pf['photon_conserving']:
                 self.pp_corr = self.grid.Vsh / self.grid.dr
             else:
-                self.A_npc = source.Lbol / 4. / np.pi / self.grid.r_mid**2
+                self.A_npc = 1. / 4. / np.pi / self.grid.r_mid**2
                 self.pp_corr = 4. * np.pi * self.grid.r_mid**2
 
     @property
@@ -88,7 +88,8 @@ class LocalVolume:
             self.kwargs = {}
 
         # Parse column densities, set attributes
-        for attribute in ['logN_by_cell', 'logNdN', 'n', 'N', 'Nc']:
+        for attribute in ['logN_by_cell', 'logNdN', 'n', 'N', 'Nc', 
+            'Lbol_by_cell']:
             val = getattr(rfield, attribute)
             setattr(self, attribute, val)
 
@@ -151,42 +152,38 @@ class LocalVolume:
         self.k_ion2 = np.zeros((self.Ns, self.grid.dims, self.grid.N_absorbers, 
             self.grid.N_absorbers))
         
-        if True:
-            self.Ja = [None] * self.Ns
+        self.Ja = [None] * self.Ns
+        
+        # Luminosity of each source in each cell: same everywhere unless 
+        # the speed of light is finite, in which case each cell sees a 
+        # different packet.
+        if self.Lbol_by_cell is None:
+            on = np.array([src.SourceOn(t) for src in self.srcs])
+            Lbol = np.zeros((self.Ns, self.grid.dims))
+            for h, src in enumerate(self.srcs):
+                if on[h]:
+                    Lbol[h] = src.Lbol(t)
         else:
-            self.Ja = np.array(self.Ns * [np.zeros(self.grid.dims)])
+            Lbol = self.Lbol_by_cell
+            on = np.any(Lbol > 0, axis=1)
 
-        # Loop over sources
-        for h, src in enumerate(self.srcs):      
+        # Loop over groups of sources with the same spectrum
+        for group in self.src_groups:      
 
-            if not src.SourceOn(t):
+            if not np.any(on[group]):
                 continue
                 
-            self.h = h
-            self.src = src
+            self.h = group[0]
+            self.src = self.srcs[self.h]
                 
             # If we're operating under the optically thin assumption, 
             # return pre-computed source-dependent values.    
             if self.pf['optically_thin']:
                 self.tau_tot = np.zeros(self.grid.dims) # by definition
-                self.k_ion[h] = src.k_ion_bar * self.pp_corr
-                self.k_heat[h] = src.k_heat_bar * self.pp_corr
-                self.k_ion2[h] = src.k_ion2_bar * self.pp_corr
+                self.k_ion[self.h] = self.src.k_ion_bar * self.pp_corr
+                self.k_heat[self.h] = self.src.k_heat_bar * self.pp_corr
+                self.k_ion2[self.h] = self.src.k_ion2_bar * self.pp_corr
                 continue
-
-            # Normalizations
-            self.A = {}
-            for absorber in self.grid.absorbers:          
-                
-                if self.pf['photon_conserving']:
-                    self.A[absorber] = self.src.Lbol(t) \
-                        / self.n[absorber] / self.grid.Vsh
-                else:
-                    self.A[absorber] = self.A_npc
-                    
-                # Correct normalizations if radiation field is plane-parallel
-                if self.pf['plane_parallel']:
-                    self.A[absorber] = self.A[absorber] * self.pp_corr
                                 
             """
             For sources with discrete SEDs.
@@ -198,9 +195,8 @@ class LocalVolume:
                                     
                     # Discrete spectrum (multi-freq approach)
                     if self.src.multi_freq:
-                        r1, r2, r3 = self.MultiFreqCoefficients(data, absorber, t)
-                        self.k_ion[h,:,i], self.k_ion2[h,:,i,:], \
-                        self.k_heat[h,:,i] = \
+                        self.k_ion[self.h,:,i], self.k_ion2[self.h,:,i,:], \
+                        self.k_heat[self.h,:,i] = \
                             self.MultiFreqCoefficients(data, absorber, t)
                     
                     # Discrete spectrum (multi-grp approach)
@@ -213,130 +209,157 @@ class LocalVolume:
             For sources with continuous SEDs.
             """
             
-            # This could be post-processed, but eventually may be more
-            # sophisticated
-            if True:
-                self.Ja = None
-            else:
-                self.Ja[h] = src.Spectrum(E_LyA) * ev_per_hz \
-                    * src.Lbol(t) / 4. / np.pi / self.grid.r_mid**2 \
-                    / E_LyA / erg_per_ev 
+            # Rates are linear in the luminosity, so compute them once for 
+            # the whole group and scale by each source's luminosity.
+            k_ion, k_ion2, k_heat = self._get_unit_coefficients(data, t)
             
-            # Initialize some arrays/dicts
-            self.PhiN = {}
-            self.PhiNdN = {}
-            self.fheat = 1.0
-            self.fion = dict([(absorber, 1.0) for absorber in self.grid.absorbers])
+            L = Lbol[group]
+            self.k_ion[group] = L[...,None] * k_ion[None,...]
+            self.k_heat[group] = L[...,None] * k_heat[None,...]
+            self.k_ion2[group] = L[...,None,None] * k_ion2[None,...]
+                       
+            # Compute total optical depth too
+            self.tau_tot = 10**self.src.tables["logTau"](self.logN_by_cell)
             
-            self.PsiN = {}
-            self.PsiNdN = {}
-            if not self.pf['isothermal'] and self.pf['secondary_ionization'] < 2:
-                self.fheat = self.esec.DepositionFraction(data['h_2'], 
-                    channel='heat')
-                
-            self.logx = None            
-            if self.pf['secondary_ionization'] > 1:
-                
-                self.logx = np.log10(data['h_2'])
-                
-                self.PhiWiggleN = {}
-                self.PhiWiggleNdN = {}
-                self.PhiHatN = {}
-                self.PhiHatNdN = {}
-                self.PsiWiggleN = {}
-                self.PsiWiggleNdN = {}
-                self.PsiHatN = {}
-                self.PsiHatNdN = {}
-                
-                for absorber in self.grid.absorbers:
-                    self.PhiWiggleN[absorber] = {}
-                    self.PhiWiggleNdN[absorber] = {}
-                    self.PsiWiggleN[absorber] = {}
-                    self.PsiWiggleNdN[absorber] = {}
-                
-            else:
-                self.fion = {}
-                for absorber in self.grid.absorbers:
-                    self.fion[absorber] = \
-                        self.esec.DepositionFraction(xHII=data['h_2'], 
-                            channel=absorber)
-                            
-            # Loop over absorbing species, compute tabulated quantities
-            for i, absorber in enumerate(self.grid.absorbers):
-                                           
-                self.PhiN[absorber] = \
-                    10**self.src.tables["logPhi_{!s}".format(absorber)](self.logN_by_cell,
-                    self.logx, t)
+        return self.k_ion, self.k_ion2, self.k_heat, self.Ja
+        
+    @property
+    def src_groups(self):
+        """
+        Indices of sources, grouped such that members of a group have
+        identical (continuous) spectra and therefore lookup tables.
+        """
+        if not hasattr(self, '_src_groups'):
+            self._src_groups = []
+            for h, src in enumerate(self.srcs):
+                for group in self._src_groups:
+                    if self._same_tables(self.srcs[group[0]], src):
+                        group.append(h)
+                        break
+                else:
+                    self._src_groups.append([h])
+            
+        return self._src_groups
+        
+    def _same_tables(self, src1, src2):
+        """
+        Determine whether two sources can share rate coefficient tables.
+        """
+        
+        if self.pf['optically_thin'] or src1.discrete or src2.discrete:
+            return False
+            
+        if set(src1.tabs.keys()) != set(src2.tabs.keys()):
+            return False
+        
+        for ax1, ax2 in [(src1.tab.logN, src2.tab.logN), 
+            (src1.tab.logx, src2.tab.logx), (src1.tab.t, src2.tab.t)]:
+            if not np.array_equal(ax1, ax2):
+                return False
+            
+        for name in src1.tabs:
+            if not np.array_equal(src1.tabs[name], src2.tabs[name]):
+                return False
                 
-                if (not self.pf['isothermal']) and (self.pf['secondary_ionization'] < 2):
-                    self.PsiN[absorber] = \
-                        10**self.src.tables["logPsi_{!s}".format(absorber)](self.logN_by_cell,
-                        self.logx, t)
-                    
-                if self.pf['photon_conserving']:
-                    self.PhiNdN[absorber] = \
-                        10**self.src.tables["logPhi_{!s}".format(absorber)](self.logNdN[i],
-                        self.logx, t)
-                    
-                    if (not self.pf['isothermal']) and (self.pf['secondary_ionization'] < 2):
-                        self.PsiNdN[absorber] = \
-                            10**self.src.tables["logPsi_{!s}".format(absorber)](self.logNdN[i],
-                            self.logx, t)
+        return True
+        
+    def _get_unit_coefficients(self, data, t):
+        """
+        Compute rate coefficients for `self.src` assuming it has unit 
+        luminosity.
+        
+        Returns
+        -------
+        Tuple containing photo-ionization rate (grid x absorbers), secondary
+        ionization rate (grid x absorbers x donors), and heating 
+        rate (grid x absorbers) coefficients.
+        
+        """
+        
+        self.t = t
+        
+        # Normalizations
+        if self.pf['photon_conserving']:
+            self.A = 1. / np.array([self.n[absorber] * self.grid.Vsh \
+                for absorber in self.grid.absorbers]).T
+        else:
+            self.A = self.A_npc[:,None] \
+                * np.ones((self.grid.dims, self.grid.N_absorbers))
+            
+        # Correct normalizations if radiation field is plane-parallel
+        if self.pf['plane_parallel']:
+            self.A = self.A * np.reshape(self.pp_corr, (-1, 1))
             
-                if self.pf['secondary_ionization'] > 1:
+        # Deposition fractions    
+        self.fheat = np.ones(self.grid.dims)
+        self.fion = np.ones((self.grid.dims, self.grid.N_absorbers))
+        self.logx = None            
+        if self.pf['secondary_ionization'] > 1:
+            self.logx = np.log10(data['h_2'])
+        else:
+            if not self.pf['isothermal']:
+                self.fheat = self.fheat * self.esec.DepositionFraction(
+                    data['h_2'], channel='heat')
+            for i, absorber in enumerate(self.grid.absorbers):
+                self.fion[:,i] = self.esec.DepositionFraction(
+                    xHII=data['h_2'], channel=absorber)
+        
+        self.E_th_arr = erg_per_ev \
+            * np.array([self.E_th[absorber] for absorber in self.grid.absorbers])
+        
+        # Tabulated integrals (net of the portion that escapes each cell 
+        # if photon-conserving), one column per absorber.
+        self.PhiN = np.array([self._tabulated('logPhi_{!s}'.format(absorber), 
+            i) for i, absorber in enumerate(self.grid.absorbers)]).T
                     
-                    self.PhiHatN[absorber] = \
-                        10**self.src.tables["logPhiHat_{!s}".format(absorber)](self.logN_by_cell,
-                        self.logx, t)    
-                                        
-                    if not self.pf['isothermal']:
-                        self.PsiHatN[absorber] = \
-                            10**self.src.tables["logPsiHat_{!s}".format(absorber)](self.logN_by_cell,
-                            self.logx, t)  
-                                                
-                        if self.pf['photon_conserving']:    
-                            self.PhiHatNdN[absorber] = \
-                                10**self.src.tables["logPhiHat_{!s}".format(absorber)](self.logNdN[i],
-                                self.logx, t)
-                            self.PsiHatNdN[absorber] = \
-                                10**self.src.tables["logPsiHat_{!s}".format(absorber)](self.logNdN[i],
-                                self.logx, t)     
+        if self.pf['secondary_ionization'] < 2:
+            # Only tabulated if needed for heating or secondary ionization
+            if 'logPsi_{!s}'.format(self.grid.absorbers[0]) in self.src.tables:
+                self.PsiN = np.array([self._tabulated(
+                    'logPsi_{!s}'.format(absorber), i) \
+                    for i, absorber in enumerate(self.grid.absorbers)]).T
+            else:
+                self.PsiN = np.zeros_like(self.PhiN)
+        else:
+            if not self.pf['isothermal']:
+                self.PhiHatN = np.array([self._tabulated(
+                    'logPhiHat_{!s}'.format(absorber), i) \
+                    for i, absorber in enumerate(self.grid.absorbers)]).T
+                self.PsiHatN = np.array([self._tabulated(
+                    'logPsiHat_{!s}'.format(absorber), i) \
+                    for i, absorber in enumerate(self.grid.absorbers)]).T
                     
-                    for j, donor in enumerate(self.grid.absorbers):
-                        
-                        suffix = '{0!s}_{1!s}'.format(absorber, donor)
-                        
-                        self.PhiWiggleN[absorber][donor] = \
-                            10**self.src.tables["logPhiWiggle_{!s}".format(suffix)](self.logN_by_cell,
-                                self.logx, t)    
-                        
-                        self.PsiWiggleN[absorber][donor] = \
-                            10**self.src.tables["logPsiWiggle_{!s}".format(suffix)](self.logN_by_cell,
-                            self.logx, t)
-                            
-                        if not self.pf['photon_conserving']:
-                            continue
-                        
-                        self.PhiWiggleNdN[absorber][donor] = \
-                            10**self.src.tables["logPhiWiggle_{!s}".format(suffix)](self.logNdN[j],
-                            self.logx, t)
-                        self.PsiWiggleNdN[absorber][donor] = \
-                            10**self.src.tables["logPsiWiggle_{!s}".format(suffix)](self.logNdN[j],
-                            self.logx, t)
-
-            # Now, go ahead and calculate the rate coefficients
-            for k, absorber in enumerate(self.grid.absorbers):
-                self.k_ion[h][...,k] = self.PhotoIonizationRate(absorber)
-                self.k_heat[h][...,k] = self.PhotoHeatingRate(absorber)
-
+            shape = (self.grid.dims, self.grid.N_absorbers, 
+                self.grid.N_absorbers)
+            self.PhiWiggleN = np.zeros(shape)
+            self.PsiWiggleN = np.zeros(shape)
+            for i, absorber in enumerate(self.grid.absorbers):
                 for j, donor in enumerate(self.grid.absorbers):
-                    self.k_ion2[h][...,k,j] = \
-                        self.SecondaryIonizationRate(absorber, donor)
-                       
-            # Compute total optical depth too
-            self.tau_tot = 10**self.src.tables["logTau"](self.logN_by_cell)
+                    suffix = '{0!s}_{1!s}'.format(absorber, donor)
+                    self.PhiWiggleN[:,i,j] = self._tabulated(
+                        'logPhiWiggle_{!s}'.format(suffix), j)
+                    self.PsiWiggleN[:,i,j] = self._tabulated(
+                        'logPsiWiggle_{!s}'.format(suffix), j)
+        
+        return self.PhotoIonizationRate(), self.SecondaryIonizationRate(), \
+            self.PhotoHeatingRate()
+        
+    def _tabulated(self, name, i):
+        """
+        Evaluate lookup table `name` for `self.src` in all cells.
+        
+        If photon-conserving, subtract off the value at the outer edge of 
+        each cell, where `i` is the index of the absorber whose column 
+        density sets the cell's thickness.
+        """
+        
+        table = self.src.tables[name]
+        
+        val = 10**table(self.logN_by_cell, self.logx, self.t)
+        if self.pf['photon_conserving']:
+            val -= 10**table(self.logNdN[i], self.logx, self.t)
             
-        return self.k_ion, self.k_ion2, self.k_heat, self.Ja
+        return val
         
     def MultiFreqCoefficients(self, data, absorber, t=None):
         """
@@ -433,50 +456,37 @@ class LocalVolume:
     def PhotoIonizationRateMultiGroup(self):
         pass
         
-    def PhotoIonizationRate(self, absorber):
+    def PhotoIonizationRate(self):
         """
         Returns photo-ionization rate coefficient for continuous source.
+        
+        Shape is (grid cells, absorbers).
         """                                     
             
-        IonizationRate = self.PhiN[absorber].copy()
-        if self.pf['photon_conserving']:
-            IonizationRate -= self.PhiNdN[absorber]
-        
-        return self.A[absorber] * IonizationRate
+        return self.A * self.PhiN
         
-    def PhotoHeatingRate(self, absorber):
+    def PhotoHeatingRate(self):
         """
-        Photo-electric heating rate coefficient due to photo-electrons previously 
-        bound to `species.'  If this method is called, it means TabulateIntegrals = 1.
+        Photo-electric heating rate coefficient due to photo-electrons 
+        previously bound to each absorber. Shape is (grid cells, absorbers).
+        
+        If this method is called, it means TabulateIntegrals = 1.
         """
 
         if self.pf['isothermal']:
-            return 0.0
+            return np.zeros((self.grid.dims, self.grid.N_absorbers))
 
         if self.esec.method < 2:
-            HeatingRate = self.PsiN[absorber].copy()
-            HeatingRate -= self.E_th[absorber] * erg_per_ev  \
-                * self.PhiN[absorber]
-            if self.pf['photon_conserving']:
-                HeatingRate -= self.PsiNdN[absorber]
-                HeatingRate += erg_per_ev \
-                    * self.E_th[absorber] \
-                    * self.PhiNdN[absorber]
+            HeatingRate = self.PsiN - self.E_th_arr * self.PhiN
         else:
-            HeatingRate = self.PsiHatN[absorber].copy()
-            HeatingRate -= self.E_th[absorber] * erg_per_ev  \
-                * self.PhiHatN[absorber]
-            if self.pf['photon_conserving']:
-                HeatingRate -= self.PsiHatNdN[absorber]
-                HeatingRate += erg_per_ev \
-                    * self.E_th[absorber] \
-                    * self.PhiHatNdN[absorber]
+            HeatingRate = self.PsiHatN - self.E_th_arr * self.PhiHatN
 
-        return self.A[absorber] * self.fheat * HeatingRate
+        return self.A * self.fheat[:,None] * HeatingRate
             
-    def SecondaryIonizationRate(self, absorber, donor):
+    def SecondaryIonizationRate(self):
         """
-        Secondary ionization rate which we denote elsewhere as gamma (note little g).
+        Secondary ionization rate which we denote elsewhere as gamma (note 
+        little g). Shape is (grid cells, absorbers, donors), where
         
             absorber = species being ionized by photo-electron
             donor = species the photo-electron came from
@@ -485,27 +495,13 @@ class LocalVolume:
         """    
         
         if self.esec.method < 2:
-            IonizationRate = self.PsiN[donor].copy()
-            IonizationRate -= self.E_th[donor] \
-                * erg_per_ev * self.PhiN[donor]
-            if self.pf['photon_conserving']:
-                IonizationRate -= self.PsiNdN[donor]
-                IonizationRate += self.E_th[donor] \
-                    * erg_per_ev * self.PhiNdN[donor]
-                            
+            IonizationRate = self.fion[:,:,None] \
+                * (self.PsiN - self.E_th_arr * self.PhiN)[:,None,:]
         else:
-            IonizationRate = self.PsiWiggleN[absorber][donor] \
-                - self.E_th[donor] \
-                * erg_per_ev * self.PhiWiggleN[absorber][donor]
-            if self.pf['photon_conserving']:
-                IonizationRate -= self.PsiWiggleNdN[absorber][donor]
-                IonizationRate += self.E_th[donor] \
-                    * erg_per_ev * self.PhiWiggleNdN[absorber][donor]            
+            IonizationRate = self.PsiWiggleN \
+                - self.E_th_arr[None,None,:] * self.PhiWiggleN
                         
         # Normalization (by number densities) will be applied in 
         # chemistry solver    
-        return self.A[donor] * self.fion[absorber] * IonizationRate \
-                / self.E_th[absorber] / erg_per_ev    
-        
-        
-        
+        return self.A[:,None,:] * IonizationRate \
+            / self.E_th_arr[None,:,None]
@@ -1,8 +1,13 @@
-from ares.static.Grid import Grid
-from ares.static.VolumeLocal import LocalVolume
-from ares.static.VolumeGlobal import GlobalVolume
-from ares.static.IntegralTables import IntegralTable
-from ares.static.InterpolationTables import LookupTable
-from ares.static.ChemicalNetwork import ChemicalNetwork
-from ares.static.Fluctuations import Fluctuations
-from ares.static.SpectralSynthesis import SpectralSynthesis
+from ares.util.Lazy import lazy_import
+
+__getattr__, __dir__ = lazy_import(__name__,
+{
+ 'Grid': ('Grid', 'Grid'),
+ 'LocalVolume': ('VolumeLocal', 'LocalVolume'),
+ 'GlobalVolume': ('VolumeGlobal', 'GlobalVolume'),
+ 'IntegralTable': ('IntegralTables', 'IntegralTable'),
+ 'LookupTable': ('InterpolationTables', 'LookupTable'),
+ 'ChemicalNetwork': ('ChemicalNetwork', 'ChemicalNetwork'),
+ 'Fluctuations': ('Fluctuations', 'Fluctuations'),
+ 'SpectralSynthesis': ('SpectralSynthesis', 'SpectralSynthesis'),
+})
@@ -0,0 +1,89 @@
+"""
+
+Lazy.py
+
+Description: Deferred imports for ares sub-packages, so that `import ares`
+doesn't drag in matplotlib, scipy, h5py, etc. until they're actually needed.
+
+"""
+
+import sys
+import types
+import importlib
+
+class _LazyModule(types.ModuleType):
+    def __setattr__(self, name, value):
+        # The import system binds each sub-module to its parent package once
+        # it has been loaded, which would clobber classes that share a name
+        # with their module, e.g., ares.physics.Cosmology. Keep the class.
+        lazy = self.__dict__.get('_lazy_attrs', {})
+        if (name in lazy) and isinstance(value, types.ModuleType):
+            mod, obj = lazy[name]
+            if (obj is not None) and \
+                value.__name__ == '{}.{}'.format(self.__name__, mod):
+                value = getattr(value, obj)
+
+        types.ModuleType.__setattr__(self, name, value)
+
+def lazy_import(name, attrs):
+    """
+    Set up lazy attribute access for a package.
+
+    Parameters
+    ----------
+    name : str
+        Name of package, i.e., `__name__` in its `__init__.py`.
+    attrs : dict
+        Maps attribute names to (sub-module, object) pairs, where object is
+        the name of the object to pull out of the sub-module, or None if the
+        attribute is the sub-module itself.
+
+    Returns
+    -------
+    Module-level `__getattr__` and `__dir__` functions (PEP 562). Attributes
+    not in `attrs` are looked for among sub-modules, as they would be if
+    some other module had already imported them.
+
+    """
+
+    module = sys.modules[name]
+    module._lazy_attrs = attrs
+
+    def __getattr__(attr):
+        if attr in attrs:
+            mod, obj = attrs[attr]
+        elif not attr.startswith('__'):
+            mod, obj = attr, None
+        else:
+            raise AttributeError("module {!r} has no attribute {!r}".format(
+                name, attr))
+
+        try:
+            value = importlib.import_module('{}.{}'.format(name, mod))
+        except ImportError as err:
+            if attr in attrs:
+                raise
+            # Only hide the error if it's this sub-module that's missing.
+            if getattr(err, 'name', None) not in [None, '{}.{}'.format(name, mod)]:
+                raise
+            raise AttributeError("module {!r} has no attribute {!r}".format(
+                name, attr))
+
+        if obj is not None:
+            value = getattr(value, obj)
+
+        setattr(module, attr, value)
+        return value
+
+    def __dir__():
+        return sorted(set(module.__dict__.keys()) | set(attrs.keys()))
+
+    # Before PEP 562 (Python < 3.7), there's no way to intercept module
+    # attribute access, so just import everything now.
+    if sys.version_info < (3, 7):
+        for attr in attrs:
+            __getattr__(attr)
+    else:
+        module.__class__ = _LazyModule
+
+    return __getattr__, __dir__
@@ -1,4 +1,11 @@
 import gc
+import threading
+from collections import deque
+
+try:
+    import multiprocessing
+except ImportError:
+    pass
 
 try:
     from mpi4py import MPI
@@ -82,6 +89,53 @@ class MPIPool(object): # pragma: no cover
 
         return resultlist
 
+    def submit(self, function, arg, tag):
+        """
+        Send a single task to the next free worker (or queue it up).
+        
+        Results are retrieved (in order of completion) via `wait`.
+        
+        Parameters
+        ----------
+        tag : int
+            Identifier for this task, returned alongside the result.
+        
+        """
+        assert self.is_master()
+        
+        if not hasattr(self, '_free'):
+            self._free = self.workers.copy()
+            self._queue = deque()
+            
+        if self._free:
+            self.comm.send((function, arg), dest=self._free.pop(), tag=tag)
+        else:
+            self._queue.append((tag, (function, arg)))
+            
+    def wait(self):
+        """
+        Block until any submitted task is complete.
+        
+        Returns
+        -------
+        Tuple: (tag, result).
+        
+        """
+        assert self.is_master()
+        
+        status = MPI.Status()
+        result = self.comm.recv(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, 
+            status=status)
+        
+        # This worker is free now: give it something to do.
+        if self._queue:
+            tag, task = self._queue.popleft()
+            self.comm.send(task, dest=status.source, tag=tag)
+        else:
+            self._free.add(status.source)
+            
+        return status.tag, result
+        
     def start(self):
         if not self.is_worker(): 
             return
@@ -108,6 +162,77 @@ class MPIPool(object): # pragma: no cover
         for worker in self.workers:
             self.comm.send(None, worker, 0)
 
+            
+class LocalPool(object):
+    def __init__(self, processes=None, fork=False):
+        """
+        Initialize a pool of local worker processes.
+        
+        Same interface as MPIPool, so it can be used in place of MPIPool
+        when running on a single machine (e.g., for testing).
+        
+        Parameters
+        ----------
+        processes : int
+            Number of worker processes. If None, will use all CPUs.
+        fork : bool
+            If True, workers are forked regardless of the platform's default
+            start method (spawn on macOS and Windows), so they inherit the 
+            state of the parent process, e.g., module-level globals. Raises
+            NotImplementedError if fork is unavailable.
+        
+        """
+        if fork:
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                raise NotImplementedError("Worker processes must be " +\
+                    "forked, which isn't possible on this platform. " +\
+                    "Set the number of processes to 1.")
+            self.pool = multiprocessing.get_context('fork').Pool(processes)
+        else:
+            self.pool = multiprocessing.Pool(processes)
+        self._done = deque()
+        self._cv = threading.Condition()
+        
+    def is_master(self):
+        return True
+        
+    def is_worker(self):
+        return False
+        
+    def map(self, function, iterable):
+        return self.pool.map(function, iterable)
+        
+    def submit(self, function, arg, tag):
+        def callback(result):
+            with self._cv:
+                self._done.append((tag, result))
+                self._cv.notify()
+                
+        def error_callback(err):
+            callback(err)
+        
+        self.pool.apply_async(function, (arg,), callback=callback,
+            error_callback=error_callback)
+        
+    def wait(self):
+        with self._cv:
+            while not self._done:
+                self._cv.wait()
+            tag, result = self._done.popleft()
+        
+        # Don't hang forever if a worker raised an exception.
+        if isinstance(result, Exception):
+            raise result
+            
+        return tag, result
+        
+    def start(self):
+        pass
+        
+    def stop(self):
+        self.pool.close()
+        self.pool.join()
+                
 
 #if __name__ == '__main__':
 #
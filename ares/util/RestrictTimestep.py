@@ -24,13 +24,19 @@ class RestrictTimestep(object):
         self.verbose = verbose
         self.grid_indices = np.arange(self.grid.dims)
         
-    def Limit(self, q, dqdt, z=None, tau=None, tau_ifront=0.5, method=['ions']):
+    def Limit(self, q, dqdt, z=None, tau=None, tau_ifront=0.5, method=['ions'],
+        per_cell=False):
         """
         Limit timestep based on maximum allowed change in fields.  Which 
         fields determined by method parameter.
+        
+        If per_cell==True, will return an array of time-steps, one for each
+        cell (i.e., each row of `q`), rather than the minimum over all cells.
         """
                 
         if method is None:
+            if per_cell:
+                return huge_dt * np.ones(q.shape[0])
             return huge_dt        
                 
         # Projected timestep for each cell and field (dt.shape = grid x species)
@@ -69,14 +75,21 @@ class RestrictTimestep(object):
                 raise ValueError('Unrecognized dt restriction method: {!s}'.format(mth))
 
             if mth != 'hubble':
-                min_dt = np.min(dt[..., j])
+                if per_cell:
+                    min_dt = np.min(np.reshape(dt[..., j], (q.shape[0], -1)),
+                        axis=1)
+                else:
+                    min_dt = np.min(dt[..., j])
 
-            not_ok = ((min_dt <= 0) or np.isnan(min_dt) or np.isinf(min_dt))            
+            bad = (min_dt <= 0) | np.isnan(min_dt) | np.isinf(min_dt)
+            not_ok = np.any(bad)
 
             # Determine which cell is behaving badly (if any)
             if not_ok:
                 if self.grid.dims == 1:
                     which_cell = 0
+                elif per_cell:
+                    which_cell = int(np.argwhere(bad)[0])
                 else:
                     if j is not None:
                         cond = np.argwhere(dt[...,j] == min_dt)
@@ -89,7 +102,10 @@ class RestrictTimestep(object):
                     dt_error(self.grid, z, q, dqdt, min_dt, which_cell, mth)
 
             # Update the time-step
-            new_dt = min(new_dt, min_dt)
+            new_dt = np.minimum(new_dt, min_dt)
+
+        if per_cell:
+            return new_dt * np.ones(q.shape[0])
 
         return new_dt
 
@@ -9,7 +9,7 @@ Description: Defaults for all different kinds of parameters.
      
 """
 
-import os, imp
+import os
 import numpy as np
 from ares import rcParams
 from ..physics.Constants import m_H, cm_per_kpc, s_per_myr, E_LL
@@ -211,6 +211,11 @@ def PhysicsParameters():
     "approx_Salpha": 1, # 1 = Salpha = 1
                         # 2 = Chuzhoy, Alvarez, & Shapiro (2005),
                         # 3 = Furlanetto & Pritchard (2006)
+    
+    # If True, approx_Salpha=3 interpolates S_alpha from a table accurate to
+    # within approx_Salpha_tol, rather than computing it exactly each time.
+    "approx_Salpha_tab": False,
+    "approx_Salpha_tol": 1e-6,
 
     "approx_thermal_history": False,
     "inits_Tk_p0": None,
@@ -432,6 +437,15 @@ def PowerSpectrumParameters():
      'ps_fht_rtol': 1e-4,
      'ps_fht_atol': 1e-4,
      
+     # Redshifts are independent, so can be done in parallel: either by 
+     # a pool of ps_nprocs local processes, or over MPI ranks (ps_mpi).
+     'ps_nprocs': 1,
+     'ps_mpi': False,
+     
+     # Overlap volumes depend only on geometry, not redshift, so they're
+     # shared in memory. Can also save them to (and read from) HDF5 file.
+     'ps_overlap_cache': None,
+     
      'ps_include_lya_lc': False,
 
      "ps_volfix": True,
@@ -565,6 +579,9 @@ def PopulationParameters():
     
     # Cache tricks: must be pickleable for MCMC to work.
     "pop_sps_data": None,
+    # Directory for binary copies of SPS tables
+    # (True = $ARES/input/sps_cache, None or False = no cache)
+    "pop_sps_cache": True,
     
     "pop_tsf": 100.,
     "pop_binaries": False,        # for BPASS
@@ -679,6 +696,9 @@ def PopulationParameters():
     "pop_histories": None,
     "pop_guide_pop": None,
     "pop_thin_hist": False,
+    # If not None, stream halo histories from disk in blocks of this many
+    # halos (see GalaxyEnsemble.RunSAMChunked)
+    "pop_hist_chunk": None,
     "pop_scatter_mar": 0.0,
     "pop_scatter_mar_seed": None,
     "pop_scatter_sfr": 0.0,
@@ -693,8 +713,15 @@ def PopulationParameters():
     "pop_delay_rad_feedback": 0.0,
     "pop_delay_sne_feedback": 0.0,
     "pop_force_equilibrium": np.inf,
+    # Approximate: number of SNe per cluster is drawn without sampling
+    # individual stars (see GalaxyEnsemble._draw_massive_stars).
     "pop_sample_imf": False,
     "pop_sample_cmf": False,
+    "pop_sample_seed": None,
+    # Halos per chunk (and per random stream). Changing this changes the
+    # realization (but not its statistics), even with a fixed seed.
+    "pop_sample_chunk": 1000,
+    "pop_sample_nprocs": 1,
     "pop_imf": 2.35,     # default to standard SSPs. 
     "pop_imf_bins": None,#np.arange(0.1, 150.01, 0.01),  # bin centers
     "pop_cmf": None,
@@ -946,6 +973,7 @@ def SourceParameters():
     "source_interpolant": None,
     
     "source_sps_data": None,
+    "source_sps_cache": True,
     
     # Log masses
     "source_imf_bins": np.arange(-1, 2.52, 0.02),  # bin centers
@@ -1042,6 +1070,7 @@ def SynthesisParameters():
     "source_sed_by_Z": None,
     "source_rad_yield": 'from_sed',
     "source_sps_data": None,
+    "source_sps_cache": True,
     
     # Only used by toy SPS
     "source_dE": None,
@@ -1218,6 +1247,12 @@ def ControlParameters():
     'logdzDataDump': None,
     "stop_time": 500,
     
+    # Keep every Nth step in history of GasParcel/RaySegment runs, and 
+    # optionally write it to disk (.npz, or .hdf5, which is streamed).
+    "history_decimate": 1,
+    "history_file": None,
+    "history_clobber": False,
+    
     "initial_redshift": 60.,
     "final_redshift": 5,
     "fallback_dz": 0.1, # only used when no other constraints 
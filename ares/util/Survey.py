@@ -142,17 +142,29 @@ class Survey(object):
                 
             return result
                 
+        # Don't re-scan directories if we've seen this request before.
+        if not hasattr(self, '_throughput_cache'):
+            self._throughput_cache = {}
+            
+        key = repr(filter_set), repr(filters)
+        if key in self._throughput_cache:
+            return self._throughput_cache[key]
+                
         if self.camera == 'nircam':
-            return self._read_nircam(filter_set, filters)
+            data = self._read_nircam(filter_set, filters)
         elif self.camera == 'wfc3':
-            return self._read_wfc3(filter_set, filters)
+            data = self._read_wfc3(filter_set, filters)
         elif self.camera == 'wfc':
-            return self._read_wfc(filter_set, filters)
+            data = self._read_wfc(filter_set, filters)
         elif self.camera == 'irac':
-            return self._read_irac(filter_set, filters)    
+            data = self._read_irac(filter_set, filters)    
         else:
             raise NotImplemented('help')
             
+        self._throughput_cache[key] = data
+        
+        return data
+            
     def _read_nircam(self, filter_set='W', filters=None):
 
         if not hasattr(self, '_filter_cache'):
@@ -216,3 +216,147 @@ class CheckPoints(object):
         else:
             return '{0!s}{1!s}'.format(self.z_basename, str(int(rd)).zfill(self.fill))
         
+
+class HistoryBuffer(object):
+    def __init__(self, decimate=1, fn=None, chunk=128, clobber=False):
+        """
+        Accumulate snapshots of a simulation in preallocated, contiguous 
+        arrays, one per field, with time along the first axis.
+        
+        Parameters
+        ----------
+        decimate : int
+            Only keep every `decimate`-th snapshot. The last snapshot (see
+            `append`) is always kept.
+        fn : str
+            If supplied, write history to this file. If it's an HDF5 file,
+            snapshots are flushed to disk every `chunk` steps, so the 
+            buffer never grows beyond that. If it's a .npz file, the full
+            history is written when we `finish`. Only the root processor
+            writes to disk; the rest just hold their history in memory.
+        chunk : int
+            Initial size of buffer (in snapshots). Grows by factors of two
+            as needed unless we're streaming to HDF5.
+        clobber : bool
+            Overwrite `fn` if it already exists? If False, and it does,
+            an IOError is raised.
+            
+        """
+        self.decimate = int(decimate)
+        self.fn = fn
+        self.chunk = int(chunk)
+        
+        self.stream = False
+        if fn is not None:
+            if fn.endswith('.hdf5') or fn.endswith('.h5'):
+                if not have_h5py:
+                    raise ImportError('Need h5py to stream history to disk.')
+                # Every processor appending to the same file won't end well
+                self.stream = rank == 0
+            elif not fn.endswith('.npz'):
+                raise IOError('Unrecognized format for history file.')
+                
+            if rank == 0 and os.path.exists(fn):
+                if not clobber:
+                    raise IOError('File \'{}\' exists! Set clobber=True to overwrite.'.format(fn))
+                os.remove(fn)
+            
+        self.data = None
+        self.Nsteps = 0    # number of snapshots seen
+        self.N = 0         # number of snapshots in buffer
+        self.Nflushed = 0  # number of snapshots on disk
+        
+    def _allocate(self, data):
+        self.data = {}
+        for key in data:
+            arr = np.asarray(data[key], dtype=float)
+            self.data[key] = np.empty((self.chunk,) + arr.shape)
+            
+    def _grow(self):
+        for key in self.data:
+            arr = self.data[key]
+            new = np.empty((2 * arr.shape[0],) + arr.shape[1:])
+            new[0:self.N] = arr[0:self.N]
+            self.data[key] = new
+            
+    def _flush(self):
+        if self.N == 0:
+            return
+            
+        with h5py.File(self.fn, 'a') as f:
+            for key in self.data:
+                name = str(key)
+                arr = self.data[key][0:self.N]
+                if name not in f:
+                    f.create_dataset(name, data=arr, 
+                        maxshape=(None,) + arr.shape[1:])
+                else:
+                    f[name].resize(self.Nflushed + self.N, axis=0)
+                    f[name][self.Nflushed:] = arr
+            
+        self.Nflushed += self.N
+        self.N = 0
+        
+    def append(self, t, data, last=False):
+        """
+        Add snapshot at time `t` (maybe, depending on `decimate`).
+        
+        Parameters
+        ----------
+        t : int, float
+            Current time.
+        data : dict
+            Dictionary containing all fields at this snapshot. Should
+            always have the same keys and shapes.
+        last : bool
+            If True, keep this snapshot no matter what.
+            
+        """
+        
+        keep = (self.Nsteps % self.decimate == 0) or last
+        self.Nsteps += 1
+        
+        if not keep:
+            return
+            
+        snapshot = {'t': t}
+        snapshot.update(data)
+            
+        if self.data is None:
+            self._allocate(snapshot)
+        
+        if self.N == self.data['t'].shape[0]:
+            if self.stream:
+                self._flush()
+            else:
+                self._grow()
+            
+        for key in snapshot:
+            self.data[key][self.N] = snapshot[key]
+            
+        self.N += 1
+        
+    def finish(self):
+        """
+        Return history as a dictionary of arrays. Writes to disk if 
+        `fn` was supplied.
+        """
+        
+        if self.stream:
+            self._flush()
+            history = {}
+            with h5py.File(self.fn, 'r') as f:
+                for key in self.data:
+                    history[key] = np.array(f[str(key)])
+            return history
+        
+        # Trim buffer, so we're not holding on to extra memory
+        history = {}
+        for key in self.data:
+            history[key] = self.data[key] = self.data[key][0:self.N].copy()
+        
+        if self.fn is not None and rank == 0:
+            np.savez(self.fn, **{str(key): history[key] for key in history})
+            
+        return history
+        
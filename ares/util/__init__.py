@@ -1,16 +1,27 @@
-import ares.util.Pickling
-from ares.util.Pickling import read_pickle_file, write_pickle_file,\
-    delete_file, delete_file_if_clobber, overwrite_pickle_file
-import ares.util.Photometry
-from ares.util.GridND import GridND
-from ares.util.Survey import Survey
-from ares.util.Aesthetics import labels
-from ares.util.WriteData import CheckPoints
-from ares.util.BlobBundles import BlobBundle
-from ares.util.ProgressBar import ProgressBar
-from ares.util.ParameterFile import ParameterFile
-from ares.util.ReadData import read_lit, lit_options
-from ares.util.MagnitudeSystem import MagnitudeSystem
-from ares.util.ParameterBundles import ParameterBundle
-from ares.util.RestrictTimestep import RestrictTimestep
-from ares.util.Misc import get_rev, get_cmd_line_kwargs
+from ares.util.Lazy import lazy_import
+
+__getattr__, __dir__ = lazy_import(__name__,
+{
+ 'Pickling': ('Pickling', None),
+ 'read_pickle_file': ('Pickling', 'read_pickle_file'),
+ 'write_pickle_file': ('Pickling', 'write_pickle_file'),
+ 'delete_file': ('Pickling', 'delete_file'),
+ 'delete_file_if_clobber': ('Pickling', 'delete_file_if_clobber'),
+ 'overwrite_pickle_file': ('Pickling', 'overwrite_pickle_file'),
+ 'Photometry': ('Photometry', None),
+ 'GridND': ('GridND', 'GridND'),
+ 'Survey': ('Survey', 'Survey'),
+ 'labels': ('Aesthetics', 'labels'),
+ 'CheckPoints': ('WriteData', 'CheckPoints'),
+ 'HistoryBuffer': ('WriteData', 'HistoryBuffer'),
+ 'BlobBundle': ('BlobBundles', 'BlobBundle'),
+ 'ProgressBar': ('ProgressBar', 'ProgressBar'),
+ 'ParameterFile': ('ParameterFile', 'ParameterFile'),
+ 'read_lit': ('ReadData', 'read_lit'),
+ 'lit_options': ('ReadData', 'lit_options'),
+ 'MagnitudeSystem': ('MagnitudeSystem', 'MagnitudeSystem'),
+ 'ParameterBundle': ('ParameterBundles', 'ParameterBundle'),
+ 'RestrictTimestep': ('RestrictTimestep', 'RestrictTimestep'),
+ 'get_rev': ('Misc', 'get_rev'),
+ 'get_cmd_line_kwargs': ('Misc', 'get_cmd_line_kwargs'),
+})
@@ -0,0 +1,60 @@
+"""
+
+test_checkpoint_io.py
+
+Description: Per-evaluation overhead of ModelFit's loglikelihood wrapper,
+with checkpoints written synchronously (checkpoint_freq=0, the old way) and
+buffered in memory (checkpoint_freq > 0), with and without forced garbage
+collection. The "model" costs nothing so all we measure is overhead.
+
+Usage: python test_checkpoint_io.py <number of evaluations>
+
+"""
+
+import os
+import sys
+import time
+import glob
+import numpy as np
+from ares.inference.ModelFit import loglikelihood, get_checkpoint_buffer
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+prefix = 'test_checkpoint_io'
+
+class Priors(object):
+    params = []
+    def log_value(self, point):
+        return 0.0
+
+class Model(object):
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+    def run(self):
+        pass
+    @property
+    def blobs(self):
+        return [[np.zeros(100)]]
+
+class Fitter(object):
+    def loglikelihood(self, sim):
+        return -0.5 * sim.kwargs['x']**2
+
+pars = ['x']
+for freq in [0, 30.]:
+    for force_gc in [True, False]:
+        args = [prefix, pars, [False], Priors(), Priors(), [], {}, True,
+            Model, [Fitter()], False, freq, force_gc]
+
+        t1 = time.time()
+        for i in range(N):
+            loglikelihood(np.random.normal(size=1), *args)
+        t2 = time.time()
+
+        print("checkpoint_freq={}, force_gc={}: {:.3g} ms / evaluation".format(
+            freq, force_gc, 1e3 * (t2 - t1) / N))
+
+# Stop background writer before cleaning up.
+get_checkpoint_buffer(prefix, 30.).close()
+
+for fn in glob.glob('{}*'.format(prefix)):
+    os.remove(fn)
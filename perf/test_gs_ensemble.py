@@ -0,0 +1,47 @@
+"""
+
+test_gs_ensemble.py
+
+Description: Compare N global 21-cm models run one at a time to the same
+N models evolved in lock-step with Global21cmEnsemble.
+
+Usage: python test_gs_ensemble.py <number of models>
+
+"""
+
+import sys
+import time
+import ares
+import numpy as np
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+
+pars = \
+{
+ 'problem_type': 100,
+ 'cosmology_name': 'user',
+ 'load_ics': False,
+ 'initial_redshift': 30.,
+ 'final_redshift': 6.,
+ 'igm_initial_temperature': 30.,
+ 'igm_initial_ionization': [1.-2e-4, 2e-4, 1.-2e-4-1e-10, 2e-4, 1e-10],
+ 'pop_sfr_model': 'sfrd-func',
+ 'pop_sfrd': lambda z: 0.1 * np.exp(-(z - 6.) / 1.5),
+ 'progress_bar': False,
+ 'verbose': False,
+}
+
+yields = 2.6e39 * np.logspace(-1, 1, N)
+
+t1 = time.time()
+for i in range(N):
+    sim = ares.simulations.Global21cm(pop_rad_yield=yields[i], **pars)
+    sim.run()
+t2 = time.time()
+
+ens = ares.simulations.Global21cmEnsemble({'pop_rad_yield': yields}, **pars)
+ens.run()
+t3 = time.time()
+
+print("{} models, one at a time: {:.3g} s".format(N, t2 - t1))
+print("{} models, in lock-step:  {:.3g} s".format(N, t3 - t2))
@@ -0,0 +1,47 @@
+"""
+
+test_import_time.py
+
+Description: Time `import ares` (and touching a few sub-packages) in fresh
+interpreters, and check which heavy dependencies each one drags in.
+
+Usage: python test_import_time.py <number of trials>
+
+"""
+
+import sys
+import subprocess
+import numpy as np
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+heavy = ['matplotlib', 'scipy', 'h5py', 'mpi4py', 'sklearn']
+
+stmts = \
+[
+ 'import ares',
+ 'import ares; ares.util.ParameterFile',
+ 'import ares; ares.simulations.Global21cm',
+ 'import ares; ares.analysis.ModelSet',
+ 'import ares; ares.inference.ModelFit',
+]
+
+script = \
+"""
+import sys, time
+t1 = time.time()
+{}
+t2 = time.time()
+print(t2 - t1)
+print(' '.join([mod for mod in {} if mod in sys.modules]))
+"""
+
+for stmt in stmts:
+    times = []
+    for i in range(N):
+        out = subprocess.check_output([sys.executable, '-c',
+            script.format(stmt, heavy)]).decode().split('\n')
+        times.append(float(out[0]))
+
+    print("{:45s} {:.3g} s (min of {})  loaded: {}".format(stmt,
+        np.min(times), N, out[1] if out[1] else 'none'))
@@ -0,0 +1,82 @@
+"""
+
+test_pq_speed.py
+
+Description: Time evaluation of every type of ParameterizedQuantity on a
+(redshift, halo mass) grid, both for new inputs each time and for repeated
+inputs, which should be handled by the memoization in __call__.
+
+Usage: python test_pq_speed.py <number of calls>
+
+"""
+
+import sys
+import time
+import numpy as np
+from ares.phenom.ParameterizedQuantity import ParameterizedQuantity
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+z = np.linspace(5, 30, 100)
+Mh = np.logspace(7, 14, 1000)
+zz, MM = np.meshgrid(z, Mh, indexing='ij')
+
+# Function name, secondary variable (if any), parameters
+dpl = [0.05, 3e11, 0.6, -0.6, 1e10]
+funcs = \
+[
+ ('pl', None, [0.05, 1e10, 0.5]),
+ ('pl_10', None, [0.1, 1e10, 0.5]),
+ ('pl_evolN', '1+z', [0.05, 1e10, 0.5, 7., -1.]),
+ ('dpl', None, dpl),
+ ('dpl_arbnorm', None, dpl),
+ ('dplx', None, dpl + [1e9, 1., -1.]),
+ ('dpl_normP', None, dpl[0:4]),
+ ('dpl_evolN', '1+z', dpl + [7., -1.]),
+ ('dpl_evolP', '1+z', dpl + [7., -1.]),
+ ('dpl_evolNP', '1+z', dpl + [7., -1., 0.5]),
+ ('dpl_evolNPS', '1+z', dpl + [7., -1., 0.5, 0.1, 0.1]),
+ ('dpl_evolNPSF', '1+z', dpl + [7., -1., 0.5, 0.1, 0.1, 1e-4, 0.]),
+ ('exp', None, [0.05, 1e12, 0.5]),
+ ('exp-', None, [0.05, 1e12, 0.5]),
+ ('normal', None, [0.05, 1e10, 1e9]),
+ ('lognormal', None, [0.05, 10., 1.]),
+ ('pwpl', None, [0.05, 0.5, 0.05, -0.5, 1e11]),
+ ('ramp', None, [0.01, 1e9, 0.1, 1e12]),
+ ('logramp', None, [0.01, 9., 0.1, 12.]),
+ ('tanh_abs', None, [0.01, 0.1, 1e10, 1e9]),
+ ('tanh_rel', None, [1., 0.1, 1e10, 1e9]),
+ ('logtanh_abs', None, [0.01, 0.1, 10., 0.5]),
+ ('logtanh_rel', None, [1., 0.1, 10., 0.5]),
+ ('step_abs', None, [0.01, 0.1, 1e10]),
+ ('step_rel', None, [0.1, 0.1, 1e10]),
+ ('okamoto', None, [1., 1e9]),
+ ('okamoto_evol', '1+z', [1., 1e9, 7., 0., -1.5]),
+ ('schechter', None, [-3., 1e10, -1.5]),
+ ('plexp', None, [-3., 1e10, -1.5]),
+ ('schechter_evol', '1+z', [-3., 1e10, -1.5, 7., -0.1, 0., 0.]),
+ ('linear', None, [0.05, 1e10, 1e-12]),
+]
+
+print("{:<16} {:>12} {:>12}".format('pq_func', 'new [ms]', 'repeat [ms]'))
+for name, var2, args in funcs:
+    pars = {'pq_func': name, 'pq_func_var': 'Mh', 
+        'pq_val_ceil': 1., 'pq_val_floor': 0.}
+    if var2 is not None:
+        pars['pq_func_var2'] = var2
+    for i, arg in enumerate(args):
+        pars['pq_func_par{}'.format(i)] = arg
+
+    pq = ParameterizedQuantity(**pars)
+    
+    # Defeat memoization by perturbing the inputs
+    t1 = time.time()
+    for i in range(N):
+        pq(z=zz, Mh=MM * (1. + 1e-10 * i))
+    t2 = time.time()
+    for i in range(N):
+        pq(z=zz, Mh=MM)
+    t3 = time.time()
+    
+    print("{:<16} {:>12.3g} {:>12.3g}".format(name, 1e3 * (t2 - t1) / N, 
+        1e3 * (t3 - t2) / N))
@@ -0,0 +1,69 @@
+"""
+
+test_inference_async_sampler.py
+
+Description:
+
+"""
+
+import numpy as np
+from ares.util.MPIPool import LocalPool
+from ares.inference.AsyncEnsembleSampler import AsyncEnsembleSampler
+
+def lnprob(x, mu):
+    return -0.5 * np.sum((x - mu)**2), [np.sum(x)]
+
+def lnprob_bimodal(x):
+    lnp = np.logaddexp(-0.5 * np.sum((x - 4.)**2 / 0.1),
+        -0.5 * np.sum((x + 4.)**2 / 0.1))
+    return lnp, []
+
+def _run(sampler, p0, steps, seed=1):
+    sampler._random.seed(seed)
+    chain = []
+    for pos, prob, state, blobs in sampler.sample(p0, iterations=steps):
+        assert pos.shape == p0.shape
+        assert len(blobs) == p0.shape[0]
+        chain.append(pos)
+    return np.array(chain)
+
+def test(tol=0.25):
+
+    mu = np.array([1., -1.])
+    p0 = np.random.RandomState(0).normal(size=(8, 2))
+
+    pool = LocalPool(2)
+
+    # Synchronous updates should not depend on how models are farmed out.
+    chains = []
+    for _pool in [None, pool]:
+        sampler = AsyncEnsembleSampler(8, 2, lnprob, pool=_pool, args=[mu],
+            asynchronous=False)
+        chains.append(_run(sampler, p0, 100))
+
+    assert np.array_equal(chains[0], chains[1])
+
+    # Asynchronous updates: just check that we recover the right answer.
+    sampler = AsyncEnsembleSampler(8, 2, lnprob, pool=pool, args=[mu],
+        asynchronous=True)
+    chain = _run(sampler, p0, 1000)[200:].reshape(-1, 2)
+
+    assert np.allclose(chain.mean(axis=0), mu, atol=tol)
+    assert np.allclose(chain.std(axis=0), 1., atol=tol)
+    assert 0 < sampler.acceptance_fraction.mean() < 1
+
+    pool.stop()
+
+    # Parallel tempering should find both modes even though walkers
+    # start out in just one of them.
+    p0 = 4. + 0.1 * np.random.RandomState(0).normal(size=(8, 2))
+    sampler = AsyncEnsembleSampler(8, 2, lnprob_bimodal, ntemps=4, Tmax=200.)
+    chain = _run(sampler, p0, 1000)[200:]
+
+    frac = np.mean(chain[:,:,0] < 0)
+    assert 0.1 < frac < 0.9
+    assert np.all(sampler.tswap_acceptance_fraction > 0)
+
+if __name__ == '__main__':
+    test()
+
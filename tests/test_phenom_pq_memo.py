@@ -0,0 +1,80 @@
+"""
+
+test_phenom_pq_memo.py
+
+Description: Make sure repeated calls to a ParameterizedQuantity return
+the right answer (even if inputs were modified in place), and that nested
+quantities, ceilings, and floors behave.
+
+"""
+
+import numpy as np
+from ares.util import ParameterFile
+from ares.util.ParameterFile import get_pq_pars
+from ares.phenom.ParameterizedQuantity import ParameterizedQuantity
+
+def test():
+
+    z = np.linspace(5, 20, 16)
+    Mh = np.logspace(8, 13, 51)
+    zz, MM = np.meshgrid(z, Mh, indexing='ij')
+
+    pars = \
+    {
+     'pq_func': 'dpl_evolN',
+     'pq_func_var': 'Mh',
+     'pq_func_var2': '1+z',
+     'pq_func_par0': 0.05,
+     'pq_func_par1': 3e11,
+     'pq_func_par2': 0.6,
+     'pq_func_par3': -0.6,
+     'pq_func_par4': 1e10,
+     'pq_func_par5': 7.,
+     'pq_func_par6': -1.,
+     'pq_val_ceil': 0.1,
+    }
+
+    pq = ParameterizedQuantity(**pars)
+
+    y1 = pq(z=zz, Mh=MM)
+    y2 = pq(z=zz, Mh=MM)
+    assert np.array_equal(y1, y2)
+    assert y1.max() <= 0.1
+
+    # Results handed back shouldn't be tied to the cache
+    y2 *= 2
+    assert np.array_equal(pq(z=zz, Mh=MM), y1)
+
+    # Modifying inputs in place must not return stale results
+    MM *= 2
+    y3 = pq(z=zz, Mh=MM)
+    assert not np.array_equal(y3, y1)
+    assert np.array_equal(y3, ParameterizedQuantity(**pars)(z=zz, Mh=MM))
+
+    # Scalar redshifts are common too
+    for zi in z:
+        y = pq(z=zi, Mh=Mh)
+        assert np.array_equal(y, pq(z=zi, Mh=Mh))
+        assert y.shape == Mh.shape
+
+    # Nested PQ: power-law whose slope is itself a PQ
+    pf = ParameterFile(**{'pop_fstar': 'pq[0]',
+        'pq_func[0]': 'pl', 'pq_func_var[0]': 'Mh',
+        'pq_func_par0[0]': 0.05, 'pq_func_par1[0]': 1e10,
+        'pq_func_par2[0]': 'pq[1]',
+        'pq_func[1]': 'linear', 'pq_func_var[1]': 'z',
+        'pq_func_par0[1]': 0.5, 'pq_func_par1[1]': 10.,
+        'pq_func_par2[1]': -0.1,
+        'pq_val_floor[0]': 0., 'pq_val_ceil[0]': 'pq[2]',
+        'pq_func[2]': 'pl', 'pq_func_var[2]': 'Mh',
+        'pq_func_par0[2]': 0.1, 'pq_func_par1[2]': 1e10,
+        'pq_func_par2[2]': 0.})
+
+    pq = ParameterizedQuantity(raw_pf=pf, **get_pq_pars('pq[0]', pf))
+
+    slope = 0.5 - 0.1 * (zz - 10.)
+    assert np.allclose(pq(z=zz, Mh=MM), 
+        np.minimum(0.05 * (MM / 1e10)**slope, 0.1))
+
+if __name__ == '__main__':
+    test()
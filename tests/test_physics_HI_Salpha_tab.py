@@ -0,0 +1,44 @@
+"""
+
+test_physics_HI_Salpha_tab.py
+
+Description: Make sure the tabulated Furlanetto & Pritchard (2006) S_alpha
+agrees with the exact solution to within the requested tolerance, for 
+scalars and arrays, including values of alpha that fall outside the table.
+
+"""
+
+import ares
+import numpy as np
+
+def test():
+    
+    rng = np.random.RandomState(42)
+    
+    N = 1000
+    z = rng.uniform(6, 35, N)
+    Tk = 10**rng.uniform(-0.5, 4.5, N)
+    xHII = 10**rng.uniform(-5, -0.01, N)
+    
+    for tol in [1e-4, 1e-6]:
+        h0 = ares.physics.Hydrogen(cosmology_name='user', approx_Salpha=3)
+        h1 = ares.physics.Hydrogen(cosmology_name='user', approx_Salpha=3,
+            approx_Salpha_tab=True, approx_Salpha_tol=tol)
+    
+        S0 = h0.Sa(z, Tk, xHII)
+        S1 = h1.Sa(z, Tk, xHII)
+        
+        assert S1.shape == S0.shape
+        assert np.all(np.abs(S1 - S0) <= tol)
+        
+        # Scalar inputs, in and out of the table (S_alpha -> 0 at low Tk)
+        for T in [0.2, 10., 1e3]:
+            assert abs(h1.Sa(20., T) - h0.Sa(20., T)) <= tol
+            
+        # Spin temperature should barely notice 
+        Ts0 = h0.SpinTemperature(z, Tk, 1e-20, xHII, 0.)
+        Ts1 = h1.SpinTemperature(z, Tk, 1e-20, xHII, 0.)
+        assert np.allclose(Ts0, Ts1, rtol=1e2 * tol)
+        
+if __name__ == '__main__':
+    test()
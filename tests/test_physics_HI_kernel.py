@@ -0,0 +1,73 @@
+"""
+
+test_physics_HI_kernel.py
+
+Description: Make sure the one-pass spin temperature kernel agrees with the
+individual coupling coefficient routines, and that the Hirata (2006) 
+solution is self-consistent, for arrays of inputs.
+
+"""
+
+import ares
+import numpy as np
+from scipy.optimize import fsolve
+
+def test():
+    
+    rng = np.random.RandomState(42)
+    
+    N = 100
+    z = rng.uniform(6, 35, N)
+    Tk = 10**rng.uniform(0.3, 4, N)
+    Ja = 10**rng.uniform(-25, -17, N)
+    xHII = 10**rng.uniform(-4, -0.5, N)
+    ne = 1e-7 * (1. + z)**3 * xHII
+    
+    for approx in [1, 2, 3, 3.5]:
+        hydr = ares.physics.Hydrogen(cosmology_name='user', 
+            approx_Salpha=approx)
+    
+        kern = hydr.SpinTemperatureKernel(z, Tk, Ja, xHII, ne)
+        
+        xc = hydr.CollisionalCouplingCoefficient(z, Tk, xHII, ne)
+        xa = hydr.RadiativeCouplingCoefficient(z, Ja, Tk, xHII)
+        Ts = (1. + xc + xa) / (1. / hydr.cosm.TCMB(z) + (xc + xa) / Tk)
+    
+        assert np.allclose(kern['xc'], xc, rtol=1e-12)
+        assert np.allclose(kern['xa'], xa, rtol=1e-12)
+        assert np.allclose(kern['Ts'], Ts, rtol=1e-12)
+        assert np.allclose(hydr.SpinTemperature(z, Tk, Ja, xHII, ne), Ts)
+        
+        # Scalars should work too
+        Ts0 = hydr.SpinTemperature(z[0], Tk[0], Ja[0], xHII[0], ne[0])
+        assert np.allclose(Ts0, Ts[0])
+    
+    # Hirata (2006): compare closed-form solution to brute force
+    hydr = ares.physics.Hydrogen(cosmology_name='user', approx_Salpha=4)
+    Tr = rng.uniform(0, 50, N)
+    xa, Sa, Ts = hydr.RadiativeCouplingCoefficient(z, Ja, Tk, xHII, Tr, ne)
+    
+    for i in range(0, N, 10):
+        Tcmb = hydr.cosm.TCMB(z[i]) 
+        xi = (1e-7 * hydr.tauGP(z[i], xHII=xHII[i]))**(1./3.) \
+            * Tk[i]**(-2./3.)
+        a = lambda T: 1. - 0.0631789 / Tk[i] + 0.115995 / Tk[i]**2 \
+            - 0.401403 / T / Tk[i] + 0.336463 / T / Tk[i]**2
+        b = 1. + 2.98394 * xi + 1.53583 * xi**2 + 3.85289 * xi**3
+        xc = hydr.CollisionalCouplingCoefficient(z[i], Tk[i], xHII[i], ne[i], 
+            Tr[i])
+        xa_ = lambda T: hydr.xalpha_tilde(z[i]) * a(T) / b * Ja[i]
+        Tc_inv = lambda T: 1. / Tk[i] + 0.405535 * (1. / T - 1. / Tk[i]) \
+            / Tk[i]
+        Ts_inv = lambda T: (1. / (Tcmb + Tr[i]) + xa_(T) * Tc_inv(T) \
+            + xc / Tk[i]) / (1. + xa_(T) + xc)
+        
+        T = fsolve(lambda T: np.abs(T * Ts_inv(T) - 1.), Tcmb, 
+            epsfcn=1e-3)[0]
+        
+        assert np.allclose(Ts[i], T, rtol=1e-6)
+        assert np.allclose(Sa[i], a(T) / b, rtol=1e-6)
+        assert np.allclose(xa[i], xa_(T), rtol=1e-6)
+    
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,71 @@
+"""
+
+test_physics_secondary_elec_lookup.py
+
+Description: Check vectorized lookup of Furlanetto & Stoever (2010) style 
+deposition fractions against the underlying splines. Use made-up tables 
+so we don't need the real ones.
+
+"""
+
+import ares
+import numpy as np
+
+def test():
+
+    esec = ares.physics.SecondaryElectrons(method=0)
+    esec.method = 3
+    
+    # Smooth, fake tables on FS10-like grids
+    esec.E = np.logspace(1, 4, 258)
+    esec._x = np.array([1.0e-4, 2.318e-4, 4.677e-4, 1.0e-3, 2.318e-3, 
+        4.677e-3, 1.0e-2, 2.318e-2, 4.677e-2, 1.0e-1, 0.5, 0.9, 0.99, 0.999])
+    esec._logx = np.log10(esec._x)
+    
+    E, x = np.meshgrid(esec.E, esec._x, indexing='ij')
+    esec.fh_tab = 0.15 + 0.85 * x**0.3
+    esec.fionHI_tab = 0.4 * (1. - x**0.4) * (1. - np.exp(-E / 50.))
+    esec.fionHeI_tab = 0.05 * (1. - x**0.4) * (1. - np.exp(-E / 80.))
+    esec.fionHeII_tab = 1e-3 * (1. - x) * (1. - np.exp(-E / 200.))
+    esec.fexc_tab = 0.45 * (1. - x**0.3) * (1. - np.exp(-E / 30.))
+    esec.flya_tab = 0.8 * esec.fexc_tab
+    
+    esec._setup_splines()
+    esec._setup_lookup()
+    
+    # Arrays of both energy and ionized fraction at once
+    EE = np.logspace(1.2, 3.8, 20)[:,None]
+    xx = np.logspace(-3.5, -0.1, 15)[None,:]
+    
+    fall = esec.AllDepositionFractions(xx, E=EE)
+    
+    splines = {'heat': esec.fh, 'h_1': esec.fHI, 'he_1': esec.fHeI, 
+        'he_2': esec.fHeII, 'lya': esec.flya, 'exc': esec.fexc}
+        
+    for channel, spl in splines.items():
+        assert fall[channel].shape == (20, 15)
+        assert np.allclose(fall[channel], spl(EE.ravel(), xx.ravel()), 
+            atol=1e-3), channel
+            
+        # Single channel, scalar x, as used by callers in ares
+        f = esec.DepositionFraction(0.01, E=EE.ravel(), channel=channel)
+        assert np.allclose(f, spl(EE.ravel(), 0.01).ravel(), atol=1e-3)
+        
+    # Outside tabulated range, pin to boundary
+    f = esec.DepositionFraction(np.array([1e-8, 1.]), E=1e6, channel='heat')
+    assert np.allclose(f, esec.fh(esec.E[-1], esec._x[[0,-1]]).ravel())
+
+    # Secondary ionization integrals only for photon-conserving tables
+    tab = ares.static.IntegralTable.__new__(ares.static.IntegralTable)
+    tab.pf = {'tables_discrete_gen': False, 'photon_conserving': False}
+    tab.E_th = {'h_1': 13.6}
+    for func in [tab.PhiWiggle, tab.PsiWiggle]:
+        try:
+            func(np.zeros(1), 'h_1', 'h_1', x=0.01)
+        except NotImplementedError:
+            pass
+        else:
+            raise AssertionError('Should have raised NotImplementedError!')
+    
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,101 @@
+"""
+
+test_populations_ensemble_catalog.py
+
+Description: Make sure catalogs written block by block (in serial or in
+parallel) contain the same properties, spectra, and photometry as we get
+by processing all galaxies at once.
+
+"""
+
+import os
+import ares
+import h5py
+import shutil
+import tempfile
+import numpy as np
+from ares.physics.Constants import s_per_myr
+
+def test():
+
+    pars = ares.util.ParameterBundle('mirocha2020:univ')
+    pars['pop_sed'] = 'sps-toy'
+    pars['pop_dust_yield'] = 0
+    pars['pop_dlam'] = 10.
+    pars['pop_Emin'] = 1.
+    pars['pop_thin_hist'] = 0
+    pars['pop_scatter_mar'] = 0
+    pars['pop_Tmin'] = None # So we don't have to read in HMF table for Mmin
+    pars['pop_Mmin'] = 1e8
+    pars['pop_synth_minimal'] = False
+    pars['pop_sed_degrade'] = None
+    pars['tau_clumpy'] = None
+    pars['cosmology_name'] = 'user'
+    pars['verbose'] = False
+    pars['progress_bar'] = False
+
+    cosm = ares.physics.Cosmology(cosmology_name='user')
+
+    # Toy halo histories
+    Nh = 250
+    zarr = np.arange(4, 20.01, 0.25)
+    tarr = np.array([cosm.t_of_z(z) for z in zarr]) / s_per_myr
+
+    rs = np.random.RandomState(0)
+    Mh = 10**rs.uniform(9, 12, Nh)[:,None] * np.exp(-0.7 * (zarr - 4))
+    MAR = 3e-5 * Mh * ((1. + zarr) / 7.)**2.5
+    nh = 10**rs.uniform(-5, -2, size=Mh.shape)
+
+    pars['pop_histories'] = {'z': zarr, 't': tarr, 'Mh': Mh, 'MAR': MAR,
+        'nh': nh}
+
+    pop = ares.populations.GalaxyPopulation(**pars)
+
+    waves = np.arange(900., 3000., 20.)
+    windows = [(1300, 1400), (1500, 1600), (2000, 2200)]
+
+    path = tempfile.mkdtemp()
+
+    try:
+        fn1 = pop.SaveCatalog('{}/serial'.format(path), redshifts=[5., 6.],
+            waves=waves, cam='windows', filters=windows, chunk=100)
+        fn2 = pop.SaveCatalog('{}/parallel'.format(path), redshifts=[5., 6.],
+            waves=waves, cam='windows', filters=windows, chunk=100, nprocs=2)
+
+        hist = pop.histories
+        with h5py.File(fn1, 'r') as f1, h5py.File(fn2, 'r') as f2:
+            assert np.allclose(f1['wave'][()], waves)
+
+            for z in [5., 6.]:
+                g1 = f1['z={}'.format(hist['z'][np.argmin(np.abs(z - hist['z']))])]
+                g2 = f2[g1.name]
+
+                assert set(g1.keys()) == set(g2.keys())
+                for key in g1.keys():
+                    assert np.array_equal(g1[key][()], g2[key][()]), key
+
+                zobs = float(g1.name.split('=')[1])
+                iz = np.argmin(np.abs(zobs - hist['z']))
+                assert np.allclose(g1['Ms'][()], hist['Ms'][:,iz])
+
+                spec = pop.synth.Spectrum(waves, sfh=hist['SFR'],
+                    zarr=hist['z'], zobs=zobs, hist=hist, load=False)
+                assert np.allclose(g1['spec'][()], spec)
+
+                phot = pop.synth.Photometry(zobs=zobs, sfh=hist['SFR'],
+                    zarr=hist['z'], tarr=hist['t'], hist=hist, waves=waves,
+                    cam='windows', filters=windows)
+                assert g1['mags'].shape == (Nh, len(windows))
+                assert np.allclose(g1['mags'][()], phot[3].T)
+
+        # Won't overwrite by accident
+        try:
+            pop.SaveCatalog('{}/serial'.format(path), redshifts=[5.])
+            raise AssertionError('Should have refused to overwrite!')
+        except IOError:
+            pass
+    finally:
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    test()
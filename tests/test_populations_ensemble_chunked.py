@@ -0,0 +1,131 @@
+"""
+
+test_populations_ensemble_chunked.py
+
+Description: Make sure streaming halos from disk in blocks gives the same
+SMF, LF, and SFRD as processing them all at once. Uses toy halo histories
+and a toy SPS model so we don't need any lookup tables.
+
+"""
+
+import os
+import ares
+import h5py
+import shutil
+import tempfile
+import numpy as np
+from ares.physics.Constants import s_per_myr
+from ares.inference.FitGalaxyPopulation import loglikelihood
+
+def test():
+
+    pars = ares.util.ParameterBundle('mirocha2020:univ')
+    pars['pop_sed'] = 'sps-toy'
+    pars['pop_dust_yield'] = 0
+    pars['pop_dlam'] = 10.
+    pars['pop_Emin'] = 1.
+    pars['pop_thin_hist'] = 0
+    pars['pop_scatter_mar'] = 0
+    pars['pop_Tmin'] = None # So we don't have to read in HMF table for Mmin
+    pars['pop_Mmin'] = 1e8
+    pars['pop_synth_minimal'] = False
+    pars['pop_sed_degrade'] = None
+    pars['tau_clumpy'] = None
+    pars['cosmology_name'] = 'user'
+    pars['verbose'] = False
+    pars['progress_bar'] = False
+
+    cosm = ares.physics.Cosmology(cosmology_name='user')
+
+    # Toy halo catalog
+    Nh = 1000
+    zarr = np.arange(4, 20.01, 0.25)
+    tarr = np.array([cosm.t_of_z(z) for z in zarr]) / s_per_myr
+
+    rs = np.random.RandomState(0)
+    Mh = 10**rs.uniform(9, 12, Nh)[:,None] * np.exp(-0.7 * (zarr - 4))
+    MAR = 3e-5 * Mh * ((1. + zarr) / 7.)**2.5
+    nh = 10**rs.uniform(-5, -2, size=Mh.shape)
+
+    path = tempfile.mkdtemp()
+    fn = '{}/hgh.hdf5'.format(path)
+
+    try:
+        with h5py.File(fn, 'w') as f:
+            for key, val in [('Mh', Mh), ('MAR', MAR), ('nh', nh),
+                ('z', zarr), ('t', tarr)]:
+                f.create_dataset(key, data=val)
+
+        pars['pop_histories'] = fn
+
+        pop1 = ares.populations.GalaxyPopulation(**pars)
+
+        pars['pop_hist_chunk'] = 300
+        pop2 = ares.populations.GalaxyPopulation(**pars)
+
+        assert pop2._num_halos == Nh
+
+        Ms = np.arange(6, 12, 0.5)
+        MUV = np.arange(-25, -10, 0.5)
+        for z in [5., 6.]:
+            smf1 = pop1.StellarMassFunction(z, bins=Ms)
+            smf2 = pop2.StellarMassFunction(z, bins=Ms)
+            assert np.allclose(smf1, smf2)
+
+            lf1 = pop1.LuminosityFunction(z, MUV)
+            lf2 = pop2.LuminosityFunction(z, MUV)
+            assert np.allclose(lf1, lf2)
+
+        assert np.allclose(pop1.SFRD(zarr), pop2.SFRD(zarr))
+
+        # Only one block at a time, and none left behind at the end.
+        assert not hasattr(pop2, '_histories')
+        
+        # Everything at once: should take just one pass through the catalog
+        pop3 = ares.populations.GalaxyPopulation(**pars)
+        
+        passes = []
+        _gen = pop3._gen_halo_histories
+        def _gen_halo_histories(rows=None):
+            if (rows is not None) and (rows.start == 0):
+                passes.append(1)
+            return _gen(rows=rows)
+        pop3._gen_halo_histories = _gen_halo_histories
+        
+        pop3.RunSAMChunked(zsmf=[5., 6.], zlf=[5., 6.], Msbins=Ms)
+        for z in [5., 6.]:
+            assert np.allclose(pop3.StellarMassFunction(z, bins=Ms), 
+                pop2.StellarMassFunction(z, bins=Ms))
+            assert np.allclose(pop3.LuminosityFunction(z, MUV), 
+                pop2.LuminosityFunction(z, MUV))
+        assert np.allclose(pop3.SFRD(zarr), pop2.SFRD(zarr))
+        assert len(passes) == 1
+        
+        # Same deal when called by the likelihood
+        pop4 = ares.populations.GalaxyPopulation(**pars)
+        del passes[:]
+        _gen4 = pop4._gen_halo_histories
+        def _gen_halo_histories(rows=None):
+            if (rows is not None) and (rows.start == 0):
+                passes.append(1)
+            return _gen4(rows=rows)
+        pop4._gen_halo_histories = _gen_halo_histories
+        
+        like = loglikelihood([1e8, 1e9, 1e9, -20., -18., -19.], 
+            np.ones(6), np.ones(6))
+        like.metadata = ['smf', 'smf', 'smf', 'lf', 'lf', 'lf']
+        like.redshifts = [5., 5., 6., 5., 6., 6.]
+        lnL = like(pop4)
+        assert np.isfinite(lnL)
+        assert len(passes) == 1
+        
+        # LFs for different windows or bands are cached separately (can't
+        # compute those with the toy SPS model, so just check the cache).
+        assert pop3._cache_lf(5., MUV, wave=1600.) is not None
+        assert pop3._cache_lf(5., MUV, wave=1600., window=3) is None
+        assert pop3._cache_lf(5., MUV, wave=1600., band=(1500, 1700)) is None
+    finally:
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    test()
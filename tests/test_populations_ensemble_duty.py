@@ -0,0 +1,60 @@
+"""
+
+test_populations_ensemble_duty.py
+
+Description: Check that vectorized burst generation hits the target duty
+cycles, is reproducible, and agrees with adding one burst at a time.
+
+"""
+
+import numpy as np
+from ares.populations.GalaxyEnsemble import _burst_mask
+
+def test():
+
+    Nh, Nt, i_on = 2000, 300, 7
+    fduty = np.random.RandomState(1).uniform(0.05, 0.95, size=Nh)
+    fduty[0:10] = 1.
+    active = np.ones(Nh, dtype=bool)
+    active[-10:] = False
+
+    on1 = _burst_mask(np.random.default_rng(42), fduty, i_on, Nt, active)
+    on2 = _burst_mask(np.random.default_rng(42), fduty, i_on, Nt, active)
+    assert np.array_equal(on1, on2)
+
+    frac = on1.sum(axis=1) / float(Nt)
+    assert np.all(on1[0:10])
+    assert not np.any(on1[-10:])
+
+    # Never short of target, and never overshoot by more than one burst.
+    assert np.all(frac[active] >= fduty[active])
+    assert np.all(frac[active] < fduty[active] + i_on / float(Nt))
+
+    # Compare to brute force, i.e., one burst at a time.
+    rng = np.random.default_rng(0)
+    ref = np.zeros_like(on1)
+    for i in range(Nh):
+        if not active[i]:
+            continue
+        if fduty[i] >= 1:
+            ref[i] = True
+            continue
+        while ref[i].sum() / float(Nt) < fduty[i]:
+            j = rng.integers(0, Nt)
+            ref[i,j:j+i_on] = True
+
+    # Mean overshoot, number of bursts, and where bursts land should agree.
+    d1 = frac[active] - fduty[active]
+    d2 = ref[active].sum(axis=1) / float(Nt) - fduty[active]
+    assert abs(np.mean(d1) - np.mean(d2)) < 0.002
+
+    n1 = np.sum(np.diff(on1[active].astype(int), axis=1) == 1)
+    n2 = np.sum(np.diff(ref[active].astype(int), axis=1) == 1)
+    assert abs(n1 - n2) < 0.02 * n2
+
+    p1 = np.mean(on1[active], axis=0)
+    p2 = np.mean(ref[active], axis=0)
+    assert np.allclose(p1, p2, atol=0.05)
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,232 @@
+"""
+
+test_populations_ensemble_stochastic.py
+
+Description: Check batched cluster-by-cluster star formation on some toy
+halos, i.e., no need for HMF tables or stellar tracks.
+
+"""
+
+import numpy as np
+from scipy.stats import ks_2samp
+from scipy.integrate import cumtrapz
+from ares.util.MPIPool import LocalPool
+from ares.util.ParameterFile import ParameterFile
+from ares.populations.GalaxyEnsemble import GalaxyEnsemble, \
+    _evolve_stochastic, _form_clusters, _draw_massive_stars
+
+Nh, Nt = 40, 30
+t = np.linspace(200., 1200., Nt)
+z = np.linspace(15., 5., Nt)
+
+def toy_kernel():
+    # Cluster mass function and exponential SN delay time distribution
+    Mcl = np.logspace(-1, 8, 1000)
+    mf = (Mcl / 50.)**-2 * np.exp(-50. / Mcl) * Mcl
+    cdf = cumtrapz(mf, x=np.log10(Mcl), initial=0.)
+    p_delay = []
+    for i in range(Nt):
+        p = np.exp(-(t[i:] - t[i]) / 30.)
+        p /= p.sum()
+        if p.size == 1:
+            p_delay.append((1., None))
+        else:
+            p_delay.append((p[0], p[1:] / p[1:].sum()))
+
+    kern = {'fb': 0.19, 'fstar': 0.1, 'coupling_sne': 0.1,
+        'coupling_rad': 0.1, 'delay_sne': 2, 'feedback_rad': False,
+        'force_eq': np.inf, 'multiphase': False, 'sample_imf': True,
+        'cl_M': Mcl, 'cl_cdf': cdf / cdf[-1],
+        'Mcl_avg': np.trapz(mf * Mcl, x=np.log10(Mcl)) / cdf[-1],
+        'nsn_per_m': 0.01, 'm_avg': 0.35, 'p_massive': 0.003,
+        't': t, 'z': z, 'zstop': 0, 'p_delay': p_delay}
+
+    return kern
+
+class ToyHalos(object):
+    def EscapeVelocity(self, z, M):
+        return 1e6 * (M / 1e8)**(1. / 3.)
+
+    def BindingEnergy(self, z, M):
+        return 1e52 * (M / 1e8)**(5. / 3.)
+
+class ToyEnsemble(GalaxyEnsemble):
+    """
+    Just enough of a GalaxyEnsemble to run `_gen_stochastic_histories`.
+    """
+    def __init__(self, **kwargs):
+        self.pf = ParameterFile(**kwargs)
+        self._halos = ToyHalos()
+        self._stochastic_kernel_ = toy_kernel()
+
+    def _sn_delay_probs(self, t):
+        return self._stochastic_kernel_['p_delay']
+
+def toy_halos(M0):
+    """
+    Halo histories in order of *ascending redshift*, as they would come out
+    of `_gen_halo_histories`.
+    """
+    Mh = M0[:,None] * np.exp((t[None,:] - t[0]) / 400.)
+    MAR = np.gradient(Mh, t * 1e6, axis=1)
+
+    halos = {'z': z[-1::-1], 't': t[-1::-1], 'Mh': Mh[:,-1::-1],
+        'MAR': MAR[:,-1::-1], 'nh': np.ones_like(Mh), 'zthin': z[-1::-1]}
+
+    return halos
+
+def _test_block_seeds():
+
+    pop = ToyEnsemble(pop_sample_seed=42, pop_sample_chunk=10)
+
+    halos = toy_halos(1e8 * np.ones(20))
+
+    # Same halos in two blocks streamed from disk: need different draws.
+    pop._chunk_id = 0
+    hist0 = pop._gen_stochastic_histories(halos)
+    pop._chunk_id = 1
+    hist1 = pop._gen_stochastic_histories(halos)
+
+    assert np.any(hist0['SFR'] > 0)
+    assert not np.array_equal(hist0['SFR'], hist1['SFR'])
+    assert not np.array_equal(hist0['Nsn'], hist1['Nsn'])
+
+    # ...but still reproducible.
+    hist1b = pop._gen_stochastic_histories(halos)
+    assert np.array_equal(hist1['SFR'], hist1b['SFR'])
+
+def _test_chunk_size():
+
+    halos = toy_halos(1e8 * np.ones(400))
+
+    hist = {}
+    for chunk in [10, 40]:
+        for nprocs in [1, 2]:
+            pop = ToyEnsemble(pop_sample_seed=42, pop_sample_chunk=chunk,
+                pop_sample_nprocs=nprocs)
+            hist[(chunk, nprocs)] = pop._gen_stochastic_histories(halos)
+
+    # Processors don't matter, chunk size does (but only by chance).
+    for chunk in [10, 40]:
+        assert np.array_equal(hist[(chunk, 1)]['Ms'], hist[(chunk, 2)]['Ms'])
+
+    Ms1 = hist[(10, 1)]['Ms'][:,-1]
+    Ms2 = hist[(40, 1)]['Ms'][:,-1]
+
+    assert not np.array_equal(Ms1, Ms2)
+
+    # Halos are identical, so final stellar masses should be drawn from
+    # the same distribution either way.
+    assert ks_2samp(Ms1, Ms2).pvalue > 0.01
+
+def _test_get_history():
+
+    pop = ToyEnsemble(pop_sample_seed=42, pop_dust_yield=0.4,
+        pop_enrichment=True)
+
+    halos = toy_halos(1e8 * np.ones(5))
+    halos['rand'] = np.random.rand(*halos['Mh'].shape)
+
+    hist = pop._gen_stochastic_histories(halos)
+
+    # Same shape as everything else, even if we don't evolve them yet.
+    for key in ['MZ', 'Md', 'Sd', 'Z']:
+        assert hist[key].shape == hist['Mh'].shape, key
+
+    pop.histories = hist
+    for i in range(5):
+        gal = pop.get_history(i)
+        assert gal['Sd'].shape == gal['Z'].shape == gal['Mh'].shape
+
+def _test_parallel():
+
+    M0 = 10**np.random.RandomState(0).uniform(7, 9, size=Nh)
+    Mh = M0[:,None] * np.exp((t[None,:] - t[0]) / 400.)
+    Mh[0:Nh//4,0:10] = 0
+    MAR = np.gradient(Mh, t * 1e6, axis=1)
+    vesc = 1e6 * (Mh / 1e8)**(1. / 3.)
+    Eh = 1e52 * (Mh / 1e8)**(5. / 3.)
+
+    kern = toy_kernel()
+
+    chunk = 10
+    seeds = np.random.SeedSequence(42).spawn(Nh // chunk)
+    args = [(Mh[k*chunk:(k+1)*chunk], MAR[k*chunk:(k+1)*chunk],
+        vesc[k*chunk:(k+1)*chunk], Eh[k*chunk:(k+1)*chunk], seeds[k], kern) \
+        for k in range(Nh // chunk)]
+
+    # Results shouldn't depend on how chunks are farmed out.
+    serial = [_evolve_stochastic(arg) for arg in args]
+
+    pool = LocalPool(2)
+    parallel = pool.map(_evolve_stochastic, args)
+    pool.stop()
+
+    for res1, res2 in zip(serial, parallel):
+        for key in res1:
+            assert np.array_equal(res1[key], res2[key]), key
+
+    Ms = np.concatenate([res['Ms'] for res in serial])
+    SFR = np.concatenate([res['SFR'] for res in serial])
+
+    # Sane stellar masses: non-decreasing, no stars before halos exist,
+    # and no more stars than the baryons ever accreted.
+    assert np.all(np.diff(Ms, axis=1) >= 0)
+    assert np.all(SFR[Mh == 0] == 0)
+    assert np.all(Ms[:,-1] > 0)
+    assert np.all(Ms[:,-1] <= kern['fb'] * Mh[:,-1])
+
+def _test_nonfinite():
+
+    kern = toy_kernel()
+    rng = np.random.default_rng(0)
+
+    # Junk (e.g., from Mh=0) shouldn't hang us up, or form any stars.
+    Mg = np.array([1e7, np.nan, np.inf, 1e7, 1e7])
+    vesc = np.array([1e6, 1e6, 1e6, 0., np.nan])
+    N_SN_p = np.zeros(5)
+
+    Ms, Mw, N_now, N_fut = _form_clusters(rng, kern, Mg, N_SN_p, vesc,
+        10., 0.5)
+
+    assert Ms[0] > 0
+    assert np.all(Ms[1:] == 0) and np.all(Mw[1:] == 0)
+    assert np.all(N_now[1:] == 0) and np.all(N_fut[1:] == 0)
+
+def _test_sample_imf():
+
+    # Salpeter IMF from 0.1 to 100 Msun, tabulated like SynthesisModelSBS
+    Ms = np.logspace(-1, 2, 2000)
+    norm = (0.1**-1.35 - 100.**-1.35) / 1.35
+    cdf = 1. - (Ms**-1.35 - 100.**-1.35) / 1.35 / norm
+
+    kern = {'sample_imf': True, 'm_avg': np.trapz(Ms, x=cdf),
+        'p_massive': 1. - np.interp(8., Ms, cdf)}
+
+    # The old cluster-by-cluster loop: draw stars until we reach Mc.
+    rs = np.random.RandomState(1)
+    def draw_old(Mc):
+        r2 = np.interp(rs.rand(int(3 * Mc / kern['m_avg']) + 100), cdf, Ms)
+        m2 = np.cumsum(r2)
+        cut = np.argmin(np.abs(m2 - Mc)) + 1
+        return np.sum(r2[0:cut+1] >= 8.)
+
+    rng = np.random.default_rng(2)
+    for Mc in [1e2, 1e3]:
+        ref = np.array([draw_old(Mc) for i in range(2000)])
+        N_MS = _draw_massive_stars(rng, kern, Mc * np.ones(100000))
+
+        # Same mean number of SNe, a bit more scatter (see docstring).
+        assert abs(N_MS.mean() / ref.mean() - 1.) < 0.03, Mc
+        assert 1. < N_MS.var() / ref.var() < 1.5, Mc
+
+def test():
+    _test_parallel()
+    _test_block_seeds()
+    _test_chunk_size()
+    _test_nonfinite()
+    _test_sample_imf()
+    _test_get_history()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,76 @@
+"""
+
+test_simulations_gs_ensemble.py
+
+Description: Make sure models evolved in lock-step match those run one at a
+time. Use a toy SFRD and user-supplied cosmology so we don't need any lookup
+tables.
+
+"""
+
+import ares
+import numpy as np
+
+def test():
+
+    pars = \
+    {
+     'problem_type': 100,
+     'cosmology_name': 'user',
+     'load_ics': False,
+     'initial_redshift': 30.,
+     'final_redshift': 8.,
+     'igm_initial_temperature': 30.,
+     'igm_initial_ionization': [1.-2e-4, 2e-4, 1.-2e-4-1e-10, 2e-4, 1e-10],
+     'pop_sfr_model': 'sfrd-func',
+     'pop_sfrd': lambda z: 0.1 * np.exp(-(z - 6.) / 1.5),
+     'progress_bar': False,
+     'verbose': False,
+    }
+
+    fX = [0.2, 5.]
+
+    ens = ares.simulations.Global21cmEnsemble(
+        {'pop_rad_yield': 2.6e39 * np.array(fX)}, **pars)
+    ens.run()
+
+    assert len(ens.histories) == len(fX)
+
+    zarr = np.linspace(9, 29, 41)
+    for i, f in enumerate(fX):
+        sim = ares.simulations.Global21cm(pop_rad_yield=2.6e39 * f, **pars)
+        sim.run()
+
+        hist1 = sim.history
+        hist2 = ens.histories[i]
+
+        assert set(hist1.keys()) == set(hist2.keys())
+        assert hist2['z'][-1] >= pars['final_redshift']
+
+        # Time-steps won't be identical, so just demand close agreement.
+        for key in ['igm_Tk', 'igm_h_2', 'Ts']:
+            val1 = np.interp(zarr, hist1['z'][-1::-1], hist1[key][-1::-1])
+            val2 = np.interp(zarr, hist2['z'][-1::-1], hist2[key][-1::-1])
+            assert np.allclose(val1, val2, rtol=1e-2), key
+
+    # Can't mix models with different gas physics
+    try:
+        bad = ares.simulations.Global21cmEnsemble(
+            [{'omega_b_0': 0.04}, {'omega_b_0': 0.05}], **pars)
+        bad.sims
+        raise AssertionError('Should have complained about omega_b_0!')
+    except ValueError:
+        pass
+
+    # Nor models without an IGM
+    try:
+        bad = ares.simulations.Global21cmEnsemble(
+            {'pop_rad_yield': 2.6e39 * np.array(fX)}, include_igm=False,
+            **pars)
+        bad.sims
+        raise AssertionError('Should have complained about include_igm!')
+    except ValueError:
+        pass
+
+if __name__ == '__main__':
+    test()
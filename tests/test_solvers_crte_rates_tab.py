@@ -0,0 +1,95 @@
+"""
+
+test_solvers_crte_rates_tab.py
+
+Description: Make sure rate coefficients tabulated for all redshifts at once
+match those computed one redshift at a time, including when we're forced to
+fall back on the latter.
+
+"""
+
+import ares
+import numpy as np
+
+pars = \
+{
+ 'pop_sfr_model': 'sfrd-func',
+ 'pop_type': 'galaxy',
+ 'pop_sfrd': lambda z: 0.1 * (1. + z)**-6.,
+ 'pop_sfrd_units': 'msun/yr/mpc^3',
+ 'pop_sed': 'pl',
+ 'pop_alpha': -1.5,
+ 'pop_Emin': 2e2,
+ 'pop_Emax': 3e4,
+ 'pop_EminNorm': 5e2,
+ 'pop_EmaxNorm': 8e3,
+ 'pop_solve_rte': True,
+ 'pop_ion_src_cgm': False,
+ 'pop_ion_src_igm': True,
+ 'pop_heat_src_igm': True,
+
+ 'tau_approx': True,
+ 'tau_redshift_bins': 100,
+ 'initial_redshift': 30.,
+ 'final_redshift': 10.,
+
+ 'cosmology_name': 'user',
+ 'load_ics': False,
+ 'igm_initial_temperature': 30.,
+ 'igm_initial_ionization': [1.-2e-4, 2e-4, 1.-2e-4-1e-10, 2e-4, 1e-10],
+ 'include_He': True,
+ 'approx_He': False,
+ 'secondary_ionization': 1,
+}
+
+def test():
+
+    # Second time through, fix the fraction of photo-electron energy
+    # deposited as heat.
+    for fXh in [None, 0.2]:
+        kwargs = pars.copy()
+        kwargs['pop_fXh'] = fXh
+
+        # Borrow the IGM grid so we don't need any cosmology lookup tables.
+        grid = ares.simulations.MultiPhaseMedium(**kwargs).parcel_igm.grid
+        mgb = ares.simulations.MetaGalacticBackground(grid=grid, **kwargs)
+        mgb.run()
+
+        solver = mgb.solver
+
+        # Fluxes are stored in order of descending redshift
+        z = np.array(solver.redshifts[0])
+        fluxes = np.array([hist[0] for hist in mgb.history[0][-1::-1]])
+
+        kw = {'zone': 'igm', 'return_rc': True, 'igm_e': 2e-3}
+        for sp in grid.absorbers:
+            kw['igm_{!s}'.format(sp)] = 1.0
+
+        # One redshift at a time
+        ref = {key: [] for key in ['k_ion', 'k_ion2', 'k_heat']}
+        for i, redshift in enumerate(z):
+            coeff = solver.update_rate_coefficients(redshift, popid=0,
+                fluxes={0: [fluxes[i]]}, **kw)
+            for key in ref:
+                ref[key].append(np.array(coeff[key][0]))
+
+        tab = solver.TabulateRateCoefficients(z, popid=0, fluxes=[fluxes],
+            **kw)
+
+        for key in ref:
+            assert tab[key].shape == (z.size,) + ref[key][0].shape, key
+            assert np.any(tab[key] > 0), key
+            assert np.allclose(tab[key], ref[key], rtol=1e-10, atol=0), key
+
+        # Fall back on the scalar routines, should get identical results.
+        solver.volume._can_tabulate = lambda *args: False
+        assert solver.volume.TabulateHeatingRate(z, fluxes) is None
+
+        tab = solver.TabulateRateCoefficients(z, popid=0, fluxes=[fluxes],
+            **kw)
+
+        for key in ref:
+            assert np.array_equal(tab[key], ref[key]), key
+
+if __name__ == '__main__':
+    test()
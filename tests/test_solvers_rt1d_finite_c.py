@@ -0,0 +1,61 @@
+"""
+
+test_solvers_rt1d_finite_c.py
+
+Description: Stromgren sphere with a finite speed of light. Make sure 
+photons don't outrun c, and that the answer converges to the infinite-c
+result once the light crossing time is short compared to the run.
+
+"""
+
+import ares
+import numpy as np
+from ares.physics.Constants import c, s_per_myr
+
+def test():
+
+    pars = {'problem_type': 2, 'grid_cells': 32, 'stop_time': 30.,
+        'cosmology_name': 'user', 'verbose': False, 'progress_bar': False}
+
+    sim = ares.simulations.RaySegment(infinite_c=0, **pars)
+    field = sim.field
+    
+    # Nobody can see the source at first
+    field.update_rate_coefficients(sim.grid.data, 0.)
+    assert np.all(field.Lbol_by_cell == 0)
+    
+    # Next time around, only cells within c * t of the source are lit
+    t = 0.5 * sim.grid.r_edg[-1] / c
+    field.update_rate_coefficients(sim.grid.data, t)
+    lit = field.Lbol_by_cell[0] > 0
+    assert np.any(lit) and not np.all(lit)
+    assert np.all(sim.grid.r_mid[lit] <= c * t)
+    assert np.allclose(field.Lbol_by_cell[0][lit], 
+        field.sources[0].Lbol(0.))
+    
+    # Eventually, everybody is lit
+    field.update_rate_coefficients(sim.grid.data, 2.5 * t)
+    assert np.all(field.Lbol_by_cell[0] > 0)
+    
+    # Crossing time is ~0.02 Myr, so should end up near infinite-c answer
+    sim1 = ares.simulations.RaySegment(infinite_c=0, **pars)
+    sim1.run()
+    sim2 = ares.simulations.RaySegment(infinite_c=1, **pars)
+    sim2.run()
+    
+    assert np.allclose(sim1.history['h_2'][-1], sim2.history['h_2'][-1], 
+        atol=1e-2)
+
+    # Packets only know how to feed continuous SEDs that need RT
+    for kw in [{'optically_thin': 1}, {'problem_type': 1}]:
+        _pars = pars.copy()
+        _pars.update(kw)
+        try:
+            ares.simulations.RaySegment(infinite_c=0, **_pars)
+        except NotImplementedError:
+            pass
+        else:
+            raise AssertionError('Should not ignore infinite_c=0!')
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,39 @@
+"""
+
+test_solvers_rt1d_multi_source.py
+
+Description: Two identical sources at half the luminosity should behave 
+just like one source, and their rate coefficients should be computed in one 
+go.
+
+"""
+
+import ares
+import numpy as np
+
+def test():
+
+    pars = {'problem_type': 2, 'grid_cells': 32, 'stop_time': 10.,
+        'cosmology_name': 'user', 'verbose': False, 'progress_bar': False}
+        
+    sim1 = ares.simulations.RaySegment(**pars)
+    sim1.run()
+    
+    sim2 = ares.simulations.RaySegment(source_type=['star', 'star'],
+        source_qdot=0.5 * sim1.field.sources[0].pf['source_qdot'], **pars)
+    
+    assert sim2.field.volume.src_groups == [[0, 1]]
+        
+    sim2.run()
+    
+    for key in ['h_2', 'Tk']:
+        assert np.allclose(sim1.history[key][-1], sim2.history[key][-1], 
+            rtol=1e-6), key
+        
+    # Each source gets half the total rate
+    kw = sim2.field.volume.kwargs
+    assert np.allclose(kw['k_ion_0'], kw['k_ion_1'])
+    assert np.allclose(kw['k_ion'], 2 * kw['k_ion_0'])
+
+if __name__ == '__main__':
+    test()
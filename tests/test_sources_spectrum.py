@@ -0,0 +1,63 @@
+"""
+
+test_sources_spectrum.py
+
+Description: Make sure SEDs evaluated on arrays of photon energies agree
+with those evaluated one energy at a time, and that normalization integrals
+are shared between identical sources.
+
+"""
+
+import ares
+import numpy as np
+from ares.sources.Source import _norm_cache
+
+def test():
+
+    base = \
+    {
+     'source_type': 'bh',
+     'source_mass': 10.,
+     'source_rmax': 1e2,
+     'source_Emin': 1e2,
+     'source_Emax': 1e4,
+     'source_EminNorm': 1e2,
+     'source_EmaxNorm': 1e4,
+     'source_alpha': -1.5,
+     'source_fsc': 0.1,
+     'cosmology_name': 'user',
+     'verbose': False,
+    }
+
+    E = np.logspace(2, 4, 31)
+
+    for sed in ['pl', 'mcd', 'simpl']:
+        bh = ares.sources.BlackHole(init_tabs=False, source_sed=sed, **base)
+
+        I1 = np.array([bh.Spectrum(nrg) for nrg in E])
+        I2 = bh.Spectrum(E)
+
+        assert np.allclose(I1, I2, rtol=1e-10), sed
+
+        # Same parameters -> normalization comes from the cache
+        Ncache = len(_norm_cache)
+        bh2 = ares.sources.BlackHole(init_tabs=False, source_sed=sed, **base)
+        assert bh2._normL == bh._normL
+        assert len(_norm_cache) == Ncache
+
+        # Different parameters -> new normalization
+        bh3 = ares.sources.BlackHole(init_tabs=False, source_sed=sed,
+            **dict(base, source_EminNorm=2e2))
+        assert bh3._normL != bh._normL
+        assert len(_norm_cache) == Ncache + 1
+
+    # Excise a band
+    bh = ares.sources.BlackHole(init_tabs=False, source_sed='pl',
+        source_Ekill=(5e2, 1e3), **base)
+    I = bh.Spectrum(E)
+    kill = np.logical_and(E >= 5e2, E <= 1e3)
+    assert np.all(I[kill] == 0) and np.all(I[~kill] > 0)
+    assert np.allclose(I, [bh.Spectrum(nrg) for nrg in E])
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,97 @@
+"""
+
+test_sources_sps_cache.py
+
+Description: Check that SEDs read from the binary SPS cache match those
+read from the original tables. Uses a fake SPS model so we don't need any
+lookup tables.
+
+"""
+
+import os
+import shutil
+import tempfile
+import ares
+import numpy as np
+
+class FakeSPS(object):
+    metallicities = {'001': 0.001, '004': 0.004, '008': 0.008, '020': 0.02}
+    times = np.logspace(0, 3, 20)
+    waves = np.logspace(2, 4, 50)
+
+    def __init__(self):
+        self.calls = 0
+
+    def _load(self, **kwargs):
+        Z = kwargs['source_Z']
+
+        # Like the real thing, return all metallicities if Z is off-grid.
+        if Z not in self.metallicities.values():
+            out = [self._load(**dict(kwargs, source_Z=_Z)) \
+                for _Z in sorted(self.metallicities.values())]
+            return self.waves, [d for w, d, fn in out], \
+                [fn for w, d, fn in out]
+
+        self.calls += 1
+        data = 1e30 * (1. + 10 * Z) * np.outer(self.waves**-1, self.times)
+        return self.waves, data, 'fake_Z{}'.format(Z)
+
+def _src(path, Z, lit, **kwargs):
+    src = ares.sources.SynthesisModel(source_sed='fake', source_Z=Z,
+        source_sps_cache=path, verbose=False, **kwargs)
+    src._litinst_ = lit
+    return src
+
+def test():
+
+    path = tempfile.mkdtemp()
+
+    try:
+        for Z in [0.004, 0.01]:
+            lit = FakeSPS()
+            ref = _src(False, Z, lit).data
+
+            # First call writes the cache, second should just read it.
+            src1 = _src(path, Z, lit)
+            assert np.allclose(src1.data, ref)
+            assert len(os.listdir(path)) == 2
+
+            lit2 = FakeSPS()
+            src2 = _src(path, Z, lit2)
+            assert np.allclose(src2.data, ref)
+            assert lit2.calls == 0
+            assert isinstance(src2._data_all_Z, np.memmap)
+
+            # Must be able to modify SED without touching the cache.
+            data = src2.data
+            data *= 2
+            assert np.allclose(_src(path, Z, lit2).data, ref)
+            
+        # SSPs: normalization shouldn't force us to read the whole table.
+        for Z in [0.004, 0.01]:
+            kw = {'source_ssp': True, 'source_mass': 1e4}
+            lit = FakeSPS()
+            ref = _src(False, Z, lit, **kw)
+            src = _src(path, Z, lit, **kw)
+            assert np.allclose(src.data, ref.data)
+            assert isinstance(src._data_all_Z, np.memmap)
+            
+            # Per-metallicity luminosities still normalized properly.
+            L = src.L_per_sfr_of_t(wave=1600., Z=0.008)
+            raw = np.array(src._data_all_Z[2])
+            j = np.argmin(np.abs(src.wavelengths - 1600.))
+            assert np.allclose(L, raw[j] * 1e-2 * np.abs(src.dwdn[j]))
+            
+        # Default cache lives in $ARES/input, nothing written without $ARES
+        src = _src(True, 0.004, FakeSPS())
+        ARES = os.environ.get('ARES')
+        if ARES is None:
+            assert src._cache_prefix is None
+        else:
+            assert src._cache_prefix.startswith(
+                os.path.join(ARES, 'input', 'sps_cache'))
+    finally:
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    test()
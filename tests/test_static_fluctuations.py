@@ -0,0 +1,311 @@
+"""
+
+test_static_fluctuations.py
+
+Description: Check overlap kernels, bubble size distributions, and two-point
+expectation values computed for many separations (or redshifts) at once
+against those computed one at a time. Uses toy halo tables and a toy
+reionization history so we don't need any lookup tables.
+
+"""
+
+import os
+import shutil
+import tempfile
+import ares
+import numpy as np
+from ares.static.Fluctuations import Fluctuations
+from ares.util.ParameterFile import ParameterFile
+
+class ToyHalos(object):
+    def __init__(self):
+        self.tab_z = np.linspace(5, 30, 26)
+        self.tab_z_ps = self.tab_z
+        self.tab_R = np.logspace(-3, 3, 400)
+        self.tab_cf_mm = np.array([0.5 * (self.tab_R / 5.)**-1.8 \
+            * np.exp(-self.tab_R / 50.) / (1. + z / 10.) for z in self.tab_z])
+        self.tab_M = np.logspace(4, 18, 300)
+        self.tab_sigma = 10. * (self.tab_M / 1e4)**-0.08
+        self.tab_dlnsdlnm = -0.08 * np.ones_like(self.tab_M)
+        self.tab_growth = 1. / (1. + self.tab_z)
+        self.tab_dndm = np.array([1e-3 * (self.tab_M / 1e8)**-1.9 \
+            / self.tab_M * np.exp(-self.tab_M * (1. + z) / 1e13) \
+            for z in self.tab_z])
+        self.tab_fcoll = 0.1 * np.ones((self.tab_z.size, self.tab_M.size))
+
+    def fcoll_2d(self, z, logM):
+        return 1e-3 * np.exp(-(z - 6.) / 3.) * (8. / logM)
+
+    def VirialRadius(self, M, z):
+        return 10. * (M / 1e8)**(1. / 3.) / (1. + z)
+
+    def Bias(self, z):
+        return 1. + (self.tab_M / 1e10)**0.3
+
+def toy_fluctuations(base=Fluctuations, **kwargs):
+    """
+    Fluctuations object with toy halo tables, i.e., no HMF needed.
+    """
+
+    class ToyFluctuations(base):
+        def __init__(self, **kwargs):
+            self.pf = ParameterFile(**kwargs)
+            self._halos = ToyHalos()
+            self.cosm = ares.physics.Cosmology(cosmology_name='user')
+            self.zeta = 40.
+            self.zeta_X = 5.
+            self.tab_Mmin = 1e8
+
+    return ToyFluctuations(cosmology_name='user', **kwargs)
+
+class ToyReionization(Fluctuations):
+    """
+    Fixed filling factors, densities, and bubble size distribution, so that
+    two-point terms only depend on the overlap geometry.
+    """
+    def MeanIonizedFraction(self, z, ion=True):
+        return 0.3 if ion else 0.2
+
+    def delta_bubble_vol_weighted(self, z, ion=True):
+        return 0.4
+
+    def delta_shell(self, z):
+        return 0.1
+
+    def BulkDensity(self, z, R_s):
+        return -0.2
+
+    def TempToContrast(self, z, **kwargs):
+        return -2.
+
+    def Mmin(self, z):
+        return 1e8
+
+    def BubbleSizeDistribution(self, z, ion=True, rescale=True):
+        R = 0.2 * (self.m / 1e8)**(1. / 3.) * (1. if ion else 2.)
+        dndm = 5e-2 * (self.m / 1e8)**-1.5 / self.m * np.exp(-self.m / 1e13)
+        return R, self.m, dndm
+
+    def bubble_bias(self, z, ion=True):
+        return 1. + (self.m / 1e10)**0.2
+
+    def mean_bubble_bias(self, z, ion=True):
+        return 2.
+
+    def mean_halo_bias(self, z):
+        return 1.5
+
+    def mean_halo_overdensity(self, z):
+        return 5.
+
+    def ExpectationValue1pt(self, z, **kwargs):
+        return 0.
+
+    def _B(self, z, ion=True):
+        return np.ones_like(self.m)
+
+def _test_overlap_kernels():
+
+    f = toy_fluctuations()
+
+    R = np.logspace(-2, 2, 50)
+    R_i = np.logspace(-2, 1, 20)
+    R_s = 1.5 * R_i
+    R3 = np.zeros_like(R_i)
+
+    Vo, IV = f.overlap_kernels(R, R_i, R_s, R3)
+
+    assert Vo.shape == IV.shape == (6, R.size, R_i.size)
+
+    # Compare to one separation at a time
+    for j, dr in enumerate(R):
+        for k, V in enumerate(f.overlap_volumes(dr, R_i, R_s)):
+            assert np.allclose(Vo[k,j], V, rtol=1e-12, atol=0)
+        for k, V in enumerate(f.intersectional_volumes(dr, R_i, R_s, R3)):
+            assert np.allclose(IV[k,j], V, rtol=1e-12, atol=0)
+
+    # Same geometry -> same kernels, different geometry -> new kernels.
+    assert f.overlap_kernels(R, R_i, R_s, R3)[0] is Vo
+    assert f.overlap_kernels(R, R_i, 2 * R_i, R3)[0] is not Vo
+    assert len(f._overlap_kernels) == 2
+
+    # Workers shouldn't write to disk, just hand kernels to the parent.
+    path = tempfile.mkdtemp()
+    fn = os.path.join(path, 'overlap.hdf5')
+
+    try:
+        worker = toy_fluctuations(ps_overlap_cache=fn)
+        worker.defer_overlap_save = True
+        worker.overlap_kernels(R, R_i, R_s, R3)
+
+        assert not os.path.exists(fn)
+
+        kernels = worker.unsaved_overlap_kernels()
+        assert len(kernels) == 1
+        assert len(worker.unsaved_overlap_kernels()) == 0
+
+        parent = toy_fluctuations(ps_overlap_cache=fn)
+        parent.save_overlap_kernels(kernels)
+        assert os.path.exists(fn)
+
+        # Kernels already on disk shouldn't cause trouble
+        parent.save_overlap_kernels(kernels)
+        toy_fluctuations(ps_overlap_cache=fn).save_overlap_kernels(kernels)
+
+        # Should be read from disk, not re-computed.
+        reader = toy_fluctuations(ps_overlap_cache=fn)
+        reader.overlap_volumes = None
+        _Vo, _IV = reader.overlap_kernels(R, R_i, R_s, R3)
+        assert np.array_equal(_Vo, Vo) and np.array_equal(_IV, IV)
+    finally:
+        shutil.rmtree(path)
+
+def _test_bubble_size_distribution():
+
+    zarr = np.arange(6., 20., 0.5)
+
+    for model in ['fzh04', 'hmf']:
+        for ion in [True, False]:
+            for rescale in [True, False]:
+                kw = {'bubble_size_dist': model, 'ps_include_temp': True}
+
+                # All redshifts at once vs. one at a time (fresh object
+                # so nothing is pulled from the cache).
+                tab = toy_fluctuations(**kw).BubbleSizeDistribution(zarr,
+                    ion=ion, rescale=rescale)
+
+                f = toy_fluctuations(**kw)
+                for i, z in enumerate(zarr):
+                    bsd = f.BubbleSizeDistribution(z, ion=ion,
+                        rescale=rescale)
+                    for j in range(3):
+                        assert np.array_equal(tab[j][i], bsd[j],
+                            equal_nan=True), (model, ion, rescale, z)
+
+        # Changing zeta at fixed z should change the (rescaled) BSD of
+        # ionized *and* heated regions, since Qh = zeta_X * fcoll - Qi.
+        for ion in [True, False]:
+            f = toy_fluctuations(bubble_size_dist=model, ps_include_temp=True)
+            dndm1 = f.BubbleSizeDistribution(10., ion=ion)[2]
+            f.zeta = 20.
+            dndm2 = f.BubbleSizeDistribution(10., ion=ion)[2]
+
+            g = toy_fluctuations(bubble_size_dist=model, ps_include_temp=True)
+            g.zeta = 20.
+            ref = g.BubbleSizeDistribution(10., ion=ion)[2]
+
+            assert not np.allclose(dndm1, dndm2, equal_nan=True), (model, ion)
+            assert np.array_equal(dndm2, ref, equal_nan=True), (model, ion)
+
+# Two-point terms at z=10 for R = np.logspace(-2, 1.5, 6), computed with
+# the old (one separation at a time) implementation.
+temp1 = {'ps_include_temp': True, 'ps_temp_model': 1,
+    'ps_include_xcorr_ion_hot': True}
+temp2 = {'ps_include_temp': True, 'ps_temp_model': 2}
+ev2pt_ref = \
+[
+ ({'ps_igm_model': 2}, 'ii',
+  [5.103033391543585e-04, 4.967297815632318e-04, 4.276503520240868e-04,
+   1.456289525097933e-04, 5.787098537044914e-06, 2.688740532566053e-07]),
+ ({'ps_igm_model': 2}, 'ib',
+  [2.684868235221603e-06, 1.626511749178477e-05, 8.537285190217309e-05,
+   3.674107285685358e-04, 5.072024606880010e-04, 5.127179654034036e-04]),
+ ({'ps_igm_model': 2}, 'bb',
+  [9.994843269243752e-01, 9.994707399834531e-01, 9.994016039441715e-01,
+   9.991195495903531e-01, 9.989798079800869e-01, 9.989742951951399e-01]),
+ (dict(ps_igm_model=2, **temp1), 'hh',
+  [1.994887879580159e-01, 1.974352067514129e-01, 1.871335180083492e-01,
+   1.548636196623669e-01, 6.230917134229129e-02, 4.077506306330596e-02]),
+ (dict(ps_igm_model=2, **temp1), 'ih',
+  [9.025777649170497e-02, 9.258560042413433e-02, 1.040761364445273e-01,
+   8.477423779589749e-02, 5.319506721643201e-03, 1.051558226817611e-04]),
+ (dict(ps_igm_model=2, **temp1), 'hb',
+  [-3.309505634647509e-04, -4.991052391470907e-04, -6.811492499473479e-04,
+   2.055309310261669e-02, 1.363970074089653e-01, 1.591206120239896e-01]),
+ (dict(ps_igm_model=2, **temp2), 'hh',
+  [1.176798996227474e-02, 1.166691855450236e-02, 1.042212227784704e-02,
+   4.208193488247682e-03, 4.248181594495197e-04, 1.417307459651604e-04]),
+ (dict(ps_igm_model=1, **temp1), 'cc',
+  [1.021711794774379e+00, 1.013091046378000e+00, 9.679180047046064e-01,
+   7.981993925332700e-01, 1.570718101594720e-01, 1.154407554239809e-02]),
+ (dict(ps_igm_model=1, **temp1), 'ic',
+  [-1.805155529834099e-01, -1.851712008482687e-01, -2.081522728890546e-01,
+   -1.695285084969635e-01, -1.043098562811836e-02, 3.441350648520717e-05]),
+]
+
+def _test_ev2pt():
+
+    R = np.logspace(-2, 1.5, 6)
+    zarr = [8., 10., 12.]
+    terms = ['ii', 'hh', 'ih', 'ib', 'hb', 'bb', 'cc', 'ic']
+
+    combos = \
+    [
+     {'ps_igm_model': 2},
+     {'ps_igm_model': 2, 'ps_include_xcorr_ion_rho': True},
+     {'ps_igm_model': 2, 'ps_include_temp': True, 'ps_temp_model': 1,
+      'ps_include_xcorr_ion_hot': True},
+     {'ps_igm_model': 2, 'ps_include_temp': True, 'ps_temp_model': 2},
+     # Contrast terms
+     {'ps_igm_model': 1, 'ps_include_temp': True, 'ps_temp_model': 1,
+      'ps_include_xcorr_ion_hot': True},
+    ]
+
+    def ev2pt(kw, z, R, term, f=None):
+        if f is None:
+            f = toy_fluctuations(base=ToyReionization, **kw)
+        if kw.get('ps_temp_model') == 1:
+            R_s = 1.5 * f.BubbleSizeDistribution(z)[0]
+        else:
+            R_s = None
+        return np.array(f.ExpectationValue2pt(z, R, term=term, R_s=R_s,
+            Ts=50.))
+
+    for kw, term, ref in ev2pt_ref:
+        jp = ev2pt(kw, 10., R, term)
+        assert np.allclose(jp[0], ref, rtol=1e-10, atol=0), (kw, term)
+
+    # Haven't done these yet
+    kw = dict(ps_igm_model=2, ps_include_xcorr_ion_rho=True, **temp1)
+    for term in ['cdd', 'ccdd']:
+        try:
+            ev2pt(kw, 10., R, term)
+        except NotImplementedError:
+            pass
+        else:
+            raise AssertionError('term={} should not work!'.format(term))
+
+    for kw in combos:
+        for term in terms:
+            # All separations at once
+            jp = ev2pt(kw, 10., R, term)
+
+            assert np.all(np.isfinite(jp)), (kw, term)
+
+            # One separation at a time. Need a new object each time, since
+            # joint probabilities are cached by redshift.
+            for j, dr in enumerate(R):
+                ref = ev2pt(kw, 10., np.array([dr]), term)
+                assert np.allclose(jp[:,j], ref[:,0], rtol=1e-10, atol=0), \
+                    (kw, term, dr)
+
+        # Several redshifts with one object, i.e., re-using overlap kernels,
+        # vs. a new object at each redshift.
+        f = toy_fluctuations(base=ToyReionization, **kw)
+        for z in zarr:
+            for term in terms:
+                assert np.array_equal(ev2pt(kw, z, R, term, f=f),
+                    ev2pt(kw, z, R, term)), (kw, z, term)
+
+        # BSD (and hence the geometry) doesn't evolve, so one set of kernels
+        # should have served every redshift.
+        if hasattr(f, '_overlap_kernels'):
+            assert len(f._overlap_kernels) == 1, kw
+
+def test():
+    _test_overlap_kernels()
+    _test_bubble_size_distribution()
+    _test_ev2pt()
+
+if __name__ == '__main__':
+    test()
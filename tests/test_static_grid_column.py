@@ -0,0 +1,50 @@
+"""
+
+test_static_grid_column.py
+
+Description: Make sure column densities computed for all absorbers at once 
+(and in place) agree with those computed one absorber at a time.
+
+"""
+
+import ares
+import numpy as np
+
+def test():
+    
+    # Hydrogen and helium, so we have three absorbers
+    sim = ares.simulations.GasParcel(problem_type=12, grid_cells=32,
+        cosmology_name='user', verbose=False, progress_bar=False)
+    grid = sim.grid
+    
+    assert len(grid.absorbers) == 3
+        
+    data = grid.data.copy()
+    rng = np.random.RandomState(42)
+    for absorber in grid.absorbers:
+        data[absorber] = 10**rng.uniform(-5, 0, grid.dims)
+    
+    N = grid.zeros_grid_x_absorbers
+    logN = grid.zeros_grid_x_absorbers
+    Nc = grid.zeros_grid_x_absorbers
+    out = grid.ColumnDensityByCell(data, N=N, logN=logN, Nc=Nc)
+    
+    # Should have filled our arrays rather than making new ones
+    assert out[0] is N and out[1] is logN and out[2] is Nc
+    
+    N_d, logN_d, Nc_d = grid.ColumnDensity(data)
+    
+    for i, absorber in enumerate(grid.absorbers):
+        _Nc = grid.dr * data[absorber] * grid.x_to_n[absorber]
+        _N = np.cumsum(_Nc)
+        
+        assert np.array_equal(Nc[:,i], _Nc)
+        assert np.array_equal(N[:,i], _N)
+        assert np.array_equal(logN[:,i], np.log10(_N))
+        
+        assert np.array_equal(N_d[absorber], _N)
+        assert np.array_equal(logN_d[absorber], np.log10(_N))
+        assert np.array_equal(Nc_d[absorber], _Nc)
+    
+if __name__ == '__main__':
+    test()
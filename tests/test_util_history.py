@@ -0,0 +1,106 @@
+"""
+
+test_util_history.py
+
+Description: Make sure the preallocated history buffer agrees with the full
+history, whether it's decimated, grown, or streamed to disk.
+
+"""
+
+import os
+import ares
+import shutil
+import tempfile
+import numpy as np
+
+def test():
+    
+    pars = {'problem_type': 0, 'cosmology_name': 'user', 'stop_time': 10.,
+        'verbose': False, 'progress_bar': False}
+    
+    sim = ares.simulations.GasParcel(**pars)
+    sim.run()
+    
+    full = sim.history
+    N = full['t'].size
+    
+    assert full['h_2'].shape == (N, sim.grid.dims)
+    assert full['h_2'].flags['C_CONTIGUOUS']
+    
+    # Decimate
+    sim2 = ares.simulations.GasParcel(history_decimate=4, **pars)
+    sim2.run()
+    
+    # Always keep last snapshot
+    keep = np.arange(0, N, 4)
+    if keep[-1] != N - 1:
+        keep = np.concatenate((keep, [N - 1]))
+    
+    for key in full:
+        assert np.array_equal(sim2.history[key], full[key][keep]), key
+    
+    path = tempfile.mkdtemp()
+
+    try:
+        _test_files(path, full, pars)
+    finally:
+        shutil.rmtree(path)
+
+def _test_files(path, full, pars):
+
+    N = full['t'].size
+
+    # Small chunks, so we have to grow the buffer (or flush it) many times
+    for suffix in ['npz', 'hdf5']:
+        fn = os.path.join(path, 'test_history.{}'.format(suffix))
+        hist = ares.util.HistoryBuffer(fn=fn, chunk=7)
+        for i in range(N):
+            data = {key: full[key][i] for key in full if key != 't'}
+            hist.append(full['t'][i], data, last=i==N-1)
+        
+        out = hist.finish()
+        
+        if fn.endswith('npz'):
+            disk = np.load(fn)
+        else:
+            import h5py
+            disk = h5py.File(fn, 'r')
+            
+        for key in full:
+            assert np.array_equal(out[key], full[key]), key
+            assert np.array_equal(np.array(disk[key]), full[key]), key
+
+        disk.close()
+
+        # Don't overwrite existing history unless we're told to
+        try:
+            ares.util.HistoryBuffer(fn=fn)
+        except IOError:
+            pass
+        else:
+            raise AssertionError('Should not overwrite {}!'.format(fn))
+
+        assert os.path.exists(fn)
+
+        ares.util.HistoryBuffer(fn=fn, clobber=True)
+        assert not os.path.exists(fn)
+
+        # Same goes for simulations
+        sim3 = ares.simulations.GasParcel(history_file=fn,
+            history_clobber=True, **pars)
+        sim3.run()
+
+        for key in full:
+            assert np.array_equal(sim3.history[key], full[key]), key
+
+        try:
+            ares.simulations.GasParcel(history_file=fn, **pars).run()
+        except IOError:
+            pass
+        else:
+            raise AssertionError('Should not overwrite {}!'.format(fn))
+
+        os.remove(fn)
+    
+if __name__ == '__main__':
+    test()